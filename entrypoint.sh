@@ -6,6 +6,12 @@ python /app/webhook_dialogflow/manage.py migrate
 # Collect static files
 python /app/webhook_dialogflow/manage.py collectstatic --noinput
 
-# Start Gunicorn server
+# Preparar el modelo de embeddings int8 si está seleccionado y aún no existe
+if [ "$FUNCION_EMBEDDING" = "onnx_int8" ]; then
+    (cd /app/webhook_dialogflow && python scripts/cuantizar_embeddings.py --si-falta)
+fi
+
+# Start Gunicorn server (configuración en webhook_dialogflow/gunicorn.conf.py:
+# clase de worker, número de workers/hilos, timeouts y preload)
 cd /app/webhook_dialogflow
-exec gunicorn webhook_dialogflow.wsgi:application --bind 0.0.0.0:8000
\ No newline at end of file
+exec gunicorn --config gunicorn.conf.py
@@ -0,0 +1,127 @@
+"""
+Almacén compacto de los documentos completos, separado del índice vectorial.
+
+ChromaDB guarda solo el texto que se embebe (resumen y entidades clave) y
+los metadatos; el documento completo vive aquí, comprimido con zlib y
+indexado por el mismo id. ``ServicioChromaDB`` une ambos al devolver
+resultados. Es un archivo SQLite en modo WAL dentro del directorio de
+persistencia, de modo que la ingesta puede escribir mientras los workers
+leen. No depende de Django para poder usarse desde los scripts de ingesta.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import os
+import sqlite3
+import threading
+import zlib
+
+ARCHIVO_ALMACEN = 'documentos.sqlite3'
+
+# SQLite admite hasta 999 parámetros por sentencia en versiones antiguas
+_MAX_PARAMETROS = 900
+
+
+class AlmacenDocumentos:
+    """Documentos JSON comprimidos por id, compartidos entre procesos."""
+
+    def __init__(self, persist_dir: str, nivel_compresion: int = 6):
+        """
+        Args:
+            persist_dir: Directorio de persistencia de ChromaDB.
+            nivel_compresion: Nivel de zlib para los documentos nuevos.
+        """
+        self.ruta = os.path.join(persist_dir, ARCHIVO_ALMACEN)
+        self.nivel_compresion = nivel_compresion
+        self._local = threading.local()
+        os.makedirs(persist_dir, exist_ok=True)
+        with self._conexion() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS documentos ("
+                "id TEXT PRIMARY KEY, coleccion TEXT NOT NULL, "
+                "hash TEXT NOT NULL, payload BLOB NOT NULL)"
+            )
+            conexion.execute("CREATE INDEX IF NOT EXISTS documentos_coleccion ON documentos(coleccion)")
+
+    def _conexion(self) -> sqlite3.Connection:
+        # Una conexión por hilo y por proceso (las conexiones no sobreviven a un fork)
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or getattr(self._local, 'pid', None) != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=5)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def guardar(self, coleccion: str, documentos: Iterable[Tuple[str, str, str]]) -> None:
+        """
+        Inserta o reemplaza documentos en una sola transacción.
+
+        Args:
+            coleccion: Colección a la que pertenecen.
+            documentos: Tuplas ``(id, hash, documento_json)``.
+        """
+        filas = [
+            (id_doc, coleccion, hash_doc, zlib.compress(doc.encode('utf-8'), self.nivel_compresion))
+            for id_doc, hash_doc, doc in documentos
+        ]
+        if not filas:
+            return
+        with self._conexion() as conexion:
+            conexion.executemany(
+                "INSERT OR REPLACE INTO documentos (id, coleccion, hash, payload) VALUES (?, ?, ?, ?)",
+                filas
+            )
+
+    def eliminar(self, ids: Iterable[str]) -> None:
+        """Elimina documentos por id."""
+        ids = list(ids)
+        with self._conexion() as conexion:
+            for i in range(0, len(ids), _MAX_PARAMETROS):
+                lote = ids[i:i + _MAX_PARAMETROS]
+                conexion.execute(
+                    f"DELETE FROM documentos WHERE id IN ({','.join('?' * len(lote))})", lote
+                )
+
+    def eliminar_coleccion(self, coleccion: str) -> None:
+        """Elimina todos los documentos de una colección."""
+        with self._conexion() as conexion:
+            conexion.execute("DELETE FROM documentos WHERE coleccion = ?", (coleccion,))
+
+    def obtener(self, ids: List[str]) -> Dict[str, str]:
+        """
+        Retorna los documentos JSON de los ids indicados.
+
+        Args:
+            ids: Ids a buscar.
+
+        Returns:
+            Diccionario id -> documento JSON (los ids ausentes se omiten).
+        """
+        documentos: Dict[str, str] = {}
+        conexion = self._conexion()
+        for i in range(0, len(ids), _MAX_PARAMETROS):
+            lote = ids[i:i + _MAX_PARAMETROS]
+            filas = conexion.execute(
+                f"SELECT id, payload FROM documentos WHERE id IN ({','.join('?' * len(lote))})", lote
+            )
+            for id_doc, payload in filas:
+                documentos[id_doc] = zlib.decompress(payload).decode('utf-8')
+        return documentos
+
+    def iterar(self, coleccion: Optional[str] = None) -> Iterator[Tuple[str, str, str, str]]:
+        """
+        Recorre el almacén.
+
+        Yields:
+            Tuplas ``(id, coleccion, hash, documento_json)``.
+        """
+        consulta = "SELECT id, coleccion, hash, payload FROM documentos"
+        parametros: Tuple[str, ...] = ()
+        if coleccion is not None:
+            consulta += " WHERE coleccion = ?"
+            parametros = (coleccion,)
+        for id_doc, nombre, hash_doc, payload in self._conexion().execute(consulta + " ORDER BY id", parametros):
+            yield id_doc, nombre, hash_doc, zlib.decompress(payload).decode('utf-8')
+
+    def __len__(self) -> int:
+        return self._conexion().execute("SELECT COUNT(*) FROM documentos").fetchone()[0]
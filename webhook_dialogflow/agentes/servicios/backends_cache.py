@@ -0,0 +1,201 @@
+"""
+Backends clave-valor con expiración para las cachés del servicio.
+
+- ``memoria``: LRU en el proceso (no se comparte entre workers).
+- ``django``: usa el sistema de caché de Django (``settings.CACHES``).
+- ``sqlite``: archivo SQLite compartido por todos los workers y persistente
+  entre reinicios.
+
+Los valores deben ser serializables a JSON.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BackendMemoria:
+    """LRU en memoria con TTL por entrada."""
+
+    def __init__(self, max_entradas: int = 1000):
+        self.max_entradas = max_entradas
+        self._datos: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.time():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave: str, valor: Any, ttl: float) -> None:
+        with self._lock:
+            self._datos[clave] = (time.time() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def eliminar(self, clave: str) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+
+class BackendDjangoCache:
+    """
+    Adaptador sobre un alias de ``django.core.cache.caches``.
+
+    Las claves llevan el prefijo del backend y una generación guardada en la
+    propia caché; ``limpiar`` incrementa la generación en lugar de vaciar la
+    caché de Django, que puede compartirse con otros usos.
+    """
+
+    def __init__(self, alias: str = 'default', prefijo: str = 'kv'):
+        from django.core.cache import caches
+        self._cache = caches[alias]
+        self.prefijo = prefijo
+        self._clave_generacion = f"{prefijo}:generacion"
+
+    def _generacion(self) -> int:
+        return self._cache.get_or_set(self._clave_generacion, 1, timeout=None)
+
+    def _clave(self, clave: str) -> str:
+        # Hash para respetar las restricciones de longitud/caracteres de memcached
+        return f"{self.prefijo}:{self._generacion()}:{hashlib.sha1(clave.encode('utf-8')).hexdigest()}"
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        return self._cache.get(self._clave(clave))
+
+    def guardar(self, clave: str, valor: Any, ttl: float) -> None:
+        self._cache.set(self._clave(clave), valor, timeout=ttl)
+
+    def eliminar(self, clave: str) -> None:
+        self._cache.delete(self._clave(clave))
+
+    def limpiar(self) -> None:
+        # Las entradas de generaciones anteriores dejan de leerse y expiran por su TTL
+        try:
+            self._cache.incr(self._clave_generacion)
+        except ValueError:
+            self._cache.set(self._clave_generacion, 2, timeout=None)
+
+
+class BackendSQLite:
+    """
+    Tabla clave-valor en un archivo SQLite (modo WAL) compartida entre procesos.
+
+    La expulsión LRU se hace por lotes cada ``intervalo_limpieza`` escrituras
+    para no pagar un ``COUNT`` en cada inserción.
+    """
+
+    def __init__(self, ruta: str, max_entradas: int = 10000, tabla: str = 'kv',
+                 intervalo_limpieza: int = 100):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.tabla = tabla
+        self.intervalo_limpieza = intervalo_limpieza
+        self._local = threading.local()
+        self._escrituras = 0
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        with self._conexion() as conexion:
+            conexion.execute(
+                f"CREATE TABLE IF NOT EXISTS {tabla} ("
+                "clave TEXT PRIMARY KEY, valor TEXT NOT NULL, "
+                "expira REAL NOT NULL, accedido REAL NOT NULL)"
+            )
+            conexion.execute(f"CREATE INDEX IF NOT EXISTS {tabla}_accedido ON {tabla}(accedido)")
+
+    def _conexion(self) -> sqlite3.Connection:
+        # Una conexión por hilo y por proceso (las conexiones no sobreviven a un fork)
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or getattr(self._local, 'pid', None) != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        conexion = self._conexion()
+        ahora = time.time()
+        fila = conexion.execute(
+            f"SELECT valor, expira FROM {self.tabla} WHERE clave = ?", (clave,)
+        ).fetchone()
+        if fila is None:
+            return None
+        if fila[1] < ahora:
+            conexion.execute(f"DELETE FROM {self.tabla} WHERE clave = ?", (clave,))
+            return None
+        conexion.execute(f"UPDATE {self.tabla} SET accedido = ? WHERE clave = ?", (ahora, clave))
+        return json.loads(fila[0])
+
+    def guardar(self, clave: str, valor: Any, ttl: float) -> None:
+        conexion = self._conexion()
+        ahora = time.time()
+        conexion.execute(
+            f"INSERT OR REPLACE INTO {self.tabla} (clave, valor, expira, accedido) VALUES (?, ?, ?, ?)",
+            (clave, json.dumps(valor, ensure_ascii=False), ahora + ttl, ahora)
+        )
+        self._escrituras += 1
+        if self._escrituras % self.intervalo_limpieza == 0:
+            self._expulsar(conexion, ahora)
+
+    def _expulsar(self, conexion: sqlite3.Connection, ahora: float) -> None:
+        conexion.execute(f"DELETE FROM {self.tabla} WHERE expira < ?", (ahora,))
+        conexion.execute(
+            f"DELETE FROM {self.tabla} WHERE clave IN ("
+            f"SELECT clave FROM {self.tabla} ORDER BY accedido DESC LIMIT -1 OFFSET ?)",
+            (self.max_entradas,)
+        )
+
+    def eliminar(self, clave: str) -> None:
+        self._conexion().execute(f"DELETE FROM {self.tabla} WHERE clave = ?", (clave,))
+
+    def limpiar(self) -> None:
+        self._conexion().execute(f"DELETE FROM {self.tabla}")
+
+    def __len__(self) -> int:
+        return self._conexion().execute(f"SELECT COUNT(*) FROM {self.tabla}").fetchone()[0]
+
+
+def crear_backend(configuracion: Dict[str, Any], nombre: str):
+    """
+    Construye un backend a partir de su configuración.
+
+    Args:
+        configuracion: Diccionario con ``backend`` ('memoria', 'django' o
+            'sqlite') y sus opciones (``max_entradas``, ``ruta``, ``alias``).
+        nombre: Nombre lógico de la caché; se usa como tabla o prefijo.
+
+    Returns:
+        Instancia del backend.
+    """
+    tipo = configuracion.get('backend', 'memoria')
+    max_entradas = configuracion.get('max_entradas', 1000)
+    if tipo == 'memoria':
+        return BackendMemoria(max_entradas)
+    if tipo == 'django':
+        return BackendDjangoCache(configuracion.get('alias', 'default'), prefijo=nombre)
+    if tipo == 'sqlite':
+        return BackendSQLite(configuracion['ruta'], max_entradas, tabla=nombre)
+    raise ValueError(f"Backend de caché desconocido: {tipo}")
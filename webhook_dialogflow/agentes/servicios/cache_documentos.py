@@ -0,0 +1,135 @@
+"""
+Caché de documentos decodificados del almacén de documentos.
+
+ChromaDB guarda solo el texto embebido y los metadatos; el documento completo
+es una cadena JSON en ``almacen_documentos``. Esta caché decodifica cada
+documento una sola vez por versión de datos, lo guarda en una forma
+inmutable compacta y entrega vistas ligeras en lugar de copias. Los aciertos
+y fallos se cuentan solo en la métrica ``CACHE_DOCUMENTOS``.
+"""
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, Mapping, Optional
+import json
+import threading
+from .metricas import CACHE_DOCUMENTOS
+
+
+def congelar(valor: Any) -> Any:
+    """
+    Convierte recursivamente un valor JSON a una forma inmutable.
+
+    Los diccionarios pasan a ``MappingProxyType`` y las listas a tuplas, de
+    modo que varios hilos pueden compartir el mismo documento sin copiarlo.
+
+    Args:
+        valor: Valor decodificado de JSON.
+
+    Returns:
+        Valor equivalente inmutable.
+    """
+    if isinstance(valor, dict):
+        return MappingProxyType({clave: congelar(v) for clave, v in valor.items()})
+    if isinstance(valor, list):
+        return tuple(congelar(v) for v in valor)
+    return valor
+
+
+class VistaDocumento(Mapping):
+    """
+    Vista de solo lectura de un documento congelado.
+
+    Superpone ``_metadata`` y ``_score`` del resultado de la búsqueda sin
+    copiar ni modificar el documento compartido de la caché.
+    """
+    __slots__ = ('_doc', '_extra')
+
+    def __init__(self, doc: Mapping[str, Any], metadata: Optional[Dict[str, Any]] = None,
+                 score: Optional[float] = None):
+        self._doc = doc
+        self._extra = {'_metadata': metadata or {}, '_score': score}
+
+    def __getitem__(self, clave: str) -> Any:
+        if clave in self._extra:
+            return self._extra[clave]
+        return self._doc[clave]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._doc
+        yield from self._extra
+
+    def __len__(self) -> int:
+        return len(self._doc) + len(self._extra)
+
+    def __repr__(self) -> str:
+        return f"VistaDocumento(ciudad={self._doc.get('ciudad')!r}, score={self._extra['_score']!r})"
+
+
+class CacheDocumentos:
+    """
+    Caché LRU de documentos decodificados, indexada por id de ChromaDB.
+
+    Cada entrada pertenece a una versión de datos; al consultar con una
+    versión distinta la caché se vacía completa.
+    """
+
+    def __init__(self, max_entradas: int = 5000):
+        """
+        Args:
+            max_entradas: Número máximo de documentos en memoria.
+        """
+        self.max_entradas = max_entradas
+        self.version = None
+        self._docs: "OrderedDict[str, Mapping[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def buscar(self, version: str, id_doc: str) -> Optional[Mapping[str, Any]]:
+        """
+        Retorna el documento si ya está decodificado en caché, sin decodificar nada.
+
+        Args:
+            version: Versión de datos con la que se leyó el documento.
+            id_doc: Id del documento.
+        """
+        with self._lock:
+            if version != self.version:
+                self._docs.clear()
+                self.version = version
+            doc = self._docs.get(id_doc)
+            if doc is not None:
+                self._docs.move_to_end(id_doc)
+        CACHE_DOCUMENTOS.incrementar('fallo' if doc is None else 'acierto')
+        return doc
+
+    def guardar(self, version: str, id_doc: str, doc_str: str) -> Mapping[str, Any]:
+        """
+        Decodifica un documento y lo guarda en la caché.
+
+        Args:
+            version: Versión de datos con la que se leyó el documento.
+            id_doc: Id del documento.
+            doc_str: Documento JSON tal como lo devuelve el almacén.
+
+        Returns:
+            Documento inmutable.
+
+        Raises:
+            json.JSONDecodeError: Si el documento no es JSON válido.
+        """
+        doc = congelar(json.loads(doc_str))
+
+        with self._lock:
+            if version == self.version:
+                self._docs[id_doc] = doc
+                while len(self._docs) > self.max_entradas:
+                    self._docs.popitem(last=False)
+        return doc
+
+    def invalidar(self) -> None:
+        """Vacía la caché."""
+        with self._lock:
+            self._docs.clear()
+            self.version = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
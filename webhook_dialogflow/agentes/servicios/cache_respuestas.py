@@ -0,0 +1,163 @@
+"""
+Caché de respuestas generadas por Gemini.
+
+Las respuestas se indexan por (agente, versión de datos, ciudad resuelta,
+consulta normalizada): al publicarse una versión nueva de la base vectorial
+las respuestas generadas con los documentos anteriores dejan de usarse,
+aunque el backend sea compartido y no hayan expirado. Opcionalmente, una
+consulta sin coincidencia exacta puede reutilizar la respuesta de una
+consulta anterior de la misma ciudad cuyo embedding supere un umbral de
+similitud coseno. Los aciertos y fallos se cuentan solo en la métrica
+``CACHE_RESPUESTAS``.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+import threading
+import numpy as np
+from .backends_cache import crear_backend
+from .metricas import CACHE_RESPUESTAS
+from .resolutor_ciudades import normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+
+class CacheRespuestas:
+    """
+    Caché de respuestas de un agente con política propia.
+
+    Las coincidencias exactas se resuelven en el backend configurado (que
+    puede compartirse entre workers). El índice de similitud semántica vive
+    en el proceso y apunta a claves del backend.
+    """
+
+    def __init__(
+        self,
+        agente: str,
+        politica: Dict[str, Any],
+        funcion_embedding: Optional[Callable[[List[str]], Sequence[Sequence[float]]]] = None,
+        version_datos: Optional[Callable[[], str]] = None
+    ):
+        """
+        Args:
+            agente: Nombre del agente ('turismo' o 'salud_mental').
+            politica: Configuración de ``settings.CACHE_RESPUESTAS[agente]``:
+                ``ttl`` (segundos), ``max_entradas``, ``umbral_similitud``
+                (None desactiva la búsqueda semántica), ``backend`` y sus opciones.
+            funcion_embedding: Función que convierte textos en embeddings
+                (necesaria solo para la búsqueda semántica).
+            version_datos: Retorna la versión actual de los datos (opcional;
+                sin ella las respuestas solo caducan por TTL).
+        """
+        self.agente = agente
+        self.ttl = politica.get('ttl', 3600)
+        self.max_entradas = politica.get('max_entradas', 1000)
+        self.umbral_similitud = politica.get('umbral_similitud')
+        self.funcion_embedding = funcion_embedding if self.umbral_similitud else None
+        self.backend = crear_backend(politica, f"respuestas_{agente}")
+        self.version_datos = version_datos
+
+        self._lock = threading.Lock()
+        # (versión, ciudad normalizada) -> (claves, matriz de embeddings normalizados)
+        self._semantico: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def _version(self) -> str:
+        return self.version_datos() if self.version_datos is not None else ''
+
+    def _clave(self, version: str, ciudad: str, consulta: str) -> str:
+        return f"{self.agente}|{version}|{normalizar_texto(ciudad)}|{normalizar_texto(consulta)}"
+
+    def _embedding(self, consulta: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(self.funcion_embedding([normalizar_texto(consulta)])[0], dtype=np.float32)
+            norma = np.linalg.norm(vector)
+            return vector / norma if norma else None
+        except Exception as e:
+            logger.error(f"Error calculando embedding para la caché de respuestas: {str(e)}")
+            return None
+
+    def obtener(self, ciudad: str, consulta: str) -> Optional[str]:
+        """
+        Busca una respuesta en caché.
+
+        Args:
+            ciudad: Ciudad resuelta de la consulta.
+            consulta: Consulta del usuario.
+
+        Returns:
+            Respuesta almacenada o None.
+        """
+        try:
+            version = self._version()
+            respuesta = self.backend.obtener(self._clave(version, ciudad, consulta))
+            if respuesta is not None:
+                CACHE_RESPUESTAS.incrementar(self.agente, 'acierto')
+                return respuesta
+
+            if self.funcion_embedding is not None:
+                respuesta = self._obtener_semantico(version, ciudad, consulta)
+                if respuesta is not None:
+                    CACHE_RESPUESTAS.incrementar(self.agente, 'acierto_semantico')
+                    return respuesta
+        except Exception as e:
+            logger.error(f"Error leyendo caché de respuestas ({self.agente}): {str(e)}")
+
+        CACHE_RESPUESTAS.incrementar(self.agente, 'fallo')
+        return None
+
+    def _obtener_semantico(self, version: str, ciudad: str, consulta: str) -> Optional[str]:
+        grupo = self._semantico.get((version, normalizar_texto(ciudad)))
+        if not grupo or not grupo['claves']:
+            return None
+        vector = self._embedding(consulta)
+        if vector is None:
+            return None
+
+        similitudes = grupo['matriz'] @ vector
+        mejor = int(np.argmax(similitudes))
+        if similitudes[mejor] < self.umbral_similitud:
+            return None
+        return self.backend.obtener(grupo['claves'][mejor])
+
+    def guardar(self, ciudad: str, consulta: str, respuesta: str) -> None:
+        """
+        Almacena una respuesta generada.
+
+        Args:
+            ciudad: Ciudad resuelta de la consulta.
+            consulta: Consulta del usuario.
+            respuesta: Texto generado por el modelo.
+        """
+        try:
+            version = self._version()
+            clave = self._clave(version, ciudad, consulta)
+            self.backend.guardar(clave, respuesta, self.ttl)
+        except Exception as e:
+            logger.error(f"Error escribiendo caché de respuestas ({self.agente}): {str(e)}")
+            return
+
+        if self.funcion_embedding is not None:
+            vector = self._embedding(consulta)
+            if vector is None:
+                return
+            with self._lock:
+                # Los índices de versiones anteriores ya no pueden acertar
+                for anterior in [g for g in self._semantico if g[0] != version]:
+                    del self._semantico[anterior]
+                grupo = self._semantico.setdefault(
+                    (version, normalizar_texto(ciudad)),
+                    {'claves': [], 'matriz': np.empty((0, vector.shape[0]), dtype=np.float32)}
+                )
+                if clave in grupo['claves']:
+                    return
+                claves = grupo['claves'] + [clave]
+                matriz = np.vstack([grupo['matriz'], vector])
+                # Mantener acotado el índice semántico (se descartan las más antiguas)
+                if len(claves) > self.max_entradas:
+                    claves, matriz = claves[-self.max_entradas:], matriz[-self.max_entradas:]
+                self._semantico[(version, normalizar_texto(ciudad))] = {'claves': claves, 'matriz': matriz}
+
+    def limpiar(self) -> None:
+        """Vacía la caché y el índice semántico."""
+        with self._lock:
+            self._semantico.clear()
+        self.backend.limpiar()
@@ -1,31 +1,176 @@
 """
 Servicio para gestionar la base de datos vectorial ChromaDB.
+
+El motor se elige con ``MOTOR_VECTORIAL``: ChromaDB (duckdb+parquet) o el
+motor NumPy en proceso de ``motor_vectorial``, con la misma interfaz.
 """
-from typing import List, Dict, Any, Optional
-import chromadb
-from chromadb.config import Settings
+from typing import List, Dict, Any, Mapping, Optional
+from contextlib import nullcontext
 from django.conf import settings
 import os
 import json
 import logging
+import threading
+from .version_datos import leer_version, marcar_version
+from .cache_documentos import CacheDocumentos, VistaDocumento
+from .ingesta import registros_unicos, registros_cambiados, hashes_en_coleccion, aplicar_registros
+from .almacen_documentos import AlmacenDocumentos
+from .snapshot import restaurar_si_vacio
+from .motor_vectorial import abrir_cliente
+from .embeddings import crear_funcion_embedding
+from .metricas import CONSULTAS_CHROMADB, DECODIFICACION
 
 logger = logging.getLogger(__name__)
 
 class ServicioChromaDB:
     def __init__(self):
-        """Inicializa el cliente de ChromaDB con persistencia."""
+        """
+        Inicializa el cliente de ChromaDB con persistencia.
+
+        El backend duckdb+parquet no admite uso concurrente de la misma
+        conexión, por lo que las operaciones sobre el cliente se serializan
+        con un lock y la instancia puede compartirse entre hilos. El motor
+        NumPy admite consultas concurrentes y estas no toman el lock.
+        """
+        self._lock = threading.RLock()
+        self.motor = settings.MOTOR_VECTORIAL
+        self._lock_consultas = self._lock if self.motor == 'chromadb' else nullcontext()
+        self.cache_documentos = CacheDocumentos(settings.CACHE_DOCUMENTOS_MAX_ENTRADAS)
+        # Una sola instancia de la función de embeddings para colecciones y consultas
+        # (FUNCION_EMBEDDING); la int8 mapea sus pesos aquí, antes del fork con preload
+        self.funcion_embedding = crear_funcion_embedding(settings.FUNCION_EMBEDDING, **settings.EMBEDDING_ONNX)
         # Asegurar que el directorio de persistencia existe
-        persist_dir = os.path.join(settings.BASE_DIR, 'data', 'chromadb')
-        os.makedirs(persist_dir, exist_ok=True)
-        
+        self.persist_dir = str(settings.CHROMADB_PERSIST_DIR)
+        os.makedirs(self.persist_dir, exist_ok=True)
+        # Documentos completos; ChromaDB guarda solo el texto embebido y los metadatos
+        self.almacen = AlmacenDocumentos(self.persist_dir)
+        self._restaurar_snapshot()
+        self._abrir_cliente()
+
+    def _abrir_cliente(self) -> None:
+        """Crea el cliente de ChromaDB y recuerda la versión de datos cargada."""
         try:
-            self.cliente = chromadb.Client(Settings(
-                chroma_db_impl="duckdb+parquet",
-                persist_directory=persist_dir
-            ))
+            with self._lock:
+                self.version_cargada = leer_version(self.persist_dir)
+                self.cliente = self._nuevo_cliente()
         except Exception as e:
             logger.error(f"Error inicializando ChromaDB: {str(e)}")
             raise RuntimeError("No se pudo inicializar ChromaDB")
+
+    def reabrir(self) -> None:
+        """
+        Abre una conexión nueva (por ejemplo en un worker tras un fork).
+
+        La caché de documentos decodificados se conserva mientras la versión
+        de datos en disco no cambie.
+        """
+        self._abrir_cliente()
+
+    def _nuevo_cliente(self) -> Any:
+        return abrir_cliente(self.persist_dir, self.motor, settings.MOTOR_VECTORIAL_MMAP)
+
+    def _restaurar_snapshot(self) -> None:
+        """Puebla un directorio de persistencia vacío desde ``CHROMADB_SNAPSHOT``."""
+        try:
+            if restaurar_si_vacio(settings.CHROMADB_SNAPSHOT, self._nuevo_cliente, self.almacen, self.persist_dir):
+                logger.info(f"ChromaDB restaurado desde el snapshot {settings.CHROMADB_SNAPSHOT}")
+        except Exception as e:
+            # Sin snapshot el servicio arranca con lo que haya en disco
+            logger.error(f"Error restaurando snapshot de ChromaDB: {str(e)}")
+
+    def embeber(self, textos: List[str]) -> List[List[float]]:
+        """
+        Calcula embeddings con la misma función que usan las colecciones.
+        
+        Args:
+            textos: Textos a convertir.
+            
+        Returns:
+            Lista de vectores.
+        """
+        return self.funcion_embedding(textos)
+
+    def version_datos(self) -> str:
+        """Retorna la versión de datos marcada actualmente en disco."""
+        return leer_version(self.persist_dir)
+
+    def sincronizar(self) -> bool:
+        """
+        Reabre el cliente si otro proceso repobló las colecciones.
+        
+        duckdb+parquet carga los datos al crear el cliente, por lo que los
+        cambios escritos por otro proceso solo se ven tras reabrirlo.
+        
+        Returns:
+            True si el cliente se reabrió.
+        """
+        with self._lock:
+            if self.version_datos() == self.version_cargada:
+                return False
+            logger.info("Versión de datos cambiada en disco, reabriendo ChromaDB")
+            self._abrir_cliente()
+            return True
+
+    def _decodificar(self, id_doc: str, doc_str: str) -> Optional[Mapping[str, Any]]:
+        """
+        Decodifica un documento del almacén y lo guarda en la caché de documentos.
+        
+        Returns:
+            Documento inmutable o None si no es un objeto JSON válido.
+        """
+        try:
+            doc = self.cache_documentos.guardar(self.version_cargada, id_doc, doc_str)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Error decodificando documento {id_doc}: {str(e)}")
+            return None
+        if not isinstance(doc, Mapping):
+            logger.warning(f"Documento {id_doc} no es un objeto JSON")
+            return None
+        return doc
+
+    def _unir_documentos(
+        self,
+        ids: List[str],
+        metadatas: List[Optional[Dict[str, Any]]],
+        scores: Optional[List[float]] = None
+    ) -> List[VistaDocumento]:
+        """
+        Une los resultados del índice con los documentos completos del almacén.
+        
+        Los documentos encontrados en la caché de documentos decodificados se
+        usan tal cual; los demás se leen del almacén en una sola consulta. El
+        texto guardado en ChromaDB es solo el texto embebido y nunca se
+        decodifica: un id sin documento en el almacén se registra y se omite.
+        
+        Returns:
+            Vistas de los documentos, en el orden de ``ids``.
+        """
+        version = self.version_cargada
+        docs = {id_doc: self.cache_documentos.buscar(version, id_doc) for id_doc in ids}
+        faltantes = [id_doc for id_doc, doc in docs.items() if doc is None]
+        if faltantes:
+            payloads = self.almacen.obtener(faltantes)
+            for id_doc in faltantes:
+                if id_doc in payloads:
+                    docs[id_doc] = self._decodificar(id_doc, payloads[id_doc])
+                else:
+                    logger.warning(
+                        f"Documento {id_doc} sin registro en el almacén de documentos; "
+                        "se omite (vuelve a poblar la colección)"
+                    )
+        
+        documentos = []
+        for i, id_doc in enumerate(ids):
+            doc = docs.get(id_doc)
+            if doc is not None:
+                documentos.append(VistaDocumento(doc, metadatas[i], scores[i] if scores else None))
+        return documentos
+
+    def _marcar_cambio(self) -> None:
+        """Persiste el cliente y publica una nueva versión de datos."""
+        with self._lock:
+            self.cliente.persist()
+            self.version_cargada = marcar_version(self.persist_dir)
         
     def crear_coleccion(self, nombre: str) -> Any:
         """
@@ -38,10 +183,18 @@ class ServicioChromaDB:
             Colección de ChromaDB.
         """
         try:
-            return self.cliente.create_collection(name=nombre)
+            with self._lock:
+                return self.cliente.create_collection(
+                    name=nombre,
+                    embedding_function=self.funcion_embedding
+                )
         except ValueError:
             # La colección ya existe
-            return self.cliente.get_collection(name=nombre)
+            with self._lock:
+                return self.cliente.get_collection(
+                    name=nombre,
+                    embedding_function=self.funcion_embedding
+                )
         except Exception as e:
             logger.error(f"Error creando/obteniendo colección {nombre}: {str(e)}")
             raise
@@ -52,7 +205,11 @@ class ServicioChromaDB:
         documentos: List[Dict[str, Any]]
     ) -> None:
         """
-        Agrega documentos a la colección.
+        Inserta o actualiza documentos en la colección.
+        
+        Los ids se derivan de la ciudad, por lo que volver a agregar el mismo
+        documento es idempotente y solo se recalculan los embeddings de los
+        documentos cuyo contenido cambió.
         
         Args:
             nombre_coleccion: Nombre de la colección.
@@ -60,31 +217,23 @@ class ServicioChromaDB:
         """
         try:
             coleccion = self.crear_coleccion(nombre_coleccion)
-            
-            # Preparar los datos para inserción
-            ids = [f"doc_{i}" for i in range(len(documentos))]
-            docs_json = [json.dumps(doc, ensure_ascii=False) for doc in documentos]
-            
-            # Extraer metadatos relevantes
-            metadatos = []
-            for doc in documentos:
-                metadata = {}
-                if nombre_coleccion == "destinos_turisticos":
-                    metadata["ciudad"] = doc.get("ciudad", "")
-                    metadata["tipo"] = "turismo"
-                elif nombre_coleccion == "salud_mental":
-                    metadata["ciudad"] = doc.get("ciudad", "")
-                    metadata["tipo"] = "salud_mental"
-                metadatos.append(metadata)
-            
-            # Agregar documentos a la colección
-            coleccion.add(
-                ids=ids,
-                documents=docs_json,
-                metadatas=metadatos
+            registros = registros_unicos(
+                nombre_coleccion, documentos, settings.CHROMADB_TEXTO_EMBEDDING
             )
             
-            logger.info(f"Agregados {len(documentos)} documentos a la colección {nombre_coleccion}")
+            with self._lock:
+                existentes = hashes_en_coleccion(coleccion, [r.id for r in registros])
+                cambiados = registros_cambiados(registros, existentes)
+                if cambiados:
+                    aplicar_registros(
+                        coleccion, self.almacen, cambiados, self.embeber([r.texto for r in cambiados])
+                    )
+                    self._marcar_cambio()
+            
+            logger.info(
+                f"Colección {nombre_coleccion}: {len(cambiados)} documentos escritos, "
+                f"{len(registros) - len(cambiados)} sin cambios"
+            )
             
         except Exception as e:
             logger.error(f"Error agregando documentos a {nombre_coleccion}: {str(e)}")
@@ -96,7 +245,7 @@ class ServicioChromaDB:
         query_text: str,
         n_results: int = 3,
         filtro: Optional[Dict[str, str]] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> List[Mapping[str, Any]]:
         """
         Busca documentos en la colección basados en texto.
         
@@ -107,37 +256,103 @@ class ServicioChromaDB:
             filtro: Filtro opcional para la búsqueda (ej: {"ciudad": "Cancún"})
             
         Returns:
-            Lista de documentos encontrados.
+            Lista de documentos encontrados, como vistas de solo lectura
+            sobre la caché de documentos decodificados.
         """
         try:
             coleccion = self.crear_coleccion(nombre_coleccion)
             
             # Realizar la búsqueda
-            resultados = coleccion.query(
-                query_texts=[query_text],
-                n_results=n_results,
-                where=filtro if filtro else None
-            )
+            with CONSULTAS_CHROMADB.medir(nombre_coleccion, 'si' if filtro else 'no'), self._lock_consultas:
+                resultados = coleccion.query(
+                    query_texts=[query_text],
+                    n_results=n_results,
+                    where=filtro if filtro else None,
+                    include=["metadatas", "distances"]
+                )
             
-            # Procesar resultados
-            documentos = []
-            for i, doc_str in enumerate(resultados['documents'][0]):
-                try:
-                    doc = json.loads(doc_str)
-                    # Agregar metadatos y score
-                    doc['_metadata'] = resultados['metadatas'][0][i]
-                    doc['_score'] = resultados['distances'][0][i] if 'distances' in resultados else None
-                    documentos.append(doc)
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Error decodificando documento: {str(e)}")
-                    continue
-                    
-            return documentos
+            # Unir con los documentos completos (decodificando solo los que no están en caché)
+            with DECODIFICACION.medir(nombre_coleccion):
+                return self._unir_documentos(
+                    resultados['ids'][0],
+                    resultados['metadatas'][0],
+                    resultados['distances'][0] if 'distances' in resultados else None
+                )
             
         except Exception as e:
             logger.error(f"Error en búsqueda de {nombre_coleccion}: {str(e)}")
             return []
             
+    def obtener_documento(self, nombre_coleccion: str, id_doc: str) -> Optional[Mapping[str, Any]]:
+        """
+        Obtiene un documento por id, sin calcular embeddings ni buscar.
+
+        Args:
+            nombre_coleccion: Nombre de la colección.
+            id_doc: Id del documento.
+
+        Returns:
+            Vista del documento o None si no existe.
+        """
+        try:
+            coleccion = self.crear_coleccion(nombre_coleccion)
+            with self._lock_consultas:
+                resultados = coleccion.get(ids=[id_doc], include=["metadatas"])
+
+            documentos = self._unir_documentos(resultados['ids'], resultados['metadatas'])
+            return documentos[0] if documentos else None
+
+        except Exception as e:
+            logger.error(f"Error obteniendo documento {id_doc} de {nombre_coleccion}: {str(e)}")
+            return None
+
+    def obtener_documentos(self, nombre_coleccion: str) -> List[Mapping[str, Any]]:
+        """
+        Obtiene y decodifica todos los documentos de una colección.
+        
+        Args:
+            nombre_coleccion: Nombre de la colección.
+            
+        Returns:
+            Lista de documentos con sus metadatos en ``_metadata``.
+        """
+        try:
+            coleccion = self.crear_coleccion(nombre_coleccion)
+            with self._lock:
+                resultados = coleccion.get(include=["metadatas"])
+            
+            return self._unir_documentos(resultados['ids'], resultados['metadatas'])
+            
+        except Exception as e:
+            logger.error(f"Error obteniendo documentos de {nombre_coleccion}: {str(e)}")
+            return []
+            
+    def listar_ciudades(self, nombre_coleccion: str) -> List[str]:
+        """
+        Lista los valores distintos de ``ciudad`` en los metadatos de una colección.
+        
+        Args:
+            nombre_coleccion: Nombre de la colección.
+            
+        Returns:
+            Lista de nombres de ciudad (sin repetir).
+        """
+        try:
+            coleccion = self.crear_coleccion(nombre_coleccion)
+            with self._lock:
+                resultados = coleccion.get(include=["metadatas"])
+            
+            ciudades = []
+            for metadata in resultados.get('metadatas') or []:
+                ciudad = (metadata or {}).get("ciudad")
+                if ciudad and ciudad not in ciudades:
+                    ciudades.append(ciudad)
+            return ciudades
+            
+        except Exception as e:
+            logger.error(f"Error listando ciudades de {nombre_coleccion}: {str(e)}")
+            return []
+            
     def reset_collection(self, nombre_coleccion: str) -> None:
         """
         Elimina y recrea una colección.
@@ -146,8 +361,11 @@ class ServicioChromaDB:
             nombre_coleccion: Nombre de la colección a resetear.
         """
         try:
-            self.cliente.delete_collection(nombre_coleccion)
-            self.crear_coleccion(nombre_coleccion)
+            with self._lock:
+                self.cliente.delete_collection(nombre_coleccion)
+                self.almacen.eliminar_coleccion(nombre_coleccion)
+                self.crear_coleccion(nombre_coleccion)
+                self._marcar_cambio()
             logger.info(f"Colección {nombre_coleccion} reseteada exitosamente")
         except Exception as e:
             logger.error(f"Error reseteando colección {nombre_coleccion}: {str(e)}")
@@ -0,0 +1,408 @@
+"""
+Cliente de Gemini compartido con interruptor de circuito y llamadas de cobertura.
+
+``ClienteGemini`` envuelve un ``GenerativeModel`` y expone la misma interfaz
+(``generate_content`` y ``generate_content_async``), de modo que los agentes
+RAG y ``ServicioGemini`` lo usan sin cambios.
+
+- Interruptor de circuito: tras ``GEMINI_CIRCUITO_FALLOS`` errores seguidos,
+  o si el p95 de las últimas llamadas supera ``GEMINI_CIRCUITO_P95_SEGUNDOS``,
+  el circuito se abre y las llamadas se rechazan al instante con
+  ``CircuitoAbierto`` durante ``GEMINI_CIRCUITO_ESPERA_SEGUNDOS``. Después
+  se deja pasar una sola llamada de sonda (semiabierto): si responde bien y
+  a tiempo el circuito se cierra, si no se vuelve a abrir. Una llamada
+  asíncrona cortada por el plazo de la petición cuenta como fallo.
+- Cobertura (``GEMINI_COBERTURA``): si una llamada tarda más que el p90 de
+  las recientes se lanza una segunda idéntica y se usa la primera que
+  responda. Como mucho ``GEMINI_COBERTURA_FRACCION`` de las llamadas
+  lanzan una segunda, para no duplicar la carga cuando Gemini va lento.
+- Limitador de cuota (``GEMINI_CUOTA_RPM``): cada llamada toma un token de
+  un ``CuboTokens``; si la cola es demasiado larga se descarta con
+  ``LimiteExcedido``. Las coberturas solo se lanzan si hay un token libre.
+"""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as TimeoutFuturo, wait
+from typing import Any, Callable, Optional
+import asyncio
+import logging
+import threading
+import time
+import google.generativeai as genai
+from django.conf import settings
+from .plazos import PlazoVencido
+from .limitador import CuboTokens, LimiteExcedido
+from .metricas import GEMINI_LLAMADAS, GEMINI_CIRCUITO, GEMINI_APERTURAS, GEMINI_COBERTURAS, GEMINI_ESPERA_CUOTA
+
+logger = logging.getLogger(__name__)
+
+MODELO_GEMINI = 'gemini-2.5-flash'
+
+CERRADO = 'cerrado'
+ABIERTO = 'abierto'
+SEMIABIERTO = 'semiabierto'
+
+
+class CircuitoAbierto(PlazoVencido):
+    """
+    El interruptor rechazó la llamada sin enviarla a Gemini.
+
+    Hereda de ``PlazoVencido``: Gemini no va a responder a tiempo, así que
+    los agentes responden igual que al agotarse el plazo (respuesta degradada
+    con el documento recuperado).
+    """
+
+    def __init__(self):
+        super().__init__('circuito_abierto')
+
+
+def _percentil(valores, fraccion: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(fraccion * len(ordenados)))]
+
+
+class InterruptorCircuito:
+    """
+    Interruptor de circuito con apertura por fallos seguidos o por latencia.
+
+    Las latencias de las últimas ``ventana`` llamadas también sirven para
+    calcular la espera de las llamadas de cobertura.
+    """
+
+    def __init__(self, umbral_fallos: int = 5, umbral_p95: Optional[float] = None,
+                 espera: float = 30.0, ventana: int = 100, min_muestras: int = 20):
+        """
+        Args:
+            umbral_fallos: Errores seguidos que abren el circuito.
+            umbral_p95: Segundos de p95 que abren el circuito (None o 0: sin límite).
+            espera: Segundos que el circuito permanece abierto antes de la sonda.
+            ventana: Número de latencias recientes que se conservan.
+            min_muestras: Latencias necesarias para calcular percentiles.
+        """
+        self.umbral_fallos = umbral_fallos
+        self.umbral_p95 = umbral_p95 or None
+        self.espera = espera
+        self.min_muestras = min_muestras
+        self.estado = CERRADO
+        self._latencias = deque(maxlen=ventana)
+        self._fallos_seguidos = 0
+        self._abierto_hasta = 0.0
+        self._sonda_en_curso = False
+        self._lock = threading.Lock()
+        self._publicar()
+
+    def entrar(self) -> bool:
+        """
+        Pide permiso para una llamada.
+
+        Returns:
+            True si la llamada es la sonda del estado semiabierto.
+
+        Raises:
+            CircuitoAbierto: Si el circuito está abierto o ya hay una sonda en curso.
+        """
+        with self._lock:
+            if self.estado == CERRADO:
+                return False
+            if self.estado == ABIERTO:
+                if time.monotonic() < self._abierto_hasta:
+                    raise CircuitoAbierto()
+                self._cambiar(SEMIABIERTO)
+            if self._sonda_en_curso:
+                raise CircuitoAbierto()
+            self._sonda_en_curso = True
+            return True
+
+    def registrar(self, latencia: float, exito: bool, sonda: bool = False) -> None:
+        """Registra el resultado de una llamada permitida por ``entrar``."""
+        with self._lock:
+            if sonda:
+                self._sonda_en_curso = False
+                if exito and (self.umbral_p95 is None or latencia <= self.umbral_p95):
+                    self._fallos_seguidos = 0
+                    self._latencias.clear()
+                    self._cambiar(CERRADO)
+                    logger.info("Interruptor de Gemini cerrado tras una sonda correcta")
+                else:
+                    self._abrir('sonda')
+                return
+            # Llamadas lanzadas antes de abrirse el circuito que terminan tarde
+            if self.estado != CERRADO:
+                return
+            self._latencias.append(latencia)
+            self._fallos_seguidos = 0 if exito else self._fallos_seguidos + 1
+            if self._fallos_seguidos >= self.umbral_fallos:
+                self._abrir('fallos')
+            elif (self.umbral_p95 is not None and len(self._latencias) >= self.min_muestras
+                  and _percentil(self._latencias, 0.95) > self.umbral_p95):
+                self._abrir('latencia')
+
+    def cancelar(self, sonda: bool) -> None:
+        """Libera la sonda de una llamada cancelada sin resultado."""
+        if sonda:
+            with self._lock:
+                self._sonda_en_curso = False
+
+    def percentil(self, fraccion: float) -> Optional[float]:
+        """Percentil de las latencias recientes, o None si no hay muestras suficientes."""
+        with self._lock:
+            if len(self._latencias) < self.min_muestras:
+                return None
+            return _percentil(self._latencias, fraccion)
+
+    def _abrir(self, motivo: str) -> None:
+        self._abierto_hasta = time.monotonic() + self.espera
+        self._fallos_seguidos = 0
+        self._sonda_en_curso = False
+        self._latencias.clear()
+        self._cambiar(ABIERTO)
+        GEMINI_APERTURAS.incrementar(motivo)
+        logger.warning(f"Interruptor de Gemini abierto por {motivo} durante {self.espera}s")
+
+    def _cambiar(self, estado: str) -> None:
+        self.estado = estado
+        self._publicar()
+
+    def _publicar(self) -> None:
+        for estado in (CERRADO, ABIERTO, SEMIABIERTO):
+            GEMINI_CIRCUITO.fijar(1 if estado == self.estado else 0, estado)
+
+
+class ClienteGemini:
+    """
+    Modelo de Gemini protegido por un ``InterruptorCircuito``, con cobertura
+    y limitador de cuota opcionales.
+    """
+
+    def __init__(self, modelo: Any, interruptor: Optional[InterruptorCircuito] = None,
+                 cobertura: bool = False, percentil_cobertura: float = 0.9,
+                 fraccion_cobertura: float = 0.1, hilos_cobertura: int = 64,
+                 limitador: Optional[CuboTokens] = None):
+        """
+        Args:
+            modelo: ``GenerativeModel`` (o un objeto con la misma interfaz).
+            interruptor: Interruptor de circuito (por defecto uno con valores estándar).
+            cobertura: Si se lanzan llamadas de cobertura.
+            percentil_cobertura: Percentil de latencia tras el que se lanza la cobertura.
+            fraccion_cobertura: Fracción máxima de llamadas que lanzan cobertura.
+            hilos_cobertura: Hilos para las llamadas síncronas con cobertura.
+            limitador: Cubo de tokens de la cuota (opcional, sin él no hay límite).
+        """
+        self.modelo = modelo
+        self.interruptor = interruptor if interruptor is not None else InterruptorCircuito()
+        self.cobertura = cobertura
+        self.percentil_cobertura = percentil_cobertura
+        self.fraccion_cobertura = fraccion_cobertura
+        self.hilos_cobertura = hilos_cobertura
+        self.limitador = limitador
+        self._llamadas = 0
+        self._coberturas = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: Any, **opciones) -> Any:
+        """``GenerativeModel.generate_content`` protegido por el interruptor."""
+        return self.llamar(self.modelo.generate_content, prompt, cubrir=self.cobertura, **opciones)
+
+    async def generate_content_async(self, prompt: Any, **opciones) -> Any:
+        """``GenerativeModel.generate_content_async`` protegido por el interruptor."""
+        return await self.allamar(self.modelo.generate_content_async, prompt, cubrir=self.cobertura, **opciones)
+
+    def start_chat(self, **kwargs) -> Any:
+        """Chat del modelo; sus mensajes se envían con ``llamar(chat.send_message, ...)``."""
+        return self.modelo.start_chat(**kwargs)
+
+    def llamar(self, funcion: Callable[..., Any], *args, cubrir: bool = False, **kwargs) -> Any:
+        """
+        Ejecuta una llamada bloqueante a Gemini a través del interruptor.
+
+        Args:
+            funcion: Método del modelo o del chat.
+            cubrir: Si se puede lanzar una segunda llamada de cobertura. Solo
+                para llamadas sin efectos (no ``chat.send_message``).
+
+        Raises:
+            CircuitoAbierto: Si el interruptor rechaza la llamada.
+            LimiteExcedido: Si la cola del limitador de cuota está llena.
+        """
+        sonda = self._entrar()
+        if self.limitador is not None:
+            try:
+                GEMINI_ESPERA_CUOTA.observar(self.limitador.adquirir())
+            except LimiteExcedido:
+                self._descartar(sonda)
+                raise
+            except BaseException:
+                self.interruptor.cancelar(sonda)
+                raise
+        inicio = time.monotonic()
+        try:
+            espera = self._espera_cobertura() if cubrir and not sonda else None
+            if espera is None:
+                resultado = funcion(*args, **kwargs)
+            else:
+                resultado = self._llamar_con_cobertura(espera, funcion, args, kwargs)
+        except Exception:
+            self._registrar(inicio, False, sonda)
+            raise
+        except BaseException:
+            self.interruptor.cancelar(sonda)
+            raise
+        self._registrar(inicio, True, sonda)
+        return resultado
+
+    async def allamar(self, funcion: Callable[..., Any], *args, cubrir: bool = False, **kwargs) -> Any:
+        """Versión asíncrona de ``llamar`` para corrutinas del modelo."""
+        sonda = self._entrar()
+        if self.limitador is not None:
+            try:
+                GEMINI_ESPERA_CUOTA.observar(await self.limitador.aadquirir())
+            except LimiteExcedido:
+                self._descartar(sonda)
+                raise
+            except BaseException:
+                self.interruptor.cancelar(sonda)
+                raise
+        inicio = time.monotonic()
+        try:
+            espera = self._espera_cobertura() if cubrir and not sonda else None
+            if espera is None:
+                resultado = await funcion(*args, **kwargs)
+            else:
+                resultado = await self._allamar_con_cobertura(espera, funcion, args, kwargs)
+        except Exception:
+            self._registrar(inicio, False, sonda)
+            raise
+        except asyncio.CancelledError:
+            # Cortada por el plazo de la petición: Gemini no respondió a tiempo,
+            # cuenta como fallo con la latencia transcurrida
+            self._registrar(inicio, False, sonda, 'plazo')
+            raise
+        except BaseException:
+            self.interruptor.cancelar(sonda)
+            raise
+        self._registrar(inicio, True, sonda)
+        return resultado
+
+    def _entrar(self) -> bool:
+        try:
+            return self.interruptor.entrar()
+        except CircuitoAbierto:
+            GEMINI_LLAMADAS.incrementar('rechazada')
+            raise
+
+    def _descartar(self, sonda: bool) -> None:
+        """Libera la sonda de una llamada descartada por el limitador."""
+        self.interruptor.cancelar(sonda)
+        GEMINI_LLAMADAS.incrementar('limitada')
+
+    def _registrar(self, inicio: float, exito: bool, sonda: bool, resultado: Optional[str] = None) -> None:
+        self.interruptor.registrar(time.monotonic() - inicio, exito, sonda)
+        GEMINI_LLAMADAS.incrementar(resultado or ('exito' if exito else 'error'))
+
+    def _espera_cobertura(self) -> Optional[float]:
+        """Segundos tras los que se lanza la cobertura (None sin muestras suficientes)."""
+        with self._lock:
+            self._llamadas += 1
+        return self.interruptor.percentil(self.percentil_cobertura)
+
+    def _reservar_cobertura(self) -> bool:
+        """Reserva una cobertura si no se supera ``fraccion_cobertura`` de las llamadas."""
+        with self._lock:
+            if self._coberturas >= self.fraccion_cobertura * self._llamadas:
+                return False
+            if self.limitador is not None and not self.limitador.intentar():
+                return False
+            self._coberturas += 1
+        GEMINI_COBERTURAS.incrementar('lanzada')
+        return True
+
+    def _obtener_executor(self) -> ThreadPoolExecutor:
+        # Pool propio: las llamadas llegan desde hilos del pool de Gemini y no
+        # deben esperar a tareas encoladas en ese mismo pool
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.hilos_cobertura, thread_name_prefix='gemini-cobertura'
+                    )
+        return self._executor
+
+    def _llamar_con_cobertura(self, espera: float, funcion: Callable[..., Any], args, kwargs) -> Any:
+        executor = self._obtener_executor()
+        primera = executor.submit(funcion, *args, **kwargs)
+        try:
+            return primera.result(timeout=espera)
+        except TimeoutFuturo:
+            pass
+        if not self._reservar_cobertura():
+            return primera.result()
+        segunda = executor.submit(funcion, *args, **kwargs)
+        pendientes = {primera, segunda}
+        error = None
+        while pendientes:
+            hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                if futuro.exception() is None:
+                    if futuro is segunda:
+                        GEMINI_COBERTURAS.incrementar('ganadora')
+                    for pendiente in pendientes:
+                        pendiente.cancel()
+                    return futuro.result()
+                error = futuro.exception()
+        raise error
+
+    async def _allamar_con_cobertura(self, espera: float, funcion: Callable[..., Any], args, kwargs) -> Any:
+        primera = asyncio.ensure_future(funcion(*args, **kwargs))
+        segunda = None
+        try:
+            hechos, _ = await asyncio.wait({primera}, timeout=espera)
+            if hechos or not self._reservar_cobertura():
+                return await primera
+            segunda = asyncio.ensure_future(funcion(*args, **kwargs))
+            pendientes = {primera, segunda}
+            error = None
+            while pendientes:
+                hechos, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in hechos:
+                    if tarea.exception() is None:
+                        if tarea is segunda:
+                            GEMINI_COBERTURAS.incrementar('ganadora')
+                        return tarea.result()
+                    error = tarea.exception()
+            raise error
+        finally:
+            for tarea in (primera, segunda):
+                if tarea is not None and not tarea.done():
+                    tarea.cancel()
+
+
+def crear_cliente_gemini(modelo: Optional[Any] = None) -> ClienteGemini:
+    """
+    Construye un ``ClienteGemini`` con la configuración de settings.
+
+    Args:
+        modelo: Modelo a envolver (opcional). Si no se indica se crea
+            ``MODELO_GEMINI`` con ``GEMINI_API_KEY``.
+    """
+    if modelo is None:
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+        modelo = genai.GenerativeModel(MODELO_GEMINI)
+    interruptor = InterruptorCircuito(
+        umbral_fallos=settings.GEMINI_CIRCUITO_FALLOS,
+        umbral_p95=settings.GEMINI_CIRCUITO_P95_SEGUNDOS,
+        espera=settings.GEMINI_CIRCUITO_ESPERA_SEGUNDOS,
+        ventana=settings.GEMINI_CIRCUITO_VENTANA,
+        min_muestras=settings.GEMINI_CIRCUITO_MIN_MUESTRAS
+    )
+    limitador = None
+    if settings.GEMINI_CUOTA_RPM:
+        tasa = settings.GEMINI_CUOTA_RPM / 60.0 / max(1, settings.GEMINI_CUOTA_PROCESOS)
+        limitador = CuboTokens(tasa, settings.GEMINI_CUOTA_RAFAGA, settings.GEMINI_CUOTA_ESPERA_SEGUNDOS)
+    return ClienteGemini(
+        modelo, interruptor,
+        cobertura=settings.GEMINI_COBERTURA,
+        percentil_cobertura=settings.GEMINI_COBERTURA_PERCENTIL,
+        fraccion_cobertura=settings.GEMINI_COBERTURA_FRACCION,
+        hilos_cobertura=settings.GEMINI_MAX_CONCURRENCIA,
+        limitador=limitador
+    )
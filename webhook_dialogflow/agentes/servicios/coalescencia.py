@@ -0,0 +1,87 @@
+"""
+Coalescencia de llamadas idénticas en vuelo (singleflight).
+
+En campañas muchos usuarios preguntan lo mismo a la vez. Las llamadas a
+Gemini con la misma clave (agente, etapa, ciudad, consulta normalizada) que
+coinciden en el tiempo dentro de un proceso comparten una única llamada: la
+primera la lanza (líder) y las demás esperan su resultado (seguidores), cada
+una con su propio plazo. La llamada compartida no se cancela cuando un
+solicitante abandona por plazo, así que los demás siguen pudiendo usarla.
+"""
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+import asyncio
+import threading
+import weakref
+from .resolutor_ciudades import normalizar_texto
+
+
+def clave_vuelo(agente: str, etapa: str, ciudad: str, consulta: str) -> Tuple[str, str, str, str]:
+    """Clave de coalescencia: la misma normalización que la caché de respuestas."""
+    return agente, etapa, normalizar_texto(ciudad), normalizar_texto(consulta)
+
+
+class GrupoVuelo:
+    """Llamadas en vuelo por clave, para hilos (``Future``) y para el event loop (``Task``)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo: Dict[Hashable, Future] = {}
+        self._en_vuelo_async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, asyncio.Task]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def compartir(self, clave: Hashable, lanzar: Callable[[], Future]) -> Tuple[Future, bool]:
+        """
+        Retorna la llamada en vuelo para ``clave`` o lanza una nueva.
+
+        Args:
+            clave: Clave de la llamada (ver ``clave_vuelo``).
+            lanzar: Envía la llamada a un pool y retorna su ``Future``.
+
+        Returns:
+            (futuro compartido, True si esta petición lanzó la llamada).
+        """
+        with self._lock:
+            futuro = self._en_vuelo.get(clave)
+            if futuro is not None:
+                return futuro, False
+            futuro = lanzar()
+            self._en_vuelo[clave] = futuro
+        futuro.add_done_callback(lambda f: self._soltar(self._en_vuelo, clave, f))
+        return futuro, True
+
+    def acompartir(self, clave: Hashable, crear: Callable[[], Awaitable[Any]]) -> Tuple[asyncio.Task, bool]:
+        """
+        Versión asíncrona de ``compartir`` para el loop actual.
+
+        Los seguidores deben esperar la tarea con ``asyncio.shield`` para que
+        su cancelación no cancele la llamada compartida.
+        """
+        loop = asyncio.get_running_loop()
+        en_vuelo = self._en_vuelo_async.setdefault(loop, {})
+        tarea = en_vuelo.get(clave)
+        if tarea is not None:
+            return tarea, False
+        tarea = loop.create_task(crear())
+        en_vuelo[clave] = tarea
+        tarea.add_done_callback(lambda t: self._asoltar(en_vuelo, clave, t))
+        return tarea, True
+
+    def _soltar(self, en_vuelo: Dict[Hashable, Any], clave: Hashable, futuro: Any) -> None:
+        with self._lock:
+            if en_vuelo.get(clave) is futuro:
+                del en_vuelo[clave]
+
+    def _asoltar(self, en_vuelo: Dict[Hashable, Any], clave: Hashable, tarea: asyncio.Task) -> None:
+        if en_vuelo.get(clave) is tarea:
+            del en_vuelo[clave]
+        # Marcar la excepción como leída aunque todos los solicitantes hayan abandonado
+        if not tarea.cancelled():
+            tarea.exception()
+
+    def __len__(self) -> int:
+        return len(self._en_vuelo) + sum(len(d) for d in self._en_vuelo_async.values())
+
+
+vuelos = GrupoVuelo()
@@ -0,0 +1,93 @@
+"""
+Utilidades de concurrencia para el camino asíncrono (ASGI) de los webhooks.
+
+Las llamadas bloqueantes (ChromaDB, cachés en disco, embeddings) se envían a
+un pool de hilos acotado y las llamadas a Gemini se limitan con un semáforo
+por proceso, de modo que un worker puede atender cientos de conversaciones
+en vuelo sin saturar la cuota ni la CPU.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+import asyncio
+import functools
+import threading
+import weakref
+from django.conf import settings
+
+_lock = threading.Lock()
+_executor = None
+_executor_gemini = None
+_semaforos_gemini: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def obtener_executor() -> ThreadPoolExecutor:
+    """Retorna el pool de hilos del proceso para operaciones bloqueantes."""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.EXECUTOR_BLOQUEANTE_HILOS,
+                    thread_name_prefix='bloqueante'
+                )
+    return _executor
+
+
+def obtener_executor_gemini() -> ThreadPoolExecutor:
+    """
+    Retorna el pool de hilos para llamadas síncronas a Gemini con tiempo límite.
+
+    Está separado del pool de ChromaDB: una llamada abandonada por el plazo
+    sigue ocupando su hilo hasta que Gemini responde, y no debe dejar sin
+    hilos a las consultas locales. Su tamaño es ``GEMINI_MAX_CONCURRENCIA``.
+    """
+    global _executor_gemini
+    if _executor_gemini is None:
+        with _lock:
+            if _executor_gemini is None:
+                _executor_gemini = ThreadPoolExecutor(
+                    max_workers=settings.GEMINI_MAX_CONCURRENCIA,
+                    thread_name_prefix='gemini'
+                )
+    return _executor_gemini
+
+
+async def ejecutar_bloqueante(funcion: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Ejecuta una función bloqueante en el pool acotado sin bloquear el event loop.
+
+    Args:
+        funcion: Función a ejecutar.
+        *args, **kwargs: Argumentos de la función.
+
+    Returns:
+        El valor retornado por la función.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        obtener_executor(), functools.partial(funcion, *args, **kwargs)
+    )
+
+
+def semaforo_gemini() -> asyncio.Semaphore:
+    """Retorna el semáforo que limita las llamadas concurrentes a Gemini en el loop actual."""
+    loop = asyncio.get_running_loop()
+    semaforo = _semaforos_gemini.get(loop)
+    if semaforo is None:
+        semaforo = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCIA)
+        _semaforos_gemini[loop] = semaforo
+    return semaforo
+
+
+def reset() -> None:
+    """Detiene los pools de hilos (pruebas o después de un fork)."""
+    global _executor, _executor_gemini
+    with _lock:
+        for executor in (_executor, _executor_gemini):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        _executor = None
+        _executor_gemini = None
+        _semaforos_gemini.clear()
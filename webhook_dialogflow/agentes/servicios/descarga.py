@@ -0,0 +1,278 @@
+"""
+Descarga paralela de archivos JSON desde GCS (o un directorio local).
+
+``DescargadorParalelo`` reparte las descargas en un pool de hilos acotado,
+reintenta cada archivo con espera exponencial y entrega los resultados a
+medida que terminan, de modo que el análisis de un archivo se solapa con la
+descarga de los siguientes. Un archivo que falla no detiene a los demás: su
+resultado trae el error. ``FuenteLocal`` sustituye al bucket por un
+directorio para pruebas y ejecuciones sin red. No depende de Django para
+poder usarse desde los scripts de ingesta.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ArchivoFuente(NamedTuple):
+    """Archivo listado en la fuente con su marca de cambio."""
+    nombre: str
+    generacion: str
+
+
+class ResultadoDescarga(NamedTuple):
+    """Resultado de descargar un archivo; ``contenido`` es None si falló."""
+    nombre: str
+    generacion: str
+    contenido: Optional[bytes]
+    error: Optional[str]
+    intentos: int
+    segundos: float
+
+
+# Clientes de GCS compartidos por proceso: (credenciales, conexiones) -> cliente
+_clientes_gcs: Dict[Any, Any] = {}
+_lock_clientes = threading.Lock()
+
+
+def sesion_gcs(credenciales: Any, max_conexiones: int = 16) -> Any:
+    """
+    Sesión HTTP autenticada con un pool de conexiones del tamaño indicado.
+
+    Args:
+        credenciales: Credenciales de google-auth.
+        max_conexiones: Conexiones simultáneas que mantiene el pool.
+    """
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+    sesion = AuthorizedSession(credenciales)
+    adaptador = HTTPAdapter(pool_connections=max_conexiones, pool_maxsize=max_conexiones)
+    sesion.mount("https://", adaptador)
+    return sesion
+
+
+def obtener_cliente_gcs(credenciales: Optional[str] = None, max_conexiones: int = 16) -> Any:
+    """
+    Retorna un cliente de Storage compartido con un pool de conexiones HTTP
+    dimensionado para las descargas concurrentes.
+
+    La sesión se configura antes de crear el cliente y se le pasa al
+    constructor, en lugar de modificar el transporte interno del cliente.
+
+    Args:
+        credenciales: Ruta al JSON de la cuenta de servicio; None usa las
+            credenciales por defecto del entorno.
+        max_conexiones: Conexiones simultáneas que mantiene el pool.
+    """
+    clave = (credenciales, max_conexiones, os.getpid())
+    cliente = _clientes_gcs.get(clave)
+    if cliente is None:
+        with _lock_clientes:
+            cliente = _clientes_gcs.get(clave)
+            if cliente is None:
+                import google.auth
+                from google.cloud import storage
+                from google.oauth2 import service_account
+                if credenciales:
+                    cuenta = service_account.Credentials.from_service_account_file(
+                        credenciales, scopes=storage.Client.SCOPE
+                    )
+                    proyecto = cuenta.project_id
+                else:
+                    cuenta, proyecto = google.auth.default(scopes=storage.Client.SCOPE)
+                cliente = storage.Client(
+                    project=proyecto, credentials=cuenta, _http=sesion_gcs(cuenta, max_conexiones)
+                )
+                _clientes_gcs[clave] = cliente
+    return cliente
+
+
+class FuenteGCS:
+    """Archivos JSON de un bucket de Google Cloud Storage."""
+
+    def __init__(self, bucket_name: str, cliente: Any = None, credenciales: Optional[str] = None,
+                 max_conexiones: int = 16):
+        self.cliente = cliente or obtener_cliente_gcs(credenciales, max_conexiones)
+        self.bucket = self.cliente.bucket(bucket_name)
+
+    def listar(self, prefijo: str) -> List[ArchivoFuente]:
+        """Lista los archivos ``.json`` bajo el prefijo sin descargarlos."""
+        return [
+            ArchivoFuente(blob.name, str(blob.generation))
+            for blob in self.bucket.list_blobs(prefix=prefijo)
+            if blob.name.endswith('.json')
+        ]
+
+    def descargar(self, archivo: ArchivoFuente) -> bytes:
+        """Descarga exactamente la generación listada del archivo."""
+        generacion = int(archivo.generacion) if archivo.generacion.isdigit() else None
+        return self.bucket.blob(archivo.nombre, generation=generacion).download_as_bytes()
+
+
+class FuenteLocal:
+    """
+    Directorio local que hace las veces de bucket.
+
+    Los nombres son rutas relativas con ``/`` y la generación se deriva del
+    tamaño y la fecha de modificación del archivo.
+    """
+
+    def __init__(self, directorio: str):
+        self.directorio = Path(directorio)
+
+    def listar(self, prefijo: str) -> List[ArchivoFuente]:
+        archivos = []
+        for ruta in sorted(self.directorio.rglob('*.json')):
+            nombre = ruta.relative_to(self.directorio).as_posix()
+            if nombre.startswith(prefijo):
+                estado = ruta.stat()
+                archivos.append(ArchivoFuente(nombre, f"{estado.st_mtime_ns}-{estado.st_size}"))
+        return archivos
+
+    def descargar(self, archivo: ArchivoFuente) -> bytes:
+        return (self.directorio / archivo.nombre).read_bytes()
+
+
+def _es_definitivo(error: Exception) -> bool:
+    # Errores que no mejoran al reintentar (el archivo ya no existe)
+    return isinstance(error, FileNotFoundError) or type(error).__name__ == 'NotFound'
+
+
+class EstadisticasDescarga:
+    """Contadores de progreso y rendimiento de una descarga."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.completados = 0
+        self.errores = 0
+        self.reintentos = 0
+        self.bytes = 0
+        self.inicio = time.perf_counter()
+
+    @property
+    def segundos(self) -> float:
+        return time.perf_counter() - self.inicio
+
+    def resumen(self) -> str:
+        segundos = max(self.segundos, 1e-9)
+        return (
+            f"{self.completados}/{self.total} archivos, {self.errores} errores, "
+            f"{self.reintentos} reintentos, {self.bytes / 1e6:.1f} MB en {segundos:.1f}s "
+            f"({self.completados / segundos:.1f} archivos/s, {self.bytes / 1e6 / segundos:.2f} MB/s)"
+        )
+
+
+class DescargadorParalelo:
+    """Descarga archivos de una fuente con un pool de hilos acotado."""
+
+    def __init__(
+        self,
+        fuente: Any,
+        hilos: int = 8,
+        reintentos: int = 3,
+        espera_base: float = 0.5,
+        progreso: Optional[Callable[[EstadisticasDescarga], None]] = None,
+        intervalo_progreso: int = 25
+    ):
+        """
+        Args:
+            fuente: ``FuenteGCS``, ``FuenteLocal`` o cualquier objeto con
+                ``listar(prefijo)`` y ``descargar(archivo)``.
+            hilos: Descargas simultáneas.
+            reintentos: Reintentos por archivo tras el primer intento.
+            espera_base: Espera inicial entre reintentos (se duplica en cada uno).
+            progreso: Función llamada cada ``intervalo_progreso`` archivos y al final.
+            intervalo_progreso: Archivos entre reportes de progreso.
+        """
+        self.fuente = fuente
+        self.hilos = max(1, hilos)
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.progreso = progreso
+        self.intervalo_progreso = max(1, intervalo_progreso)
+        self.estadisticas: Optional[EstadisticasDescarga] = None
+
+    def _descargar_uno(self, archivo: ArchivoFuente) -> ResultadoDescarga:
+        inicio = time.perf_counter()
+        intento = 0
+        while True:
+            intento += 1
+            try:
+                contenido = self.fuente.descargar(archivo)
+                return ResultadoDescarga(archivo.nombre, archivo.generacion, contenido, None,
+                                         intento, time.perf_counter() - inicio)
+            except Exception as e:
+                if intento > self.reintentos or _es_definitivo(e):
+                    return ResultadoDescarga(archivo.nombre, archivo.generacion, None, str(e),
+                                             intento, time.perf_counter() - inicio)
+                espera = self.espera_base * (2 ** (intento - 1))
+                time.sleep(espera * random.uniform(0.5, 1.5))
+
+    def descargar(self, archivos: Iterable[ArchivoFuente]) -> Iterator[ResultadoDescarga]:
+        """
+        Descarga los archivos y entrega los resultados en orden de llegada.
+
+        Como máximo hay ``2 * hilos`` descargas en vuelo para acotar la
+        memoria aunque el consumidor sea más lento que la red.
+
+        Args:
+            archivos: Archivos a descargar (normalmente de ``fuente.listar``).
+
+        Yields:
+            ``ResultadoDescarga`` por archivo, incluidos los fallidos.
+        """
+        pendientes_por_enviar = list(archivos)
+        self.estadisticas = estadisticas = EstadisticasDescarga(len(pendientes_por_enviar))
+        pendientes_por_enviar.reverse()
+        en_vuelo: "set[Future]" = set()
+
+        with ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='descarga') as executor:
+            try:
+                while pendientes_por_enviar or en_vuelo:
+                    while pendientes_por_enviar and len(en_vuelo) < 2 * self.hilos:
+                        en_vuelo.add(executor.submit(self._descargar_uno, pendientes_por_enviar.pop()))
+                    terminados, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                    for futuro in terminados:
+                        resultado = futuro.result()
+                        estadisticas.completados += 1
+                        estadisticas.reintentos += resultado.intentos - 1
+                        if resultado.error is not None:
+                            estadisticas.errores += 1
+                            logger.error(f"Error descargando {resultado.nombre}: {resultado.error}")
+                        else:
+                            estadisticas.bytes += len(resultado.contenido)
+                        if self.progreso and estadisticas.completados % self.intervalo_progreso == 0:
+                            self.progreso(estadisticas)
+                        yield resultado
+            finally:
+                # Si el consumidor abandona la iteración no se lanzan más descargas
+                for futuro in en_vuelo:
+                    futuro.cancel()
+        if self.progreso and estadisticas.completados % self.intervalo_progreso:
+            self.progreso(estadisticas)
+
+
+def decodificar_json(resultado: ResultadoDescarga) -> Optional[List[Dict[str, Any]]]:
+    """
+    Decodifica el contenido descargado como lista de documentos.
+
+    Returns:
+        Lista de documentos (un objeto suelto se envuelve en lista), o None
+        si la descarga falló o el JSON no es válido.
+    """
+    if resultado.contenido is None:
+        return None
+    try:
+        datos = json.loads(resultado.contenido)
+    except ValueError as e:
+        logger.error(f"Error decodificando {resultado.nombre}: {str(e)}")
+        return None
+    return datos if isinstance(datos, list) else [datos]
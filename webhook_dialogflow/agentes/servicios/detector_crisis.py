@@ -0,0 +1,102 @@
+"""
+Detector local de lenguaje de crisis para el agente de salud mental.
+
+Un léxico curado de frases en español (ideación suicida, autolesión, planes
+o medios, despedidas y violencia inminente) compilado al importar en una sola
+expresión regular sobre el texto normalizado (sin acentos, minúsculas y sin
+puntuación). Detectar cuesta unos microsegundos: se ejecuta antes de la
+extracción de ciudad y, ante una coincidencia, el agente responde al momento
+con los números de emergencia sin esperar a Gemini ni a ChromaDB.
+
+El léxico prefiere frases en primera persona a palabras sueltas
+("suicidarme" y no "suicidio") para no desviar consultas informativas; ante
+la duda se inclina por el falso positivo, cuya respuesta sigue siendo útil.
+Los verbos con usos cotidianos ("cortarme", "morir", "matar") excluyen los
+contextos que los vuelven inofensivos (el pelo, "de la risa", "mi jefe").
+El corpus de verificación está en ``benchmarks/corpus_crisis.py``.
+"""
+from typing import Dict, NamedTuple, Optional, Tuple
+import re
+from .resolutor_ciudades import normalizar_texto
+
+# Contextos que vuelven inofensivo un verbo del léxico ("me corto el pelo",
+# "me quiero morir de la risa", "me va a matar mi jefe si llego tarde")
+_NO_CUERPO = r"(?! (?:el|la|las|los|mi|mis) (?:pelo|cabello|fleco|flequillo|barba|bigote|unas|puntas))"
+_NO_MODISMO = r"(?! de (?:la )?(?:risa|hambre|sueno|frio|calor|verguenza|envidia|aburrimiento|ganas))"
+_NO_HIPERBOLE = r"(?! (?:mi |el |la )?(?:jefe|jefa|maestro|maestra|profe|profesor|profesora|entrenador|entrenadora)\b)"
+_NO_ESFUERZO = r"(?! (?:de|a|trabajando|estudiando|haciendo|por))"
+
+# Categoría -> frases (expresiones regulares sobre texto normalizado)
+LEXICO_CRISIS: Dict[str, Tuple[str, ...]] = {
+    'ideacion_suicida': (
+        r"suicidarme",
+        r"me (?:voy a |quiero |pienso |podria )?suicidar",
+        r"me suicidare",
+        r"(?:pensamientos|ideas|ideacion|intentos?) suicidas?",
+        r"pienso en (?:el )?suicidio",
+        r"(?:me )?(?:quiero|quisiera|deseo|prefiero|necesito) morir(?:me)?" + _NO_MODISMO,
+        r"ganas de morir(?:me)?" + _NO_MODISMO,
+        r"me (?:voy a |quiero |pienso |podria )matar" + _NO_ESFUERZO,
+        r"me (?:mato|matare)" + _NO_ESFUERZO,
+        r"(?:quiero|voy a|pienso(?: en)?|pensando en|pensado en|podria|ganas de) matarme",
+        r"(?:quitarme|me (?:voy a |quiero |pienso |podria )?quitar) la vida",
+        r"(?:acabar|terminar) con (?:mi vida|todo de una vez)",
+        r"no (?:quiero|puedo) (?:seguir )?(?:vivir|viviendo|existir)",
+        r"ya no quiero (?:estar aqui|seguir aqui|despertar)",
+        r"no (?:vale|tiene sentido) (?:la pena )?(?:seguir )?vivir",
+        r"(?:estarian|estaria|estarias) mejor sin mi",
+        r"mejor (?:muerto|muerta)",
+        r"(?:ojala|quisiera) no despertar",
+        r"desaparecer para siempre",
+    ),
+    'autolesion': (
+        r"(?:cortarme|me corto|me estoy cortando|me volvi a cortar)" + _NO_CUERPO,
+        r"(?:lastimarme|me lastimo|me estoy lastimando)",
+        r"(?:hacerme|me hago|me estoy haciendo) dano",
+        r"(?:autolesionarme|me autolesiono|me estoy autolesionando)",
+        r"(?:quemarme|me quemo) (?:a proposito|los brazos|la piel)",
+    ),
+    'plan_o_medios': (
+        r"tomarme (?:todas )?las pastillas",
+        r"(?:pastillas|veneno|cuerda|soga|pistola|arma) para (?:morir|matarme)",
+        r"(?:tirarme|aventarme|lanzarme|me (?:voy a |quiero |pienso |podria )?(?:tirar|aventar|lanzar)) "
+        r"(?:de|del|desde) (?:un |el |la )?(?:puente|edificio|techo|azotea|balcon)",
+        r"(?:colgarme|ahorcarme|dispararme|envenenarme)",
+        r"(?:escribi|escribiendo|dejar|deje) (?:una |mi )?carta de despedida",
+        r"despedirme de (?:todos|mi familia|ustedes)",
+    ),
+    'violencia_inminente': (
+        r"me (?:quiere|va a|amenazo con|amenaza con) matar(?:me)?" + _NO_HIPERBOLE,
+        r"me esta (?:golpeando|pegando)",
+    ),
+}
+
+
+def _compilar(lexico: Dict[str, Tuple[str, ...]]) -> "re.Pattern[str]":
+    grupos = (f"(?P<{categoria}>{'|'.join(frases)})" for categoria, frases in lexico.items())
+    return re.compile(r"\b(?:" + "|".join(grupos) + r")\b")
+
+
+_PATRON_CRISIS = _compilar(LEXICO_CRISIS)
+
+
+class DeteccionCrisis(NamedTuple):
+    """Coincidencia del detector: categoría del léxico y frase encontrada."""
+    categoria: str
+    frase: str
+
+
+def detectar_crisis(texto: str) -> Optional[DeteccionCrisis]:
+    """
+    Busca lenguaje de crisis en la consulta.
+
+    Args:
+        texto: Consulta del usuario tal como llega del webhook.
+
+    Returns:
+        La primera coincidencia, o None si no hay ninguna.
+    """
+    coincidencia = _PATRON_CRISIS.search(normalizar_texto(texto))
+    if coincidencia is None:
+        return None
+    return DeteccionCrisis(coincidencia.lastgroup, coincidencia.group(0))
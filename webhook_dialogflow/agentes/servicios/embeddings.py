@@ -0,0 +1,153 @@
+"""
+Etapa explícita de cálculo de embeddings para la ingesta.
+
+Los textos se dividen en lotes que se reparten entre un pool de procesos;
+cada proceso carga su propia instancia del modelo de embeddings (la misma
+función que usan las colecciones), de modo que la ingesta escala con el
+número de núcleos. Los vectores se pasan a ChromaDB con
+``embeddings=`` y la colección no vuelve a calcularlos. No depende de Django
+para poder usarse desde los scripts de ingesta.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import logging
+import multiprocessing
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# 'chromadb': all-MiniLM-L6-v2 en fp32, la función por defecto de ChromaDB.
+# 'onnx_int8': el mismo modelo cuantizado a int8 (embeddings_onnx).
+FUNCIONES_EMBEDDING = ('chromadb', 'onnx_int8')
+
+# Función de embeddings del proceso worker (se crea una vez por proceso)
+_funcion_worker = None
+
+
+def crear_funcion_embedding(
+    funcion: str = 'chromadb',
+    directorio_modelo: Optional[str] = None,
+    hilos: int = 1,
+    tamano_lote: int = 32
+) -> Callable[[List[str]], Sequence[Sequence[float]]]:
+    """
+    Función de embeddings de las colecciones.
+
+    Args:
+        funcion: Una de ``FUNCIONES_EMBEDDING``.
+        directorio_modelo: Directorio del modelo int8 (solo 'onnx_int8').
+        hilos: Hilos intra-op de ONNX Runtime (solo 'onnx_int8').
+        tamano_lote: Textos por llamada al modelo (solo 'onnx_int8').
+    """
+    if funcion == 'onnx_int8':
+        from .embeddings_onnx import FuncionEmbeddingONNX
+        return FuncionEmbeddingONNX(directorio_modelo, hilos=hilos, tamano_lote=tamano_lote)
+    if funcion != 'chromadb':
+        raise ValueError(f"Función de embeddings desconocida: {funcion} "
+                         f"(opciones: {', '.join(FUNCIONES_EMBEDDING)})")
+    from chromadb.utils import embedding_functions
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+def _inicializar_worker(opciones: Dict[str, Any]) -> None:
+    global _funcion_worker
+    _funcion_worker = crear_funcion_embedding(**opciones)
+
+
+def _embeber_lote(textos: List[str]) -> List[List[float]]:
+    return [[float(x) for x in vector] for vector in _funcion_worker(textos)]
+
+
+class EtapaEmbeddings:
+    """
+    Calcula embeddings por lotes, en paralelo entre procesos.
+
+    El pool se crea en el primer uso y se reutiliza entre colecciones;
+    usar como context manager (o llamar a ``cerrar``) para liberarlo.
+    """
+
+    def __init__(
+        self,
+        procesos: Optional[int] = None,
+        tamano_lote: int = 64,
+        funcion: Optional[Callable[[List[str]], Sequence[Sequence[float]]]] = None,
+        opciones: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Args:
+            procesos: Procesos del pool; None usa todos los núcleos y 1 (o
+                menos) calcula en el proceso actual.
+            tamano_lote: Textos por lote enviado a cada proceso.
+            funcion: Función de embeddings para el modo en proceso (por
+                defecto, la que crean ``opciones``).
+            opciones: Argumentos de ``crear_funcion_embedding`` en cada
+                proceso (por defecto, la función de ChromaDB).
+        """
+        self.procesos = procesos if procesos is not None else (os.cpu_count() or 1)
+        self.tamano_lote = max(1, tamano_lote)
+        self._funcion = funcion
+        self.opciones = dict(opciones or {})
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.documentos = 0
+        self.segundos = 0.0
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # 'spawn' evita heredar el estado del runtime del modelo con fork
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_inicializar_worker,
+                initargs=(self.opciones,)
+            )
+        return self._pool
+
+    def embeber(self, textos: Sequence[str]) -> List[List[float]]:
+        """
+        Calcula los embeddings de los textos conservando su orden.
+
+        Args:
+            textos: Textos a convertir.
+
+        Returns:
+            Un vector por texto.
+        """
+        if not textos:
+            return []
+        inicio = time.perf_counter()
+        lotes = [list(textos[i:i + self.tamano_lote]) for i in range(0, len(textos), self.tamano_lote)]
+
+        if self.procesos <= 1 or len(lotes) == 1:
+            if self._funcion is None:
+                self._funcion = crear_funcion_embedding(**self.opciones)
+            vectores = [[float(x) for x in v] for lote in lotes for v in self._funcion(lote)]
+        else:
+            vectores = [v for lote in self._obtener_pool().map(_embeber_lote, lotes) for v in lote]
+
+        self.documentos += len(textos)
+        self.segundos += time.perf_counter() - inicio
+        return vectores
+
+    @property
+    def documentos_por_segundo(self) -> float:
+        return self.documentos / self.segundos if self.segundos else 0.0
+
+    def resumen(self) -> str:
+        return (
+            f"{self.documentos} documentos embebidos en {self.segundos:.1f}s "
+            f"({self.documentos_por_segundo:.1f} docs/s, {self.procesos} procesos, "
+            f"lotes de {self.tamano_lote}, función {self.opciones.get('funcion', 'chromadb')})"
+        )
+
+    def cerrar(self) -> None:
+        """Libera el pool de procesos."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self) -> "EtapaEmbeddings":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.cerrar()
@@ -0,0 +1,246 @@
+"""
+Función de embeddings ONNX cuantizada a int8 con pesos compartidos.
+
+Es el mismo modelo que la función por defecto de ChromaDB (all-MiniLM-L6-v2
+exportado a ONNX), con los pesos de las capas lineales cuantizados a int8
+por ``preparar_modelo`` (``scripts/cuantizar_embeddings.py``). El directorio
+del modelo contiene:
+
+- ``modelo_int8.onnx``: el grafo, con los pesos como datos externos.
+- ``pesos.bin`` y ``pesos.json``: los pesos contiguos y alineados, y su
+  índice (dtype, forma y desplazamiento de cada tensor).
+- ``tokenizer.json``: el tokenizador del modelo original.
+
+``pesos.bin`` se mapea en memoria una vez por proceso y cada sesión de ONNX
+Runtime recibe sus tensores con ``add_initializer``, sin copiarlos (el
+pre-empaquetado de pesos se desactiva para que no se dupliquen). Con
+``preload_app`` el mapa se abre en el maestro de gunicorn y los workers lo
+heredan; sin él, todos los procesos comparten las mismas páginas de la caché
+del sistema de archivos. La sesión, con su pool de hilos, no sobrevive a un
+fork y se crea en cada proceso en el primer uso.
+
+A diferencia de la función de ChromaDB, que rellena cada texto hasta 256
+tokens, los lotes se ordenan por longitud y se rellenan solo hasta el texto
+más largo del lote. No depende de Django.
+"""
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import json
+import logging
+import os
+import shutil
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_MODELO = 'modelo_int8.onnx'
+ARCHIVO_PESOS = 'pesos.bin'
+ARCHIVO_INDICE = 'pesos.json'
+ARCHIVO_TOKENIZADOR = 'tokenizer.json'
+
+# Directorio del modelo fp32 que descarga la función por defecto de ChromaDB
+MODELO_CHROMADB = os.path.join(os.path.expanduser('~'), '.cache', 'chroma', 'onnx_models', 'all-MiniLM-L6-v2', 'onnx')
+
+# Máximo de tokens por texto (el mismo que usa ChromaDB)
+MAX_TOKENS = 256
+# Alineación de cada tensor dentro de pesos.bin (una página)
+ALINEACION = 4096
+# Tensores más pequeños que esto se quedan dentro del grafo
+TAMANO_MINIMO_COMPARTIDO = 1024
+
+# ruta de pesos.bin -> (mapa, índice); se hereda tras un fork
+_pesos: Dict[str, Tuple[np.memmap, Dict[str, Any]]] = {}
+_lock_pesos = threading.Lock()
+
+
+def preparar_modelo(origen: str = MODELO_CHROMADB, destino: str = './data/modelo_embeddings') -> Dict[str, Any]:
+    """
+    Cuantiza a int8 un modelo ONNX fp32 y separa sus pesos en un archivo compartible.
+
+    Requiere los paquetes ``onnx`` y ``onnxruntime`` (solo para preparar).
+
+    Args:
+        origen: Directorio con ``model.onnx`` y ``tokenizer.json`` en fp32.
+        destino: Directorio del modelo cuantizado.
+
+    Returns:
+        Resumen con el tamaño de ambos modelos y el número de tensores compartidos.
+    """
+    import onnx
+    from onnx import numpy_helper
+    from onnx.external_data_helper import set_external_data
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(destino, exist_ok=True)
+    cuantizado = os.path.join(destino, ARCHIVO_MODELO + '.tmp')
+    quantize_dynamic(os.path.join(origen, 'model.onnx'), cuantizado, weight_type=QuantType.QInt8)
+    modelo = onnx.load(cuantizado)
+
+    indice = {}
+    desplazamiento = 0
+    ruta_pesos = os.path.join(destino, ARCHIVO_PESOS)
+    with open(ruta_pesos + '.tmp', 'wb') as archivo:
+        for tensor in modelo.graph.initializer:
+            arreglo = np.ascontiguousarray(numpy_helper.to_array(tensor))
+            if arreglo.nbytes < TAMANO_MINIMO_COMPARTIDO:
+                continue
+            relleno = -desplazamiento % ALINEACION
+            archivo.write(b'\0' * relleno)
+            desplazamiento += relleno
+            archivo.write(arreglo.tobytes())
+            indice[tensor.name] = {
+                'dtype': arreglo.dtype.str,
+                'forma': list(arreglo.shape),
+                'desplazamiento': desplazamiento,
+            }
+            # El grafo sigue siendo un ONNX válido: el tensor apunta a pesos.bin
+            tensor.CopyFrom(numpy_helper.from_array(arreglo, tensor.name))
+            set_external_data(tensor, ARCHIVO_PESOS, offset=desplazamiento, length=arreglo.nbytes)
+            tensor.ClearField('raw_data')
+            tensor.data_location = onnx.TensorProto.EXTERNAL
+            desplazamiento += arreglo.nbytes
+
+    with open(os.path.join(destino, ARCHIVO_INDICE + '.tmp'), 'w') as archivo:
+        json.dump(indice, archivo)
+    onnx.save(modelo, os.path.join(destino, ARCHIVO_MODELO + '.grafo'))
+    shutil.copyfile(os.path.join(origen, 'tokenizer.json'), os.path.join(destino, ARCHIVO_TOKENIZADOR))
+    # Reemplazar al final para no dejar un modelo a medias
+    os.replace(ruta_pesos + '.tmp', ruta_pesos)
+    os.replace(os.path.join(destino, ARCHIVO_INDICE + '.tmp'), os.path.join(destino, ARCHIVO_INDICE))
+    os.replace(os.path.join(destino, ARCHIVO_MODELO + '.grafo'), os.path.join(destino, ARCHIVO_MODELO))
+    os.remove(cuantizado)
+
+    return {
+        'bytes_fp32': os.path.getsize(os.path.join(origen, 'model.onnx')),
+        'bytes_int8': os.path.getsize(ruta_pesos) + os.path.getsize(os.path.join(destino, ARCHIVO_MODELO)),
+        'tensores_compartidos': len(indice),
+    }
+
+
+def _pesos_compartidos(directorio: str) -> Tuple[np.memmap, Dict[str, Any]]:
+    """Mapa en memoria de ``pesos.bin`` y su índice, abiertos una vez por proceso."""
+    ruta = os.path.abspath(os.path.join(directorio, ARCHIVO_PESOS))
+    with _lock_pesos:
+        if ruta not in _pesos:
+            with open(os.path.join(directorio, ARCHIVO_INDICE)) as archivo:
+                indice = json.load(archivo)
+            _pesos[ruta] = (np.memmap(ruta, dtype=np.uint8, mode='r'), indice)
+        return _pesos[ruta]
+
+
+class _Sesion(NamedTuple):
+    pid: int
+    sesion: Any
+    tokenizador: Any
+    entradas: Tuple[str, ...]
+
+
+class FuncionEmbeddingONNX:
+    """
+    Función de embeddings compatible con ChromaDB (``__call__(textos)``).
+
+    La sesión de ONNX Runtime admite llamadas concurrentes, así que una
+    instancia se comparte entre hilos.
+    """
+
+    def __init__(self, directorio: str, hilos: int = 1, tamano_lote: int = 32):
+        """
+        Args:
+            directorio: Directorio del modelo preparado con ``preparar_modelo``.
+            hilos: Hilos intra-op de ONNX Runtime por proceso. Con varios
+                workers, 1 evita que compitan por los núcleos.
+            tamano_lote: Textos por llamada al modelo.
+        """
+        self.directorio = directorio
+        self.hilos = max(1, hilos)
+        self.tamano_lote = max(1, tamano_lote)
+        self._lock = threading.Lock()
+        self._sesion: Optional[_Sesion] = None
+        # Abrir el mapa ya (en el maestro, si se construye antes del fork)
+        mapa, indice = _pesos_compartidos(directorio)
+        self._valores = self._valores_compartidos(mapa, indice)
+
+    @staticmethod
+    def _valores_compartidos(mapa: np.memmap, indice: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        import onnxruntime as ort
+        valores = []
+        for nombre, tensor in indice.items():
+            dtype = np.dtype(tensor['dtype'])
+            tamano = int(np.prod(tensor['forma'], dtype=np.int64)) * dtype.itemsize
+            inicio = tensor['desplazamiento']
+            arreglo = mapa[inicio:inicio + tamano].view(dtype).reshape(tensor['forma'])
+            # OrtValue sobre la memoria del mapa, sin copia
+            valores.append((nombre, ort.OrtValue.ortvalue_from_numpy(arreglo)))
+        return valores
+
+    def _obtener_sesion(self) -> _Sesion:
+        sesion = self._sesion
+        if sesion is not None and sesion.pid == os.getpid():
+            return sesion
+        with self._lock:
+            if self._sesion is None or self._sesion.pid != os.getpid():
+                self._sesion = self._crear_sesion()
+            return self._sesion
+
+    def _crear_sesion(self) -> _Sesion:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        opciones = ort.SessionOptions()
+        opciones.intra_op_num_threads = self.hilos
+        opciones.inter_op_num_threads = 1
+        opciones.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # Los pesos pre-empaquetados serían una copia privada por proceso
+        opciones.add_session_config_entry('session.disable_prepacking', '1')
+        for nombre, valor in self._valores:
+            opciones.add_initializer(nombre, valor)
+        sesion = ort.InferenceSession(
+            os.path.join(self.directorio, ARCHIVO_MODELO), opciones, providers=['CPUExecutionProvider']
+        )
+
+        tokenizador = Tokenizer.from_file(os.path.join(self.directorio, ARCHIVO_TOKENIZADOR))
+        tokenizador.enable_truncation(max_length=MAX_TOKENS)
+        tokenizador.enable_padding(pad_id=0, pad_token="[PAD]")
+        entradas = tuple(entrada.name for entrada in sesion.get_inputs())
+        logger.info(f"Modelo de embeddings int8 cargado en el proceso {os.getpid()} ({self.hilos} hilos)")
+        return _Sesion(os.getpid(), sesion, tokenizador, entradas)
+
+    def _embeber_lote(self, sesion: _Sesion, textos: List[str]) -> np.ndarray:
+        codificados = sesion.tokenizador.encode_batch(textos)
+        ids = np.array([c.ids for c in codificados], dtype=np.int64)
+        mascara = np.array([c.attention_mask for c in codificados], dtype=np.int64)
+        valores = {'input_ids': ids, 'attention_mask': mascara, 'token_type_ids': np.zeros_like(ids)}
+        estados = sesion.sesion.run(None, {nombre: valores[nombre] for nombre in sesion.entradas})[0]
+        # Promedio de los tokens reales y normalización L2, como ChromaDB
+        peso = mascara[:, :, None].astype(np.float32)
+        vectores = (estados * peso).sum(axis=1) / np.clip(peso.sum(axis=1), 1e-9, None)
+        normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+        normas[normas == 0] = 1e-12
+        return (vectores / normas).astype(np.float32)
+
+    def embeber(self, textos: Sequence[str]) -> np.ndarray:
+        """
+        Calcula los embeddings por lotes conservando el orden.
+
+        Args:
+            textos: Textos a convertir.
+
+        Returns:
+            Matriz float32 de un vector normalizado por texto.
+        """
+        if not textos:
+            return np.zeros((0, 0), dtype=np.float32)
+        sesion = self._obtener_sesion()
+        # Lotes de longitudes parecidas: menos relleno por lote
+        orden = sorted(range(len(textos)), key=lambda i: len(textos[i]))
+        resultado = None
+        for desde in range(0, len(orden), self.tamano_lote):
+            posiciones = orden[desde:desde + self.tamano_lote]
+            vectores = self._embeber_lote(sesion, [textos[i] for i in posiciones])
+            if resultado is None:
+                resultado = np.empty((len(textos), vectores.shape[1]), dtype=np.float32)
+            resultado[posiciones] = vectores
+        return resultado
+
+    def __call__(self, textos: Sequence[str]) -> List[List[float]]:
+        return self.embeber(textos).tolist()
@@ -0,0 +1,90 @@
+"""
+Estado de conversación por sesión de Dialogflow.
+
+Dialogflow envía el mismo ``session`` en cada turno de una conversación. Por
+sesión y agente se guarda la ciudad resuelta y el id del documento
+recuperado; un turno de seguimiento sin ciudad ("¿Y restaurantes?") los
+reutiliza y pasa directo a la generación, sin extracción ni búsqueda. Un
+turno con otras palabras solo los reutiliza si la extracción con Gemini
+confirma que no nombra ninguna ciudad.
+
+El estado vive en un backend de ``backends_cache`` con TTL y número máximo
+de sesiones: ``memoria`` (por worker) o ``sqlite`` (compartido entre
+workers, necesario cuando los turnos de una sesión caen en workers
+distintos).
+"""
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+import logging
+from .backends_cache import crear_backend
+from .indice_ciudades import ciudad_documento
+from .ingesta import id_documento
+
+logger = logging.getLogger(__name__)
+
+
+class EstadoConversacion(NamedTuple):
+    """Ciudad y documento del último turno resuelto de una sesión."""
+    ciudad: str
+    id_documento: str
+
+
+class EstadoSesiones:
+    """Estado de conversación de ambos agentes, indexado por (agente, sesión)."""
+
+    def __init__(self, politica: Dict[str, Any]):
+        """
+        Args:
+            politica: Configuración de ``settings.ESTADO_SESION``: ``ttl``
+                (segundos sin turnos tras los que se olvida la sesión),
+                ``max_entradas``, ``backend`` y sus opciones.
+        """
+        self.ttl = politica.get('ttl', 1800)
+        self.backend = crear_backend(politica, 'sesiones')
+
+    def _clave(self, agente: str, sesion: str) -> str:
+        return f"{agente}|{sesion}"
+
+    def obtener(self, agente: str, sesion: str) -> Optional[EstadoConversacion]:
+        """
+        Retorna el estado de la sesión, o None si no hay o expiró.
+
+        Args:
+            agente: 'turismo' o 'salud_mental'.
+            sesion: Campo ``session`` de la petición de Dialogflow.
+        """
+        try:
+            valor = self.backend.obtener(self._clave(agente, sesion))
+        except Exception as e:
+            logger.error(f"Error leyendo estado de sesión ({agente}): {str(e)}")
+            return None
+        if not valor:
+            return None
+        return EstadoConversacion(valor.get('ciudad', ''), valor.get('id_documento', ''))
+
+    def recordar(self, agente: str, sesion: str, coleccion: str, city_data: Mapping[str, Any]) -> None:
+        """
+        Guarda la ciudad y el documento recuperados en el turno actual.
+
+        Cada turno renueva el TTL de la sesión.
+
+        Args:
+            agente: 'turismo' o 'salud_mental'.
+            sesion: Campo ``session`` de la petición de Dialogflow.
+            coleccion: Colección de la que proviene el documento.
+            city_data: Documento recuperado.
+        """
+        ciudad = ciudad_documento(city_data)
+        if not ciudad:
+            return
+        valor = {'ciudad': ciudad, 'id_documento': id_documento(coleccion, {'ciudad': ciudad})}
+        try:
+            self.backend.guardar(self._clave(agente, sesion), valor, self.ttl)
+        except Exception as e:
+            logger.error(f"Error escribiendo estado de sesión ({agente}): {str(e)}")
+
+    def olvidar(self, agente: str, sesion: str) -> None:
+        """Elimina el estado de una sesión."""
+        try:
+            self.backend.eliminar(self._clave(agente, sesion))
+        except Exception as e:
+            logger.error(f"Error eliminando estado de sesión ({agente}): {str(e)}")
@@ -1,18 +1,23 @@
 import json
 from typing import List, Dict, Any
-from google.cloud import storage
 from django.conf import settings
 import os
+import logging
+from .descarga import DescargadorParalelo, FuenteGCS, obtener_cliente_gcs
+
+logger = logging.getLogger(__name__)
 
 class ServicioGCS:
     def __init__(self):
-        """Inicializa el cliente de Google Cloud Storage."""
+        """Inicializa el cliente de Google Cloud Storage (compartido en el proceso)."""
         if not os.path.exists(settings.GCP_SERVICE_ACCOUNT_PATH):
             raise Exception(f"No se encontró el archivo de credenciales en: {settings.GCP_SERVICE_ACCOUNT_PATH}")
-        self.cliente = storage.Client.from_service_account_json(
-            settings.GCP_SERVICE_ACCOUNT_PATH
+        self.cliente = obtener_cliente_gcs(
+            settings.GCP_SERVICE_ACCOUNT_PATH,
+            max_conexiones=settings.GCS_DESCARGA_HILOS
         )
         self.bucket = self.cliente.get_bucket(settings.GCP_BUCKET_NAME)
+        self.fuente = FuenteGCS(settings.GCP_BUCKET_NAME, cliente=self.cliente)
 
     def listar_archivos(self, prefijo: str) -> List[str]:
         """
@@ -45,22 +50,34 @@ class ServicioGCS:
         """
         Carga todos los documentos JSON de una carpeta específica.
 
+        Los archivos se descargan en paralelo; un archivo que falla se omite
+        sin detener la carga del resto.
+
         Args:
             carpeta: Nombre de la carpeta en el bucket.
 
         Returns:
-            Lista de documentos cargados.
+            Lista de documentos cargados, en el orden del listado.
         """
-        documentos = []
-        archivos = self.listar_archivos(carpeta)
+        archivos = self.fuente.listar(carpeta)
+        descargador = DescargadorParalelo(
+            self.fuente,
+            hilos=settings.GCS_DESCARGA_HILOS,
+            reintentos=settings.GCS_DESCARGA_REINTENTOS
+        )
 
-        for archivo in archivos:
+        por_archivo = {}
+        for resultado in descargador.descargar(archivos):
+            if resultado.contenido is None:
+                logger.warning(f"Error al cargar {resultado.nombre}: {resultado.error}")
+                continue
             try:
-                documento = self.descargar_json(archivo)
-                documento['fuente'] = archivo
+                documento = json.loads(resultado.contenido)
+                documento['fuente'] = resultado.nombre
                 documento['categoria'] = carpeta
-                documentos.append(documento)
+                por_archivo[resultado.nombre] = documento
             except Exception as e:
-                print(f"Error al cargar {archivo}: {str(e)}")
+                logger.warning(f"Error al cargar {resultado.nombre}: {str(e)}")
 
-        return documentos
\ No newline at end of file
+        logger.info(f"Carga de {carpeta}: {descargador.estadisticas.resumen()}")
+        return [por_archivo[a.nombre] for a in archivos if a.nombre in por_archivo]
@@ -1,13 +1,11 @@
-import google.generativeai as genai
-from django.conf import settings
 from typing import Dict, Any, Optional, List
 import json
+from .registro import registro
 
 class ServicioGemini:
     def __init__(self):
-        """Inicializa el cliente de Gemini AI."""
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        """Usa el cliente de Gemini compartido del proceso (y su interruptor de circuito)."""
+        self.model = registro.obtener_modelo()
         
     def generate_response(self, 
                          prompt: str, 
@@ -30,7 +28,7 @@ class ServicioGemini:
         # Si hay historial, usar chat
         if history:
             chat = self.model.start_chat(history=history)
-            response = chat.send_message(full_prompt)
+            response = self.model.llamar(chat.send_message, full_prompt)
         else:
             response = self.model.generate_content(full_prompt)
             
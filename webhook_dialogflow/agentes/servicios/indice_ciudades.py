@@ -0,0 +1,125 @@
+"""
+Índice exacto en memoria de ciudad normalizada -> documento.
+
+Responde en O(1) las búsquedas por ciudad que antes requerían una consulta
+filtrada a ChromaDB (embedding + búsqueda ANN) y se reconstruye solo cuando
+cambia la versión de datos de las colecciones.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+import logging
+import threading
+import time
+from .chromadb_service import ServicioChromaDB
+from .resolutor_ciudades import normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+COLECCIONES = ("destinos_turisticos", "salud_mental")
+
+
+def ciudad_documento(doc: Mapping[str, Any]) -> str:
+    """Retorna el nombre de ciudad de un documento (campo propio o metadatos)."""
+    return doc.get("ciudad") or (doc.get("_metadata") or {}).get("ciudad", "")
+
+
+def misma_ciudad(doc: Optional[Mapping[str, Any]], ciudad: str) -> bool:
+    """Indica si un documento corresponde a la ciudad dada (sin acentos ni mayúsculas)."""
+    return doc is not None and normalizar_texto(ciudad_documento(doc)) == normalizar_texto(ciudad)
+
+
+class IndiceCiudades:
+    def __init__(
+        self,
+        chroma_db: ServicioChromaDB,
+        colecciones: Iterable[str] = COLECCIONES,
+        intervalo_verificacion: float = 5.0
+    ):
+        """
+        Inicializa y construye el índice.
+
+        Args:
+            chroma_db: Cliente de ChromaDB del que se leen las colecciones.
+            colecciones: Colecciones a indexar.
+            intervalo_verificacion: Segundos mínimos entre comprobaciones de versión.
+        """
+        self.chroma_db = chroma_db
+        self.colecciones = tuple(colecciones)
+        self.intervalo_verificacion = intervalo_verificacion
+        self.version = None
+        self._indices: Dict[str, Dict[str, Mapping[str, Any]]] = {}
+        self._suscriptores: List[Callable[[List[str]], None]] = []
+        self._lock = threading.Lock()
+        self._ultima_verificacion = 0.0
+        self.construir()
+
+    def construir(self) -> None:
+        """Reconstruye el índice de todas las colecciones desde ChromaDB."""
+        with self._lock:
+            self.chroma_db.sincronizar()
+            version = self.chroma_db.version_datos()
+            indices = {}
+            for coleccion in self.colecciones:
+                indice = {}
+                for doc in self.chroma_db.obtener_documentos(coleccion):
+                    clave = normalizar_texto(ciudad_documento(doc))
+                    if clave:
+                        indice.setdefault(clave, doc)
+                indices[coleccion] = indice
+
+            self._indices = indices
+            self.version = version
+            self._ultima_verificacion = time.monotonic()
+            logger.info(
+                "Índice de ciudades construido: "
+                + ", ".join(f"{c}={len(i)}" for c, i in indices.items())
+            )
+
+        ciudades = self.ciudades()
+        for suscriptor in self._suscriptores:
+            try:
+                suscriptor(ciudades)
+            except Exception as e:
+                logger.error(f"Error notificando reconstrucción del índice: {str(e)}")
+
+    def suscribir(self, callback: Callable[[List[str]], None]) -> None:
+        """
+        Registra una función que recibe la lista de ciudades tras cada reconstrucción.
+
+        Args:
+            callback: Función a invocar con los nombres de ciudad indexados.
+        """
+        self._suscriptores.append(callback)
+
+    def ciudades(self) -> List[str]:
+        """Retorna los nombres de ciudad indexados en todas las colecciones."""
+        # dict.fromkeys conserva el orden de aparición y elimina duplicados en O(n)
+        return list(dict.fromkeys(
+            ciudad_documento(doc) for indice in self._indices.values() for doc in indice.values()
+        ))
+
+    def _verificar_version(self) -> None:
+        """Reconstruye el índice si la versión de datos cambió (con limitación de frecuencia)."""
+        ahora = time.monotonic()
+        if ahora - self._ultima_verificacion < self.intervalo_verificacion:
+            return
+        self._ultima_verificacion = ahora
+        if self.chroma_db.version_datos() != self.version:
+            logger.info("Colecciones repobladas, reconstruyendo índice de ciudades")
+            self.construir()
+
+    def buscar(self, nombre_coleccion: str, ciudad: str) -> Optional[Mapping[str, Any]]:
+        """
+        Busca el documento de una ciudad por nombre exacto (sin acentos ni mayúsculas).
+
+        Args:
+            nombre_coleccion: Nombre de la colección.
+            ciudad: Nombre de la ciudad.
+
+        Returns:
+            Documento de la ciudad o None si no está indexada.
+        """
+        try:
+            self._verificar_version()
+        except Exception as e:
+            logger.error(f"Error verificando versión del índice: {str(e)}")
+        return self._indices.get(nombre_coleccion, {}).get(normalizar_texto(ciudad))
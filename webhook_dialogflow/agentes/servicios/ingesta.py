@@ -0,0 +1,337 @@
+"""
+Identificadores estables, hashes de contenido y manifiesto de ingesta.
+
+Los documentos se identifican por su colección y su ciudad normalizada, de
+modo que el id no depende del orden en que llegan. Cada registro guarda en
+sus metadatos el hash de su contenido; junto con el manifiesto de ingesta
+(hashes por documento y generación de cada archivo de origen en GCS) permite
+insertar o eliminar solo lo que cambió. No depende de Django para poder
+usarse desde los scripts de ingesta.
+"""
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Set
+import hashlib
+import json
+import os
+from datetime import datetime
+from .prompts import VERSION_CONTEXTO, metadatos_contexto
+from .resolutor_ciudades import normalizar_texto
+
+ARCHIVO_MANIFIESTO = 'manifiesto_ingesta.json'
+
+PREFIJOS_ID = {
+    "destinos_turisticos": "destino",
+    "salud_mental": "salud",
+}
+
+TIPOS = {
+    "destinos_turisticos": "turismo",
+    "salud_mental": "salud_mental",
+}
+
+# Texto sobre el que se calcula el embedding de cada documento. Es también
+# el ``document`` que guarda ChromaDB; el documento completo va al almacén.
+TEXTO_DOCUMENTO = 'documento'  # el documento JSON completo (comportamiento histórico)
+TEXTO_RESUMEN = 'resumen'      # ciudad, resumen y entidades clave
+MODOS_TEXTO = (TEXTO_DOCUMENTO, TEXTO_RESUMEN)
+
+CAMPOS_RESUMEN = {
+    "destinos_turisticos": ("informacion_turistica", "resumen_turistico"),
+    "salud_mental": ("informacion_salud_mental", "resumen_salud_mental"),
+}
+
+# Entidades de ``campos_extraidos`` que se añaden al resumen (las primeras de cada lista)
+ENTIDADES_CLAVE = {
+    "destinos_turisticos": ("lugares_turisticos", "actividades", "comida_tipica"),
+    "salud_mental": ("centros_locales", "servicios_gratuitos", "organizaciones_apoyo"),
+}
+MAX_ENTIDADES = 5
+
+
+class Registro(NamedTuple):
+    """Documento listo para escribirse en ChromaDB."""
+    id: str
+    documento: str
+    metadata: Dict[str, Any]
+    hash: str
+    texto: str
+
+
+def id_documento(nombre_coleccion: str, dato: Mapping[str, Any]) -> str:
+    """
+    Id estable derivado de la colección y la ciudad normalizada.
+
+    Args:
+        nombre_coleccion: Colección destino.
+        dato: Documento con campo ``ciudad``.
+    """
+    prefijo = PREFIJOS_ID.get(nombre_coleccion, "doc")
+    ciudad = normalizar_texto(str(dato.get("ciudad", "")))
+    return f"{prefijo}_{hashlib.sha1(ciudad.encode('utf-8')).hexdigest()[:16]}"
+
+
+def hash_documento(dato: Mapping[str, Any], modo_texto: str = TEXTO_DOCUMENTO) -> str:
+    """
+    Hash del contenido del documento (independiente del orden de las claves).
+
+    Incluye la versión del contexto precompilado y el modo de texto del
+    embedding para que un cambio de formato vuelva a escribir el registro.
+    """
+    canonico = json.dumps(dato, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{VERSION_CONTEXTO}|{modo_texto}|{canonico}".encode('utf-8')).hexdigest()
+
+
+def texto_embedding(nombre_coleccion: str, dato: Mapping[str, Any], documento: str,
+                    modo_texto: str = TEXTO_DOCUMENTO) -> str:
+    """
+    Texto del documento sobre el que se calcula el embedding.
+
+    Args:
+        nombre_coleccion: Colección destino.
+        dato: Documento de origen.
+        documento: Documento serializado (se usa en modo ``documento`` o si falta el resumen).
+        modo_texto: Uno de ``MODOS_TEXTO``.
+    """
+    if modo_texto == TEXTO_RESUMEN and nombre_coleccion in CAMPOS_RESUMEN:
+        seccion, campo = CAMPOS_RESUMEN[nombre_coleccion]
+        info = dato.get(seccion) or {}
+        resumen = info.get(campo)
+        if resumen:
+            partes = [f"{dato.get('ciudad', '')}. {resumen}"]
+            campos = info.get("campos_extraidos") or {}
+            for entidad in ENTIDADES_CLAVE.get(nombre_coleccion, ()):
+                valores = [str(v) for v in (campos.get(entidad) or [])[:MAX_ENTIDADES]]
+                if valores:
+                    partes.append(f"{entidad.replace('_', ' ').capitalize()}: {', '.join(valores)}.")
+            return " ".join(partes)
+    return documento
+
+
+def registro_documento(nombre_coleccion: str, dato: Mapping[str, Any],
+                       modo_texto: str = TEXTO_DOCUMENTO) -> Registro:
+    """
+    Construye el registro (id, documento, metadatos, hash, texto) de un documento.
+
+    Args:
+        nombre_coleccion: Colección destino.
+        dato: Documento de origen.
+        modo_texto: Texto a embeber (uno de ``MODOS_TEXTO``).
+    """
+    hash_contenido = hash_documento(dato, modo_texto)
+    documento = json.dumps(dato, ensure_ascii=False, separators=(',', ':'))
+    metadata = {"ciudad": dato.get("ciudad", ""), "hash": hash_contenido}
+    if nombre_coleccion in TIPOS:
+        metadata["tipo"] = TIPOS[nombre_coleccion]
+    # Contexto de prompt precompilado junto al documento
+    metadata.update(metadatos_contexto(nombre_coleccion, dato))
+    return Registro(
+        id=id_documento(nombre_coleccion, dato),
+        documento=documento,
+        metadata=metadata,
+        hash=hash_contenido,
+        texto=texto_embedding(nombre_coleccion, dato, documento, modo_texto),
+    )
+
+
+def registros_unicos(nombre_coleccion: str, datos: Iterable[Mapping[str, Any]],
+                     modo_texto: str = TEXTO_DOCUMENTO) -> List[Registro]:
+    """
+    Construye los registros de una lista de documentos, uno por ciudad.
+
+    Si una ciudad aparece varias veces se conserva la última aparición.
+    """
+    por_id: Dict[str, Registro] = {}
+    for dato in datos:
+        registro = registro_documento(nombre_coleccion, dato, modo_texto)
+        por_id[registro.id] = registro
+    return list(por_id.values())
+
+
+def registros_cambiados(
+    registros: Iterable[Registro],
+    hashes_existentes: Mapping[str, str]
+) -> List[Registro]:
+    """Filtra los registros cuyo hash difiere del almacenado."""
+    return [r for r in registros if hashes_existentes.get(r.id) != r.hash]
+
+
+def hashes_en_coleccion(coleccion: Any, ids: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    Lee los hashes guardados en los metadatos de una colección de ChromaDB.
+
+    Args:
+        coleccion: Colección de ChromaDB.
+        ids: Ids a consultar; None para toda la colección.
+
+    Returns:
+        Diccionario id -> hash (cadena vacía si el registro no tiene hash).
+    """
+    if ids is not None and not ids:
+        return {}
+    resultado = coleccion.get(ids=ids, include=["metadatas"])
+    return {
+        id_doc: (metadata or {}).get("hash", "")
+        for id_doc, metadata in zip(resultado["ids"], resultado["metadatas"])
+    }
+
+
+def aplicar_registros(
+    coleccion: Any,
+    almacen: Any,
+    registros: List[Registro],
+    embeddings: Sequence[Sequence[float]]
+) -> None:
+    """
+    Inserta o actualiza registros con sus embeddings precalculados.
+
+    El documento completo se escribe primero en el almacén y ChromaDB
+    guarda solo el texto embebido, de modo que el índice nunca apunta a un
+    id sin documento.
+
+    Args:
+        coleccion: Colección de ChromaDB.
+        almacen: ``AlmacenDocumentos`` donde se guardan los documentos completos.
+        registros: Registros a escribir.
+        embeddings: Un vector por registro, calculado sobre ``registro.texto``.
+    """
+    if not registros:
+        return
+    almacen.guardar(coleccion.name, ((r.id, r.hash, r.documento) for r in registros))
+    coleccion.upsert(
+        ids=[r.id for r in registros],
+        embeddings=[list(v) for v in embeddings],
+        documents=[r.texto for r in registros],
+        metadatas=[r.metadata for r in registros],
+    )
+
+
+def eliminar_registros(coleccion: Any, almacen: Any, ids: Iterable[str]) -> None:
+    """Elimina registros del índice y después sus documentos del almacén."""
+    ids = sorted(ids)
+    if not ids:
+        return
+    coleccion.delete(ids=ids)
+    almacen.eliminar(ids)
+
+
+# ---------------------------------------------------------------------------
+# Manifiesto
+# ---------------------------------------------------------------------------
+
+def leer_manifiesto(persist_dir: str) -> Dict[str, Any]:
+    """
+    Lee el manifiesto de la última ingesta.
+
+    Returns:
+        ``{"colecciones": {nombre: {"archivos": {...}, "documentos": {...}}}}``;
+        vacío si no existe o es de otra versión del contexto.
+    """
+    try:
+        with open(os.path.join(persist_dir, ARCHIVO_MANIFIESTO), encoding='utf-8') as archivo:
+            manifiesto = json.load(archivo)
+    except (OSError, ValueError):
+        return {"colecciones": {}}
+    if manifiesto.get("version_contexto") != VERSION_CONTEXTO:
+        return {"colecciones": {}}
+    manifiesto.setdefault("colecciones", {})
+    return manifiesto
+
+
+def escribir_manifiesto(persist_dir: str, manifiesto: Dict[str, Any]) -> None:
+    """Escribe el manifiesto de forma atómica."""
+    manifiesto = {
+        **manifiesto,
+        "version_contexto": VERSION_CONTEXTO,
+        "fecha": datetime.now().isoformat(),
+    }
+    os.makedirs(persist_dir, exist_ok=True)
+    ruta = os.path.join(persist_dir, ARCHIVO_MANIFIESTO)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(manifiesto, archivo, ensure_ascii=False, indent=1)
+    os.replace(temporal, ruta)
+
+
+class PlanArchivos(NamedTuple):
+    """Resultado de comparar un listado de archivos con el manifiesto."""
+    cambiados: List[str]
+    eliminados: List[str]
+    sin_cambios: List[str]
+
+
+def planificar_archivos(
+    generaciones: Mapping[str, Any],
+    estado_coleccion: Mapping[str, Any]
+) -> PlanArchivos:
+    """
+    Compara las generaciones actuales de los archivos de origen con el manifiesto.
+
+    Args:
+        generaciones: Nombre de archivo -> generación (o cualquier marca de cambio).
+        estado_coleccion: Entrada del manifiesto para la colección.
+    """
+    anteriores = estado_coleccion.get("archivos", {})
+    cambiados, sin_cambios = [], []
+    for nombre, generacion in generaciones.items():
+        anterior = anteriores.get(nombre)
+        if anterior is not None and str(anterior.get("generacion")) == str(generacion):
+            sin_cambios.append(nombre)
+        else:
+            cambiados.append(nombre)
+    eliminados = [nombre for nombre in anteriores if nombre not in generaciones]
+    return PlanArchivos(sorted(cambiados), sorted(eliminados), sorted(sin_cambios))
+
+
+def ids_obsoletos(
+    plan: PlanArchivos,
+    estado_coleccion: Mapping[str, Any],
+    ids_nuevos: Mapping[str, List[str]]
+) -> Set[str]:
+    """
+    Ids que ya no provienen de ningún archivo tras aplicar el plan.
+
+    Args:
+        plan: Plan de archivos.
+        estado_coleccion: Entrada anterior del manifiesto.
+        ids_nuevos: Archivo cambiado -> ids que contiene ahora.
+    """
+    anteriores = estado_coleccion.get("archivos", {})
+    vigentes: Set[str] = set()
+    for nombre in plan.sin_cambios:
+        vigentes.update(anteriores[nombre].get("ids", []))
+    for ids in ids_nuevos.values():
+        vigentes.update(ids)
+
+    candidatos: Set[str] = set()
+    for nombre in list(plan.cambiados) + list(plan.eliminados):
+        candidatos.update(anteriores.get(nombre, {}).get("ids", []))
+    return candidatos - vigentes
+
+
+def estado_actualizado(
+    plan: PlanArchivos,
+    estado_coleccion: Mapping[str, Any],
+    generaciones: Mapping[str, Any],
+    registros_por_archivo: Mapping[str, List[Registro]],
+    eliminados: Iterable[str]
+) -> Dict[str, Any]:
+    """
+    Nueva entrada del manifiesto para la colección tras aplicar el plan.
+
+    Returns:
+        ``{"archivos": {nombre: {"generacion", "ids"}}, "documentos": {id: hash}}``.
+    """
+    anteriores = estado_coleccion.get("archivos", {})
+    documentos = dict(estado_coleccion.get("documentos", {}))
+    for id_doc in eliminados:
+        documentos.pop(id_doc, None)
+
+    archivos: Dict[str, Any] = {}
+    for nombre in plan.sin_cambios:
+        archivos[nombre] = anteriores[nombre]
+    for nombre, registros in registros_por_archivo.items():
+        archivos[nombre] = {
+            "generacion": str(generaciones[nombre]),
+            "ids": [r.id for r in registros],
+        }
+        documentos.update((r.id, r.hash) for r in registros)
+    return {"archivos": archivos, "documentos": documentos}
@@ -0,0 +1,95 @@
+"""
+Limitador de llamadas a Gemini con cubo de tokens.
+
+El cubo se rellena a la tasa de la cuota (``GEMINI_CUOTA_RPM`` repartida
+entre los procesos) y admite ráfagas de hasta ``capacidad`` llamadas. Cuando
+está vacío las llamadas hacen cola hasta ``espera_maxima`` segundos en orden
+de llegada (el saldo de tokens puede quedar negativo: cada reserva espera a
+que se reponga su token); si la cola es más larga la llamada se descarta con
+``LimiteExcedido`` en lugar de recibir un 429 de Gemini.
+"""
+from typing import Optional
+import asyncio
+import threading
+import time
+from .plazos import PlazoVencido
+
+
+class LimiteExcedido(PlazoVencido):
+    """
+    La llamada se descartó porque la cola del limitador excede la espera máxima.
+
+    Como ``CircuitoAbierto``, hereda de ``PlazoVencido`` para que los agentes
+    respondan con la respuesta degradada.
+    """
+
+    def __init__(self):
+        super().__init__('limite_cuota')
+
+
+class CuboTokens:
+    """Cubo de tokens seguro para hilos y usable desde el event loop."""
+
+    def __init__(self, tasa: float, capacidad: float, espera_maxima: float = 1.0):
+        """
+        Args:
+            tasa: Tokens por segundo.
+            capacidad: Tokens máximos acumulados (tamaño de ráfaga).
+            espera_maxima: Segundos máximos de cola antes de descartar.
+        """
+        self.tasa = tasa
+        self.capacidad = max(1.0, capacidad)
+        self.espera_maxima = espera_maxima
+        self._tokens = self.capacidad
+        self._actualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reservar(self, espera_maxima: float) -> Optional[float]:
+        """Reserva un token y retorna la espera hasta poder usarlo, o None si excede ``espera_maxima``."""
+        with self._lock:
+            ahora = time.monotonic()
+            self._tokens = min(self.capacidad, self._tokens + (ahora - self._actualizado) * self.tasa)
+            self._actualizado = ahora
+            espera = max(0.0, (1.0 - self._tokens) / self.tasa)
+            if espera > espera_maxima:
+                return None
+            self._tokens -= 1.0
+            return espera
+
+    def _devolver(self) -> None:
+        with self._lock:
+            self._tokens = min(self.capacidad, self._tokens + 1.0)
+
+    def intentar(self) -> bool:
+        """Toma un token solo si hay uno disponible ya (llamadas prescindibles)."""
+        return self._reservar(0.0) is not None
+
+    def adquirir(self) -> float:
+        """
+        Espera un token bloqueando el hilo.
+
+        Returns:
+            Segundos esperados.
+
+        Raises:
+            LimiteExcedido: Si la espera superaría ``espera_maxima``.
+        """
+        espera = self._reservar(self.espera_maxima)
+        if espera is None:
+            raise LimiteExcedido()
+        if espera:
+            time.sleep(espera)
+        return espera
+
+    async def aadquirir(self) -> float:
+        """Versión asíncrona de ``adquirir``; si se cancela la espera devuelve el token."""
+        espera = self._reservar(self.espera_maxima)
+        if espera is None:
+            raise LimiteExcedido()
+        if espera:
+            try:
+                await asyncio.sleep(espera)
+            except asyncio.CancelledError:
+                self._devolver()
+                raise
+        return espera
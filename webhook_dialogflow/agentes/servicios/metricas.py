@@ -0,0 +1,519 @@
+"""
+Métricas del servicio en formato de texto de Prometheus.
+
+Contadores, medidores e histogramas con etiquetas, en memoria del proceso
+y sin dependencias externas. Registrar una observación cuesta un lock y
+una búsqueda binaria en los límites del histograma.
+
+Con varios workers cada proceso vuelca periódicamente sus valores a
+``<directorio>/metricas_<pid>.json``; el worker que atiende ``/metrics``
+suma los archivos de todos. Los contadores e histogramas de workers que ya
+terminaron (reciclados por ``max_requests``) se acumulan en
+``metricas_acumuladas.json`` para que no retrocedan; los medidores solo
+cuentan los procesos vivos.
+"""
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import atexit
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CONTADOR = 'counter'
+MEDIDOR = 'gauge'
+HISTOGRAMA = 'histogram'
+
+# Límites en segundos: de microsegundos (índice en memoria) a decenas de segundos (Gemini)
+LIMITES_LATENCIA = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+PREFIJO_ARCHIVO = 'metricas_'
+ARCHIVO_ACUMULADO = 'metricas_acumuladas.json'
+ARCHIVO_BLOQUEO = '.metricas.lock'
+
+
+class _Metrica(ABC):
+    """Base de las métricas: una serie por combinación de valores de etiquetas."""
+
+    tipo = ''
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _serie(self, valores: Tuple[str, ...]) -> Any:
+        serie = self._series.get(valores)
+        if serie is None:
+            if len(valores) != len(self.etiquetas):
+                raise ValueError(f"{self.nombre} espera las etiquetas {self.etiquetas}")
+            with self._lock:
+                serie = self._series.setdefault(valores, self._nueva_serie())
+        return serie
+
+    @abstractmethod
+    def _nueva_serie(self) -> Any:
+        """Serie vacía para una combinación de etiquetas nueva."""
+
+    def exportar_series(self) -> List[List[Any]]:
+        """Series como ``[[valores de etiquetas], datos]`` serializables en JSON."""
+        with self._lock:
+            return [[list(valores), serie.datos()] for valores, serie in self._series.items()]
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._series = {}
+
+
+class _Valor:
+    __slots__ = ('valor', '_lock')
+
+    def __init__(self):
+        self.valor = 0.0
+        self._lock = threading.Lock()
+
+    def sumar(self, cantidad: float) -> None:
+        with self._lock:
+            self.valor += cantidad
+
+    def fijar(self, valor: float) -> None:
+        with self._lock:
+            self.valor = valor
+
+    def datos(self) -> float:
+        return self.valor
+
+
+class Contador(_Metrica):
+    """Valor que solo crece (peticiones, aciertos de caché, fallbacks...)."""
+
+    tipo = CONTADOR
+
+    def _nueva_serie(self) -> _Valor:
+        return _Valor()
+
+    def incrementar(self, *valores: str, cantidad: float = 1.0) -> None:
+        self._serie(valores).sumar(cantidad)
+
+
+class Medidor(_Metrica):
+    """Valor que sube y baja (peticiones en curso)."""
+
+    tipo = MEDIDOR
+
+    def _nueva_serie(self) -> _Valor:
+        return _Valor()
+
+    def sumar(self, *valores: str, cantidad: float = 1.0) -> None:
+        self._serie(valores).sumar(cantidad)
+
+    def fijar(self, valor: float, *valores: str) -> None:
+        self._serie(valores).fijar(valor)
+
+    @contextmanager
+    def en_curso(self, *valores: str) -> Iterator[None]:
+        """Suma 1 mientras dura el bloque."""
+        serie = self._serie(valores)
+        serie.sumar(1)
+        try:
+            yield
+        finally:
+            serie.sumar(-1)
+
+
+class _SerieHistograma:
+    __slots__ = ('limites', 'cubetas', 'suma', 'cuenta', '_lock')
+
+    def __init__(self, limites: Tuple[float, ...]):
+        self.limites = limites
+        self.cubetas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.cuenta = 0
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float) -> None:
+        indice = bisect_left(self.limites, valor)
+        with self._lock:
+            self.cubetas[indice] += 1
+            self.suma += valor
+            self.cuenta += 1
+
+    def datos(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'cubetas': list(self.cubetas), 'suma': self.suma, 'cuenta': self.cuenta}
+
+
+class Histograma(_Metrica):
+    """Distribución de duraciones en segundos."""
+
+    tipo = HISTOGRAMA
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 limites: Sequence[float] = LIMITES_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(sorted(limites))
+
+    def _nueva_serie(self) -> _SerieHistograma:
+        return _SerieHistograma(self.limites)
+
+    def observar(self, valor: float, *valores: str) -> None:
+        self._serie(valores).observar(valor)
+
+    @contextmanager
+    def medir(self, *valores: str) -> Iterator[None]:
+        """Observa la duración del bloque."""
+        serie = self._serie(valores)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            serie.observar(time.perf_counter() - inicio)
+
+
+class Cronometro:
+    """
+    Mide etapas consecutivas de una petición con un solo reloj.
+
+    ``marcar(etapa)`` observa el tiempo transcurrido desde la marca anterior;
+    ``terminar()`` observa la duración total como etapa ``total``.
+    """
+
+    __slots__ = ('histograma', 'agente', 'inicio', 'ultima')
+
+    def __init__(self, histograma: Histograma, agente: str):
+        self.histograma = histograma
+        self.agente = agente
+        self.inicio = self.ultima = time.perf_counter()
+
+    def marcar(self, etapa: str) -> None:
+        ahora = time.perf_counter()
+        self.histograma.observar(ahora - self.ultima, self.agente, etapa)
+        self.ultima = ahora
+
+    def terminar(self) -> None:
+        self.histograma.observar(time.perf_counter() - self.inicio, self.agente, 'total')
+
+
+class RegistroMetricas:
+    """Conjunto de métricas del proceso y su volcado para varios workers."""
+
+    def __init__(self):
+        self._metricas: Dict[str, _Metrica] = {}
+        self._lock = threading.Lock()
+        self.directorio: Optional[str] = None
+        self.intervalo = 5.0
+        self._pid_volcado: Optional[int] = None
+        self._detener = threading.Event()
+
+    def registrar(self, metrica: _Metrica) -> Any:
+        with self._lock:
+            if metrica.nombre in self._metricas:
+                raise ValueError(f"Métrica duplicada: {metrica.nombre}")
+            self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Contador:
+        return self.registrar(Contador(nombre, ayuda, etiquetas))
+
+    def medidor(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Medidor:
+        return self.registrar(Medidor(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                   limites: Sequence[float] = LIMITES_LATENCIA) -> Histograma:
+        return self.registrar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    # --- Varios procesos -------------------------------------------------
+
+    def configurar(self, directorio: Optional[str], intervalo: float = 5.0) -> None:
+        """
+        Activa el volcado periódico a ``directorio`` en este proceso.
+
+        Es idempotente; después de un fork vuelve a arrancar el hilo de
+        volcado en el proceso hijo.
+
+        Args:
+            directorio: Directorio compartido por los workers (None: solo este proceso).
+            intervalo: Segundos entre volcados.
+        """
+        if not directorio:
+            return
+        with self._lock:
+            if self._pid_volcado == os.getpid() and self.directorio == directorio:
+                return
+            os.makedirs(directorio, exist_ok=True)
+            self.directorio = directorio
+            self.intervalo = intervalo
+            self._pid_volcado = os.getpid()
+            self._detener = threading.Event()
+            threading.Thread(target=self._volcar_periodicamente, args=(self._detener,),
+                             name='metricas', daemon=True).start()
+
+    def _volcar_periodicamente(self, detener: threading.Event) -> None:
+        while not detener.wait(self.intervalo):
+            self.volcar()
+
+    def despues_de_fork(self) -> None:
+        """Descarta en el worker los valores heredados del maestro."""
+        with self._lock:
+            for metrica in self._metricas.values():
+                metrica.reiniciar()
+            self._pid_volcado = None
+
+    def instantanea(self) -> Dict[str, List[List[Any]]]:
+        return {nombre: metrica.exportar_series() for nombre, metrica in self._metricas.items()}
+
+    def volcar(self) -> None:
+        """Escribe los valores de este proceso en su archivo (de forma atómica)."""
+        if self.directorio is None or self._pid_volcado != os.getpid():
+            return
+        ruta = os.path.join(self.directorio, f"{PREFIJO_ARCHIVO}{os.getpid()}.json")
+        temporal = f"{ruta}.tmp"
+        try:
+            with open(temporal, 'w', encoding='utf-8') as archivo:
+                json.dump(self.instantanea(), archivo, separators=(',', ':'))
+            os.replace(temporal, ruta)
+        except OSError as e:
+            logger.error(f"Error volcando métricas: {str(e)}")
+
+    def _leer(self, ruta: str) -> Dict[str, List[List[Any]]]:
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError):
+            return {}
+
+    def _combinar(self, total: Dict[Tuple[str, Tuple[str, ...]], Any],
+                  datos: Dict[str, List[List[Any]]], incluir_medidores: bool = True) -> None:
+        for nombre, series in datos.items():
+            metrica = self._metricas.get(nombre)
+            if metrica is None or (metrica.tipo == MEDIDOR and not incluir_medidores):
+                continue
+            for valores, dato in series:
+                clave = (nombre, tuple(valores))
+                previo = total.get(clave)
+                if metrica.tipo == HISTOGRAMA:
+                    if previo is None or len(previo['cubetas']) != len(dato['cubetas']):
+                        total[clave] = {'cubetas': list(dato['cubetas']), 'suma': dato['suma'],
+                                        'cuenta': dato['cuenta']}
+                    else:
+                        previo['cubetas'] = [a + b for a, b in zip(previo['cubetas'], dato['cubetas'])]
+                        previo['suma'] += dato['suma']
+                        previo['cuenta'] += dato['cuenta']
+                else:
+                    total[clave] = (previo or 0.0) + dato
+
+    def _agregar_procesos(self) -> Dict[Tuple[str, Tuple[str, ...]], Any]:
+        """Suma los archivos de todos los workers (acumulando los que terminaron)."""
+        self.volcar()
+        total: Dict[Tuple[str, Tuple[str, ...]], Any] = {}
+        with open(os.path.join(self.directorio, ARCHIVO_BLOQUEO), 'w') as bloqueo:
+            fcntl.flock(bloqueo, fcntl.LOCK_EX)
+            ruta_acumulado = os.path.join(self.directorio, ARCHIVO_ACUMULADO)
+            acumulado: Dict[Tuple[str, Tuple[str, ...]], Any] = {}
+            self._combinar(acumulado, self._leer(ruta_acumulado), incluir_medidores=False)
+            terminados = []
+            for entrada in os.listdir(self.directorio):
+                if not (entrada.startswith(PREFIJO_ARCHIVO) and entrada.endswith('.json')):
+                    continue
+                pid = entrada[len(PREFIJO_ARCHIVO):-len('.json')]
+                if not pid.isdigit():
+                    continue
+                ruta = os.path.join(self.directorio, entrada)
+                if _proceso_vivo(int(pid)):
+                    self._combinar(total, self._leer(ruta))
+                else:
+                    self._combinar(acumulado, self._leer(ruta), incluir_medidores=False)
+                    terminados.append(ruta)
+            if terminados:
+                _escribir_agregado(ruta_acumulado, acumulado)
+                for ruta in terminados:
+                    os.remove(ruta)
+        for clave, dato in acumulado.items():
+            self._combinar(total, {clave[0]: [[list(clave[1]), dato]]})
+        return total
+
+    # --- Exposición ------------------------------------------------------
+
+    def exportar(self) -> str:
+        """
+        Texto en formato de exposición de Prometheus (versión 0.0.4).
+
+        Con ``configurar`` activo incluye a todos los workers; si no, solo
+        a este proceso.
+        """
+        if self.directorio is not None and self._pid_volcado == os.getpid():
+            try:
+                valores = self._agregar_procesos()
+            except OSError as e:
+                logger.error(f"Error agregando métricas de los workers: {str(e)}")
+                valores = {}
+                self._combinar(valores, self.instantanea())
+        else:
+            valores = {}
+            self._combinar(valores, self.instantanea())
+
+        lineas = []
+        for nombre, metrica in sorted(self._metricas.items()):
+            series = sorted(((v, d) for (n, v), d in valores.items() if n == nombre), key=lambda serie: serie[0])
+            nombre_expuesto = f"{nombre}_total" if metrica.tipo == CONTADOR else nombre
+            lineas.append(f"# HELP {nombre_expuesto} {metrica.ayuda}")
+            lineas.append(f"# TYPE {nombre_expuesto} {metrica.tipo}")
+            for valores_etiquetas, dato in series:
+                etiquetas = list(zip(metrica.etiquetas, valores_etiquetas))
+                if metrica.tipo == HISTOGRAMA:
+                    acumulado = 0
+                    limites = [_formatear(l) for l in metrica.limites] + ['+Inf']
+                    for limite, cantidad in zip(limites, dato['cubetas']):
+                        acumulado += cantidad
+                        lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + [('le', limite)])} {acumulado}")
+                    lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_formatear(dato['suma'])}")
+                    lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {dato['cuenta']}")
+                else:
+                    lineas.append(f"{nombre_expuesto}{_etiquetas(etiquetas)} {_formatear(dato)}")
+        return "\n".join(lineas) + "\n"
+
+
+def limpiar_directorio(directorio: Optional[str]) -> None:
+    """Borra los archivos de métricas de una ejecución anterior (arranque del maestro)."""
+    if not directorio or not os.path.isdir(directorio):
+        return
+    for entrada in os.listdir(directorio):
+        if entrada.startswith(PREFIJO_ARCHIVO) or entrada == ARCHIVO_BLOQUEO:
+            try:
+                os.remove(os.path.join(directorio, entrada))
+            except OSError:
+                pass
+
+
+def _proceso_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escribir_agregado(ruta: str, valores: Dict[Tuple[str, Tuple[str, ...]], Any]) -> None:
+    datos: Dict[str, List[List[Any]]] = {}
+    for (nombre, etiquetas), dato in valores.items():
+        datos.setdefault(nombre, []).append([list(etiquetas), dato])
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo, separators=(',', ':'))
+    os.replace(temporal, ruta)
+
+
+def _formatear(valor: float) -> str:
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _etiquetas(pares: List[Tuple[str, str]]) -> str:
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{clave}="{_escapar(valor)}"' for clave, valor in pares) + '}'
+
+
+metricas = RegistroMetricas()
+atexit.register(metricas.volcar)
+
+# --- Métricas del servicio -----------------------------------------------
+
+ETAPAS_RAG = metricas.histograma(
+    'rag_etapa_segundos',
+    "Duración de cada etapa de process_query (extraccion_local, extraccion_llm, recuperacion, generacion, total)",
+    ('agente', 'etapa')
+)
+CACHE_RESPUESTAS = metricas.contador(
+    'rag_cache_respuestas', "Consultas a la caché de respuestas por resultado (acierto, acierto_semantico, fallo)",
+    ('agente', 'resultado')
+)
+RESPALDOS = metricas.contador(
+    'rag_respaldo', "Respuestas de respaldo por motivo (sin_destino, sin_informacion, datos_nacionales, error...)",
+    ('agente', 'motivo')
+)
+CONSULTAS_SIN_FILTRO = metricas.contador(
+    'rag_consulta_sin_filtro', "Segundas consultas a ChromaDB sin filtro de ciudad tras no encontrar coincidencia exacta",
+    ('agente',)
+)
+RESPUESTAS_DEGRADADAS = metricas.contador(
+    'rag_respuesta_degradada', "Respuestas degradadas por plazo vencido, por etapa en la que se agotó",
+    ('agente', 'etapa')
+)
+SESIONES = metricas.contador(
+    'rag_sesion',
+    "Turnos sin ciudad por uso del estado de sesión (continuacion, sin_estado, sin_documento)",
+    ('agente', 'resultado')
+)
+RESPUESTAS_PRECALCULADAS = metricas.contador(
+    'rag_respuesta_precalculada',
+    "Consultas de un tema frecuente por resultado en el almacén de respuestas precalculadas (acierto, fallo)",
+    ('agente', 'resultado')
+)
+RUTA_CRISIS = metricas.contador(
+    'rag_ruta_crisis', "Consultas respondidas al instante por el detector de crisis, por categoría",
+    ('categoria',)
+)
+CONSULTAS_CHROMADB = metricas.histograma(
+    'chromadb_consulta_segundos', "Duración de cada consulta vectorial a ChromaDB",
+    ('coleccion', 'filtro')
+)
+DECODIFICACION = metricas.histograma(
+    'chromadb_decodificacion_segundos', "Unión con el almacén y decodificación de los documentos de una consulta",
+    ('coleccion',)
+)
+CACHE_DOCUMENTOS = metricas.contador(
+    'chromadb_cache_documentos', "Documentos pedidos a la caché de documentos decodificados por resultado",
+    ('resultado',)
+)
+GEMINI_LLAMADAS = metricas.contador(
+    'gemini_llamadas',
+    "Llamadas a Gemini por resultado (exito, error, plazo vencido, rechazada con el circuito abierto, "
+    "limitada por la cuota)",
+    ('resultado',)
+)
+GEMINI_CIRCUITO = metricas.medidor(
+    'gemini_circuito_estado', "Workers con el interruptor de Gemini en cada estado (cerrado, abierto, semiabierto)",
+    ('estado',)
+)
+GEMINI_APERTURAS = metricas.contador(
+    'gemini_circuito_aperturas', "Aperturas del interruptor de Gemini por motivo (fallos, latencia, sonda)",
+    ('motivo',)
+)
+GEMINI_COBERTURAS = metricas.contador(
+    'gemini_coberturas', "Segundas llamadas de cobertura a Gemini (lanzada, ganadora)",
+    ('resultado',)
+)
+GEMINI_ESPERA_CUOTA = metricas.histograma(
+    'gemini_espera_cuota_segundos', "Espera en la cola del limitador de cuota de Gemini"
+)
+COALESCENCIA = metricas.contador(
+    'rag_coalescencia', "Llamadas a Gemini por rol en la coalescencia (lider lanza, seguidor comparte)",
+    ('agente', 'etapa', 'rol')
+)
+PETICIONES_EN_CURSO = metricas.medidor(
+    'webhook_peticiones_en_curso', "Peticiones del webhook en curso", ('agente',)
+)
+PETICIONES = metricas.contador(
+    'webhook_peticiones', "Peticiones del webhook por código de estado HTTP", ('agente', 'codigo')
+)
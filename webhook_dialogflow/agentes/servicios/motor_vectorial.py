@@ -0,0 +1,454 @@
+"""
+Motor vectorial en proceso con NumPy, alternativo a ChromaDB.
+
+Con ``MOTOR_VECTORIAL=numpy`` el servicio usa ``ClienteVectorial`` en lugar
+del cliente duckdb+parquet. Cada colección guarda sus embeddings normalizados
+en una sola matriz float32 contigua (mapeada en memoria desde disco, de modo
+que los workers comparten las páginas) y los ids, textos y metadatos en
+columnas paralelas. Una consulta es un producto matriz-vector y un
+``argpartition`` para el top-k exacto; los filtros ``where`` se resuelven con
+máscaras booleanas que se calculan una vez por (clave, valor) y se reutilizan
+hasta la siguiente escritura.
+
+``ClienteVectorial`` y ``ColeccionVectorial`` implementan el subconjunto de la
+API de ChromaDB 0.3 que usan el servicio, la ingesta, los snapshots y los
+scripts, por lo que el resto del código no distingue entre motores. Las
+distancias son L2 al cuadrado entre vectores normalizados (``2 - 2·coseno``),
+comparables con las de ChromaDB para embeddings normalizados como los de
+all-MiniLM-L6-v2.
+
+Las lecturas no toman locks: cada escritura construye un estado nuevo y lo
+publica con una sola asignación. Solo el proceso que escribe (la ingesta o la
+restauración de un snapshot) modifica las colecciones; ``persist()`` las
+escribe en ``<persist_dir>/vectorial/`` y los demás procesos las ven al
+reabrir el cliente tras el cambio de versión de datos.
+"""
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+import json
+import os
+import re
+import threading
+import uuid
+import numpy as np
+
+# Motores admitidos en MOTOR_VECTORIAL
+MOTORES = ('chromadb', 'numpy')
+
+# Subdirectorio del directorio de persistencia con las colecciones del motor NumPy
+DIRECTORIO_MOTOR = 'vectorial'
+
+FORMATO = 1
+
+# Máscaras de filtro (clave, valor) conservadas por colección
+MAX_MASCARAS = 1024
+
+_NOMBRE_VALIDO = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+class _Estado(NamedTuple):
+    """Contenido inmutable de una colección; se reemplaza entero en cada escritura."""
+    ids: List[str]
+    textos: List[Optional[str]]
+    metadatas: List[Optional[Dict[str, Any]]]
+    vectores: np.ndarray
+    posiciones: Dict[str, int]
+    # Cachés derivadas del estado: columnas de metadatos y máscaras de filtro
+    columnas: Dict[str, np.ndarray]
+    mascaras: Dict[Tuple[str, str], np.ndarray]
+
+
+def _estado(ids: List[str], textos: List[Optional[str]], metadatas: List[Optional[Dict[str, Any]]],
+            vectores: np.ndarray) -> _Estado:
+    posiciones = {id_doc: fila for fila, id_doc in enumerate(ids)}
+    return _Estado(ids, textos, metadatas, vectores, posiciones, {}, {})
+
+
+def _normalizar(vectores: Any) -> np.ndarray:
+    """Matriz float32 contigua con filas de norma 1 (las filas nulas quedan en cero)."""
+    matriz = np.array(vectores, dtype=np.float32, ndmin=2)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    np.divide(matriz, normas, out=matriz, where=normas > 0)
+    return np.ascontiguousarray(matriz)
+
+
+class ColeccionVectorial:
+    """Colección del motor NumPy con la interfaz de ``chromadb.api.models.Collection``."""
+
+    def __init__(self, name: str, embedding_function: Any = None, estado: Optional[_Estado] = None):
+        self.name = name
+        self._embedding_function = embedding_function
+        self._estado = estado or _estado([], [], [], np.empty((0, 0), dtype=np.float32))
+        self._lock_escritura = threading.Lock()
+        # Pendiente de escribir en disco
+        self.sucia = estado is None
+
+    def count(self) -> int:
+        return len(self._estado.ids)
+
+    def _vectores(self, embeddings: Any, textos: Optional[Sequence[Optional[str]]]) -> np.ndarray:
+        if embeddings is None:
+            if self._embedding_function is None or textos is None:
+                raise ValueError(f"La colección {self.name} necesita embeddings o una embedding_function")
+            embeddings = self._embedding_function(list(textos))
+        return _normalizar(embeddings)
+
+    # --- Escritura ---
+
+    def add(self, ids: Sequence[str], embeddings: Any = None, metadatas: Optional[Sequence[Any]] = None,
+            documents: Optional[Sequence[Optional[str]]] = None) -> None:
+        repetidos = [id_doc for id_doc in ids if id_doc in self._estado.posiciones]
+        if repetidos:
+            raise ValueError(f"Ids ya existentes en {self.name}: {repetidos[:5]}")
+        self.upsert(ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def upsert(self, ids: Sequence[str], embeddings: Any = None, metadatas: Optional[Sequence[Any]] = None,
+               documents: Optional[Sequence[Optional[str]]] = None) -> None:
+        ids = list(ids)
+        if not ids:
+            return
+        vectores = self._vectores(embeddings, documents)
+        if len(vectores) != len(ids):
+            raise ValueError(f"{len(ids)} ids y {len(vectores)} embeddings en {self.name}")
+
+        with self._lock_escritura:
+            anterior = self._estado
+            if len(anterior.ids) and vectores.shape[1] != anterior.vectores.shape[1]:
+                raise ValueError(
+                    f"Dimensión {vectores.shape[1]} distinta de la de {self.name} ({anterior.vectores.shape[1]})"
+                )
+            nuevos_ids = list(anterior.ids)
+            textos = list(anterior.textos)
+            metas = list(anterior.metadatas)
+            posiciones = dict(anterior.posiciones)
+            filas = []
+            for i, id_doc in enumerate(ids):
+                fila = posiciones.get(id_doc)
+                if fila is None:
+                    fila = posiciones[id_doc] = len(nuevos_ids)
+                    nuevos_ids.append(id_doc)
+                    textos.append(None)
+                    metas.append(None)
+                if documents is not None:
+                    textos[fila] = documents[i]
+                if metadatas is not None:
+                    metas[fila] = metadatas[i]
+                filas.append(fila)
+
+            matriz = np.empty((len(nuevos_ids), vectores.shape[1]), dtype=np.float32)
+            if len(anterior.ids):
+                matriz[:len(anterior.ids)] = anterior.vectores
+            # Con ids repetidos en el lote prevalece la última aparición
+            matriz[filas] = vectores
+            self._estado = _Estado(nuevos_ids, textos, metas, matriz, posiciones, {}, {})
+            self.sucia = True
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Mapping[str, Any]] = None) -> List[str]:
+        with self._lock_escritura:
+            anterior = self._estado
+            borrar = self._seleccion(anterior, ids, where)
+            if not borrar.any():
+                return []
+            conservar = np.flatnonzero(~borrar)
+            eliminados = [anterior.ids[fila] for fila in np.flatnonzero(borrar)]
+            self._estado = _estado(
+                [anterior.ids[fila] for fila in conservar],
+                [anterior.textos[fila] for fila in conservar],
+                [anterior.metadatas[fila] for fila in conservar],
+                np.ascontiguousarray(anterior.vectores[conservar]),
+            )
+            self.sucia = True
+            return eliminados
+
+    # --- Lectura ---
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Mapping[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Iterable[str] = ("metadatas", "documents")) -> Dict[str, Any]:
+        estado = self._estado
+        if ids is not None:
+            # En el orden pedido, omitiendo los que no existen
+            filas = [estado.posiciones[id_doc] for id_doc in ids if id_doc in estado.posiciones]
+            if where:
+                mascara = self._mascara(estado, where)
+                filas = [fila for fila in filas if mascara[fila]]
+        elif where:
+            filas = np.flatnonzero(self._mascara(estado, where)).tolist()
+        else:
+            filas = range(len(estado.ids))
+        filas = list(filas)[offset or 0:]
+        if limit is not None:
+            filas = filas[:limit]
+        return self._resultado(estado, filas, include)
+
+    def query(self, query_embeddings: Any = None, query_texts: Optional[Sequence[str]] = None,
+              n_results: int = 10, where: Optional[Mapping[str, Any]] = None,
+              include: Iterable[str] = ("metadatas", "documents", "distances")) -> Dict[str, Any]:
+        """
+        Top-k exacto por similitud coseno.
+
+        Un solo producto matriz-vector (o matriz-matriz con varias consultas)
+        puntúa toda la colección; ``argpartition`` elige los ``n_results``
+        mejores entre las filas que pasan el filtro y solo esos se ordenan.
+        """
+        estado = self._estado
+        consultas = self._vectores(query_embeddings, query_texts)
+        include = tuple(include)
+        resultado: Dict[str, List[Any]] = {clave: [] for clave in ("ids", "documents", "metadatas", "distances")}
+        if not estado.ids:
+            for _ in range(len(consultas)):
+                for lista in resultado.values():
+                    lista.append([])
+            return resultado
+
+        similitudes = estado.vectores @ consultas.T
+        candidatas = np.flatnonzero(self._mascara(estado, where)) if where else None
+        for j in range(len(consultas)):
+            puntajes = similitudes[:, j] if candidatas is None else similitudes[candidatas, j]
+            k = min(n_results, len(puntajes))
+            if k < len(puntajes):
+                mejores = np.argpartition(-puntajes, k - 1)[:k]
+                mejores = mejores[np.argsort(-puntajes[mejores], kind='stable')]
+            else:
+                mejores = np.argsort(-puntajes, kind='stable')
+            filas = mejores if candidatas is None else candidatas[mejores]
+            parcial = self._resultado(estado, filas.tolist(), include)
+            resultado["ids"].append(parcial["ids"])
+            resultado["documents"].append(parcial["documents"])
+            resultado["metadatas"].append(parcial["metadatas"])
+            resultado["distances"].append(np.maximum(0.0, 2.0 - 2.0 * puntajes[mejores]).tolist())
+        return resultado
+
+    def _resultado(self, estado: _Estado, filas: List[int], include: Iterable[str]) -> Dict[str, Any]:
+        include = tuple(include)
+        return {
+            "ids": [estado.ids[fila] for fila in filas],
+            "documents": [estado.textos[fila] for fila in filas] if "documents" in include else None,
+            "metadatas": [estado.metadatas[fila] for fila in filas] if "metadatas" in include else None,
+            "embeddings": estado.vectores[filas].tolist() if "embeddings" in include else None,
+        }
+
+    # --- Filtros ---
+
+    def _seleccion(self, estado: _Estado, ids: Optional[Sequence[str]],
+                   where: Optional[Mapping[str, Any]]) -> np.ndarray:
+        """Máscara de las filas que cumplen ``ids`` y ``where`` (todas si no hay ninguno)."""
+        mascara = self._mascara(estado, where) if where else np.ones(len(estado.ids), dtype=bool)
+        if ids is not None:
+            por_id = np.zeros(len(estado.ids), dtype=bool)
+            por_id[[estado.posiciones[i] for i in ids if i in estado.posiciones]] = True
+            mascara = mascara & por_id
+        return mascara
+
+    def _mascara(self, estado: _Estado, where: Mapping[str, Any]) -> np.ndarray:
+        """
+        Evalúa un filtro ``where`` de ChromaDB como máscara booleana.
+
+        Admite igualdad, ``$eq``, ``$ne``, ``$in``, ``$nin``, ``$and`` y ``$or``.
+        """
+        partes = []
+        for clave, condicion in where.items():
+            if clave in ('$and', '$or'):
+                mascaras = [self._mascara(estado, sub) for sub in condicion]
+                union = np.logical_and if clave == '$and' else np.logical_or
+                partes.append(union.reduce(mascaras) if mascaras else np.ones(len(estado.ids), dtype=bool))
+                continue
+            if isinstance(condicion, Mapping):
+                if len(condicion) != 1:
+                    raise ValueError(f"Condición inválida para {clave}: {condicion}")
+                operador, valor = next(iter(condicion.items()))
+            else:
+                operador, valor = '$eq', condicion
+            if operador in ('$eq', '$ne'):
+                mascara = self._igualdad(estado, clave, valor)
+            elif operador in ('$in', '$nin'):
+                mascara = np.zeros(len(estado.ids), dtype=bool)
+                for elemento in valor:
+                    mascara = mascara | self._igualdad(estado, clave, elemento)
+            else:
+                raise ValueError(f"Operador no soportado por el motor NumPy: {operador}")
+            partes.append(~mascara if operador in ('$ne', '$nin') else mascara)
+        return np.logical_and.reduce(partes) if partes else np.ones(len(estado.ids), dtype=bool)
+
+    def _igualdad(self, estado: _Estado, clave: str, valor: Any) -> np.ndarray:
+        """Máscara ``metadata[clave] == valor``, calculada una vez por estado."""
+        llave = (clave, json.dumps(valor))
+        mascara = estado.mascaras.get(llave)
+        if mascara is None:
+            columna = estado.columnas.get(clave)
+            if columna is None:
+                columna = np.empty(len(estado.ids), dtype=object)
+                columna[:] = [(metadata or {}).get(clave) for metadata in estado.metadatas]
+                estado.columnas[clave] = columna
+            mascara = np.fromiter((v == valor for v in columna), dtype=bool, count=len(columna))
+            mascara.setflags(write=False)
+            if len(estado.mascaras) >= MAX_MASCARAS:
+                estado.mascaras.clear()
+            estado.mascaras[llave] = mascara
+        return mascara
+
+    # --- Persistencia ---
+
+    def _guardar(self, directorio: str) -> None:
+        """
+        Escribe la colección; el JSON de registros nombra el archivo de vectores.
+
+        Los vectores van a un archivo con nombre nuevo y el JSON se reemplaza
+        de forma atómica, así un lector nunca combina registros y vectores de
+        versiones distintas. Se conserva el archivo de vectores anterior por
+        si otro proceso está abriéndolo.
+        """
+        with self._lock_escritura:
+            estado = self._estado
+            ruta_registros = os.path.join(directorio, f"{self.name}.json")
+            anterior = _leer_registros(ruta_registros)
+            archivo_vectores = None
+            if estado.ids:
+                archivo_vectores = f"{self.name}.{uuid.uuid4().hex[:12]}.npy"
+                np.save(os.path.join(directorio, archivo_vectores), estado.vectores)
+            registros = {
+                "formato": FORMATO,
+                "vectores": archivo_vectores,
+                "ids": estado.ids,
+                "textos": estado.textos,
+                "metadatas": estado.metadatas,
+            }
+            temporal = f"{ruta_registros}.{os.getpid()}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as archivo:
+                json.dump(registros, archivo, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temporal, ruta_registros)
+            conservar = {archivo_vectores, (anterior or {}).get("vectores")}
+            _eliminar_vectores(directorio, self.name, conservar)
+            self.sucia = False
+
+
+def _leer_registros(ruta: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return None
+
+
+def _eliminar_vectores(directorio: str, nombre: str, conservar: Iterable[Optional[str]] = ()) -> None:
+    conservar = set(conservar)
+    for archivo in os.listdir(directorio):
+        if archivo.startswith(f"{nombre}.") and archivo.endswith('.npy') and archivo not in conservar:
+            try:
+                os.remove(os.path.join(directorio, archivo))
+            except FileNotFoundError:
+                pass
+
+
+class ClienteVectorial:
+    """Cliente del motor NumPy con la interfaz de ``chromadb.Client`` (duckdb+parquet)."""
+
+    def __init__(self, persist_dir: str, mmap: bool = True):
+        """
+        Args:
+            persist_dir: Directorio de persistencia del servicio.
+            mmap: Mapear en memoria las matrices de vectores en lugar de leerlas.
+        """
+        self.directorio = os.path.join(persist_dir, DIRECTORIO_MOTOR)
+        os.makedirs(self.directorio, exist_ok=True)
+        self.mmap = mmap
+        self._colecciones: Dict[str, ColeccionVectorial] = {}
+        self._eliminadas: set = set()
+        self._lock = threading.RLock()
+
+    def _cargar(self, nombre: str) -> Optional[_Estado]:
+        registros = _leer_registros(os.path.join(self.directorio, f"{nombre}.json"))
+        if registros is None:
+            return None
+        if registros.get("formato") != FORMATO:
+            raise ValueError(f"Formato de colección no soportado: {registros.get('formato')}")
+        if registros["vectores"]:
+            vectores = np.load(os.path.join(self.directorio, registros["vectores"]),
+                               mmap_mode='r' if self.mmap else None)
+        else:
+            vectores = np.empty((0, 0), dtype=np.float32)
+        if len(vectores) != len(registros["ids"]):
+            raise ValueError(f"La colección {nombre} tiene {len(registros['ids'])} ids y {len(vectores)} vectores")
+        return _estado(registros["ids"], registros["textos"], registros["metadatas"], vectores)
+
+    def _buscar(self, nombre: str) -> Optional[ColeccionVectorial]:
+        coleccion = self._colecciones.get(nombre)
+        if coleccion is None and nombre not in self._eliminadas:
+            estado = self._cargar(nombre)
+            if estado is not None:
+                coleccion = self._colecciones[nombre] = ColeccionVectorial(nombre, estado=estado)
+        return coleccion
+
+    def create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None,
+                          embedding_function: Any = None, get_or_create: bool = False) -> ColeccionVectorial:
+        if not _NOMBRE_VALIDO.match(name):
+            raise ValueError(f"Nombre de colección inválido: {name}")
+        with self._lock:
+            coleccion = self._buscar(name)
+            if coleccion is not None:
+                if not get_or_create:
+                    raise ValueError(f"Collection {name} already exists")
+            else:
+                coleccion = self._colecciones[name] = ColeccionVectorial(name)
+                self._eliminadas.discard(name)
+            if embedding_function is not None:
+                coleccion._embedding_function = embedding_function
+            return coleccion
+
+    def get_collection(self, name: str, embedding_function: Any = None) -> ColeccionVectorial:
+        with self._lock:
+            coleccion = self._buscar(name)
+            if coleccion is None:
+                raise ValueError(f"Collection {name} does not exist")
+            if embedding_function is not None:
+                coleccion._embedding_function = embedding_function
+            return coleccion
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None,
+                                 embedding_function: Any = None) -> ColeccionVectorial:
+        return self.create_collection(name, metadata, embedding_function, get_or_create=True)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            if self._buscar(name) is None:
+                raise ValueError(f"Collection {name} does not exist")
+            del self._colecciones[name]
+            self._eliminadas.add(name)
+
+    def list_collections(self) -> List[ColeccionVectorial]:
+        with self._lock:
+            nombres = {archivo[:-len('.json')] for archivo in os.listdir(self.directorio)
+                       if archivo.endswith('.json')}
+            nombres = (nombres | set(self._colecciones)) - self._eliminadas
+            return [self._buscar(nombre) for nombre in sorted(nombres)]
+
+    def persist(self) -> None:
+        """Escribe en disco las colecciones modificadas y elimina las borradas."""
+        with self._lock:
+            for nombre in self._eliminadas:
+                try:
+                    os.remove(os.path.join(self.directorio, f"{nombre}.json"))
+                except FileNotFoundError:
+                    pass
+                _eliminar_vectores(self.directorio, nombre)
+            self._eliminadas.clear()
+            for coleccion in self._colecciones.values():
+                if coleccion.sucia:
+                    coleccion._guardar(self.directorio)
+
+
+def abrir_cliente(persist_dir: str, motor: str = 'chromadb', mmap: bool = True) -> Any:
+    """
+    Abre el cliente del motor vectorial indicado sobre ``persist_dir``.
+
+    Args:
+        persist_dir: Directorio de persistencia.
+        motor: Uno de ``MOTORES``.
+        mmap: Solo para el motor NumPy, mapear en memoria las matrices.
+    """
+    if motor == 'numpy':
+        return ClienteVectorial(persist_dir, mmap=mmap)
+    if motor != 'chromadb':
+        raise ValueError(f"Motor vectorial desconocido: {motor} (opciones: {', '.join(MOTORES)})")
+    import chromadb
+    from chromadb.config import Settings
+    return chromadb.Client(Settings(chroma_db_impl="duckdb+parquet", persist_directory=persist_dir))
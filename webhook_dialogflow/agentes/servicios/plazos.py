@@ -0,0 +1,128 @@
+"""
+Plazo de una petición del webhook.
+
+Dialogflow abandona el webhook a los pocos segundos, así que cada petición
+lleva un ``Plazo`` que se reparte entre extracción, recuperación y
+generación. Cada etapa se ejecuta con tiempo límite (``ejecutar_con_plazo``
+o ``esperar_con_plazo``) y, si el presupuesto se agota, se lanza
+``PlazoVencido`` para que el agente responda con una respuesta degradada
+construida directamente del documento recuperado.
+"""
+from concurrent.futures import Executor, Future, TimeoutError as TimeoutFuturo
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import math
+import time
+from django.conf import settings
+
+
+class PlazoVencido(Exception):
+    """El presupuesto de la petición se agotó en ``etapa``."""
+
+    def __init__(self, etapa: str):
+        super().__init__(f"Plazo vencido en la etapa {etapa}")
+        self.etapa = etapa
+
+
+class Plazo:
+    """
+    Tiempo disponible para una petición, medido con un reloj monótono.
+
+    Se reserva ``margen`` segundos al final para construir y enviar la
+    respuesta degradada.
+    """
+
+    __slots__ = ('limite', 'margen')
+
+    def __init__(self, segundos: Optional[float] = None, margen: float = 0.0):
+        """
+        Args:
+            segundos: Duración total del plazo (None o 0: sin límite).
+            margen: Segundos reservados que no se asignan a ninguna etapa.
+        """
+        self.limite = time.monotonic() + segundos if segundos else math.inf
+        self.margen = margen
+
+    def restante(self) -> float:
+        """Segundos disponibles para etapas (sin contar el margen)."""
+        return self.limite - self.margen - time.monotonic()
+
+    @property
+    def ilimitado(self) -> bool:
+        return self.limite == math.inf
+
+    def para_etapa(self, etapa: str, maximo: Optional[float] = None) -> Optional[float]:
+        """
+        Tiempo límite de una etapa: lo que queda del plazo, acotado por ``maximo``.
+
+        Args:
+            etapa: Nombre de la etapa (para el error).
+            maximo: Duración máxima de la etapa (None: sin tope propio).
+
+        Returns:
+            Segundos para la etapa, o None si no hay ningún límite.
+
+        Raises:
+            PlazoVencido: Si ya no queda tiempo.
+        """
+        restante = self.restante()
+        if restante <= 0:
+            raise PlazoVencido(etapa)
+        if maximo:
+            restante = min(restante, maximo)
+        return None if restante == math.inf else restante
+
+
+def plazo_peticion() -> Plazo:
+    """Plazo de una petición nueva según ``WEBHOOK_PLAZO_SEGUNDOS``."""
+    return Plazo(settings.WEBHOOK_PLAZO_SEGUNDOS, settings.PLAZO_MARGEN_SEGUNDOS)
+
+
+def ejecutar_con_plazo(executor: Executor, limite: Optional[float], etapa: str,
+                       funcion: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Ejecuta una función bloqueante esperando como máximo ``limite`` segundos.
+
+    Sin límite la función se ejecuta en el hilo actual. Con límite se envía
+    a ``executor``; si no termina a tiempo, el hilo que la ejecuta queda
+    libre cuando la llamada termine por su cuenta.
+
+    Raises:
+        PlazoVencido: Si la función no terminó a tiempo.
+    """
+    if limite is None:
+        return funcion(*args, **kwargs)
+    futuro = executor.submit(funcion, *args, **kwargs)
+    try:
+        return futuro.result(timeout=limite)
+    except TimeoutFuturo:
+        futuro.cancel()
+        raise PlazoVencido(etapa)
+
+
+def esperar_futuro(futuro: Future, limite: Optional[float], etapa: str) -> Any:
+    """
+    Espera un futuro compartido como máximo ``limite`` segundos, sin cancelarlo.
+
+    Raises:
+        PlazoVencido: Si el futuro no terminó a tiempo.
+    """
+    try:
+        return futuro.result(timeout=limite)
+    except TimeoutFuturo:
+        raise PlazoVencido(etapa)
+
+
+async def esperar_con_plazo(corrutina: Awaitable[Any], limite: Optional[float], etapa: str) -> Any:
+    """
+    Versión asíncrona de ``ejecutar_con_plazo``: cancela la corrutina al vencer.
+
+    Raises:
+        PlazoVencido: Si la corrutina no terminó a tiempo.
+    """
+    if limite is None:
+        return await corrutina
+    try:
+        return await asyncio.wait_for(corrutina, timeout=limite)
+    except asyncio.TimeoutError:
+        raise PlazoVencido(etapa)
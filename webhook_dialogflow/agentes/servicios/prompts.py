@@ -0,0 +1,322 @@
+"""
+Plantillas de prompt, parámetros de generación y contextos precompilados.
+
+La parte del prompt que depende solo del documento de la ciudad (resumen,
+hoteles, centros de atención, ...) se compila una vez durante la ingesta y se
+guarda en los metadatos del documento (``contexto`` + ``contexto_version``).
+En tiempo de petición solo queda interpolar ese fragmento y la consulta del
+usuario en la plantilla. No depende de Django para poder usarse desde los
+scripts de ingesta.
+"""
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+import google.generativeai as genai
+from .cache_documentos import congelar
+
+# Incrementar cuando cambie el formato de los contextos compilados; los
+# documentos con otra versión se compilan al vuelo hasta la siguiente ingesta.
+VERSION_CONTEXTO = 1
+
+NUMEROS_EMERGENCIA = MappingProxyType({
+    "Línea de la Vida": "800-911-2000",
+    "SAPTEL": "55-5259-8121",
+    "Emergencias": "911",
+    "Consejo Ciudadano": "55-5533-5533",
+    "Cruz Roja": "065"
+})
+
+NUMEROS_EMERGENCIA_FMT = "\n".join(
+    f"- {nombre}: {numero}" for nombre, numero in NUMEROS_EMERGENCIA.items()
+)
+
+# Mensaje mínimo para errores del agente de salud mental
+MENSAJE_EMERGENCIA = (
+    "Si necesitas ayuda inmediata, por favor llama a:\n"
+    f"- Línea de la Vida: {NUMEROS_EMERGENCIA['Línea de la Vida']} (24 horas)\n"
+    f"- Emergencias: {NUMEROS_EMERGENCIA['Emergencias']}"
+)
+
+# Respuesta degradada de turismo cuando el plazo se agota sin datos del destino
+MENSAJE_DEMORA_TURISMO = (
+    "Estoy tardando más de lo normal en encontrar esa información. "
+    "Por favor, intenta de nuevo en unos segundos."
+)
+
+SAFETY_SETTINGS = MappingProxyType({
+    genai.types.HarmCategory.HARM_CATEGORY_HARASSMENT: genai.types.HarmBlockThreshold.BLOCK_NONE,
+    genai.types.HarmCategory.HARM_CATEGORY_HATE_SPEECH: genai.types.HarmBlockThreshold.BLOCK_NONE,
+    genai.types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: genai.types.HarmBlockThreshold.BLOCK_NONE,
+    genai.types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: genai.types.HarmBlockThreshold.BLOCK_NONE,
+})
+
+OPCIONES_TURISMO = MappingProxyType({
+    "safety_settings": SAFETY_SETTINGS,
+    "generation_config": MappingProxyType({
+        "temperature": 0.7,
+        "top_p": 0.8,
+        "top_k": 40,
+        "max_output_tokens": 1024,
+    }),
+})
+
+OPCIONES_SALUD_MENTAL = MappingProxyType({
+    "safety_settings": SAFETY_SETTINGS,
+    "generation_config": MappingProxyType({
+        "temperature": 0.3,  # Más conservador para temas sensibles
+        "top_p": 0.8,
+        "top_k": 40,
+        "max_output_tokens": 1024,
+    }),
+})
+
+PLANTILLA_TURISMO = """
+Actúa como un experto guía turístico de México. Responde la pregunta del usuario
+usando la siguiente información verificada sobre el destino.
+
+{contexto}
+
+Pregunta del usuario:
+{query}
+
+Instrucciones para la respuesta:
+1. Sé específico y usa datos concretos de la información proporcionada
+2. Mantén un tono amigable y profesional
+3. Si la información específica solicitada no está disponible, menciona alternativas del destino
+4. Organiza la respuesta de manera clara y estructurada
+5. Incluye consejos prácticos relevantes para la consulta
+6. No inventes información que no esté en los datos proporcionados
+"""
+
+# Los números de emergencia son constantes y se incrustan en la plantilla
+PLANTILLA_SALUD_MENTAL = """
+Actúa como un profesional de la salud mental empático y comprensivo. Tu prioridad es la
+seguridad y el bienestar de la persona. Usa la siguiente información verificada para
+proporcionar ayuda y recursos.
+
+{contexto}
+
+Números de emergencia (SIEMPRE INCLUIR EN LA RESPUESTA):
+""" + NUMEROS_EMERGENCIA_FMT.replace("{", "{{").replace("}", "}}") + """
+
+Consulta del usuario:
+{query}
+
+Instrucciones CRÍTICAS para la respuesta:
+1. SIEMPRE prioriza la seguridad del usuario
+2. SIEMPRE incluye números de emergencia relevantes
+3. Mantén un tono empático, comprensivo y esperanzador
+4. Proporciona recursos específicos de la localidad cuando estén disponibles
+5. Anima activamente a buscar ayuda profesional
+6. Si detectas riesgo, enfatiza la importancia de contactar servicios de emergencia
+7. NO minimices la situación ni des consejos genéricos
+8. Responde con estructura clara: Empatía → Recursos → Próximos pasos
+"""
+
+
+def compilar_contexto_turismo(dato: Mapping[str, Any]) -> str:
+    """
+    Compila el fragmento de contexto de un destino turístico.
+
+    Args:
+        dato: Documento del destino.
+
+    Returns:
+        Texto listo para interpolar en ``PLANTILLA_TURISMO``.
+    """
+    info_turistica = dato.get("informacion_turistica", {})
+    campos = info_turistica.get("campos_extraidos", {})
+
+    def lista(campo: str) -> str:
+        return ", ".join(campos.get(campo, []))[:200]
+
+    return (
+        f"Destino: {dato.get('ciudad', '')}\n\n"
+        f"Resumen general:\n{info_turistica.get('resumen_turistico', '')}\n\n"
+        "Información específica disponible:\n"
+        f"- Hoteles: {lista('hoteles')}\n"
+        f"- Actividades: {lista('actividades')}\n"
+        f"- Restaurantes: {lista('restaurantes')}\n"
+        f"- Comida típica: {lista('comida_tipica')}\n"
+        f"- Lugares turísticos: {lista('lugares_turisticos')}\n"
+        f"- Consejos para viajeros: {lista('consejos_viajero')}"
+    )
+
+
+def compilar_contexto_salud_mental(dato: Mapping[str, Any]) -> str:
+    """
+    Compila el fragmento de contexto de servicios de salud mental de una ciudad.
+
+    Args:
+        dato: Documento de la ciudad.
+
+    Returns:
+        Texto listo para interpolar en ``PLANTILLA_SALUD_MENTAL``.
+    """
+    info_salud = dato.get("informacion_salud_mental", {})
+    campos = info_salud.get("campos_extraidos", {})
+
+    def lista(campo: str, alternativa: str) -> str:
+        return ", ".join(campos.get(campo, [])) or alternativa
+
+    return (
+        f"Ciudad: {dato.get('ciudad', '')}\n\n"
+        f"Resumen de servicios disponibles:\n{info_salud.get('resumen_salud_mental', '')}\n\n"
+        "Recursos locales disponibles:\n"
+        f"- Centros de atención: {lista('centros_locales', 'Consulta el número de emergencias')}\n"
+        f"- Servicios gratuitos: {lista('servicios_gratuitos', 'Disponibles a través de líneas nacionales')}\n"
+        f"- Líneas de ayuda locales: {lista('lineas_ayuda_locales', 'Ver números nacionales')}\n"
+        f"- Organizaciones de apoyo: {lista('organizaciones_apoyo', 'Consulta líneas de ayuda')}\n"
+        f"- Hospitales: {lista('hospitales_psiquiatricos', 'Acude a urgencias del hospital más cercano')}"
+    )
+
+
+COMPILADORES = MappingProxyType({
+    "destinos_turisticos": compilar_contexto_turismo,
+    "salud_mental": compilar_contexto_salud_mental,
+})
+
+
+def metadatos_contexto(nombre_coleccion: str, dato: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Metadatos con el contexto precompilado para guardar junto al documento.
+
+    Args:
+        nombre_coleccion: Colección a la que pertenece el documento.
+        dato: Documento a compilar.
+
+    Returns:
+        ``{"contexto": ..., "contexto_version": ...}`` o vacío si la colección no tiene compilador.
+    """
+    compilador = COMPILADORES.get(nombre_coleccion)
+    if compilador is None:
+        return {}
+    return {"contexto": compilador(dato), "contexto_version": VERSION_CONTEXTO}
+
+
+def obtener_contexto(nombre_coleccion: str, dato: Mapping[str, Any]) -> str:
+    """
+    Retorna el contexto precompilado del documento, o lo compila si falta o es de otra versión.
+
+    Args:
+        nombre_coleccion: Colección a la que pertenece el documento.
+        dato: Documento (con ``_metadata`` si viene de ChromaDB).
+    """
+    metadata = dato.get("_metadata") or {}
+    if metadata.get("contexto_version") == VERSION_CONTEXTO and metadata.get("contexto"):
+        return metadata["contexto"]
+    return COMPILADORES[nombre_coleccion](dato)
+
+
+PLANTILLAS = MappingProxyType({
+    "destinos_turisticos": PLANTILLA_TURISMO,
+    "salud_mental": PLANTILLA_SALUD_MENTAL,
+})
+
+OPCIONES = MappingProxyType({
+    "destinos_turisticos": OPCIONES_TURISMO,
+    "salud_mental": OPCIONES_SALUD_MENTAL,
+})
+
+
+def construir_prompt(nombre_coleccion: str, dato: Mapping[str, Any], consulta: str) -> str:
+    """
+    Prompt de generación de una consulta sobre el documento de una ciudad.
+
+    Lo usan los agentes y ``scripts/precalcular_respuestas.py``, de modo que
+    las respuestas precalculadas salen del mismo prompt.
+    """
+    return PLANTILLAS[nombre_coleccion].format(
+        contexto=obtener_contexto(nombre_coleccion, dato),
+        query=consulta
+    )
+
+
+def respuesta_degradada_turismo(dato: Mapping[str, Any]) -> str:
+    """
+    Respuesta sin Gemini construida directamente del documento del destino.
+
+    Se usa cuando el plazo de la petición no alcanza para generar.
+    """
+    info_turistica = dato.get("informacion_turistica", {})
+    campos = info_turistica.get("campos_extraidos", {})
+    partes = [f"Esto es lo que sé de {dato.get('ciudad', 'este destino')}:"]
+    if info_turistica.get("resumen_turistico"):
+        partes.append(info_turistica["resumen_turistico"])
+    for campo, titulo in (("lugares_turisticos", "Lugares para visitar"),
+                          ("actividades", "Actividades"),
+                          ("comida_tipica", "Comida típica")):
+        if campos.get(campo):
+            partes.append(f"{titulo}: {', '.join(list(campos[campo])[:5])}.")
+    return "\n\n".join(partes)
+
+
+def respuesta_degradada_salud_mental(dato: Mapping[str, Any]) -> str:
+    """
+    Respuesta sin Gemini con los recursos locales del documento y los números
+    de emergencia. Se usa cuando el plazo de la petición no alcanza para generar.
+    """
+    info_salud = dato.get("informacion_salud_mental", {})
+    campos = info_salud.get("campos_extraidos", {})
+    partes = []
+    if info_salud.get("resumen_salud_mental"):
+        partes.append(info_salud["resumen_salud_mental"])
+    for campo, titulo in (("centros_locales", "Centros de atención"),
+                          ("lineas_ayuda_locales", "Líneas de ayuda locales"),
+                          ("servicios_gratuitos", "Servicios gratuitos")):
+        if campos.get(campo):
+            partes.append(f"{titulo}: {', '.join(list(campos[campo])[:3])}.")
+    partes.append(f"Si necesitas ayuda inmediata, llama a:\n{NUMEROS_EMERGENCIA_FMT}")
+    return "\n\n".join(partes)
+
+
+# Apertura de la respuesta inmediata ante lenguaje de crisis
+MENSAJE_CRISIS = (
+    "Siento mucho que estés pasando por esto. No tienes que enfrentarlo en soledad: "
+    "hay personas preparadas para escucharte ahora mismo, de forma gratuita y confidencial."
+)
+
+
+def respuesta_crisis(dato: Optional[Mapping[str, Any]] = None) -> str:
+    """
+    Respuesta inmediata, sin Gemini, cuando el detector encuentra lenguaje de
+    crisis: números de emergencia primero y, si la ciudad se resolvió en
+    memoria, sus líneas de ayuda y centros locales.
+    """
+    partes = [MENSAJE_CRISIS, f"Llama ahora:\n{NUMEROS_EMERGENCIA_FMT}"]
+    if dato:
+        campos = dato.get("informacion_salud_mental", {}).get("campos_extraidos", {})
+        for campo, titulo in (("lineas_ayuda_locales", "Líneas de ayuda en tu ciudad"),
+                              ("centros_locales", "Centros de atención cercanos")):
+            if campos.get(campo):
+                partes.append(f"{titulo}: {', '.join(list(campos[campo])[:3])}.")
+    partes.append("Si estás en peligro inmediato, llama al 911 o acude a urgencias del hospital más cercano. "
+                  "Si quieres, cuéntame qué está pasando; estoy aquí para acompañarte.")
+    return "\n\n".join(partes)
+
+
+_DATOS_NACIONALES_BASE = {
+    "ciudad": "Nacional",
+    "informacion_salud_mental": {
+        "campos_extraidos": {
+            "numeros_emergencia": list(NUMEROS_EMERGENCIA.values()),
+            "servicios_gratuitos": [
+                "Línea de la Vida - Atención 24/7",
+                "SAPTEL - Sistema de Ayuda Psicológica por Teléfono",
+                "Consejo Ciudadano - Atención psicológica gratuita"
+            ]
+        },
+        "resumen_salud_mental": (
+            "Existen servicios nacionales de ayuda disponibles 24/7 para toda la República Mexicana. "
+            "Estos servicios son gratuitos y confidenciales, atendidos por profesionales capacitados."
+        )
+    },
+    "contactos_nacionales": [
+        {"nombre": k, "telefono": v} for k, v in NUMEROS_EMERGENCIA.items()
+    ]
+}
+
+# Datos nacionales inmutables con su contexto ya compilado
+DATOS_NACIONALES = congelar({
+    **_DATOS_NACIONALES_BASE,
+    "_metadata": metadatos_contexto("salud_mental", _DATOS_NACIONALES_BASE),
+})
@@ -0,0 +1,627 @@
+"""
+Pipeline RAG común a los agentes de turismo y salud mental.
+
+Ambos agentes siguen los mismos pasos sobre su propia colección: resolver la
+ciudad (localmente, con la sesión o con Gemini), recuperar su documento y
+generar la respuesta. ``RAGBase`` implementa esos pasos una sola vez; cada
+agente fija su colección y sus opciones y define qué responder cuando falta
+información o Gemini no responde a tiempo.
+
+Las versiones asíncronas (``a*``) solo difieren en la E/S: usan la API
+asíncrona de Gemini y envían el trabajo bloqueante (ChromaDB, SQLite, el
+índice de ciudades, que verifica la versión de datos en disco y se
+reconstruye tras un cambio, y el resolutor difuso) al pool acotado con
+``ejecutar_bloqueante``.
+"""
+from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import Future, TimeoutError as TimeoutFuturo
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+import google.generativeai as genai
+from django.conf import settings
+from .chromadb_service import ServicioChromaDB
+from .resolutor_ciudades import ResolutorCiudades
+from .indice_ciudades import IndiceCiudades, ciudad_documento, misma_ciudad
+from .cache_respuestas import CacheRespuestas
+from .estado_sesion import EstadoSesiones
+from .respuestas_precalculadas import AlmacenRespuestas, hash_fuente
+from .temas import TEMAS, clasificar_tema
+from .cliente_gemini import crear_cliente_gemini
+from .prompts import OPCIONES, construir_prompt
+from .concurrencia import ejecutar_bloqueante, obtener_executor, obtener_executor_gemini, semaforo_gemini
+from .plazos import Plazo, PlazoVencido, plazo_peticion, ejecutar_con_plazo, esperar_con_plazo, esperar_futuro
+from .coalescencia import clave_vuelo, vuelos
+from .metricas import (
+    Cronometro, ETAPAS_RAG, RESPALDOS, CONSULTAS_SIN_FILTRO, RESPUESTAS_DEGRADADAS,
+    COALESCENCIA, SESIONES, RESPUESTAS_PRECALCULADAS
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RAGBase(ABC):
+    """
+    Agente RAG sobre una colección de documentos por ciudad.
+
+    Las subclases definen ``AGENTE``, ``COLECCION``, ``DESCRIPCION`` (para
+    los mensajes de error), los mensajes de respaldo y los métodos
+    abstractos ``_prompt_extraccion`` y ``_texto_degradado`` (respuesta
+    degradada). Según el agente redefinen también ``_respuesta_inmediata``
+    (con su versión asíncrona ``_arespuesta_inmediata``),
+    ``_datos_sin_documento`` o ``_respuesta_sin_documento``.
+    """
+
+    AGENTE: str
+    COLECCION: str
+    DESCRIPCION: str
+    MENSAJE_ERROR: str
+    MENSAJE_ERROR_GENERACION: str
+
+    def __init__(self, model: Optional[genai.GenerativeModel] = None,
+                 chroma_db: Optional[ServicioChromaDB] = None,
+                 resolutor: Optional[ResolutorCiudades] = None,
+                 indice: Optional[IndiceCiudades] = None,
+                 cache_respuestas: Optional[CacheRespuestas] = None,
+                 sesiones: Optional[EstadoSesiones] = None,
+                 precalculadas: Optional[AlmacenRespuestas] = None):
+        """
+        Inicializa el servicio RAG del agente.
+
+        Args:
+            model: Cliente de Gemini compartido (opcional). Si no se indica se crea
+                un ``ClienteGemini`` con su propio interruptor de circuito.
+            chroma_db: Cliente de ChromaDB compartido (opcional). Si no se indica se crea uno.
+            resolutor: Resolutor local de ciudades (opcional). Sin él siempre se usa Gemini.
+            indice: Índice exacto ciudad -> documento (opcional). Sin él se consulta ChromaDB.
+            cache_respuestas: Caché de respuestas generadas (opcional).
+            sesiones: Estado de conversación por sesión (opcional). Sin él
+                cada turno se resuelve desde cero.
+            precalculadas: Respuestas precalculadas por ciudad y tema (opcional).
+        """
+        try:
+            self.model = model if model is not None else crear_cliente_gemini()
+            self.chroma_db = chroma_db if chroma_db is not None else ServicioChromaDB()
+            self.resolutor = resolutor
+            self.indice = indice
+            self.cache_respuestas = cache_respuestas
+            self.sesiones = sesiones
+            self.precalculadas = precalculadas
+        except Exception as e:
+            logger.error(f"Error inicializando {type(self).__name__}: {str(e)}")
+            raise RuntimeError(f"No se pudo inicializar el servicio RAG de {self.DESCRIPCION}")
+
+    def buscar_documento(self, city: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca el documento de una ciudad en la colección del agente.
+
+        Args:
+            city: Nombre de la ciudad a buscar.
+
+        Returns:
+            Documento de la ciudad o None si no se encuentra.
+        """
+        try:
+            if self.indice is not None:
+                # Búsqueda exacta O(1) en el índice en memoria
+                city_data = self.indice.buscar(self.COLECCION, city)
+                if city_data is not None:
+                    return city_data
+
+                # El índice ya cubre el filtro exacto: solo queda la búsqueda vectorial
+                CONSULTAS_SIN_FILTRO.incrementar(self.AGENTE)
+                results = self.chroma_db.query_collection(self.COLECCION, city, n_results=1)
+                return results[0] if results else None
+
+            # Buscar con filtro exacto primero
+            results = self.chroma_db.query_collection(
+                self.COLECCION,
+                city,
+                n_results=1,
+                filtro={"ciudad": city}
+            )
+
+            if not results:
+                # Si no hay resultados exactos, buscar sin filtro
+                CONSULTAS_SIN_FILTRO.incrementar(self.AGENTE)
+                results = self.chroma_db.query_collection(self.COLECCION, city, n_results=1)
+
+            return results[0] if results else None
+
+        except Exception as e:
+            logger.error(f"Error buscando información de {self.DESCRIPCION} para {city}: {str(e)}")
+            return None
+
+    async def abuscar_documento(self, city: str) -> Optional[Dict[str, Any]]:
+        """
+        Versión asíncrona de ``buscar_documento``: el índice (que puede
+        reconstruirse) y ChromaDB se consultan en el pool de hilos acotado.
+        """
+        return await ejecutar_bloqueante(self.buscar_documento, city)
+
+    def _llamar_modelo(self, prompt: str, limite: Optional[float], etapa: str,
+                       clave: Optional[tuple] = None, al_responder: Optional[Callable[[Any], None]] = None,
+                       **opciones) -> Any:
+        """
+        Llama a Gemini esperando como máximo ``limite`` segundos.
+
+        Con ``clave`` (y ``GEMINI_COALESCENCIA``) las llamadas idénticas en
+        vuelo comparten una sola; ``al_responder`` se ejecuta una vez con la
+        respuesta compartida, aunque quien la lanzó ya haya abandonado.
+        """
+        def llamar():
+            response = self.model.generate_content(prompt, **opciones)
+            if al_responder is not None:
+                al_responder(response)
+            return response
+        if clave is None or not settings.GEMINI_COALESCENCIA:
+            return ejecutar_con_plazo(obtener_executor_gemini(), limite, etapa, llamar)
+        futuro, lider = vuelos.compartir(clave, lambda: obtener_executor_gemini().submit(llamar))
+        COALESCENCIA.incrementar(self.AGENTE, etapa, 'lider' if lider else 'seguidor')
+        return esperar_futuro(futuro, limite, etapa)
+
+    async def _allamar_modelo(self, prompt: str, limite: Optional[float], etapa: str,
+                              clave: Optional[tuple] = None,
+                              al_responder: Optional[Callable[[Any], Awaitable[None]]] = None,
+                              **opciones) -> Any:
+        """Versión asíncrona de ``_llamar_modelo``; la espera del semáforo cuenta para el plazo."""
+        async def llamar():
+            async with semaforo_gemini():
+                response = await self.model.generate_content_async(prompt, **opciones)
+            if al_responder is not None:
+                await al_responder(response)
+            return response
+        if clave is None or not settings.GEMINI_COALESCENCIA:
+            return await esperar_con_plazo(llamar(), limite, etapa)
+        tarea, lider = vuelos.acompartir(clave, llamar)
+        COALESCENCIA.incrementar(self.AGENTE, etapa, 'lider' if lider else 'seguidor')
+        return await esperar_con_plazo(asyncio.shield(tarea), limite, etapa)
+
+    def _construir_prompt(self, user_query: str, city_data: Mapping[str, Any]) -> str:
+        """
+        Construye el prompt de generación a partir de los datos de la ciudad.
+
+        El contexto de la ciudad viene precompilado desde la ingesta, por lo
+        que aquí solo se interpola junto con la consulta.
+        """
+        return construir_prompt(self.COLECCION, city_data, user_query)
+
+    def _respuesta_precalculada(self, user_query: str, city_data: Mapping[str, Any]) -> Optional[str]:
+        """
+        Respuesta precalculada si la consulta es exactamente un tema frecuente.
+
+        Solo se usa si la entrada no expiró y se generó con el documento actual.
+        """
+        if self.precalculadas is None:
+            return None
+        ciudad = ciudad_documento(city_data)
+        hash_documento = (city_data.get("_metadata") or {}).get("hash")
+        tema = clasificar_tema(self.COLECCION, user_query, ciudad) if hash_documento else None
+        if tema is None:
+            return None
+        try:
+            respuesta = self.precalculadas.obtener(
+                self.AGENTE, ciudad, tema, hash_fuente(hash_documento, TEMAS[self.COLECCION][tema].pregunta)
+            )
+        except Exception as e:
+            logger.error(f"Error leyendo respuestas precalculadas: {str(e)}")
+            respuesta = None
+        RESPUESTAS_PRECALCULADAS.incrementar(self.AGENTE, 'fallo' if respuesta is None else 'acierto')
+        return respuesta
+
+    def _respuesta_sin_modelo(self, user_query: str, city_data: Mapping[str, Any]) -> Optional[str]:
+        """
+        Respuesta precalculada o de la caché de respuestas, sin llamar a Gemini.
+
+        Lee SQLite: en el webhook asíncrono se ejecuta en el pool de hilos.
+        """
+        # Las consultas de un tema frecuente se responden por adelantado
+        respuesta = self._respuesta_precalculada(user_query, city_data)
+        if respuesta is not None:
+            return respuesta
+        # Reutilizar una respuesta previa para la misma ciudad y consulta
+        if self.cache_respuestas is not None:
+            respuesta = self.cache_respuestas.obtener(city_data.get("ciudad", ""), user_query)
+        return respuesta
+
+    def _error_generacion(self, e: Exception) -> str:
+        logger.error(f"Error generando respuesta de {self.DESCRIPCION}: {str(e)}")
+        RESPALDOS.incrementar(self.AGENTE, 'error_generacion')
+        return self.MENSAJE_ERROR_GENERACION
+
+    def generate_response(self, user_query: str, city_data: Mapping[str, Any],
+                          plazo: Optional[Plazo] = None) -> str:
+        """
+        Genera una respuesta usando RAG con Gemini.
+
+        Args:
+            user_query: Consulta del usuario.
+            city_data: Datos de la ciudad.
+            plazo: Plazo de la petición (opcional). Sin él no hay tiempo límite.
+
+        Returns:
+            Respuesta generada.
+
+        Raises:
+            PlazoVencido: Si Gemini no respondió dentro del plazo.
+        """
+        try:
+            respuesta = self._respuesta_sin_modelo(user_query, city_data)
+            if respuesta is not None:
+                return respuesta
+
+            ciudad = city_data.get("ciudad", "")
+            guardar = None
+            if self.cache_respuestas is not None:
+                def guardar(response):
+                    self.cache_respuestas.guardar(ciudad, user_query, response.text)
+
+            limite = plazo.para_etapa('generacion') if plazo is not None else None
+            response = self._llamar_modelo(
+                self._construir_prompt(user_query, city_data), limite, 'generacion',
+                clave_vuelo(self.AGENTE, 'generacion', ciudad, user_query), guardar,
+                **OPCIONES[self.COLECCION]
+            )
+            return response.text
+
+        except PlazoVencido:
+            raise
+        except Exception as e:
+            return self._error_generacion(e)
+
+    async def agenerate_response(self, user_query: str, city_data: Mapping[str, Any],
+                                 plazo: Optional[Plazo] = None) -> str:
+        """Versión asíncrona de ``generate_response`` (usa la API asíncrona de Gemini)."""
+        try:
+            if self.precalculadas is not None or self.cache_respuestas is not None:
+                respuesta = await ejecutar_bloqueante(self._respuesta_sin_modelo, user_query, city_data)
+                if respuesta is not None:
+                    return respuesta
+
+            ciudad = city_data.get("ciudad", "")
+            guardar = None
+            if self.cache_respuestas is not None:
+                async def guardar(response):
+                    await ejecutar_bloqueante(self.cache_respuestas.guardar, ciudad, user_query, response.text)
+
+            limite = plazo.para_etapa('generacion') if plazo is not None else None
+            response = await self._allamar_modelo(
+                self._construir_prompt(user_query, city_data), limite, 'generacion',
+                clave_vuelo(self.AGENTE, 'generacion', ciudad, user_query), guardar,
+                **OPCIONES[self.COLECCION]
+            )
+            return response.text
+
+        except PlazoVencido:
+            raise
+        except Exception as e:
+            return self._error_generacion(e)
+
+    @abstractmethod
+    def _prompt_extraccion(self, user_query: str) -> str:
+        """Construye el prompt para extraer la ciudad con Gemini."""
+
+    def _resolver_ciudad_local(self, user_query: str) -> Optional[str]:
+        """Intenta resolver la ciudad con el resolutor local (sin llamar a Gemini)."""
+        if self.resolutor is None:
+            return None
+        resultado = self.resolutor.resolver(user_query)
+        return resultado.ciudad if resultado is not None else None
+
+    def _error_extraccion(self, e: Exception) -> str:
+        logger.error(f"Error extrayendo ciudad: {str(e)}")
+        RESPALDOS.incrementar(self.AGENTE, 'error_extraccion')
+        return "None"
+
+    def _extraer_ciudad(self, user_query: str, plazo: Optional[Plazo] = None) -> str:
+        """
+        Extrae con Gemini la ciudad mencionada en la consulta.
+
+        Returns:
+            Nombre de la ciudad o "None".
+
+        Raises:
+            PlazoVencido: Si Gemini no respondió dentro del plazo de extracción.
+        """
+        try:
+            limite = plazo.para_etapa('extraccion', settings.PLAZO_EXTRACCION_SEGUNDOS) if plazo is not None else None
+            response = self._llamar_modelo(
+                self._prompt_extraccion(user_query), limite, 'extraccion',
+                clave_vuelo(self.AGENTE, 'extraccion', '', user_query)
+            )
+            return response.text.strip()
+        except PlazoVencido:
+            raise
+        except Exception as e:
+            return self._error_extraccion(e)
+
+    async def _aextraer_ciudad(self, user_query: str, plazo: Optional[Plazo] = None) -> str:
+        """Versión asíncrona de ``_extraer_ciudad``."""
+        try:
+            limite = plazo.para_etapa('extraccion', settings.PLAZO_EXTRACCION_SEGUNDOS) if plazo is not None else None
+            response = await self._allamar_modelo(
+                self._prompt_extraccion(user_query), limite, 'extraccion',
+                clave_vuelo(self.AGENTE, 'extraccion', '', user_query)
+            )
+            return response.text.strip()
+        except PlazoVencido:
+            raise
+        except Exception as e:
+            return self._error_extraccion(e)
+
+    def _buscar_especulativo(self, user_query: str) -> Optional[Dict[str, Any]]:
+        """Búsqueda vectorial sin filtro sobre el texto crudo de la consulta."""
+        results = self.chroma_db.query_collection(self.COLECCION, user_query, n_results=1)
+        return results[0] if results else None
+
+    def _error_especulativo(self, e: Exception) -> None:
+        logger.error(f"Error en recuperación especulativa: {str(e)}")
+        RESPALDOS.incrementar(self.AGENTE, 'error_especulativo')
+
+    def _recuperar(self, city: str, especulativo: Optional[Future], plazo: Plazo) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene los datos de la ciudad dentro del plazo de recuperación.
+
+        Un acierto exacto del índice tiene prioridad y se resuelve en el hilo
+        actual; si no, se reutiliza el resultado especulativo cuando su
+        ``ciudad`` coincide y solo en otro caso se consulta ChromaDB con
+        tiempo límite.
+
+        Raises:
+            PlazoVencido: Si la recuperación no terminó dentro del plazo.
+        """
+        if self.indice is not None:
+            city_data = self.indice.buscar(self.COLECCION, city)
+            if city_data is not None:
+                return city_data
+        if especulativo is not None:
+            try:
+                candidato = especulativo.result(
+                    timeout=plazo.para_etapa('recuperacion', settings.PLAZO_RECUPERACION_SEGUNDOS)
+                )
+            except TimeoutFuturo:
+                candidato = None
+            except Exception as e:
+                self._error_especulativo(e)
+                candidato = None
+            if misma_ciudad(candidato, city):
+                return candidato
+        limite = plazo.para_etapa('recuperacion', settings.PLAZO_RECUPERACION_SEGUNDOS)
+        return ejecutar_con_plazo(obtener_executor(), limite, 'recuperacion', self.buscar_documento, city)
+
+    async def _arecuperar(self, city: str, especulativo: Optional[asyncio.Future],
+                          plazo: Plazo) -> Optional[Dict[str, Any]]:
+        """Versión asíncrona de ``_recuperar``."""
+        if self.indice is not None:
+            city_data = await ejecutar_bloqueante(self.indice.buscar, self.COLECCION, city)
+            if city_data is not None:
+                return city_data
+        if especulativo is not None:
+            limite = plazo.para_etapa('recuperacion', settings.PLAZO_RECUPERACION_SEGUNDOS)
+            try:
+                candidato = await esperar_con_plazo(especulativo, limite, 'recuperacion')
+            except PlazoVencido:
+                candidato = None
+            except Exception as e:
+                self._error_especulativo(e)
+                candidato = None
+            if misma_ciudad(candidato, city):
+                return candidato
+        limite = plazo.para_etapa('recuperacion', settings.PLAZO_RECUPERACION_SEGUNDOS)
+        return await esperar_con_plazo(
+            ejecutar_bloqueante(self.buscar_documento, city), limite, 'recuperacion'
+        )
+
+    def _es_seguimiento(self, user_query: str) -> bool:
+        """
+        Indica si el turno es solo un tema frecuente de la colección ("¿Y
+        restaurantes?"), sin otras palabras que puedan ser una ciudad que el
+        resolutor no reconoció (desconocida o mal escrita).
+        """
+        return clasificar_tema(self.COLECCION, user_query) is not None
+
+    def _continuar_sesion(self, sesion: Optional[str]) -> Optional[Mapping[str, Any]]:
+        """
+        Documento de la ciudad del turno anterior de la sesión.
+
+        Se resuelve en el índice en memoria o, si no está, por id en
+        ChromaDB; en ningún caso hay extracción ni búsqueda vectorial.
+        """
+        if self.sesiones is None or not sesion:
+            return None
+        estado = self.sesiones.obtener(self.AGENTE, sesion)
+        if estado is None:
+            SESIONES.incrementar(self.AGENTE, 'sin_estado')
+            return None
+        city_data = self.indice.buscar(self.COLECCION, estado.ciudad) if self.indice is not None else None
+        if city_data is None:
+            city_data = self.chroma_db.obtener_documento(self.COLECCION, estado.id_documento)
+        SESIONES.incrementar(self.AGENTE, 'continuacion' if city_data is not None else 'sin_documento')
+        return city_data
+
+    def _recordar_sesion(self, sesion: Optional[str], city_data: Mapping[str, Any]) -> None:
+        if self.sesiones is not None and sesion:
+            self.sesiones.recordar(self.AGENTE, sesion, self.COLECCION, city_data)
+
+    async def _arecordar_sesion(self, sesion: Optional[str], city_data: Mapping[str, Any]) -> None:
+        if self.sesiones is not None and sesion:
+            await ejecutar_bloqueante(self.sesiones.recordar, self.AGENTE, sesion, self.COLECCION, city_data)
+
+    def _respuesta_inmediata(self, user_query: str, city: Optional[str]) -> Optional[str]:
+        """Respuesta que no espera a la recuperación ni a Gemini (por defecto ninguna)."""
+        return None
+
+    async def _arespuesta_inmediata(self, user_query: str, city: Optional[str]) -> Optional[str]:
+        """Versión asíncrona de ``_respuesta_inmediata``."""
+        return self._respuesta_inmediata(user_query, city)
+
+    async def _aresolver_ciudad_local(self, user_query: str) -> Optional[str]:
+        """Versión asíncrona de ``_resolver_ciudad_local``: la búsqueda difusa se ejecuta en el pool."""
+        if self.resolutor is None:
+            return None
+        return await ejecutar_bloqueante(self._resolver_ciudad_local, user_query)
+
+    def _datos_sin_documento(self, city: Optional[str]) -> Optional[Mapping[str, Any]]:
+        """
+        Datos con los que generar la respuesta cuando no hay ciudad
+        (``city`` vacío) o la colección no tiene su documento. Con None se
+        responde ``_respuesta_sin_documento``.
+        """
+        return None
+
+    def _respuesta_sin_documento(self, city: Optional[str]) -> str:
+        """Respuesta cuando ``_datos_sin_documento`` no aporta datos."""
+        return self.MENSAJE_ERROR
+
+    @abstractmethod
+    def _texto_degradado(self, city_data: Optional[Mapping[str, Any]]) -> str:
+        """Texto de la respuesta degradada, con o sin documento de la ciudad."""
+
+    def _respuesta_degradada(self, city_data: Optional[Mapping[str, Any]], etapa: str) -> str:
+        """Respuesta sin Gemini cuando el plazo se agota en ``etapa`` o el circuito está abierto."""
+        logger.warning(f"Sin respuesta de Gemini ({etapa}), respuesta degradada")
+        RESPUESTAS_DEGRADADAS.incrementar(self.AGENTE, etapa)
+        return self._texto_degradado(city_data)
+
+    def _respuesta_error(self, e: Exception) -> str:
+        logger.error(f"Error procesando consulta de {self.DESCRIPCION}: {str(e)}")
+        RESPALDOS.incrementar(self.AGENTE, 'error')
+        return self.MENSAJE_ERROR
+
+    def process_query(self, user_query: str, city: Optional[str] = None, plazo: Optional[Plazo] = None,
+                      sesion: Optional[str] = None) -> str:
+        """
+        Procesa una consulta completa.
+
+        Args:
+            user_query: Consulta del usuario.
+            city: Ciudad específica (opcional).
+            plazo: Plazo de la petición (por defecto ``WEBHOOK_PLAZO_SEGUNDOS`` desde ahora).
+            sesion: Sesión de Dialogflow (opcional). Si la consulta no nombra
+                ninguna ciudad se reutiliza la del turno anterior.
+
+        Returns:
+            Respuesta procesada, o una respuesta degradada si el plazo se agota.
+        """
+        especulativo = None
+        city_data = None
+        cronometro = Cronometro(ETAPAS_RAG, self.AGENTE)
+        plazo = plazo if plazo is not None else plazo_peticion()
+        try:
+            respuesta = self._respuesta_inmediata(user_query, city)
+            if respuesta is not None:
+                cronometro.marcar('crisis')
+                return respuesta
+
+            # Si no se especifica ciudad, intentar resolverla localmente
+            if not city:
+                city = self._resolver_ciudad_local(user_query)
+                cronometro.marcar('extraccion_local')
+
+            # Un turno de seguimiento sin ciudad reutiliza la de la sesión: sin
+            # Gemini si el turno es solo un tema ("¿Y restaurantes?"); si no, solo
+            # cuando la extracción confirma que no nombra ninguna ciudad
+            seguimiento = not city and self.sesiones is not None and bool(sesion)
+            if seguimiento and self._es_seguimiento(user_query):
+                seguimiento = False
+                city_data = self._continuar_sesion(sesion)
+                cronometro.marcar('sesion')
+
+            if city_data is None:
+                # Solo si el resolutor no encontró nada confiable, extraerla con Gemini,
+                # lanzando en paralelo una búsqueda vectorial especulativa
+                if not city:
+                    if settings.RAG_RECUPERACION_ESPECULATIVA:
+                        especulativo = obtener_executor().submit(self._buscar_especulativo, user_query)
+                    city = self._extraer_ciudad(user_query, plazo)
+                    cronometro.marcar('extraccion_llm')
+
+                if city.lower() == "none":
+                    city = None
+                    if seguimiento:
+                        city_data = self._continuar_sesion(sesion)
+                        cronometro.marcar('sesion')
+                else:
+                    city_data = self._recuperar(city, especulativo, plazo)
+                    cronometro.marcar('recuperacion')
+
+            if city_data:
+                self._recordar_sesion(sesion, city_data)
+            else:
+                city_data = self._datos_sin_documento(city)
+                if city_data is None:
+                    return self._respuesta_sin_documento(city)
+
+            respuesta = self.generate_response(user_query, city_data, plazo)
+            cronometro.marcar('generacion')
+            return respuesta
+
+        except PlazoVencido as e:
+            return self._respuesta_degradada(city_data, e.etapa)
+        except Exception as e:
+            return self._respuesta_error(e)
+        finally:
+            cronometro.terminar()
+            if especulativo is not None:
+                especulativo.cancel()
+
+    async def aprocess_query(self, user_query: str, city: Optional[str] = None,
+                             plazo: Optional[Plazo] = None, sesion: Optional[str] = None) -> str:
+        """Versión asíncrona de ``process_query`` para el webhook ASGI."""
+        especulativo = None
+        city_data = None
+        cronometro = Cronometro(ETAPAS_RAG, self.AGENTE)
+        plazo = plazo if plazo is not None else plazo_peticion()
+        try:
+            respuesta = await self._arespuesta_inmediata(user_query, city)
+            if respuesta is not None:
+                cronometro.marcar('crisis')
+                return respuesta
+
+            if not city:
+                city = await self._aresolver_ciudad_local(user_query)
+                cronometro.marcar('extraccion_local')
+
+            seguimiento = not city and self.sesiones is not None and bool(sesion)
+            if seguimiento and self._es_seguimiento(user_query):
+                seguimiento = False
+                city_data = await ejecutar_bloqueante(self._continuar_sesion, sesion)
+                cronometro.marcar('sesion')
+
+            if city_data is None:
+                if not city:
+                    if settings.RAG_RECUPERACION_ESPECULATIVA:
+                        especulativo = asyncio.ensure_future(
+                            ejecutar_bloqueante(self._buscar_especulativo, user_query)
+                        )
+                    city = await self._aextraer_ciudad(user_query, plazo)
+                    cronometro.marcar('extraccion_llm')
+
+                if city.lower() == "none":
+                    city = None
+                    if seguimiento:
+                        city_data = await ejecutar_bloqueante(self._continuar_sesion, sesion)
+                        cronometro.marcar('sesion')
+                else:
+                    city_data = await self._arecuperar(city, especulativo, plazo)
+                    cronometro.marcar('recuperacion')
+
+            if city_data:
+                await self._arecordar_sesion(sesion, city_data)
+            else:
+                city_data = self._datos_sin_documento(city)
+                if city_data is None:
+                    return self._respuesta_sin_documento(city)
+
+            respuesta = await self.agenerate_response(user_query, city_data, plazo)
+            cronometro.marcar('generacion')
+            return respuesta
+
+        except PlazoVencido as e:
+            return self._respuesta_degradada(city_data, e.etapa)
+        except Exception as e:
+            return self._respuesta_error(e)
+        finally:
+            cronometro.terminar()
+            if especulativo is not None and not especulativo.done():
+                especulativo.cancel()
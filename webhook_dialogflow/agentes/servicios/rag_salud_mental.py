@@ -1,243 +1,117 @@
-import json
-from typing import Dict, List, Any, Optional
-import google.generativeai as genai
+from typing import Dict, Any, Mapping, Optional
 from django.conf import settings
-from .chromadb_service import ServicioChromaDB
+from .rag_base import RAGBase
+from .prompts import (
+    NUMEROS_EMERGENCIA, MENSAJE_EMERGENCIA, DATOS_NACIONALES,
+    respuesta_degradada_salud_mental, respuesta_crisis
+)
+from .detector_crisis import DeteccionCrisis, detectar_crisis
+from .metricas import RESPALDOS, RUTA_CRISIS
+from .concurrencia import ejecutar_bloqueante
 import logging
 
 logger = logging.getLogger(__name__)
 
-class RAGSaludMental:
-    def __init__(self):
-        """Inicializa el servicio RAG para salud mental."""
-        try:
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-            self.chroma_db = ServicioChromaDB()
-            
-            # Números de emergencia nacionales (constantes)
-            self.NUMEROS_EMERGENCIA = {
-                "Línea de la Vida": "800-911-2000",
-                "SAPTEL": "55-5259-8121",
-                "Emergencias": "911",
-                "Consejo Ciudadano": "55-5533-5533",
-                "Cruz Roja": "065"
-            }
-            
-        except Exception as e:
-            logger.error(f"Error inicializando RAGSaludMental: {str(e)}")
-            raise RuntimeError("No se pudo inicializar el servicio RAG de salud mental")
-        
+AGENTE = 'salud_mental'
+
+class RAGSaludMental(RAGBase):
+    """Agente RAG de servicios de salud mental (colección ``salud_mental``)."""
+
+    AGENTE = AGENTE
+    COLECCION = "salud_mental"
+    DESCRIPCION = "salud mental"
+    # Ante cualquier error, al menos los números de emergencia
+    MENSAJE_ERROR = MENSAJE_EMERGENCIA
+    MENSAJE_ERROR_GENERACION = MENSAJE_EMERGENCIA
+
+    # Números de emergencia nacionales (constantes de módulo)
+    NUMEROS_EMERGENCIA = NUMEROS_EMERGENCIA
+
     def get_city_mental_health_info(self, city: str) -> Optional[Dict[str, Any]]:
         """
         Busca información sobre servicios de salud mental en una ciudad.
-        
+
         Args:
             city: Nombre de la ciudad a buscar.
-            
+
         Returns:
             Información de salud mental de la ciudad o None si no se encuentra.
         """
-        try:
-            # Buscar con filtro exacto primero
-            results = self.chroma_db.query_collection(
-                "salud_mental",
-                city,
-                n_results=1,
-                filtro={"ciudad": city}
-            )
-            
-            if not results:
-                # Si no hay resultados exactos, buscar sin filtro
-                results = self.chroma_db.query_collection(
-                    "salud_mental",
-                    city,
-                    n_results=1
-                )
-            
-            return results[0] if results else None
-            
-        except Exception as e:
-            logger.error(f"Error buscando información de salud mental para {city}: {str(e)}")
+        return self.buscar_documento(city)
+
+    async def aget_city_mental_health_info(self, city: str) -> Optional[Dict[str, Any]]:
+        """Versión asíncrona de ``get_city_mental_health_info``."""
+        return await self.abuscar_documento(city)
+
+    def _prompt_extraccion(self, user_query: str) -> str:
+        """Construye el prompt para extraer la ciudad con Gemini."""
+        return f"""
+        Analiza la siguiente consulta y extrae el nombre de la ciudad mexicana mencionada.
+        Si no hay ninguna mencionada explícitamente, responde "None".
+
+        Consulta: {user_query}
+
+        Responde ÚNICAMENTE con el nombre de la ciudad, sin texto adicional:
+        """
+
+    def _respuesta_inmediata(self, user_query: str, city: Optional[str]) -> Optional[str]:
+        """Ante lenguaje de crisis responder ya, sin esperar a Gemini."""
+        deteccion = detectar_crisis(user_query) if settings.CRISIS_RUTA_RAPIDA else None
+        if deteccion is None:
             return None
+        return self._respuesta_crisis(user_query, city, deteccion)
 
-    def generate_response(self, user_query: str, city_data: Dict[str, Any]) -> str:
+    async def _arespuesta_inmediata(self, user_query: str, city: Optional[str]) -> Optional[str]:
+        """Versión asíncrona: la detección es inmediata, el índice se consulta en el pool."""
+        deteccion = detectar_crisis(user_query) if settings.CRISIS_RUTA_RAPIDA else None
+        if deteccion is None:
+            return None
+        return await ejecutar_bloqueante(self._respuesta_crisis, user_query, city, deteccion)
+
+    def _respuesta_crisis(self, user_query: str, city: Optional[str], deteccion: DeteccionCrisis) -> str:
         """
-        Genera una respuesta usando RAG con Gemini.
-        
-        Args:
-            user_query: Consulta del usuario.
-            city_data: Datos de la ciudad.
-            
-        Returns:
-            Respuesta generada.
+        Respuesta inmediata ante lenguaje de crisis, sin Gemini ni ChromaDB:
+        números de emergencia y, si la ciudad se resuelve en memoria, sus
+        líneas locales del índice.
         """
-        try:
-            # Extraer información relevante
-            info_salud = city_data.get("informacion_salud_mental", {})
-            campos = info_salud.get("campos_extraidos", {})
-            resumen = info_salud.get("resumen_salud_mental", "")
-            contactos = city_data.get("contactos_nacionales", [])
-            
-            # Construir el prompt con la información estructurada
-            prompt_template = """
-            Actúa como un profesional de la salud mental empático y comprensivo. Tu prioridad es la 
-            seguridad y el bienestar de la persona. Usa la siguiente información verificada para 
-            proporcionar ayuda y recursos.
-
-            Ciudad: {ciudad}
-
-            Resumen de servicios disponibles:
-            {resumen}
-
-            Recursos locales disponibles:
-            - Centros de atención: {centros}
-            - Servicios gratuitos: {servicios}
-            - Líneas de ayuda locales: {lineas_locales}
-            - Organizaciones de apoyo: {organizaciones}
-            - Hospitales: {hospitales}
-
-            Números de emergencia (SIEMPRE INCLUIR EN LA RESPUESTA):
-            {numeros_emergencia}
-
-            Consulta del usuario:
-            {query}
-
-            Instrucciones CRÍTICAS para la respuesta:
-            1. SIEMPRE prioriza la seguridad del usuario
-            2. SIEMPRE incluye números de emergencia relevantes
-            3. Mantén un tono empático, comprensivo y esperanzador
-            4. Proporciona recursos específicos de la localidad cuando estén disponibles
-            5. Anima activamente a buscar ayuda profesional
-            6. Si detectas riesgo, enfatiza la importancia de contactar servicios de emergencia
-            7. NO minimices la situación ni des consejos genéricos
-            8. Responde con estructura clara: Empatía → Recursos → Próximos pasos
-            """
-            safety_settings = [
-                {
-                    "category": genai.types.HarmCategory.HARM_CATEGORY_HARASSMENT,
-                    "threshold": genai.types.HarmBlockThreshold.BLOCK_NONE
-                },
-                {
-                    "category": genai.types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-                    "threshold": genai.types.HarmBlockThreshold.BLOCK_NONE
-                },
-                {
-                    "category": genai.types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
-                    "threshold": genai.types.HarmBlockThreshold.BLOCK_NONE
-                },
-                {
-                    "category": genai.types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
-                    "threshold": genai.types.HarmBlockThreshold.BLOCK_NONE
-                }
-            ]
-            # Formatear números de emergencia
-            numeros_fmt = "\n".join([f"- {nombre}: {numero}" 
-                                   for nombre, numero in self.NUMEROS_EMERGENCIA.items()])
-
-            prompt = prompt_template.format(
-                ciudad=city_data.get("ciudad", ""),
-                resumen=resumen,
-                centros=", ".join(campos.get("centros_locales", [])) or "Consulta el número de emergencias",
-                servicios=", ".join(campos.get("servicios_gratuitos", [])) or "Disponibles a través de líneas nacionales",
-                lineas_locales=", ".join(campos.get("lineas_ayuda_locales", [])) or "Ver números nacionales",
-                organizaciones=", ".join(campos.get("organizaciones_apoyo", [])) or "Consulta líneas de ayuda",
-                hospitales=", ".join(campos.get("hospitales_psiquiatricos", [])) or "Acude a urgencias del hospital más cercano",
-                numeros_emergencia=numeros_fmt,
-                query=user_query
-            )
-
-            response = self.model.generate_content(
-                prompt,
-                safety_settings=safety_settings,
-                generation_config={
-                    "temperature": 0.3,  # Más conservador para temas sensibles
-                    "top_p": 0.8,
-                    "top_k": 40,
-                    "max_output_tokens": 1024,
-                }
-            )
-            
-            return response.text
+        # No se registra la consulta: solo la categoría detectada
+        logger.warning(f"Ruta de crisis: {deteccion.categoria}")
+        RUTA_CRISIS.incrementar(deteccion.categoria)
+        if not city:
+            city = self._resolver_ciudad_local(user_query)
+        city_data = None
+        if city and self.indice is not None:
+            city_data = self.indice.buscar(self.COLECCION, city)
+        return respuesta_crisis(city_data)
+
+    def _datos_sin_documento(self, city: Optional[str]) -> Mapping[str, Any]:
+        """
+        Sin información local se responde con los recursos nacionales.
 
-        except Exception as e:
-            logger.error(f"Error generando respuesta de salud mental: {str(e)}")
-            return (f"Si necesitas ayuda inmediata, por favor llama a:\n"
-                   f"- Línea de la Vida: {self.NUMEROS_EMERGENCIA['Línea de la Vida']} (24 horas)\n"
-                   f"- Emergencias: {self.NUMEROS_EMERGENCIA['Emergencias']}")
+        Args:
+            city: Ciudad solicitada sin información local (opcional).
+        """
+        return self._datos_nacionales(city)
 
-    def process_query(self, user_query: str, city: str = None) -> str:
+    def _datos_nacionales(self, city: Optional[str] = None) -> Mapping[str, Any]:
         """
-        Procesa una consulta sobre salud mental.
-        
+        Retorna los datos nacionales base para cuando no hay información local.
+
         Args:
-            user_query: Consulta del usuario.
-            city: Ciudad específica (opcional).
-            
-        Returns:
-            Respuesta procesada.
+            city: Ciudad solicitada sin información local (opcional).
         """
-        try:
-            # Si no se especifica ciudad, intentar extraerla de la consulta
-            if not city:
-                extraction_prompt = f"""
-                Analiza la siguiente consulta y extrae el nombre de la ciudad mexicana mencionada.
-                Si no hay ninguna mencionada explícitamente, responde "None".
-                
-                Consulta: {user_query}
-                
-                Responde ÚNICAMENTE con el nombre de la ciudad, sin texto adicional:
-                """
-                
-                try:
-                    city_response = self.model.generate_content(extraction_prompt)
-                    city = city_response.text.strip()
-                except Exception as e:
-                    logger.error(f"Error extrayendo ciudad: {str(e)}")
-                    city = "None"
-
-            # Preparar datos nacionales base
-            national_data = {
-                "ciudad": "Nacional",
-                "informacion_salud_mental": {
-                    "campos_extraidos": {
-                        "numeros_emergencia": list(self.NUMEROS_EMERGENCIA.values()),
-                        "servicios_gratuitos": [
-                            "Línea de la Vida - Atención 24/7",
-                            "SAPTEL - Sistema de Ayuda Psicológica por Teléfono",
-                            "Consejo Ciudadano - Atención psicológica gratuita"
-                        ]
-                    },
-                    "resumen_salud_mental": (
-                        "Existen servicios nacionales de ayuda disponibles 24/7 para toda la República Mexicana. "
-                        "Estos servicios son gratuitos y confidenciales, atendidos por profesionales capacitados."
-                    )
-                },
-                "contactos_nacionales": [
-                    {"nombre": k, "telefono": v} for k, v in self.NUMEROS_EMERGENCIA.items()
-                ]
-            }
-
-            if city.lower() == "none":
-                # Usar información nacional
-                return self.generate_response(user_query, national_data)
-
-            # Obtener información local de salud mental
-            city_data = self.get_city_mental_health_info(city)
-            if not city_data:
-                # Combinar información nacional con mensaje sobre la ciudad
-                national_data["nota_ciudad"] = (
-                    f"No se encontró información específica para {city}. "
-                    "Te proporcionamos recursos nacionales disponibles para todo México."
-                )
-                return self.generate_response(user_query, national_data)
-
-            # Generar respuesta con información local
-            return self.generate_response(user_query, city_data)
-
-        except Exception as e:
-            logger.error(f"Error procesando consulta de salud mental: {str(e)}")
-            emergency_msg = (f"Si necesitas ayuda inmediata, por favor llama a:\n"
-                           f"- Línea de la Vida: {self.NUMEROS_EMERGENCIA['Línea de la Vida']} (24 horas)\n"
-                           f"- Emergencias: {self.NUMEROS_EMERGENCIA['Emergencias']}")
-            return emergency_msg
+        RESPALDOS.incrementar(AGENTE, 'datos_nacionales' if not city else 'sin_informacion')
+        if not city:
+            return DATOS_NACIONALES
+        # Combinar información nacional con mensaje sobre la ciudad
+        return {
+            **DATOS_NACIONALES,
+            "nota_ciudad": (
+                f"No se encontró información específica para {city}. "
+                "Te proporcionamos recursos nacionales disponibles para todo México."
+            )
+        }
+
+    def _texto_degradado(self, city_data: Optional[Mapping[str, Any]]) -> str:
+        """Recursos locales (o nacionales) y números de emergencia."""
+        return respuesta_degradada_salud_mental(city_data or DATOS_NACIONALES)
@@ -0,0 +1,315 @@
+"""
+Registro de servicios compartidos por proceso (worker).
+
+Los webhooks obtienen aquí los agentes RAG ya construidos en lugar de crear
+un cliente de ChromaDB y un modelo de Gemini nuevos en cada petición.
+"""
+import threading
+import logging
+import time
+from typing import Any, Dict, Optional
+from django.conf import settings
+from .chromadb_service import ServicioChromaDB
+from .rag_turismo import RAGTurismo
+from .rag_salud_mental import RAGSaludMental
+from .resolutor_ciudades import ResolutorCiudades
+from .indice_ciudades import IndiceCiudades, COLECCIONES
+from .cache_respuestas import CacheRespuestas
+from .estado_sesion import EstadoSesiones
+from .respuestas_precalculadas import AlmacenRespuestas
+from .cliente_gemini import ClienteGemini, crear_cliente_gemini
+from . import concurrencia
+from .metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+class RegistroServicios:
+    """
+    Contenedor perezoso y seguro para hilos de los servicios del proceso.
+
+    Un único cliente de ChromaDB y un único modelo de Gemini se comparten
+    entre ambos agentes. Cada servicio se construye como máximo una vez
+    mientras no se llame a ``reset``.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._modelo = None
+        self._chroma_db = None
+        self._indice = None
+        self._resolutor = None
+        self._caches_respuestas = {}
+        self._sesiones = None
+        self._precalculadas = None
+        self._rag_turismo = None
+        self._rag_salud_mental = None
+        self._lock_calentamiento = threading.Lock()
+        self._listo = False
+        self._calentamiento: Dict[str, Any] = {}
+
+    def obtener_modelo(self) -> ClienteGemini:
+        """
+        Retorna el cliente de Gemini compartido: un único interruptor de
+        circuito por proceso para ambos agentes y ``ServicioGemini``.
+        """
+        if self._modelo is None:
+            with self._lock:
+                if self._modelo is None:
+                    self._modelo = crear_cliente_gemini()
+        return self._modelo
+
+    def obtener_chroma_db(self) -> ServicioChromaDB:
+        """Retorna el cliente de ChromaDB compartido."""
+        if self._chroma_db is None:
+            with self._lock:
+                if self._chroma_db is None:
+                    self._chroma_db = ServicioChromaDB()
+        return self._chroma_db
+
+    def obtener_indice(self) -> IndiceCiudades:
+        """Retorna el índice exacto ciudad -> documento de ambas colecciones."""
+        if self._indice is None:
+            with self._lock:
+                if self._indice is None:
+                    self._indice = IndiceCiudades(
+                        self.obtener_chroma_db(),
+                        intervalo_verificacion=settings.INDICE_CIUDADES_INTERVALO_VERIFICACION
+                    )
+        return self._indice
+
+    def obtener_resolutor(self) -> ResolutorCiudades:
+        """Retorna el resolutor de ciudades construido con ambas colecciones."""
+        if self._resolutor is None:
+            with self._lock:
+                if self._resolutor is None:
+                    indice = self.obtener_indice()
+                    resolutor = ResolutorCiudades(
+                        indice.ciudades(),
+                        umbral_difuso=settings.RESOLUTOR_UMBRAL_DIFUSO
+                    )
+                    # Mantener el nomenclátor al día cuando se repueblan las colecciones
+                    indice.suscribir(resolutor.actualizar)
+                    self._resolutor = resolutor
+                    logger.info(f"Resolutor de ciudades con {len(resolutor)} nombres")
+        return self._resolutor
+
+    def obtener_cache_respuestas(self, agente: str) -> Optional[CacheRespuestas]:
+        """
+        Retorna la caché de respuestas del agente, o None si está deshabilitada.
+
+        Args:
+            agente: 'turismo' o 'salud_mental'.
+        """
+        politica = settings.CACHE_RESPUESTAS.get(agente, {})
+        if not politica.get('habilitada'):
+            return None
+        if agente not in self._caches_respuestas:
+            with self._lock:
+                if agente not in self._caches_respuestas:
+                    chroma_db = self.obtener_chroma_db()
+                    funcion_embedding = chroma_db.embeber if politica.get('umbral_similitud') else None
+                    self._caches_respuestas[agente] = CacheRespuestas(
+                        agente, politica, funcion_embedding, version_datos=chroma_db.version_datos
+                    )
+        return self._caches_respuestas[agente]
+
+    def obtener_sesiones(self) -> Optional[EstadoSesiones]:
+        """Retorna el estado de sesiones compartido por ambos agentes, o None si está deshabilitado."""
+        if not settings.ESTADO_SESION.get('habilitado'):
+            return None
+        if self._sesiones is None:
+            with self._lock:
+                if self._sesiones is None:
+                    self._sesiones = EstadoSesiones(settings.ESTADO_SESION)
+        return self._sesiones
+
+    def obtener_respuestas_precalculadas(self) -> Optional[AlmacenRespuestas]:
+        """Retorna el almacén de respuestas precalculadas, o None si está deshabilitado."""
+        if not settings.RESPUESTAS_PRECALCULADAS:
+            return None
+        if self._precalculadas is None:
+            with self._lock:
+                if self._precalculadas is None:
+                    self._precalculadas = AlmacenRespuestas(self.obtener_chroma_db().persist_dir)
+        return self._precalculadas
+
+    def obtener_rag_turismo(self) -> RAGTurismo:
+        """Retorna el agente RAG de turismo del proceso."""
+        if self._rag_turismo is None:
+            with self._lock:
+                if self._rag_turismo is None:
+                    self._rag_turismo = RAGTurismo(
+                        model=self.obtener_modelo(),
+                        chroma_db=self.obtener_chroma_db(),
+                        resolutor=self.obtener_resolutor(),
+                        indice=self.obtener_indice(),
+                        cache_respuestas=self.obtener_cache_respuestas('turismo'),
+                        sesiones=self.obtener_sesiones(),
+                        precalculadas=self.obtener_respuestas_precalculadas()
+                    )
+        return self._rag_turismo
+
+    def obtener_rag_salud_mental(self) -> RAGSaludMental:
+        """Retorna el agente RAG de salud mental del proceso."""
+        if self._rag_salud_mental is None:
+            with self._lock:
+                if self._rag_salud_mental is None:
+                    self._rag_salud_mental = RAGSaludMental(
+                        model=self.obtener_modelo(),
+                        chroma_db=self.obtener_chroma_db(),
+                        resolutor=self.obtener_resolutor(),
+                        indice=self.obtener_indice(),
+                        cache_respuestas=self.obtener_cache_respuestas('salud_mental'),
+                        sesiones=self.obtener_sesiones(),
+                        precalculadas=self.obtener_respuestas_precalculadas()
+                    )
+        return self._rag_salud_mental
+
+    def inicializar(self) -> bool:
+        """
+        Construye todos los servicios por adelantado (arranque del worker).
+
+        Returns:
+            True si todos los servicios quedaron listos. Los errores se
+            registran y la construcción se reintenta en la primera petición.
+        """
+        try:
+            self.obtener_rag_turismo()
+            self.obtener_rag_salud_mental()
+            logger.info("Servicios RAG inicializados en el arranque del worker")
+            return True
+        except Exception as e:
+            logger.error(f"Error inicializando servicios del registro: {str(e)}")
+            return False
+
+    def calentar(self) -> bool:
+        """
+        Deja el worker listo para atender tráfico (arranque del worker).
+
+        Además de construir los servicios, abre ambas colecciones y lanza una
+        consulta de prueba en cada una (carga el índice vectorial y el modelo
+        de embeddings), y construye el índice de ciudades. El resultado queda
+        en ``estado()`` para el endpoint de readiness.
+
+        Returns:
+            True si el worker quedó listo. Si otro hilo está calentando, retorna
+            sin esperar.
+        """
+        if not self._lock_calentamiento.acquire(blocking=False):
+            return self._listo
+        try:
+            metricas.configurar(settings.METRICAS_DIRECTORIO, settings.METRICAS_INTERVALO_VOLCADO)
+            etapas: Dict[str, float] = {}
+            inicio = time.perf_counter()
+
+            def etapa(nombre: str, funcion) -> None:
+                t0 = time.perf_counter()
+                funcion()
+                etapas[nombre] = round(time.perf_counter() - t0, 4)
+
+            try:
+                etapa('modelo_gemini', self.obtener_modelo)
+                chroma_db = self.obtener_chroma_db()
+                etapa('embeddings', lambda: chroma_db.embeber(["calentamiento"]))
+                for coleccion in COLECCIONES:
+                    # Abrir la colección y cargar su índice vectorial con una consulta de prueba
+                    etapa(f'coleccion_{coleccion}', lambda c=coleccion: (
+                        chroma_db.crear_coleccion(c),
+                        chroma_db.query_collection(c, "calentamiento", n_results=1)
+                    ))
+                etapa('indice_ciudades', lambda: self.obtener_indice().ciudades())
+                etapa('agentes', lambda: (self.obtener_rag_turismo(), self.obtener_rag_salud_mental()))
+                self._listo = True
+                self._calentamiento = {
+                    'duracion': round(time.perf_counter() - inicio, 4),
+                    'etapas': etapas,
+                    'error': None,
+                }
+                logger.info(f"Worker listo en {self._calentamiento['duracion']}s: {etapas}")
+            except Exception as e:
+                self._listo = False
+                self._calentamiento = {'duracion': None, 'etapas': etapas, 'error': str(e)}
+                logger.error(f"Error calentando el worker: {str(e)}")
+            return self._listo
+        finally:
+            self._lock_calentamiento.release()
+
+    def precargar(self) -> None:
+        """
+        Carga en el proceso maestro de gunicorn (``preload_app``) solo las
+        estructuras de lectura que sobreviven a un fork: documentos
+        decodificados e inmutables, índice de ciudades y resolutor. Los
+        workers las comparten copy-on-write. El modelo de embeddings, el
+        cliente de Gemini y los pools de hilos no son seguros tras un fork y
+        se crean en cada worker (``despues_de_fork`` + ``calentar``); con
+        ``FUNCION_EMBEDDING=onnx_int8`` los pesos del modelo sí se mapean
+        aquí y los workers solo crean su sesión.
+        """
+        inicio = time.perf_counter()
+        self.obtener_resolutor()
+        logger.info(f"Precarga en el proceso maestro en {time.perf_counter() - inicio:.2f}s")
+
+    def despues_de_fork(self) -> None:
+        """
+        Descarta en el worker recién creado los recursos que no se pueden
+        heredar del maestro (conexión de ChromaDB, cliente de Gemini, pools
+        de hilos, conexiones SQLite) y conserva los índices de solo lectura
+        precargados.
+        """
+        with self._lock:
+            self._modelo = None
+            self._rag_turismo = None
+            self._rag_salud_mental = None
+            self._caches_respuestas = {}
+            self._sesiones = None
+            self._precalculadas = None
+            self._listo = False
+            self._calentamiento = {}
+            if self._chroma_db is not None:
+                self._chroma_db.reabrir()
+        concurrencia.reset()
+        metricas.despues_de_fork()
+
+    def estado(self) -> Dict[str, Any]:
+        """Estado de calentamiento y versión de datos para el endpoint de readiness."""
+        estado: Dict[str, Any] = {'listo': self._listo, **self._calentamiento}
+        chroma_db = self._chroma_db
+        if chroma_db is not None:
+            estado['version_datos'] = chroma_db.version_cargada
+            estado['version_datos_disco'] = chroma_db.version_datos()
+        if self._indice is not None:
+            estado['ciudades'] = len(self._indice.ciudades())
+        return estado
+
+    def reset(self) -> None:
+        """
+        Descarta todos los servicios construidos.
+
+        Útil en pruebas y para recargar datos después de repoblar ChromaDB;
+        la siguiente llamada a un ``obtener_*`` los reconstruye.
+        """
+        with self._lock:
+            self._rag_turismo = None
+            self._rag_salud_mental = None
+            self._resolutor = None
+            self._indice = None
+            self._caches_respuestas = {}
+            self._sesiones = None
+            self._precalculadas = None
+            self._chroma_db = None
+            self._modelo = None
+            self._listo = False
+            self._calentamiento = {}
+
+
+registro = RegistroServicios()
+
+
+def obtener_rag_turismo() -> RAGTurismo:
+    """Atajo para obtener el agente de turismo del registro del proceso."""
+    return registro.obtener_rag_turismo()
+
+
+def obtener_rag_salud_mental() -> RAGSaludMental:
+    """Atajo para obtener el agente de salud mental del registro del proceso."""
+    return registro.obtener_rag_salud_mental()
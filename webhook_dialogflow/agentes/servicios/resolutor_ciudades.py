@@ -0,0 +1,268 @@
+"""
+Resolución local de ciudades/destinos mencionados en una consulta.
+
+Sustituye la llamada a Gemini para extraer la ciudad cuando el nombre puede
+reconocerse directamente a partir del nomenclátor formado por los valores
+``ciudad`` de las colecciones.
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import bisect
+import difflib
+import math
+import re
+import unicodedata
+
+# Alias frecuentes -> nombre canónico de la ciudad
+ALIAS_CIUDADES: Dict[str, str] = {
+    "cdmx": "Ciudad de México",
+    "df": "Ciudad de México",
+    "d f": "Ciudad de México",
+    "mexico df": "Ciudad de México",
+    "ciudad de mexico": "Ciudad de México",
+    "gdl": "Guadalajara",
+    "mty": "Monterrey",
+    "qro": "Querétaro",
+    "pdc": "Playa del Carmen",
+    "cd del carmen": "Ciudad del Carmen",
+    "san cris": "San Cristóbal de las Casas",
+    "oax": "Oaxaca",
+    "edomex": "Estado de México",
+}
+
+# Palabras que nunca se consideran candidatas en la búsqueda difusa
+PALABRAS_VACIAS = frozenset(
+    "a al como con cual cuales de del donde el en es esta este hay la las lo los "
+    "me mi para por que quiero se sobre su sus te un una y ir ver hacer comer "
+    "hotel hoteles lugares ayuda servicios informacion".split()
+)
+
+# Nombres de una palabra que también son sustantivos comunes ("tengo paz
+# interior", "dolores de cabeza"): solo cuentan como ciudad tras una palabra
+# de contexto o si llegan como alias explícito
+NOMBRES_COMUNES = frozenset(
+    "paz victoria progreso union libertad esperanza reforma soledad dolores "
+    "concordia providencia trinidad rosario colon centro valle puerto playa".split()
+)
+
+# Palabras que, justo antes de un nombre común, indican que se habla de un lugar
+PALABRAS_CONTEXTO = frozenset(
+    "en a hacia desde visitar visito conocer viajar viajo ir voy vivo "
+    "ciudad municipio destino estado".split()
+)
+
+# Longitud mínima (en caracteres) de un n-grama para intentar la coincidencia
+# difusa; por debajo, palabras corrientes se confunden con nombres ("comal" ~ "Comala")
+LONGITUD_MINIMA_DIFUSA = 6
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Normaliza texto para comparación: sin acentos, minúsculas y sin puntuación.
+
+    Args:
+        texto: Texto a normalizar.
+
+    Returns:
+        Texto normalizado con palabras separadas por un solo espacio.
+    """
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub(" ", sin_acentos.lower()).strip()
+
+
+class ResultadoCiudad(NamedTuple):
+    ciudad: str
+    confianza: float
+    metodo: str
+
+
+class _AutomataPalabras:
+    """Autómata Aho-Corasick sobre secuencias de palabras."""
+
+    def __init__(self, patrones: Iterable[Tuple[Tuple[str, ...], str]]):
+        self._hijos: List[Dict[str, int]] = [{}]
+        self._fallo: List[int] = [0]
+        self._salida: List[List[Tuple[int, str]]] = [[]]
+
+        for palabras, valor in patrones:
+            nodo = 0
+            for palabra in palabras:
+                siguiente = self._hijos[nodo].get(palabra)
+                if siguiente is None:
+                    siguiente = len(self._hijos)
+                    self._hijos[nodo][palabra] = siguiente
+                    self._hijos.append({})
+                    self._fallo.append(0)
+                    self._salida.append([])
+                nodo = siguiente
+            self._salida[nodo].append((len(palabras), valor))
+
+        # Construir enlaces de fallo por anchura
+        cola = list(self._hijos[0].values())
+        while cola:
+            nodo = cola.pop(0)
+            for palabra, hijo in self._hijos[nodo].items():
+                cola.append(hijo)
+                fallo = self._fallo[nodo]
+                while fallo and palabra not in self._hijos[fallo]:
+                    fallo = self._fallo[fallo]
+                destino = self._hijos[fallo].get(palabra, 0)
+                self._fallo[hijo] = destino if destino != hijo else 0
+                self._salida[hijo].extend(self._salida[self._fallo[hijo]])
+
+    def buscar(self, palabras: List[str]) -> List[Tuple[int, int, str]]:
+        """Retorna coincidencias como (inicio, longitud, valor)."""
+        coincidencias = []
+        nodo = 0
+        for i, palabra in enumerate(palabras):
+            while nodo and palabra not in self._hijos[nodo]:
+                nodo = self._fallo[nodo]
+            nodo = self._hijos[nodo].get(palabra, 0)
+            for longitud, valor in self._salida[nodo]:
+                coincidencias.append((i - longitud + 1, longitud, valor))
+        return coincidencias
+
+
+class ResolutorCiudades:
+    """
+    Nomenclátor local de ciudades con alias y coincidencia difusa.
+
+    Las coincidencias exactas (incluidos nombres de varias palabras y alias)
+    se encuentran en una sola pasada con un autómata multipatrón; si no hay
+    ninguna se prueba una coincidencia difusa contra n-gramas de la consulta.
+    La búsqueda difusa solo compara con los nombres que comparten la primera
+    letra, el número de palabras y una longitud compatible con el umbral.
+    """
+
+    def __init__(
+        self,
+        ciudades: Iterable[str],
+        alias: Optional[Dict[str, str]] = None,
+        umbral_difuso: float = 0.82
+    ):
+        """
+        Args:
+            ciudades: Nombres de ciudad tal como aparecen en las colecciones.
+            alias: Alias adicionales (alias -> nombre canónico).
+            umbral_difuso: Similitud mínima para aceptar una coincidencia difusa.
+        """
+        self.umbral_difuso = umbral_difuso
+        self._alias = {**ALIAS_CIUDADES, **(alias or {})}
+        self.actualizar(ciudades)
+
+    def actualizar(self, ciudades: Iterable[str]) -> None:
+        """
+        Reconstruye el nomenclátor con una nueva lista de ciudades.
+
+        Las estructuras se construyen aparte y se sustituyen de una vez, de
+        modo que las búsquedas concurrentes nunca ven un estado a medias.
+
+        Args:
+            ciudades: Nombres de ciudad tal como aparecen en las colecciones.
+        """
+        canonicas: Dict[str, str] = {}
+        for ciudad in ciudades:
+            clave = normalizar_texto(ciudad)
+            if clave:
+                canonicas.setdefault(clave, ciudad)
+
+        patrones: Dict[str, str] = dict(canonicas)
+        for nombre_alias, destino in self._alias.items():
+            clave_destino = normalizar_texto(destino)
+            clave_alias = normalizar_texto(nombre_alias)
+            if clave_alias and clave_alias not in canonicas:
+                patrones[clave_alias] = canonicas.get(clave_destino, destino)
+
+        automata = _AutomataPalabras(
+            (tuple(clave.split()), ciudad) for clave, ciudad in patrones.items()
+        )
+
+        # Candidatos difusos agrupados por (número de palabras, primera letra)
+        # y ordenados por longitud para acotar la ventana con bisect
+        candidatos: Dict[Tuple[int, str], List[Tuple[int, str]]] = {}
+        for clave in canonicas:
+            if clave in NOMBRES_COMUNES:
+                continue
+            candidatos.setdefault((len(clave.split()), clave[0]), []).append((len(clave), clave))
+        indice_difuso = {}
+        for grupo, claves in candidatos.items():
+            claves.sort()
+            indice_difuso[grupo] = ([longitud for longitud, _ in claves], [clave for _, clave in claves])
+        longitudes_ngrama = sorted({n for n, _ in indice_difuso})
+
+        alias_normalizados = frozenset(normalizar_texto(a) for a in self._alias)
+        self._estado = (canonicas, automata, alias_normalizados, indice_difuso, longitudes_ngrama)
+
+    def __len__(self) -> int:
+        return len(self._estado[0])
+
+    def resolver(self, texto: str) -> Optional[ResultadoCiudad]:
+        """
+        Busca la ciudad mencionada en el texto.
+
+        Args:
+            texto: Consulta del usuario.
+
+        Returns:
+            Ciudad resuelta con su confianza, o None si no hay una coincidencia confiable.
+        """
+        palabras = normalizar_texto(texto).split()
+        if not palabras:
+            return None
+
+        canonicas, automata, alias_normalizados, indice_difuso, longitudes_ngrama = self._estado
+        coincidencias = [
+            (inicio, longitud, ciudad) for inicio, longitud, ciudad in automata.buscar(palabras)
+            if longitud > 1
+            or palabras[inicio] not in NOMBRES_COMUNES
+            or palabras[inicio] in alias_normalizados
+            or (inicio > 0 and palabras[inicio - 1] in PALABRAS_CONTEXTO)
+        ]
+        if coincidencias:
+            # Preferir el nombre más largo ("San Francisco de Campeche" sobre "Campeche")
+            _, _, ciudad = max(coincidencias, key=lambda c: (c[1], -c[0]))
+            return ResultadoCiudad(ciudad, 1.0, "exacta")
+
+        return self._resolver_difuso(palabras, canonicas, indice_difuso, longitudes_ngrama)
+
+    def _resolver_difuso(
+        self,
+        palabras: List[str],
+        canonicas: Dict[str, str],
+        indice_difuso: Dict[Tuple[int, str], Tuple[List[int], List[str]]],
+        longitudes_ngrama: List[int]
+    ) -> Optional[ResultadoCiudad]:
+        # ratio = 2·M / (a + b) ≤ 2·min(a, b) / (a + b): fuera de esta ventana
+        # de longitudes ningún nombre puede alcanzar el umbral
+        umbral = self.umbral_difuso
+        mejor: Optional[Tuple[float, str]] = None
+        for n in longitudes_ngrama:
+            for i in range(len(palabras) - n + 1):
+                ngrama = palabras[i:i + n]
+                if ngrama[0] in PALABRAS_VACIAS or ngrama[-1] in PALABRAS_VACIAS:
+                    continue
+                texto_ngrama = " ".join(ngrama)
+                if len(texto_ngrama) < LONGITUD_MINIMA_DIFUSA:
+                    continue
+                grupo = indice_difuso.get((n, texto_ngrama[0]))
+                if grupo is None:
+                    continue
+                longitudes, claves = grupo
+                largo = len(texto_ngrama)
+                desde = bisect.bisect_left(longitudes, math.ceil(largo * umbral / (2 - umbral) - 1e-9))
+                hasta = bisect.bisect_right(longitudes, math.floor(largo * (2 - umbral) / umbral + 1e-9))
+                candidatos = claves[desde:hasta]
+                if not candidatos:
+                    continue
+                for clave in difflib.get_close_matches(
+                    texto_ngrama, candidatos, n=1, cutoff=umbral
+                ):
+                    similitud = difflib.SequenceMatcher(None, texto_ngrama, clave).ratio()
+                    if mejor is None or similitud > mejor[0]:
+                        mejor = (similitud, clave)
+
+        if mejor is None:
+            return None
+        return ResultadoCiudad(canonicas[mejor[1]], round(mejor[0], 3), "difusa")
@@ -0,0 +1,125 @@
+"""
+Almacén de respuestas precalculadas por (agente, ciudad, tema).
+
+``scripts/precalcular_respuestas.py`` genera, después de poblar la base
+vectorial, la respuesta a la pregunta canónica de cada tema de ``temas``
+para cada ciudad, con el mismo prompt que ``generate_response``. Los agentes
+responden desde aquí las consultas que el clasificador de temas reconoce,
+sin llamar a Gemini.
+
+Cada entrada guarda la versión de datos con la que se generó, su expiración
+y un hash de su fuente (hash del documento, pregunta y ``VERSION_RESPUESTAS``).
+El agente solo la usa si no expiró y su hash coincide con el del documento
+que recuperó, de modo que una ciudad repoblada no se responde con datos
+viejos aunque el script aún no se haya vuelto a ejecutar. Como el almacén de
+documentos, es un archivo SQLite en modo WAL dentro del directorio de
+persistencia y no depende de Django.
+"""
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from .resolutor_ciudades import normalizar_texto
+
+ARCHIVO_RESPUESTAS = 'respuestas_precalculadas.sqlite3'
+
+# Incrementar al cambiar las plantillas de prompt o las preguntas de los temas
+VERSION_RESPUESTAS = 1
+
+
+def hash_fuente(hash_documento: str, pregunta: str) -> str:
+    """Hash de lo que determina una respuesta: documento, pregunta y versión."""
+    contenido = f"{VERSION_RESPUESTAS}|{hash_documento}|{pregunta}"
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+class EntradaRespuesta(NamedTuple):
+    hash_fuente: str
+    version_datos: str
+    expira: float
+
+
+class AlmacenRespuestas:
+    """Respuestas precalculadas compartidas entre procesos."""
+
+    def __init__(self, persist_dir: str):
+        """
+        Args:
+            persist_dir: Directorio de persistencia de ChromaDB.
+        """
+        self.ruta = os.path.join(persist_dir, ARCHIVO_RESPUESTAS)
+        self._local = threading.local()
+        os.makedirs(persist_dir, exist_ok=True)
+        with self._conexion() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS respuestas ("
+                "agente TEXT NOT NULL, ciudad TEXT NOT NULL, tema TEXT NOT NULL, "
+                "respuesta TEXT NOT NULL, hash_fuente TEXT NOT NULL, version_datos TEXT NOT NULL, "
+                "generada REAL NOT NULL, expira REAL NOT NULL, "
+                "PRIMARY KEY (agente, ciudad, tema))"
+            )
+
+    def _conexion(self) -> sqlite3.Connection:
+        # Una conexión por hilo y por proceso (las conexiones no sobreviven a un fork)
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or getattr(self._local, 'pid', None) != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=5)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return conexion
+
+    def obtener(self, agente: str, ciudad: str, tema: str,
+                hash_esperado: Optional[str] = None) -> Optional[str]:
+        """
+        Busca la respuesta vigente de una ciudad y tema.
+
+        Args:
+            agente: 'turismo' o 'salud_mental'.
+            ciudad: Nombre de la ciudad (se normaliza).
+            tema: Tema de ``temas.TEMAS``.
+            hash_esperado: ``hash_fuente`` del documento actual; si no
+                coincide, la entrada se considera obsoleta.
+
+        Returns:
+            Texto de la respuesta, o None si no hay una vigente.
+        """
+        fila = self._conexion().execute(
+            "SELECT respuesta, hash_fuente FROM respuestas "
+            "WHERE agente = ? AND ciudad = ? AND tema = ? AND expira > ?",
+            (agente, normalizar_texto(ciudad), tema, time.time())
+        ).fetchone()
+        if fila is None or (hash_esperado is not None and fila[1] != hash_esperado):
+            return None
+        return fila[0]
+
+    def guardar(self, agente: str, ciudad: str, tema: str, respuesta: str, hash_fuente: str,
+                version_datos: str, ttl: float) -> None:
+        """Inserta o reemplaza una respuesta."""
+        ahora = time.time()
+        with self._conexion() as conexion:
+            conexion.execute(
+                "INSERT OR REPLACE INTO respuestas "
+                "(agente, ciudad, tema, respuesta, hash_fuente, version_datos, generada, expira) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (agente, normalizar_texto(ciudad), tema, respuesta, hash_fuente, version_datos, ahora, ahora + ttl)
+            )
+
+    def entradas(self, agente: str) -> Dict[Tuple[str, str], EntradaRespuesta]:
+        """Retorna ``(ciudad normalizada, tema) -> EntradaRespuesta`` de un agente."""
+        filas = self._conexion().execute(
+            "SELECT ciudad, tema, hash_fuente, version_datos, expira FROM respuestas WHERE agente = ?",
+            (agente,)
+        )
+        return {(ciudad, tema): EntradaRespuesta(h, v, e) for ciudad, tema, h, v, e in filas}
+
+    def eliminar(self, agente: str, claves: Iterable[Tuple[str, str]]) -> None:
+        """Elimina las entradas ``(ciudad normalizada, tema)`` de un agente."""
+        with self._conexion() as conexion:
+            conexion.executemany(
+                "DELETE FROM respuestas WHERE agente = ? AND ciudad = ? AND tema = ?",
+                ((agente, ciudad, tema) for ciudad, tema in claves)
+            )
@@ -0,0 +1,305 @@
+"""
+Snapshots versionados de la base vectorial para arranques en frío rápidos.
+
+Un snapshot es un directorio autocontenido::
+
+    snapshot/
+      manifiesto.json                    formato, versión de datos, colecciones y sha256 de cada archivo
+      <coleccion>.vectores.npy           embeddings float32 contiguos (n x dimensión)
+      <coleccion>.registros.json.gz      ids, textos embebidos, metadatos y documentos completos
+
+Los vectores se abren con ``numpy.load(mmap_mode='r')``, así que cargar un
+snapshot no copia los embeddings en memoria ni recalcula ninguno: restaurar
+solo inserta vectores ya calculados. Un contenedor nuevo puede arrancar desde
+un snapshot incluido en la imagen sin acceder a GCS. No depende de Django
+para poder usarse desde los scripts de ingesta y de mantenimiento.
+"""
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+from .almacen_documentos import AlmacenDocumentos
+from .ingesta import escribir_manifiesto, leer_manifiesto
+from .version_datos import leer_version, marcar_version
+
+FORMATO_SNAPSHOT = 1
+ARCHIVO_MANIFIESTO_SNAPSHOT = 'manifiesto.json'
+COLECCIONES_SNAPSHOT = ("destinos_turisticos", "salud_mental")
+
+# Registros por llamada a ChromaDB al restaurar
+_LOTE_RESTAURACION = 512
+
+
+class ColeccionSnapshot(NamedTuple):
+    """Contenido de una colección dentro de un snapshot."""
+    nombre: str
+    ids: List[str]
+    textos: List[str]
+    metadatas: List[Dict[str, Any]]
+    documentos: List[str]
+    vectores: np.ndarray
+
+
+class Snapshot(NamedTuple):
+    """Snapshot cargado: manifiesto y colecciones (vectores en memoria mapeada)."""
+    ruta: str
+    manifiesto: Dict[str, Any]
+    colecciones: Dict[str, ColeccionSnapshot]
+
+
+def _sha256(ruta: str) -> str:
+    digest = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b''):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+def _archivos_coleccion(nombre: str) -> Dict[str, str]:
+    return {
+        "vectores": f"{nombre}.vectores.npy",
+        "registros": f"{nombre}.registros.json.gz",
+    }
+
+
+def construir_snapshot(cliente: Any, almacen: AlmacenDocumentos, persist_dir: str, destino: str,
+                       colecciones=COLECCIONES_SNAPSHOT) -> Dict[str, Any]:
+    """
+    Escribe un snapshot del estado actual de las colecciones.
+
+    El snapshot se escribe en un directorio temporal junto a ``destino`` y
+    se mueve a su lugar al terminar, por lo que nunca queda a medias.
+
+    Args:
+        cliente: Cliente de ChromaDB abierto sobre ``persist_dir``.
+        almacen: Almacén de documentos completos.
+        persist_dir: Directorio de persistencia (versión y manifiesto de ingesta).
+        destino: Directorio del snapshot (se reemplaza si existe).
+        colecciones: Colecciones a incluir.
+
+    Returns:
+        El manifiesto del snapshot.
+    """
+    destino = os.path.abspath(destino)
+    padre = os.path.dirname(destino)
+    os.makedirs(padre, exist_ok=True)
+    temporal = tempfile.mkdtemp(prefix='.snapshot-', dir=padre)
+    try:
+        manifiesto: Dict[str, Any] = {
+            "formato": FORMATO_SNAPSHOT,
+            "version_datos": leer_version(persist_dir),
+            "fecha": datetime.now().isoformat(),
+            "colecciones": {},
+            "ingesta": leer_manifiesto(persist_dir),
+        }
+        for nombre in colecciones:
+            coleccion = cliente.get_or_create_collection(name=nombre)
+            datos = coleccion.get(include=["embeddings", "documents", "metadatas"])
+            ids = list(datos["ids"])
+            payloads = almacen.obtener(ids)
+            vectores = np.ascontiguousarray(np.asarray(datos["embeddings"] or [], dtype=np.float32))
+            if vectores.ndim != 2:
+                # Una colección vacía no tiene dimensión: matriz (0, 0)
+                vectores = vectores.reshape(len(ids), -1) if ids else np.empty((0, 0), dtype=np.float32)
+
+            archivos = _archivos_coleccion(nombre)
+            np.save(os.path.join(temporal, archivos["vectores"]), vectores)
+            registros = {
+                "ids": ids,
+                "textos": list(datos["documents"]),
+                "metadatas": list(datos["metadatas"]),
+                # Las colecciones previas al almacén guardan el documento en ChromaDB
+                "documentos": [payloads.get(i) or t or '' for i, t in zip(ids, datos["documents"])],
+            }
+            with gzip.open(os.path.join(temporal, archivos["registros"]), 'wt', encoding='utf-8') as archivo:
+                json.dump(registros, archivo, ensure_ascii=False, separators=(',', ':'))
+
+            manifiesto["colecciones"][nombre] = {
+                "registros": len(ids),
+                "dimension": int(vectores.shape[1]) if vectores.size else 0,
+                "archivos": {
+                    clave: {"nombre": archivo, "sha256": _sha256(os.path.join(temporal, archivo))}
+                    for clave, archivo in archivos.items()
+                },
+            }
+
+        with open(os.path.join(temporal, ARCHIVO_MANIFIESTO_SNAPSHOT), 'w', encoding='utf-8') as archivo:
+            json.dump(manifiesto, archivo, ensure_ascii=False, indent=1)
+
+        if os.path.isdir(destino):
+            shutil.rmtree(destino)
+        os.replace(temporal, destino)
+        return manifiesto
+    except BaseException:
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+
+
+def leer_manifiesto_snapshot(ruta: str) -> Dict[str, Any]:
+    """
+    Lee el manifiesto de un snapshot.
+
+    Raises:
+        ValueError: Si el formato no es compatible.
+    """
+    with open(os.path.join(ruta, ARCHIVO_MANIFIESTO_SNAPSHOT), encoding='utf-8') as archivo:
+        manifiesto = json.load(archivo)
+    if manifiesto.get("formato") != FORMATO_SNAPSHOT:
+        raise ValueError(f"Formato de snapshot no soportado: {manifiesto.get('formato')}")
+    return manifiesto
+
+
+def cargar_snapshot(ruta: str) -> Snapshot:
+    """
+    Carga un snapshot con los vectores mapeados en memoria.
+
+    Args:
+        ruta: Directorio del snapshot.
+    """
+    manifiesto = leer_manifiesto_snapshot(ruta)
+    colecciones = {}
+    for nombre, info in manifiesto["colecciones"].items():
+        archivos = info["archivos"]
+        vectores = np.load(os.path.join(ruta, archivos["vectores"]["nombre"]), mmap_mode='r')
+        with gzip.open(os.path.join(ruta, archivos["registros"]["nombre"]), 'rt', encoding='utf-8') as archivo:
+            registros = json.load(archivo)
+        colecciones[nombre] = ColeccionSnapshot(
+            nombre, registros["ids"], registros["textos"], registros["metadatas"],
+            registros["documentos"], vectores
+        )
+    return Snapshot(ruta, manifiesto, colecciones)
+
+
+def verificar_snapshot(ruta: str) -> List[str]:
+    """
+    Comprueba hashes, conteos y dimensiones de un snapshot.
+
+    Returns:
+        Lista de problemas encontrados (vacía si el snapshot es válido).
+    """
+    try:
+        manifiesto = leer_manifiesto_snapshot(ruta)
+    except (OSError, ValueError) as e:
+        return [f"Manifiesto ilegible: {str(e)}"]
+
+    problemas = []
+    for nombre, info in manifiesto["colecciones"].items():
+        for clave, archivo in info["archivos"].items():
+            ruta_archivo = os.path.join(ruta, archivo["nombre"])
+            if not os.path.exists(ruta_archivo):
+                problemas.append(f"{nombre}: falta {archivo['nombre']}")
+            elif _sha256(ruta_archivo) != archivo["sha256"]:
+                problemas.append(f"{nombre}: sha256 incorrecto en {archivo['nombre']}")
+    if problemas:
+        return problemas
+
+    snapshot = cargar_snapshot(ruta)
+    for nombre, coleccion in snapshot.colecciones.items():
+        info = manifiesto["colecciones"][nombre]
+        n = len(coleccion.ids)
+        if n != info["registros"]:
+            problemas.append(f"{nombre}: {n} registros, el manifiesto indica {info['registros']}")
+        if not (len(coleccion.textos) == len(coleccion.metadatas) == len(coleccion.documentos) == n):
+            problemas.append(f"{nombre}: listas de registros con longitudes distintas")
+        if n and coleccion.vectores.shape != (n, info["dimension"]):
+            problemas.append(f"{nombre}: vectores {coleccion.vectores.shape}, se esperaban {(n, info['dimension'])}")
+        if coleccion.vectores.dtype != np.float32:
+            problemas.append(f"{nombre}: vectores {coleccion.vectores.dtype}, se esperaba float32")
+        if len(set(coleccion.ids)) != n:
+            problemas.append(f"{nombre}: ids repetidos")
+    return problemas
+
+
+def _lotes(n: int, tamano: int) -> Iterator[slice]:
+    for inicio in range(0, n, tamano):
+        yield slice(inicio, min(inicio + tamano, n))
+
+
+def restaurar_snapshot(snapshot: Snapshot, cliente: Any, almacen: AlmacenDocumentos,
+                       persist_dir: str) -> str:
+    """
+    Reemplaza el contenido de las colecciones por el del snapshot.
+
+    Los embeddings se insertan tal cual, sin recalcularlos. Al terminar se
+    persiste el cliente, se copia el manifiesto de ingesta (para que la
+    siguiente ingesta siga siendo incremental) y se publica una versión nueva.
+
+    Args:
+        snapshot: Snapshot cargado.
+        cliente: Cliente de ChromaDB abierto sobre ``persist_dir``.
+        almacen: Almacén de documentos completos.
+        persist_dir: Directorio de persistencia.
+
+    Returns:
+        La versión de datos publicada.
+    """
+    for nombre, coleccion_snapshot in snapshot.colecciones.items():
+        try:
+            cliente.delete_collection(nombre)
+        except Exception:
+            pass
+        almacen.eliminar_coleccion(nombre)
+        coleccion = cliente.create_collection(name=nombre)
+        n = len(coleccion_snapshot.ids)
+        for lote in _lotes(n, _LOTE_RESTAURACION):
+            ids = coleccion_snapshot.ids[lote]
+            metadatas = coleccion_snapshot.metadatas[lote]
+            almacen.guardar(nombre, (
+                (id_doc, (metadata or {}).get("hash", ""), documento)
+                for id_doc, metadata, documento in zip(ids, metadatas, coleccion_snapshot.documentos[lote])
+            ))
+            coleccion.add(
+                ids=ids,
+                embeddings=np.asarray(coleccion_snapshot.vectores[lote]).tolist(),
+                documents=coleccion_snapshot.textos[lote],
+                metadatas=metadatas,
+            )
+
+    cliente.persist()
+    ingesta = snapshot.manifiesto.get("ingesta")
+    if ingesta and ingesta.get("colecciones"):
+        escribir_manifiesto(persist_dir, ingesta)
+    return marcar_version(persist_dir)
+
+
+@contextmanager
+def bloqueo_restauracion(persist_dir: str) -> Iterator[None]:
+    """Bloqueo entre procesos para que un solo worker restaure el snapshot."""
+    os.makedirs(persist_dir, exist_ok=True)
+    with open(os.path.join(persist_dir, '.restauracion.lock'), 'w') as archivo:
+        fcntl.flock(archivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(archivo, fcntl.LOCK_UN)
+
+
+def restaurar_si_vacio(ruta_snapshot: Optional[str], cliente_factory: Any, almacen: AlmacenDocumentos,
+                       persist_dir: str) -> bool:
+    """
+    Restaura el snapshot si el directorio de persistencia nunca se pobló.
+
+    Args:
+        ruta_snapshot: Directorio del snapshot (None o inexistente no hace nada).
+        cliente_factory: Función sin argumentos que abre un cliente de ChromaDB.
+        almacen: Almacén de documentos completos.
+        persist_dir: Directorio de persistencia.
+
+    Returns:
+        True si se restauró el snapshot.
+    """
+    if not ruta_snapshot or not os.path.isdir(ruta_snapshot) or leer_version(persist_dir):
+        return False
+    with bloqueo_restauracion(persist_dir):
+        # Otro worker pudo restaurarlo mientras se esperaba el bloqueo
+        if leer_version(persist_dir):
+            return False
+        restaurar_snapshot(cargar_snapshot(ruta_snapshot), cliente_factory(), almacen, persist_dir)
+    return True
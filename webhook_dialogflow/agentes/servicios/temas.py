@@ -0,0 +1,99 @@
+"""
+Clasificador local de temas para las respuestas precalculadas.
+
+Cada colección tiene unos pocos temas frecuentes (hoteles, comida, lugares y
+consejos de un destino; servicios gratuitos y líneas de ayuda de una ciudad)
+con una pregunta canónica, que es la que se responde por adelantado con
+``scripts/precalcular_respuestas.py``.
+
+La clasificación prefiere no responder a equivocarse: una consulta pertenece
+a un tema solo si, quitando el nombre de la ciudad y las palabras de relleno,
+todas las palabras que quedan son de ese tema. "¿Qué hoteles hay en
+Mérida?" es ``hoteles``; "hoteles baratos cerca de la playa" no es ningún
+tema y sigue el camino normal hasta Gemini.
+"""
+from typing import Dict, FrozenSet, NamedTuple, Optional
+from .resolutor_ciudades import normalizar_texto
+
+
+class Tema(NamedTuple):
+    """Tema frecuente: pregunta canónica (con ``{ciudad}``) y palabras que lo identifican."""
+    pregunta: str
+    palabras: FrozenSet[str]
+
+
+def _tema(pregunta: str, palabras: str) -> Tema:
+    return Tema(pregunta, frozenset(palabras.split()))
+
+
+# Colección -> nombre del tema -> tema
+TEMAS: Dict[str, Dict[str, Tema]] = {
+    'destinos_turisticos': {
+        'hoteles': _tema(
+            "¿Qué hoteles y opciones de hospedaje me recomiendas en {ciudad}?",
+            "hotel hoteles hospedaje hospedarme hospedarse alojamiento alojarme hostal hostales "
+            "dormir quedarme",
+        ),
+        'comida': _tema(
+            "¿Qué comida típica y restaurantes me recomiendas en {ciudad}?",
+            "comida comer comidas restaurante restaurantes gastronomia platillo platillos tipica tipico "
+            "tipicas tipicos cenar desayunar",
+        ),
+        'lugares': _tema(
+            "¿Qué lugares turísticos puedo visitar en {ciudad}?",
+            "lugares lugar visitar atracciones atraccion turisticos turisticas sitios conocer hacer "
+            "recorrer pasear",
+        ),
+        'consejos': _tema(
+            "¿Qué consejos me das para viajar a {ciudad}?",
+            "consejos consejo tips recomendaciones sugerencias viajar viaje",
+        ),
+    },
+    'salud_mental': {
+        'servicios_gratuitos': _tema(
+            "¿Qué servicios de salud mental gratuitos hay en {ciudad}?",
+            "servicios servicio gratuitos gratuito gratuitas gratuita gratis costo atencion "
+            "psicologica psicologico psicologicos centros centro clinicas clinica",
+        ),
+        'lineas_ayuda': _tema(
+            "¿Qué líneas de ayuda y teléfonos de salud mental hay en {ciudad}?",
+            "linea lineas telefono telefonos numero numeros contacto contactos",
+        ),
+    },
+}
+
+# Palabras que no cambian el tema de la consulta
+RELLENO = frozenset((
+    "a al algo algun alguna algunas algunos buen buena buenas bueno buenos cual cuales de del donde "
+    "el en hay la las lo los me mejor mejores mi muy o para por puedo que quiero recomiendame "
+    "recomiendas recomiendan se sobre su sus te un una unas unos y favor busco necesito informacion "
+    "ayuda salud mental ciudad cerca encuentro existen tienen"
+).split())
+
+
+def clasificar_tema(nombre_coleccion: str, consulta: str, ciudad: str = "") -> Optional[str]:
+    """
+    Clasifica la consulta en uno de los temas de la colección.
+
+    Args:
+        nombre_coleccion: Colección del agente.
+        consulta: Consulta del usuario.
+        ciudad: Ciudad resuelta; sus palabras se ignoran.
+
+    Returns:
+        Nombre del tema, o None si la consulta no es exactamente de un tema.
+    """
+    temas = TEMAS.get(nombre_coleccion)
+    if not temas:
+        return None
+    ignoradas = RELLENO | frozenset(normalizar_texto(ciudad).split())
+    palabras = [p for p in normalizar_texto(consulta).split() if p not in ignoradas]
+    if not palabras:
+        return None
+    encontrado = None
+    for nombre, tema in temas.items():
+        if all(p in tema.palabras for p in palabras):
+            if encontrado is not None:
+                return None
+            encontrado = nombre
+    return encontrado
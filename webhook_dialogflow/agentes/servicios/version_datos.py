@@ -0,0 +1,53 @@
+"""
+Marca de versión de los datos de la base vectorial.
+
+Cada proceso que reescribe las colecciones (``poblar_vectordb.py`` o
+``ServicioChromaDB.agregar_documentos``) escribe una versión nueva en el
+directorio de persistencia; los índices y cachés en memoria la comparan para
+saber cuándo deben reconstruirse. No depende de Django para poder usarse
+desde los scripts de ingesta.
+"""
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+
+ARCHIVO_VERSION = 'version_datos.json'
+
+
+def leer_version(persist_dir: str) -> str:
+    """
+    Lee la versión actual de los datos.
+
+    Args:
+        persist_dir: Directorio de persistencia de ChromaDB.
+
+    Returns:
+        Identificador de versión, o cadena vacía si nunca se ha marcado.
+    """
+    try:
+        with open(os.path.join(persist_dir, ARCHIVO_VERSION), encoding='utf-8') as archivo:
+            return json.load(archivo).get('version', '')
+    except (OSError, ValueError):
+        return ''
+
+
+def marcar_version(persist_dir: str) -> str:
+    """
+    Escribe una versión nueva de forma atómica.
+
+    Args:
+        persist_dir: Directorio de persistencia de ChromaDB.
+
+    Returns:
+        El identificador de la versión escrita.
+    """
+    version = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(persist_dir, exist_ok=True)
+    ruta = os.path.join(persist_dir, ARCHIVO_VERSION)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump({'version': version, 'fecha': datetime.now().isoformat()}, archivo)
+    os.replace(temporal, ruta)
+    return version
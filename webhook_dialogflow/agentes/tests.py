@@ -1,3 +1,1913 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import runpy
+import tempfile
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.test import Client, RequestFactory, SimpleTestCase, override_settings
+from benchmarks import datos as datos_benchmark, falsos
+from benchmarks.corpus_crisis import NEGATIVOS, POSITIVOS
+from benchmarks.ejecutar import comparar, estadisticas
+from webhook_dialogflow import procesos
+from . import views
+from .servicios.indice_ciudades import IndiceCiudades, misma_ciudad
+from .servicios.resolutor_ciudades import ResolutorCiudades, normalizar_texto
+from .servicios.estado_sesion import EstadoSesiones
+from .servicios.rag_base import RAGBase
+from .servicios.rag_turismo import RAGTurismo
+from .servicios.rag_salud_mental import RAGSaludMental
+from .servicios.prompts import (
+    MENSAJE_EMERGENCIA, MENSAJE_DEMORA_TURISMO, VERSION_CONTEXTO, construir_prompt,
+    metadatos_contexto, obtener_contexto
+)
+from .servicios.cliente_gemini import ABIERTO, CERRADO, CircuitoAbierto, ClienteGemini, InterruptorCircuito
+from .servicios.coalescencia import GrupoVuelo, clave_vuelo
+from .servicios.limitador import CuboTokens, LimiteExcedido
+from .servicios.plazos import Plazo, PlazoVencido, ejecutar_con_plazo, esperar_con_plazo
+from .servicios import concurrencia
+from .servicios.almacen_documentos import AlmacenDocumentos
+from .servicios.backends_cache import BackendDjangoCache, BackendMemoria, BackendSQLite
+from .servicios.cache_respuestas import CacheRespuestas
+from .servicios.cache_documentos import CacheDocumentos, VistaDocumento, congelar
+from .servicios.chromadb_service import ServicioChromaDB
+from .servicios import metricas
+from .servicios.metricas import CACHE_DOCUMENTOS, CACHE_RESPUESTAS, RESPUESTAS_DEGRADADAS, RUTA_CRISIS, Cronometro, RegistroMetricas
+from .servicios.detector_crisis import detectar_crisis
+from .servicios.registro import RegistroServicios
+from .servicios.respuestas_precalculadas import AlmacenRespuestas, EntradaRespuesta, hash_fuente
+from .servicios.temas import TEMAS, clasificar_tema
+from .servicios.embeddings import EtapaEmbeddings, crear_funcion_embedding
+from .servicios.embeddings_onnx import preparar_modelo
+from .servicios.motor_vectorial import ClienteVectorial
+from .servicios.snapshot import construir_snapshot, restaurar_si_vacio, verificar_snapshot
+from .servicios.version_datos import leer_version, marcar_version
+from .servicios.descarga import ArchivoFuente, DescargadorParalelo, FuenteLocal, decodificar_json
+from .servicios.ingesta import (
+    TEXTO_DOCUMENTO, TEXTO_RESUMEN, PlanArchivos, estado_actualizado, hash_documento, id_documento,
+    ids_obsoletos, leer_manifiesto, escribir_manifiesto, planificar_archivos, registros_cambiados,
+    registros_unicos, texto_embedding, aplicar_registros, eliminar_registros
+)
+from scripts.poblar_vectordb import sincronizar_coleccion
+from scripts.precalcular_respuestas import planificar
 
-# Create your tests here.
+
+def valor_metrica(metrica, *etiquetas) -> float:
+    """Valor actual de una serie de un contador (0 si no existe)."""
+    for valores, dato in metrica.exportar_series():
+        if tuple(valores) == etiquetas:
+            return dato
+    return 0.0
+
+
+class ModeloFalso:
+    """Cliente de Gemini falso: responde según el prompt y registra las llamadas."""
+
+    def __init__(self, extraccion="None", generacion="respuesta generada", error=None):
+        self.extraccion = extraccion
+        self.generacion = generacion
+        self.error = error
+        self.prompts = []
+
+    def _responder(self, prompt):
+        self.prompts.append(prompt)
+        if self.error is not None:
+            raise self.error
+        if "extrae el nombre" in prompt:
+            return SimpleNamespace(text=self.extraccion)
+        return SimpleNamespace(text=self.generacion)
+
+    def generate_content(self, prompt, **opciones):
+        return self._responder(prompt)
+
+    async def generate_content_async(self, prompt, **opciones):
+        return self._responder(prompt)
+
+    def extracciones(self):
+        return [p for p in self.prompts if "extrae el nombre" in p]
+
+
+class ChromaFalso:
+    """Colecciones en memoria con búsqueda "vectorial" por nombre de ciudad."""
+
+    def __init__(self, documentos):
+        self.documentos = documentos
+        self.consultas = []
+
+    def query_collection(self, coleccion, texto, n_results=1, filtro=None):
+        self.consultas.append((coleccion, texto, filtro))
+        for doc in self.documentos.get(coleccion, []):
+            if filtro is not None:
+                if doc["ciudad"] == filtro.get("ciudad"):
+                    return [doc]
+            elif normalizar_texto(doc["ciudad"]) in normalizar_texto(texto):
+                return [doc]
+        return []
+
+    def obtener_documento(self, coleccion, id_doc):
+        self.consultas.append((coleccion, id_doc, None))
+        return None
+
+    def reabrir(self):
+        self.reaperturas = getattr(self, "reaperturas", 0) + 1
+
+
+class IndiceFalso:
+    """Índice exacto en memoria con la interfaz de ``IndiceCiudades``."""
+
+    def __init__(self, documentos):
+        self._indices = {
+            coleccion: {normalizar_texto(doc["ciudad"]): doc for doc in docs}
+            for coleccion, docs in documentos.items()
+        }
+
+    def buscar(self, coleccion, ciudad):
+        return self._indices.get(coleccion, {}).get(normalizar_texto(ciudad))
+
+    def ciudades(self):
+        return list(dict.fromkeys(doc["ciudad"] for indice in self._indices.values() for doc in indice.values()))
+
+
+DOCUMENTOS = {
+    "destinos_turisticos": [
+        {"ciudad": "Oaxaca", "descripcion": "Capital gastronómica", "_metadata": {"ciudad": "Oaxaca"}},
+        {"ciudad": "Mérida", "descripcion": "Ciudad blanca", "_metadata": {"ciudad": "Mérida"}},
+    ],
+    "salud_mental": [
+        {"ciudad": "Oaxaca", "servicios": [{"nombre": "Centro Oaxaca", "telefono": "951 000 0000"}],
+         "_metadata": {"ciudad": "Oaxaca"}},
+        {"ciudad": "Mérida", "servicios": [{"nombre": "Centro Mérida", "telefono": "999 000 0000"}],
+         "_metadata": {"ciudad": "Mérida"}},
+    ],
+}
+
+AJUSTES_AGENTES = dict(
+    RAG_RECUPERACION_ESPECULATIVA=False,
+    GEMINI_COALESCENCIA=False,
+    CRISIS_RUTA_RAPIDA=True,
+)
+
+
+def crear_agente(clase, modelo=None, sesiones=False, resolutor=True):
+    indice = IndiceFalso(DOCUMENTOS)
+    return clase(
+        model=modelo or ModeloFalso(),
+        chroma_db=ChromaFalso(DOCUMENTOS),
+        resolutor=ResolutorCiudades(indice.ciudades()) if resolutor else None,
+        indice=indice,
+        sesiones=EstadoSesiones({'backend': 'memoria', 'ttl': 60}) if sesiones else None,
+    )
+
+
+def ejecutar_ambos(agente, *args, **kwargs):
+    """Respuesta de ``process_query`` y de ``aprocess_query`` con los mismos argumentos."""
+    sincrona = agente.process_query(*args, **kwargs)
+    asincrona = asyncio.run(agente.aprocess_query(*args, **kwargs))
+    return sincrona, asincrona
+
+
+@override_settings(**AJUSTES_AGENTES)
+class PipelineRAGTests(SimpleTestCase):
+    """Ambos agentes comparten el pipeline y sus versiones síncrona y asíncrona coinciden."""
+
+    def tearDown(self):
+        concurrencia.reset()
+
+    def test_ciudad_resuelta_localmente_no_llama_a_extraccion(self):
+        for clase in (RAGTurismo, RAGSaludMental):
+            modelo = ModeloFalso()
+            agente = crear_agente(clase, modelo)
+            self.assertEqual(ejecutar_ambos(agente, "¿Qué hacer en Oaxaca?"),
+                             ("respuesta generada", "respuesta generada"))
+            self.assertEqual(modelo.extracciones(), [])
+            self.assertIn("Oaxaca", modelo.prompts[-1])
+
+    def test_ciudad_extraida_con_gemini(self):
+        modelo = ModeloFalso(extraccion="Mérida")
+        agente = crear_agente(RAGTurismo, modelo, resolutor=False)
+        self.assertEqual(ejecutar_ambos(agente, "quiero ir a la ciudad blanca"),
+                         ("respuesta generada", "respuesta generada"))
+        self.assertEqual(len(modelo.extracciones()), 2)
+
+    def test_turismo_sin_destino_pide_especificarlo(self):
+        agente = crear_agente(RAGTurismo, ModeloFalso(extraccion="None"))
+        sincrona, asincrona = ejecutar_ambos(agente, "recomiéndame algo")
+        self.assertEqual(sincrona, asincrona)
+        self.assertIn("especifica el destino", sincrona)
+
+    def test_turismo_destino_sin_documento(self):
+        agente = crear_agente(RAGTurismo, ModeloFalso(extraccion="Tijuana"))
+        sincrona, asincrona = ejecutar_ambos(agente, "¿qué hay en tijuana?")
+        self.assertEqual(sincrona, asincrona)
+        self.assertIn("no tengo información disponible sobre Tijuana", sincrona)
+
+    def test_salud_mental_sin_ciudad_usa_datos_nacionales(self):
+        modelo = ModeloFalso(extraccion="None")
+        agente = crear_agente(RAGSaludMental, modelo)
+        self.assertEqual(ejecutar_ambos(agente, "necesito un psicólogo"),
+                         ("respuesta generada", "respuesta generada"))
+        self.assertIn("Línea de la Vida", modelo.prompts[-1])
+
+    def test_error_de_gemini_en_salud_mental_responde_emergencias(self):
+        agente = crear_agente(RAGSaludMental, ModeloFalso(error=RuntimeError("sin servicio")))
+        self.assertEqual(ejecutar_ambos(agente, "necesito ayuda en Oaxaca"),
+                         (MENSAJE_EMERGENCIA, MENSAJE_EMERGENCIA))
+
+    def test_agente_incompleto_falla_al_construirse(self):
+        class SinDegradada(RAGTurismo):
+            _texto_degradado = RAGBase._texto_degradado
+
+        with self.assertRaises(TypeError):
+            SinDegradada(model=ModeloFalso(), chroma_db=ChromaFalso(DOCUMENTOS))
+
+    def test_plazo_vencido_responde_degradada(self):
+        agente = crear_agente(RAGTurismo, ModeloFalso(extraccion="Tijuana"), resolutor=False)
+        vencido = Plazo(1.0, margen=1.0)
+        sincrona = agente.process_query("¿qué hay en tijuana?", plazo=vencido)
+        asincrona = asyncio.run(agente.aprocess_query("¿qué hay en tijuana?", plazo=vencido))
+        self.assertEqual(sincrona, MENSAJE_DEMORA_TURISMO)
+        self.assertEqual(asincrona, MENSAJE_DEMORA_TURISMO)
+
+    def test_busqueda_sin_indice_usa_filtro_exacto(self):
+        agente = crear_agente(RAGSaludMental)
+        agente.indice = None
+        self.assertTrue(misma_ciudad(agente.get_city_mental_health_info("Mérida"), "Mérida"))
+        self.assertEqual(agente.chroma_db.consultas[0][2], {"ciudad": "Mérida"})
+
+
+@override_settings(**AJUSTES_AGENTES)
+class ContinuacionSesionTests(SimpleTestCase):
+    """Un turno de seguimiento reutiliza la ciudad de la sesión solo si no nombra ninguna."""
+
+    def tearDown(self):
+        concurrencia.reset()
+
+    def conversar(self, clase, asincrona, segundo_turno, extraccion):
+        modelo = ModeloFalso()
+        agente = crear_agente(clase, modelo, sesiones=True)
+        procesar = (lambda q: asyncio.run(agente.aprocess_query(q, sesion="s1"))) if asincrona \
+            else (lambda q: agente.process_query(q, sesion="s1"))
+        procesar("¿Qué hacer en Oaxaca?")
+        modelo.prompts.clear()
+        modelo.extraccion = extraccion
+        return procesar(segundo_turno), modelo
+
+    def test_tema_sin_ciudad_continua_sin_gemini(self):
+        for asincrona in (False, True):
+            respuesta, modelo = self.conversar(RAGTurismo, asincrona, "¿Y restaurantes?", "None")
+            self.assertEqual(respuesta, "respuesta generada")
+            self.assertEqual(modelo.extracciones(), [])
+            self.assertIn("Oaxaca", modelo.prompts[-1])
+
+    def test_ciudad_desconocida_no_reutiliza_la_sesion(self):
+        for asincrona in (False, True):
+            respuesta, modelo = self.conversar(RAGTurismo, asincrona, "¿Y en Tijuanna?", "Tijuana")
+            self.assertEqual(len(modelo.extracciones()), 1)
+            self.assertIn("no tengo información disponible sobre Tijuana", respuesta)
+
+    def test_ciudad_desconocida_en_salud_mental_usa_datos_nacionales(self):
+        for asincrona in (False, True):
+            respuesta, modelo = self.conversar(RAGSaludMental, asincrona, "¿y en Tijuanna?", "Tijuana")
+            self.assertEqual(respuesta, "respuesta generada")
+            self.assertNotIn("Centro Oaxaca", modelo.prompts[-1])
+            self.assertIn("Ciudad: Nacional", modelo.prompts[-1])
+
+    def test_sin_ciudad_confirmado_por_gemini_continua(self):
+        for asincrona in (False, True):
+            respuesta, modelo = self.conversar(RAGTurismo, asincrona, "¿algo más barato?", "None")
+            self.assertEqual(respuesta, "respuesta generada")
+            self.assertEqual(len(modelo.extracciones()), 1)
+            self.assertIn("Oaxaca", modelo.prompts[-1])
+
+
+class EstadoSesionesTests(SimpleTestCase):
+    """Estado por (agente, sesión) con TTL, límite de sesiones y backend compartido."""
+
+    def test_estado_por_agente_y_sesion(self):
+        sesiones = EstadoSesiones({"backend": "memoria", "ttl": 60})
+        sesiones.recordar("turismo", "s1", "destinos_turisticos", DOCUMENTOS["destinos_turisticos"][1])
+        sesiones.recordar("turismo", "s2", "destinos_turisticos", {"descripcion": "sin ciudad"})
+        self.assertEqual(sesiones.obtener("turismo", "s1"),
+                         ("Mérida", id_documento("destinos_turisticos", {"ciudad": "Mérida"})))
+        self.assertIsNone(sesiones.obtener("salud_mental", "s1"))
+        self.assertIsNone(sesiones.obtener("turismo", "s2"))
+        sesiones.olvidar("turismo", "s1")
+        self.assertIsNone(sesiones.obtener("turismo", "s1"))
+
+    def test_ttl_y_limite_de_sesiones(self):
+        sesiones = EstadoSesiones({"backend": "memoria", "ttl": 60, "max_entradas": 2})
+        documento = DOCUMENTOS["destinos_turisticos"][0]
+        with mock.patch("agentes.servicios.backends_cache.time.time", return_value=1000.0) as reloj:
+            for sesion in ("s1", "s2", "s3"):
+                sesiones.recordar("turismo", sesion, "destinos_turisticos", documento)
+            self.assertIsNone(sesiones.obtener("turismo", "s1"))
+            self.assertEqual(sesiones.obtener("turismo", "s2").ciudad, "Oaxaca")
+            reloj.return_value = 1061.0
+            self.assertIsNone(sesiones.obtener("turismo", "s3"))
+
+    def test_sqlite_compartido_entre_workers(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            politica = {"backend": "sqlite", "ttl": 60, "ruta": os.path.join(directorio, "sesiones.sqlite3")}
+            EstadoSesiones(politica).recordar("salud_mental", "s1", "salud_mental", DOCUMENTOS["salud_mental"][0])
+            self.assertEqual(EstadoSesiones(politica).obtener("salud_mental", "s1").ciudad, "Oaxaca")
+
+
+class AlmacenRegistrado(AlmacenDocumentos):
+    """Almacén real en un directorio temporal que registra los ids pedidos."""
+
+    def __init__(self, persist_dir):
+        super().__init__(persist_dir)
+        self.pedidos = []
+
+    def obtener(self, ids):
+        self.pedidos.append(list(ids))
+        return super().obtener(ids)
+
+
+class UnionDocumentosTests(SimpleTestCase):
+    """``_unir_documentos`` usa la caché, lee el almacén una vez y nunca el texto de ChromaDB."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.servicio = ServicioChromaDB.__new__(ServicioChromaDB)
+        self.servicio.version_cargada = "v1"
+        self.servicio.cache_documentos = CacheDocumentos(max_entradas=1)
+        self.servicio.almacen = AlmacenRegistrado(directorio.name)
+        self.servicio.almacen.guardar("c", [
+            ("a", "h", json.dumps({"ciudad": "Oaxaca"})),
+            ("b", "h", json.dumps({"ciudad": "Mérida"})),
+        ])
+
+    def test_documento_en_cache_no_se_lee_del_almacen(self):
+        self.servicio._unir_documentos(["a"], [{"ciudad": "Oaxaca"}])
+        self.servicio.almacen.eliminar(["a"])
+        vistas = self.servicio._unir_documentos(["a"], [{"ciudad": "Oaxaca"}])
+        self.assertEqual(vistas[0]["ciudad"], "Oaxaca")
+        self.assertEqual(self.servicio.almacen.pedidos, [["a"]])
+
+    def test_desalojo_entre_busqueda_y_uso_conserva_el_documento(self):
+        self.servicio._unir_documentos(["a"], [None])
+        # Guardar "b" desaloja "a" (una sola entrada) después de haberlo buscado
+        vistas = self.servicio._unir_documentos(["a", "b"], [None, None], [0.1, 0.2])
+        self.assertEqual([v["ciudad"] for v in vistas], ["Oaxaca", "Mérida"])
+        self.assertEqual(vistas[1]["_score"], 0.2)
+        self.assertEqual(self.servicio.almacen.pedidos, [["a"], ["b"]])
+
+    def test_sin_registro_en_almacen_se_omite_y_registra(self):
+        with self.assertLogs("agentes.servicios.chromadb_service", "WARNING") as registros:
+            vistas = self.servicio._unir_documentos(["a", "x"], [None, None])
+        self.assertEqual([v["ciudad"] for v in vistas], ["Oaxaca"])
+        self.assertIn("x", registros.output[0])
+
+    def test_aciertos_y_fallos_en_la_metrica(self):
+        aciertos = valor_metrica(CACHE_DOCUMENTOS, "acierto")
+        fallos = valor_metrica(CACHE_DOCUMENTOS, "fallo")
+        self.servicio._unir_documentos(["a"], [None])
+        self.servicio._unir_documentos(["a"], [None])
+        self.assertEqual(valor_metrica(CACHE_DOCUMENTOS, "acierto"), aciertos + 1)
+        self.assertEqual(valor_metrica(CACHE_DOCUMENTOS, "fallo"), fallos + 1)
+
+
+class ColeccionFalsa:
+    """Colección de ChromaDB en memoria que registra los ids consultados."""
+
+    def __init__(self, nombre):
+        self.name = nombre
+        self.metadatas = {}
+        self.textos = {}
+        self.consultas = []
+
+    def get(self, ids=None, include=None):
+        self.consultas.append(ids)
+        ids = [i for i in (ids if ids is not None else self.metadatas) if i in self.metadatas]
+        return {"ids": ids, "metadatas": [self.metadatas[i] for i in ids]}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.metadatas.update(zip(ids, metadatas))
+        self.textos.update(zip(ids, documents))
+
+    def delete(self, ids):
+        for id_doc in ids:
+            self.metadatas.pop(id_doc, None)
+
+
+class EtapaFalsa:
+    def embeber(self, textos):
+        return [[0.0] for _ in textos]
+
+
+class SincronizacionTests(SimpleTestCase):
+    """La ingesta incremental usa los hashes del manifiesto antes de consultar ChromaDB."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        os.makedirs(os.path.join(self.directorio, "turismo"))
+        self.coleccion = ColeccionFalsa("destinos_turisticos")
+        self.almacen = AlmacenDocumentos(os.path.join(self.directorio, "chromadb"))
+
+    def escribir(self, nombre, datos, generacion):
+        ruta = os.path.join(self.directorio, "turismo", nombre)
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            json.dump(datos, archivo)
+        os.utime(ruta, ns=(generacion, generacion))
+
+    def sincronizar(self, estado):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sincronizar_coleccion(
+                FuenteLocal(self.directorio), self.coleccion, self.almacen, "turismo/turismo_",
+                estado, EtapaFalsa(), hilos=2, reintentos=0
+            )
+
+    def test_documentos_sin_cambios_no_se_consultan(self):
+        self.escribir("turismo_1.json", [{"ciudad": "Oaxaca"}, {"ciudad": "Mérida"}], 1)
+        estado, escritos, _ = self.sincronizar({})
+        self.assertEqual(escritos, 2)
+
+        # Nueva generación del archivo: Oaxaca igual, Mérida modificada
+        self.escribir("turismo_1.json", [{"ciudad": "Oaxaca"}, {"ciudad": "Mérida", "clima": "cálido"}], 2)
+        self.coleccion.consultas.clear()
+        estado, escritos, eliminados = self.sincronizar(estado)
+        self.assertEqual((escritos, eliminados), (1, 0))
+        self.assertEqual(self.coleccion.consultas,
+                         [[id_documento("destinos_turisticos", {"ciudad": "Mérida"})]])
+
+        # Manifiesto al día y la colección ya escrita: nada que consultar ni escribir
+        self.escribir("turismo_1.json", [{"ciudad": "Oaxaca"}, {"ciudad": "Mérida", "clima": "cálido"}], 3)
+        self.coleccion.consultas.clear()
+        _, escritos, _ = self.sincronizar(estado)
+        self.assertEqual(escritos, 0)
+        self.assertEqual(self.coleccion.consultas, [])
+
+
+class FuenteFalsa:
+    """Fuente en memoria: cada archivo falla ``fallos[nombre]`` veces antes de descargarse."""
+
+    def __init__(self, nombres, fallos=None, error=ConnectionError, pausa=0.0):
+        self.archivos = [ArchivoFuente(nombre, "1") for nombre in nombres]
+        self.fallos = dict(fallos or {})
+        self.error = error
+        self.pausa = pausa
+        self.iniciadas = 0
+        self.activas = 0
+        self.max_activas = 0
+        self._lock = threading.Lock()
+
+    def listar(self, prefijo):
+        return [a for a in self.archivos if a.nombre.startswith(prefijo)]
+
+    def descargar(self, archivo):
+        with self._lock:
+            self.iniciadas += 1
+            self.activas += 1
+            self.max_activas = max(self.max_activas, self.activas)
+        try:
+            if self.pausa:
+                time.sleep(self.pausa)
+            if self.fallos.get(archivo.nombre, 0) > 0:
+                self.fallos[archivo.nombre] -= 1
+                raise self.error(archivo.nombre)
+            return b'[{"ciudad": "%s"}]' % archivo.nombre.encode()
+        finally:
+            with self._lock:
+                self.activas -= 1
+
+
+class DescargaParalelaTests(SimpleTestCase):
+    """Aislamiento de errores, reintentos, descargas en vuelo y progreso."""
+
+    def test_json_invalido_no_detiene_a_los_demas(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            for nombre, contenido in (("a.json", '[{"ciudad": "Oaxaca"}]'), ("b.json", "{roto"),
+                                      ("c.json", '{"ciudad": "Mérida"}')):
+                with open(os.path.join(directorio, nombre), "w", encoding="utf-8") as archivo:
+                    archivo.write(contenido)
+            fuente = FuenteLocal(directorio)
+            with self.assertLogs("agentes.servicios.descarga", "ERROR"):
+                datos = {r.nombre: decodificar_json(r)
+                         for r in DescargadorParalelo(fuente, hilos=2).descargar(fuente.listar(""))}
+        self.assertEqual(datos, {"a.json": [{"ciudad": "Oaxaca"}], "b.json": None,
+                                 "c.json": [{"ciudad": "Mérida"}]})
+
+    @mock.patch("agentes.servicios.descarga.random.uniform", return_value=1.0)
+    @mock.patch("agentes.servicios.descarga.time.sleep")
+    def test_reintentos_con_espera_exponencial(self, dormir, _):
+        fuente = FuenteFalsa(["a", "b"], fallos={"a": 2, "b": 5})
+        descargador = DescargadorParalelo(fuente, hilos=1, reintentos=2, espera_base=0.5)
+        with self.assertLogs("agentes.servicios.descarga", "ERROR"):
+            resultados = {r.nombre: r for r in descargador.descargar(fuente.archivos)}
+        self.assertEqual((resultados["a"].intentos, resultados["a"].error), (3, None))
+        self.assertEqual((resultados["b"].intentos, resultados["b"].contenido), (3, None))
+        self.assertEqual([c.args[0] for c in dormir.call_args_list], [0.5, 1.0, 0.5, 1.0])
+        self.assertEqual((descargador.estadisticas.reintentos, descargador.estadisticas.errores), (4, 1))
+
+    @mock.patch("agentes.servicios.descarga.time.sleep")
+    def test_error_definitivo_no_se_reintenta(self, dormir):
+        fuente = FuenteFalsa(["a"], fallos={"a": 1}, error=FileNotFoundError)
+        with self.assertLogs("agentes.servicios.descarga", "ERROR"):
+            resultado, = DescargadorParalelo(fuente, reintentos=3).descargar(fuente.archivos)
+        self.assertEqual(resultado.intentos, 1)
+        dormir.assert_not_called()
+
+    def test_descargas_en_vuelo_acotadas(self):
+        fuente = FuenteFalsa([f"f{i}" for i in range(20)], pausa=0.01)
+        resultados = DescargadorParalelo(fuente, hilos=2).descargar(fuente.archivos)
+        next(resultados)
+        # Con el consumidor detenido no se lanzan más de 2 * hilos descargas
+        time.sleep(0.1)
+        self.assertLessEqual(fuente.iniciadas, 4)
+        self.assertEqual(len(list(resultados)), 19)
+        self.assertLessEqual(fuente.max_activas, 2)
+
+    def test_progreso_cada_intervalo_y_al_final(self):
+        fuente = FuenteFalsa([f"f{i}" for i in range(5)])
+        reportes = []
+        descargador = DescargadorParalelo(fuente, hilos=2, intervalo_progreso=2,
+                                          progreso=lambda e: reportes.append(e.completados))
+        list(descargador.descargar(fuente.archivos))
+        self.assertEqual(reportes, [2, 4, 5])
+        self.assertEqual(descargador.estadisticas.bytes, sum(len(b'[{"ciudad": "fX"}]') for _ in range(5)))
+
+    def test_servicio_gcs_registra_errores_y_resumen(self):
+        from .servicios.gcs_service import ServicioGCS
+        with tempfile.TemporaryDirectory() as directorio:
+            os.makedirs(os.path.join(directorio, "turismo"))
+            for nombre, contenido in (("a.json", '{"ciudad": "Oaxaca"}'), ("b.json", "{roto")):
+                with open(os.path.join(directorio, "turismo", nombre), "w", encoding="utf-8") as archivo:
+                    archivo.write(contenido)
+            servicio = ServicioGCS.__new__(ServicioGCS)
+            servicio.fuente = FuenteLocal(directorio)
+            with self.assertLogs("agentes.servicios.gcs_service", "INFO") as registros:
+                documentos = servicio.cargar_documentos("turismo")
+        self.assertEqual([d["ciudad"] for d in documentos], ["Oaxaca"])
+        niveles = [(r.levelname, r.getMessage().split(":")[0]) for r in registros.records]
+        self.assertIn(("WARNING", "Error al cargar turismo/b.json"), niveles)
+        self.assertIn(("INFO", "Carga de turismo"), niveles)
+
+
+class DetectorCrisisTests(SimpleTestCase):
+    """El detector sobre el corpus de ``benchmarks/corpus_crisis.py``."""
+
+    def test_sin_falsos_negativos(self):
+        for consulta, categoria in POSITIVOS:
+            with self.subTest(consulta=consulta):
+                deteccion = detectar_crisis(consulta)
+                self.assertIsNotNone(deteccion)
+                self.assertEqual(deteccion.categoria, categoria)
+
+    def test_consultas_habituales_no_se_marcan(self):
+        for consulta in NEGATIVOS:
+            with self.subTest(consulta=consulta):
+                self.assertIsNone(detectar_crisis(consulta))
+
+
+@override_settings(**AJUSTES_AGENTES)
+class RutaCrisisWebhookTests(SimpleTestCase):
+    """El webhook de salud mental responde a una crisis sin llamar a Gemini ni a ChromaDB."""
+
+    def tearDown(self):
+        concurrencia.reset()
+
+    def test_crisis_responde_emergencias_antes_de_gemini_y_chromadb(self):
+        cuerpo = json.dumps({"queryResult": {"queryText": "ya no quiero vivir, estoy en Mérida"},
+                             "session": "s1"})
+        for vista in (views.webhook_salud_mental, views.webhook_salud_mental_async):
+            with self.subTest(vista=vista.__name__):
+                modelo = ModeloFalso(error=AssertionError("Gemini no debe llamarse"))
+                agente = crear_agente(RAGSaludMental, modelo)
+                antes = valor_metrica(RUTA_CRISIS, "ideacion_suicida")
+                request = RequestFactory().post("/webhook/salud-mental/", cuerpo,
+                                                content_type="application/json")
+                with mock.patch.object(views, "obtener_rag_salud_mental", return_value=agente):
+                    response = vista(request)
+                    if asyncio.iscoroutine(response):
+                        response = asyncio.run(response)
+                texto = json.loads(response.content)["fulfillmentText"]
+                for numero in RAGSaludMental.NUMEROS_EMERGENCIA.values():
+                    self.assertIn(numero, texto)
+                self.assertEqual(modelo.prompts, [])
+                self.assertEqual(agente.chroma_db.consultas, [])
+                self.assertEqual(valor_metrica(RUTA_CRISIS, "ideacion_suicida"), antes + 1)
+
+
+@override_settings(CACHE_RESPUESTAS={}, ESTADO_SESION={'habilitado': False}, RESPUESTAS_PRECALCULADAS=False)
+class RegistroServiciosTests(SimpleTestCase):
+    """Un solo agente por proceso, construido una vez y compartiendo modelo y ChromaDB."""
+
+    def setUp(self):
+        self.registro = RegistroServicios()
+        indice = IndiceFalso(DOCUMENTOS)
+        self.registro._modelo = ModeloFalso()
+        self.registro._chroma_db = ChromaFalso(DOCUMENTOS)
+        self.registro._indice = indice
+        self.registro._resolutor = ResolutorCiudades(indice.ciudades())
+
+    def tearDown(self):
+        concurrencia.reset()
+
+    def test_agente_construido_una_vez_entre_hilos(self):
+        agentes = []
+        hilos = [threading.Thread(target=lambda: agentes.append(self.registro.obtener_rag_turismo()))
+                 for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len({id(agente) for agente in agentes}), 1)
+
+    def test_agentes_comparten_servicios(self):
+        turismo = self.registro.obtener_rag_turismo()
+        salud_mental = self.registro.obtener_rag_salud_mental()
+        self.assertIs(turismo.model, salud_mental.model)
+        self.assertIs(turismo.chroma_db, salud_mental.chroma_db)
+        self.assertIs(turismo.resolutor, salud_mental.resolutor)
+
+    def test_despues_de_fork_conserva_indices_y_reabre_chromadb(self):
+        turismo = self.registro.obtener_rag_turismo()
+        indice, resolutor = self.registro._indice, self.registro._resolutor
+        self.registro.despues_de_fork()
+        self.assertEqual(self.registro._chroma_db.reaperturas, 1)
+        self.assertIsNone(self.registro._modelo)
+        self.assertIs(self.registro._indice, indice)
+        self.assertIs(self.registro._resolutor, resolutor)
+        self.registro._modelo = ModeloFalso()
+        self.assertIsNot(self.registro.obtener_rag_turismo(), turismo)
+
+    def test_reset_descarta_todo(self):
+        self.registro.obtener_rag_turismo()
+        self.registro.reset()
+        for atributo in ("_rag_turismo", "_modelo", "_chroma_db", "_indice", "_resolutor"):
+            self.assertIsNone(getattr(self.registro, atributo))
+
+
+class ResolutorCiudadesTests(SimpleTestCase):
+    """Coincidencia exacta más larga, alias y umbral de la coincidencia difusa."""
+
+    def setUp(self):
+        self.resolutor = ResolutorCiudades(
+            ["Campeche", "San Francisco de Campeche", "Ciudad de México", "Mérida", "Guadalajara"]
+        )
+
+    def test_prefiere_el_nombre_mas_largo(self):
+        resultado = self.resolutor.resolver("Hoteles en San Francisco de Campeche")
+        self.assertEqual(resultado, ("San Francisco de Campeche", 1.0, "exacta"))
+        self.assertEqual(self.resolutor.resolver("¿qué hay en campeche?").ciudad, "Campeche")
+
+    def test_acentos_y_alias(self):
+        self.assertEqual(self.resolutor.resolver("clínicas en MERIDA").ciudad, "Mérida")
+        self.assertEqual(self.resolutor.resolver("museos en la cdmx").ciudad, "Ciudad de México")
+
+    def test_difusa_respeta_el_umbral(self):
+        resultado = self.resolutor.resolver("tacos en guadalajarra")
+        self.assertEqual((resultado.ciudad, resultado.metodo), ("Guadalajara", "difusa"))
+        self.assertGreaterEqual(resultado.confianza, self.resolutor.umbral_difuso)
+        estricto = ResolutorCiudades(["Guadalajara"], umbral_difuso=0.99)
+        self.assertIsNone(estricto.resolver("tacos en guadalajarra"))
+
+    def test_palabras_vacias_y_consultas_sin_ciudad(self):
+        self.assertIsNone(self.resolutor.resolver("quiero hoteles para comer"))
+        self.assertIsNone(self.resolutor.resolver(""))
+
+    def test_actualizar_reemplaza_el_nomenclator(self):
+        self.resolutor.actualizar(["Tijuana"])
+        self.assertIsNone(self.resolutor.resolver("playas en Mérida"))
+        self.assertEqual(self.resolutor.resolver("playas en Tijuana").ciudad, "Tijuana")
+
+    def test_difusa_exige_longitud_minima(self):
+        resolutor = ResolutorCiudades(["Comala", "Guadalajara"])
+        self.assertIsNone(resolutor.resolver("comal de barro"))
+        self.assertEqual(resolutor.resolver("pozole en comalla").ciudad, "Comala")
+
+    def test_difusa_solo_compara_candidatos_compatibles(self):
+        resolutor = ResolutorCiudades(["Guadalajara", "Gómez Palacio", "Mérida", "Hermosillo"])
+        _, _, _, indice_difuso, _ = resolutor._estado
+        self.assertEqual(indice_difuso[(1, "g")], ([11], ["guadalajara"]))
+        self.assertEqual(resolutor.resolver("museos en guadalajarra").ciudad, "Guadalajara")
+        # La primera letra y la ventana de longitudes acotan los candidatos
+        self.assertIsNone(resolutor.resolver("museos en hguadalajara"))
+
+    def test_nombre_comun_requiere_contexto_o_alias(self):
+        resolutor = ResolutorCiudades(["Paz", "Dolores", "La Paz"])
+        self.assertIsNone(resolutor.resolver("tengo paz interior"))
+        self.assertIsNone(resolutor.resolver("tengo dolores de cabeza"))
+        self.assertEqual(resolutor.resolver("quiero viajar a paz").ciudad, "Paz")
+        self.assertEqual(resolutor.resolver("hoteles en la paz").ciudad, "La Paz")
+        con_alias = ResolutorCiudades(["Dolores Hidalgo"], alias={"dolores": "Dolores Hidalgo"})
+        self.assertEqual(con_alias.resolver("tengo dolores").ciudad, "Dolores Hidalgo")
+
+
+class ColeccionesVersionadas:
+    """Interfaz mínima de ``ServicioChromaDB`` que usa el índice de ciudades."""
+
+    def __init__(self, documentos):
+        self.documentos = documentos
+        self.version = "v1"
+        self.lecturas = 0
+
+    def sincronizar(self):
+        return False
+
+    def version_datos(self):
+        return self.version
+
+    def obtener_documentos(self, coleccion):
+        self.lecturas += 1
+        return self.documentos.get(coleccion, [])
+
+
+class IndiceCiudadesTests(SimpleTestCase):
+    """Búsqueda exacta normalizada y reconstrucción al cambiar la versión de datos."""
+
+    def test_busqueda_sin_acentos_ni_mayusculas(self):
+        indice = IndiceCiudades(ColeccionesVersionadas(DOCUMENTOS), intervalo_verificacion=60)
+        self.assertEqual(indice.buscar("salud_mental", "MERIDA")["ciudad"], "Mérida")
+        self.assertIsNone(indice.buscar("salud_mental", "Tijuana"))
+        self.assertIsNone(indice.buscar("otra", "Mérida"))
+        self.assertEqual(indice.ciudades(), ["Oaxaca", "Mérida"])
+
+    def test_reconstruye_y_notifica_al_cambiar_la_version(self):
+        colecciones = ColeccionesVersionadas(DOCUMENTOS)
+        indice = IndiceCiudades(colecciones, intervalo_verificacion=0)
+        notificadas = []
+        indice.suscribir(notificadas.append)
+        colecciones.documentos = {"destinos_turisticos": [{"ciudad": "Tijuana"}]}
+        # Misma versión: no se reconstruye aunque cambien los documentos
+        self.assertIsNone(indice.buscar("destinos_turisticos", "Tijuana"))
+        colecciones.version = "v2"
+        self.assertEqual(indice.buscar("destinos_turisticos", "Tijuana"), {"ciudad": "Tijuana"})
+        self.assertEqual(notificadas, [["Tijuana"]])
+
+    def test_verificacion_limitada_por_intervalo(self):
+        colecciones = ColeccionesVersionadas(DOCUMENTOS)
+        indice = IndiceCiudades(colecciones, intervalo_verificacion=60)
+        colecciones.version = "v2"
+        indice.buscar("destinos_turisticos", "Oaxaca")
+        self.assertEqual(colecciones.lecturas, 2)
+
+
+class CacheDocumentosTests(SimpleTestCase):
+    """Documentos congelados, vistas sin copia y LRU por versión de datos."""
+
+    def test_documento_congelado_es_inmutable(self):
+        doc = congelar({"ciudad": "Oaxaca", "servicios": [{"nombre": "Centro"}]})
+        with self.assertRaises(TypeError):
+            doc["ciudad"] = "Mérida"
+        with self.assertRaises(TypeError):
+            doc["servicios"][0]["nombre"] = "Otro"
+        self.assertIsInstance(doc["servicios"], tuple)
+
+    def test_vista_superpone_metadatos_sin_tocar_el_documento(self):
+        doc = congelar({"ciudad": "Oaxaca"})
+        vista = VistaDocumento(doc, {"ciudad": "Oaxaca"}, 0.25)
+        self.assertEqual(dict(vista), {"ciudad": "Oaxaca", "_metadata": {"ciudad": "Oaxaca"}, "_score": 0.25})
+        self.assertNotIn("_score", doc)
+
+    def test_lru_refrescado_por_busqueda(self):
+        cache = CacheDocumentos(max_entradas=2)
+        cache.buscar("v1", "a")
+        cache.guardar("v1", "a", '{"ciudad": "A"}')
+        cache.guardar("v1", "b", '{"ciudad": "B"}')
+        cache.buscar("v1", "a")
+        cache.guardar("v1", "c", '{"ciudad": "C"}')
+        self.assertIsNone(cache.buscar("v1", "b"))
+        self.assertEqual(cache.buscar("v1", "a")["ciudad"], "A")
+
+    def test_cambio_de_version_vacia_la_cache(self):
+        cache = CacheDocumentos()
+        cache.buscar("v1", "a")
+        cache.guardar("v1", "a", '{"ciudad": "A"}')
+        self.assertIsNone(cache.buscar("v2", "a"))
+        self.assertEqual(len(cache), 0)
+        # Un documento leído con la versión anterior no se guarda
+        cache.guardar("v1", "a", '{"ciudad": "A"}')
+        self.assertEqual(len(cache), 0)
+
+    def test_json_invalido(self):
+        with self.assertRaises(json.JSONDecodeError):
+            CacheDocumentos().guardar("v1", "a", "{roto")
+
+
+def embedding_por_palabras(textos):
+    """Embedding de prueba: un eje por tema, con sinónimos en el mismo eje."""
+    ejes = {"restaurantes": 0, "comida": 0, "museos": 1, "playas": 2}
+    vectores = []
+    for texto in textos:
+        vector = [0.0, 0.0, 0.0]
+        for palabra in texto.split():
+            if palabra in ejes:
+                vector[ejes[palabra]] = 1.0
+        vectores.append(vector)
+    return vectores
+
+
+class CacheRespuestasTests(SimpleTestCase):
+    """Clave normalizada, expiración, expulsión, similitud y backend compartido."""
+
+    def test_clave_normalizada_por_ciudad_y_consulta(self):
+        aciertos = valor_metrica(CACHE_RESPUESTAS, "turismo", "acierto")
+        fallos = valor_metrica(CACHE_RESPUESTAS, "turismo", "fallo")
+        cache = CacheRespuestas("turismo", {"backend": "memoria"})
+        cache.guardar("Mérida", "¿Qué museos hay?", "respuesta")
+        self.assertEqual(cache.obtener("merida", "que MUSEOS hay"), "respuesta")
+        self.assertIsNone(cache.obtener("Oaxaca", "¿Qué museos hay?"))
+        self.assertEqual(valor_metrica(CACHE_RESPUESTAS, "turismo", "acierto"), aciertos + 1)
+        self.assertEqual(valor_metrica(CACHE_RESPUESTAS, "turismo", "fallo"), fallos + 1)
+
+    def test_expiracion_y_expulsion_lru(self):
+        backend = BackendMemoria(max_entradas=2)
+        with mock.patch("agentes.servicios.backends_cache.time.time", return_value=1000.0):
+            backend.guardar("a", 1, ttl=10)
+            backend.guardar("b", 2, ttl=10)
+            backend.obtener("a")
+            backend.guardar("c", 3, ttl=10)
+            self.assertIsNone(backend.obtener("b"))
+        with mock.patch("agentes.servicios.backends_cache.time.time", return_value=1011.0):
+            self.assertIsNone(backend.obtener("a"))
+
+    def test_similitud_semantica_con_umbral(self):
+        semanticos = valor_metrica(CACHE_RESPUESTAS, "turismo", "acierto_semantico")
+        cache = CacheRespuestas("turismo", {"backend": "memoria", "umbral_similitud": 0.9},
+                                embedding_por_palabras)
+        cache.guardar("Oaxaca", "restaurantes recomendados", "ve a comer mole")
+        self.assertEqual(cache.obtener("Oaxaca", "dónde comida rica"), "ve a comer mole")
+        self.assertIsNone(cache.obtener("Oaxaca", "museos"))
+        self.assertIsNone(cache.obtener("Mérida", "restaurantes recomendados"))
+        self.assertEqual(valor_metrica(CACHE_RESPUESTAS, "turismo", "acierto_semantico"), semanticos + 1)
+
+    def test_version_de_datos_nueva_invalida_las_respuestas(self):
+        version = ["v1"]
+        with tempfile.TemporaryDirectory() as directorio:
+            politica = {"backend": "sqlite", "ruta": os.path.join(directorio, "cache.sqlite3"),
+                        "umbral_similitud": 0.9}
+            cache = CacheRespuestas("turismo", politica, embedding_por_palabras, lambda: version[0])
+            cache.guardar("Oaxaca", "restaurantes recomendados", "respuesta v1")
+            self.assertEqual(cache.obtener("Oaxaca", "restaurantes recomendados"), "respuesta v1")
+            version[0] = "v2"
+            # Ni la coincidencia exacta del backend compartido ni la semántica
+            otro_worker = CacheRespuestas("turismo", politica, embedding_por_palabras, lambda: version[0])
+            self.assertIsNone(otro_worker.obtener("Oaxaca", "restaurantes recomendados"))
+            self.assertIsNone(cache.obtener("Oaxaca", "comida"))
+            cache.guardar("Oaxaca", "restaurantes recomendados", "respuesta v2")
+            self.assertEqual(otro_worker.obtener("Oaxaca", "restaurantes recomendados"), "respuesta v2")
+
+    def test_limpiar_django_solo_afecta_al_prefijo(self):
+        from django.core.cache import cache as cache_django
+        cache_django.set("otra_clave", "se conserva")
+        backend = BackendDjangoCache(prefijo="respuestas_prueba")
+        backend.guardar("a", "valor", ttl=60)
+        backend.limpiar()
+        self.assertIsNone(backend.obtener("a"))
+        self.assertEqual(cache_django.get("otra_clave"), "se conserva")
+        backend.guardar("a", "nuevo", ttl=60)
+        self.assertEqual(BackendDjangoCache(prefijo="respuestas_prueba").obtener("a"), "nuevo")
+
+    def test_sqlite_compartido_entre_instancias(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            politica = {"backend": "sqlite", "ruta": os.path.join(directorio, "cache.sqlite3")}
+            CacheRespuestas("salud_mental", politica).guardar("Oaxaca", "psicólogo", "respuesta")
+            self.assertEqual(CacheRespuestas("salud_mental", politica).obtener("Oaxaca", "psicologo"),
+                             "respuesta")
+            self.assertIsNone(CacheRespuestas("turismo", politica).obtener("Oaxaca", "psicologo"))
+
+    def test_sqlite_expulsa_las_menos_usadas(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            backend = BackendSQLite(os.path.join(directorio, "kv.sqlite3"), max_entradas=2,
+                                    intervalo_limpieza=1)
+            for clave in ("a", "b", "c"):
+                backend.guardar(clave, clave, ttl=60)
+            self.assertEqual(len(backend), 2)
+            self.assertIsNone(backend.obtener("a"))
+
+
+@override_settings(**AJUSTES_AGENTES)
+class WebhookAsincronoTests(SimpleTestCase):
+    """Las vistas síncronas y asíncronas responden igual y están exentas de CSRF."""
+
+    cuerpo = json.dumps({"queryResult": {"queryText": "¿Qué hacer en Oaxaca?"}})
+
+    def tearDown(self):
+        concurrencia.reset()
+
+    def responder(self, vista, request):
+        respuesta = vista(request)
+        return asyncio.run(respuesta) if asyncio.iscoroutine(respuesta) else respuesta
+
+    def test_misma_respuesta_fulfillment(self):
+        agente = crear_agente(RAGTurismo)
+        contenidos = []
+        with mock.patch.object(views, "obtener_rag_turismo", return_value=agente):
+            for vista in (views.webhook_turismo, views.webhook_turismo_async):
+                request = RequestFactory().post("/webhook/turismo/", self.cuerpo,
+                                                content_type="application/json")
+                contenidos.append(json.loads(self.responder(vista, request).content))
+        self.assertEqual(contenidos[0], contenidos[1])
+        self.assertEqual(contenidos[0]["fulfillmentMessages"][0]["text"]["text"], ["respuesta generada"])
+
+    @override_settings(**AJUSTES_AGENTES)
+    def test_indice_y_resolutor_fuera_del_event_loop(self):
+        hilos = []
+
+        def registrar(funcion):
+            def envuelta(*args):
+                hilos.append(threading.current_thread())
+                return funcion(*args)
+            return envuelta
+
+        for clase, consulta in ((RAGTurismo, "¿Qué hacer en Oaxaca?"),
+                                (RAGSaludMental, "me quiero matar, estoy en Oaxaca")):
+            agente = crear_agente(clase)
+            agente.indice.buscar = registrar(agente.indice.buscar)
+            agente.resolutor.resolver = registrar(agente.resolutor.resolver)
+            asyncio.run(agente.aprocess_query(consulta))
+        self.assertGreaterEqual(len(hilos), 4)
+        self.assertNotIn(threading.main_thread(), hilos)
+
+    def test_vistas_asincronas_siguen_siendo_corrutinas(self):
+        for vista in (views.webhook_turismo_async, views.webhook_salud_mental_async):
+            self.assertTrue(asyncio.iscoroutinefunction(vista))
+            self.assertTrue(vista.csrf_exempt)
+            respuesta = self.responder(vista, RequestFactory().get("/webhook/turismo/"))
+            self.assertEqual(respuesta.status_code, 405)
+
+    def test_post_sin_token_csrf(self):
+        with mock.patch.object(views, "obtener_rag_turismo", return_value=crear_agente(RAGTurismo)):
+            respuesta = Client(enforce_csrf_checks=True).post(
+                "/webhook/turismo/", self.cuerpo, content_type="application/json"
+            )
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_json_invalido_responde_mensaje_de_error(self):
+        for vista in (views.webhook_turismo, views.webhook_turismo_async):
+            request = RequestFactory().post("/webhook/turismo/", "{roto", content_type="application/json")
+            with self.assertLogs("agentes.views", "ERROR"):
+                respuesta = self.responder(vista, request)
+            self.assertIn("ocurrió un error", json.loads(respuesta.content)["fulfillmentText"])
+
+
+@override_settings(**{**AJUSTES_AGENTES, "RAG_RECUPERACION_ESPECULATIVA": True})
+class RecuperacionEspeculativaTests(SimpleTestCase):
+    """La búsqueda lanzada durante la extracción se reutiliza solo si es de la misma ciudad."""
+
+    def tearDown(self):
+        concurrencia.reset()
+
+    def consultar(self, extraccion):
+        resultados = []
+        for asincrona in (False, True):
+            modelo = ModeloFalso(extraccion=extraccion)
+            agente = crear_agente(RAGTurismo, modelo, resolutor=False)
+            agente.indice = None
+            consulta = "viaje a merida, la ciudad blanca"
+            respuesta = (asyncio.run(agente.aprocess_query(consulta)) if asincrona
+                         else agente.process_query(consulta))
+            resultados.append((respuesta, [filtro for _, _, filtro in agente.chroma_db.consultas],
+                               modelo.prompts[-1]))
+        return resultados
+
+    def test_reutiliza_el_resultado_especulativo(self):
+        for respuesta, filtros, prompt in self.consultar("Mérida"):
+            self.assertEqual(respuesta, "respuesta generada")
+            self.assertEqual(filtros, [None])
+            self.assertIn("Destino: Mérida", prompt)
+
+    def test_descarta_el_resultado_de_otra_ciudad(self):
+        for respuesta, filtros, prompt in self.consultar("Oaxaca"):
+            self.assertEqual(respuesta, "respuesta generada")
+            self.assertEqual(sorted(filtros, key=str), [None, {"ciudad": "Oaxaca"}])
+            self.assertIn("Destino: Oaxaca", prompt)
+
+
+class ContextoPrecompiladoTests(SimpleTestCase):
+    """El contexto compilado en la ingesta se usa tal cual solo si es de la versión actual."""
+
+    dato = {
+        "ciudad": "Oaxaca",
+        "informacion_turistica": {
+            "resumen_turistico": "Capital gastronómica",
+            "campos_extraidos": {"restaurantes": ["Casa Oaxaca", "Origen"]},
+        },
+    }
+
+    def test_metadatos_con_contexto_y_version(self):
+        metadatos = metadatos_contexto("destinos_turisticos", self.dato)
+        self.assertEqual(metadatos["contexto_version"], VERSION_CONTEXTO)
+        self.assertIn("- Restaurantes: Casa Oaxaca, Origen", metadatos["contexto"])
+        self.assertEqual(metadatos_contexto("otra", self.dato), {})
+
+    def test_contexto_precompilado_de_la_version_actual(self):
+        dato = {**self.dato, "_metadata": {"contexto": "PRECOMPILADO", "contexto_version": VERSION_CONTEXTO}}
+        self.assertEqual(obtener_contexto("destinos_turisticos", dato), "PRECOMPILADO")
+        self.assertIn("PRECOMPILADO", construir_prompt("destinos_turisticos", dato, "¿dónde comer?"))
+
+    def test_contexto_de_otra_version_se_recompila(self):
+        dato = {**self.dato, "_metadata": {"contexto": "VIEJO", "contexto_version": VERSION_CONTEXTO - 1}}
+        self.assertEqual(obtener_contexto("destinos_turisticos", dato),
+                         metadatos_contexto("destinos_turisticos", self.dato)["contexto"])
+
+
+class IngestaIncrementalTests(SimpleTestCase):
+    """Ids estables, hashes de contenido y plan de archivos del manifiesto."""
+
+    estado = {
+        "archivos": {
+            "turismo_1.json": {"generacion": "1", "ids": ["a", "b"]},
+            "turismo_2.json": {"generacion": "1", "ids": ["c"]},
+            "turismo_3.json": {"generacion": "1", "ids": ["d"]},
+        },
+        "documentos": {"a": "h", "b": "h", "c": "h", "d": "h"},
+    }
+
+    def test_id_estable_por_ciudad_normalizada(self):
+        self.assertEqual(id_documento("destinos_turisticos", {"ciudad": "Mérida"}),
+                         id_documento("destinos_turisticos", {"ciudad": "MERIDA", "otro": 1}))
+        self.assertNotEqual(id_documento("destinos_turisticos", {"ciudad": "Mérida"}),
+                            id_documento("salud_mental", {"ciudad": "Mérida"}))
+
+    def test_hash_independiente_del_orden_y_sensible_al_modo(self):
+        self.assertEqual(hash_documento({"a": 1, "b": 2}), hash_documento({"b": 2, "a": 1}))
+        self.assertNotEqual(hash_documento({"a": 1}, TEXTO_DOCUMENTO), hash_documento({"a": 1}, TEXTO_RESUMEN))
+
+    def test_registros_unicos_y_cambiados(self):
+        registros = registros_unicos("destinos_turisticos", [
+            {"ciudad": "Oaxaca", "v": 1}, {"ciudad": "Mérida"}, {"ciudad": "oaxaca", "v": 2},
+        ])
+        self.assertEqual(len(registros), 2)
+        oaxaca = next(r for r in registros if r.metadata["ciudad"] == "oaxaca")
+        existentes = {r.id: r.hash for r in registros if r is not oaxaca}
+        self.assertEqual(registros_cambiados(registros, existentes), [oaxaca])
+
+    def test_texto_embedding_resumen(self):
+        dato = {"ciudad": "Oaxaca", "informacion_turistica": {
+            "resumen_turistico": "Capital gastronómica",
+            "campos_extraidos": {"comida_tipica": ["mole", "tlayudas"]},
+        }}
+        texto = texto_embedding("destinos_turisticos", dato, "{json}", TEXTO_RESUMEN)
+        self.assertEqual(texto, "Oaxaca. Capital gastronómica Comida tipica: mole, tlayudas.")
+        self.assertEqual(texto_embedding("destinos_turisticos", {"ciudad": "X"}, "{json}", TEXTO_RESUMEN),
+                         "{json}")
+
+    def test_planificar_archivos(self):
+        plan = planificar_archivos({"turismo_1.json": "1", "turismo_2.json": 2, "turismo_4.json": "1"},
+                                   self.estado)
+        self.assertEqual(plan, PlanArchivos(cambiados=["turismo_2.json", "turismo_4.json"],
+                                            eliminados=["turismo_3.json"], sin_cambios=["turismo_1.json"]))
+        self.assertEqual(planificar_archivos({"x.json": "1"}, {}).cambiados, ["x.json"])
+
+    def test_ids_obsoletos_conserva_los_que_se_movieron(self):
+        plan = PlanArchivos(cambiados=["turismo_2.json", "turismo_4.json"],
+                            eliminados=["turismo_3.json"], sin_cambios=["turismo_1.json"])
+        # "c" desaparece de turismo_2 y "d" pasa de turismo_3 (eliminado) a turismo_4
+        obsoletos = ids_obsoletos(plan, self.estado, {"turismo_2.json": ["e"], "turismo_4.json": ["d"]})
+        self.assertEqual(obsoletos, {"c"})
+
+    def test_estado_actualizado(self):
+        plan = PlanArchivos(cambiados=["turismo_2.json"], eliminados=["turismo_3.json"],
+                            sin_cambios=["turismo_1.json"])
+        registros = registros_unicos("destinos_turisticos", [{"ciudad": "Tijuana"}])
+        estado = estado_actualizado(plan, self.estado, {"turismo_1.json": "1", "turismo_2.json": "2"},
+                                    {"turismo_2.json": registros}, {"c", "d"})
+        self.assertEqual(set(estado["archivos"]), {"turismo_1.json", "turismo_2.json"})
+        self.assertEqual(estado["archivos"]["turismo_2.json"], {"generacion": "2", "ids": [registros[0].id]})
+        self.assertEqual(estado["documentos"], {"a": "h", "b": "h", registros[0].id: registros[0].hash})
+
+    def test_manifiesto_ida_y_vuelta(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            self.assertEqual(leer_manifiesto(directorio), {"colecciones": {}})
+            escribir_manifiesto(directorio, {"colecciones": {"destinos_turisticos": self.estado}})
+            self.assertEqual(leer_manifiesto(directorio)["colecciones"]["destinos_turisticos"], self.estado)
+
+
+class EtapaEmbeddingsTests(SimpleTestCase):
+    """Lotes del tamaño configurado, orden conservado y contadores de rendimiento."""
+
+    def test_lotes_en_proceso_conservan_el_orden(self):
+        lotes = []
+
+        def funcion(textos):
+            lotes.append(list(textos))
+            return [[float(len(t))] for t in textos]
+
+        with EtapaEmbeddings(procesos=1, tamano_lote=2, funcion=funcion) as etapa:
+            vectores = etapa.embeber(["a", "bb", "ccc", "dddd", "eeeee"])
+            self.assertEqual(etapa.embeber([]), [])
+        self.assertEqual(vectores, [[1.0], [2.0], [3.0], [4.0], [5.0]])
+        self.assertEqual([len(lote) for lote in lotes], [2, 2, 1])
+        self.assertEqual(etapa.documentos, 5)
+        self.assertIn("lotes de 2", etapa.resumen())
+
+    def test_funcion_desconocida(self):
+        with self.assertRaises(ValueError):
+            crear_funcion_embedding("otra")
+
+
+class AlmacenSeparadoTests(SimpleTestCase):
+    """ChromaDB recibe solo el texto embebido; el documento completo va al almacén."""
+
+    def test_aplicar_y_eliminar_registros(self):
+        dato = {"ciudad": "Oaxaca", "informacion_turistica": {"resumen_turistico": "Capital gastronómica"}}
+        registros = registros_unicos("destinos_turisticos", [dato], TEXTO_RESUMEN)
+        coleccion = ColeccionFalsa("destinos_turisticos")
+        with tempfile.TemporaryDirectory() as directorio:
+            almacen = AlmacenDocumentos(directorio)
+            aplicar_registros(coleccion, almacen, registros, [[0.0]])
+            id_doc = registros[0].id
+            self.assertEqual(coleccion.textos[id_doc], "Oaxaca. Capital gastronómica")
+            self.assertEqual(json.loads(almacen.obtener([id_doc])[id_doc]), dato)
+            eliminar_registros(coleccion, almacen, [id_doc])
+            self.assertEqual(almacen.obtener([id_doc]), {})
+            self.assertNotIn(id_doc, coleccion.metadatas)
+
+
+class SnapshotTests(SimpleTestCase):
+    """Un snapshot restaura vectores, metadatos y documentos sin recalcular embeddings."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.origen = os.path.join(directorio.name, "origen")
+        self.destino = os.path.join(directorio.name, "destino")
+        self.ruta_snapshot = os.path.join(directorio.name, "snapshot")
+        cliente = ClienteVectorial(self.origen)
+        self.almacen = AlmacenDocumentos(self.origen)
+        coleccion = cliente.create_collection(name="destinos_turisticos")
+        self.registros = registros_unicos("destinos_turisticos", DOCUMENTOS["destinos_turisticos"])
+        aplicar_registros(coleccion, self.almacen, self.registros, [[1.0, 0.0], [0.0, 1.0]])
+        cliente.create_collection(name="salud_mental")
+        cliente.persist()
+        marcar_version(self.origen)
+        construir_snapshot(cliente, self.almacen, self.origen, self.ruta_snapshot)
+
+    def test_restaurar_en_directorio_vacio(self):
+        self.assertEqual(verificar_snapshot(self.ruta_snapshot), [])
+        almacen = AlmacenDocumentos(self.destino)
+        self.assertTrue(restaurar_si_vacio(self.ruta_snapshot, lambda: ClienteVectorial(self.destino),
+                                           almacen, self.destino))
+        self.assertTrue(leer_version(self.destino))
+        restaurada = ClienteVectorial(self.destino).get_collection("destinos_turisticos")
+        datos = restaurada.get(include=["embeddings", "metadatas"])
+        self.assertEqual(datos["ids"], [r.id for r in self.registros])
+        self.assertEqual(datos["embeddings"], [[1.0, 0.0], [0.0, 1.0]])
+        self.assertEqual(almacen.obtener(datos["ids"]), {r.id: r.documento for r in self.registros})
+        # Ya poblado: no se vuelve a restaurar
+        self.assertFalse(restaurar_si_vacio(self.ruta_snapshot, lambda: ClienteVectorial(self.destino),
+                                            almacen, self.destino))
+
+    def test_verificar_detecta_archivos_alterados(self):
+        ruta = os.path.join(self.ruta_snapshot, "destinos_turisticos.vectores.npy")
+        with open(ruta, "ab") as archivo:
+            archivo.write(b"0")
+        self.assertEqual(verificar_snapshot(self.ruta_snapshot),
+                         ["destinos_turisticos: sha256 incorrecto en destinos_turisticos.vectores.npy"])
+
+
+class ChromaCalentable(ChromaFalso):
+    """``ChromaFalso`` con lo que usa el calentamiento del worker."""
+
+    version_cargada = "v1"
+
+    def __init__(self, documentos, error=None):
+        super().__init__(documentos)
+        self.error = error
+
+    def embeber(self, textos):
+        if self.error is not None:
+            raise self.error
+        return [[0.0] for _ in textos]
+
+    def crear_coleccion(self, nombre):
+        return nombre
+
+    def version_datos(self):
+        return self.version_cargada
+
+
+@override_settings(CACHE_RESPUESTAS={}, ESTADO_SESION={'habilitado': False}, RESPUESTAS_PRECALCULADAS=False,
+                   METRICAS_DIRECTORIO=None)
+class CalentamientoTests(SimpleTestCase):
+    """El worker solo se declara listo tras calentar; /readyz responde 503 hasta entonces."""
+
+    def crear_registro(self, error=None):
+        registro = RegistroServicios()
+        indice = IndiceFalso(DOCUMENTOS)
+        registro._modelo = ModeloFalso()
+        registro._chroma_db = ChromaCalentable(DOCUMENTOS, error)
+        registro._indice = indice
+        registro._resolutor = ResolutorCiudades(indice.ciudades())
+        return registro
+
+    def tearDown(self):
+        concurrencia.reset()
+
+    def test_calentar_registra_etapas(self):
+        registro = self.crear_registro()
+        self.assertTrue(registro.calentar())
+        estado = registro.estado()
+        self.assertTrue(estado["listo"])
+        self.assertEqual(set(estado["etapas"]), {
+            "modelo_gemini", "embeddings", "coleccion_destinos_turisticos", "coleccion_salud_mental",
+            "indice_ciudades", "agentes",
+        })
+        self.assertEqual(estado["ciudades"], 2)
+        self.assertEqual([c for c, texto, _ in registro._chroma_db.consultas if texto == "calentamiento"],
+                         ["destinos_turisticos", "salud_mental"])
+
+    def test_readyz_responde_503_hasta_calentar(self):
+        registro = self.crear_registro(error=RuntimeError("modelo no disponible"))
+        factory = RequestFactory()
+        with mock.patch.object(views, "registro", registro):
+            with self.assertLogs("agentes.servicios.registro", "ERROR"):
+                respuesta = views.readyz(factory.get("/readyz"))
+            self.assertEqual(respuesta.status_code, 503)
+            self.assertEqual(json.loads(respuesta.content)["error"], "modelo no disponible")
+            # /readyz reintenta el calentamiento en cada petición mientras no esté listo
+            registro._chroma_db.error = None
+            self.assertEqual(views.readyz(factory.get("/readyz")).status_code, 200)
+        self.assertEqual(views.healthz(factory.get("/healthz")).status_code, 200)
+
+
+RUTA_GUNICORN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+
+class ConfiguracionGunicornTests(SimpleTestCase):
+    """La configuración de gunicorn se deriva de las variables de entorno."""
+
+    def cargar(self, **entorno):
+        variables = {clave: valor for clave, valor in os.environ.items()
+                     if not clave.startswith("GUNICORN_") and clave != "WEBHOOK_ASYNC"}
+        with mock.patch.dict(os.environ, {**variables, **entorno}, clear=True):
+            configuracion = runpy.run_path(RUTA_GUNICORN)
+            configuracion["precarga"] = os.environ.get("GUNICORN_PRECARGA")
+        return configuracion
+
+    def test_clase_por_defecto_segun_modo(self):
+        sincrono = self.cargar()
+        self.assertEqual((sincrono["worker_class"], sincrono["wsgi_app"]),
+                         ("gthread", "webhook_dialogflow.wsgi:application"))
+        asincrono = self.cargar(WEBHOOK_ASYNC="True")
+        self.assertEqual((asincrono["worker_class"], asincrono["wsgi_app"]),
+                         ("uvicorn.workers.UvicornWorker", "webhook_dialogflow.asgi:application"))
+        self.assertEqual(asincrono["threads"], 1)
+
+    def test_variables_explicitas_y_precarga(self):
+        configuracion = self.cargar(GUNICORN_WORKER_CLASS="sync", GUNICORN_WORKERS="3", GUNICORN_PRELOAD="False")
+        self.assertEqual((configuracion["worker_class"], configuracion["workers"]), ("sync", 3))
+        self.assertFalse(configuracion["preload_app"])
+        self.assertIsNone(configuracion["precarga"])
+        self.assertEqual(self.cargar()["precarga"], "1")
+
+    def test_clase_desconocida(self):
+        with self.assertRaises(ValueError):
+            self.cargar(GUNICORN_WORKER_CLASS="eventlet")
+
+    def test_cuota_de_gemini_cuenta_los_mismos_workers(self):
+        for entorno in ({}, {"GUNICORN_WORKER_CLASS": "sync"}, {"WEBHOOK_ASYNC": "True"},
+                        {"GUNICORN_WORKERS": "3"}):
+            configuracion = self.cargar(**entorno)
+            with mock.patch.dict(os.environ, entorno):
+                for clave in {"GUNICORN_WORKER_CLASS", "GUNICORN_WORKERS", "WEBHOOK_ASYNC"} - set(entorno):
+                    os.environ.pop(clave, None)
+                self.assertEqual(procesos.numero_workers(), configuracion["workers"])
+        with mock.patch.dict(os.environ, {"GUNICORN_WORKER_CLASS": "eventlet"}):
+            with self.assertRaises(ValueError):
+                procesos.numero_workers()
+
+    def test_worker_se_calienta_tras_el_fork(self):
+        configuracion = self.cargar()
+        with mock.patch("agentes.servicios.registro.registro") as registro:
+            configuracion["post_worker_init"](None)
+        registro.despues_de_fork.assert_called_once_with()
+        registro.calentar.assert_called_once_with()
+
+
+class BenchmarkTests(SimpleTestCase):
+    """Sustitutos deterministas, resumen de duraciones y detección de regresiones."""
+
+    def test_datos_y_embeddings_deterministas(self):
+        ciudades = datos_benchmark.generar_ciudades(20)
+        self.assertEqual(ciudades, datos_benchmark.generar_ciudades(20))
+        self.assertEqual(len({c.lower() for c in ciudades}), 20)
+        self.assertEqual(datos_benchmark.generar_documentos(ciudades[:3]),
+                         datos_benchmark.generar_documentos(ciudades[:3]))
+        embedding = falsos.EmbeddingFalso(dimension=16)
+        self.assertEqual(embedding(["hoteles en Oaxaca"]), embedding(["HOTELES en oaxaca"]))
+
+    def test_modelo_falso_extrae_ciudades_conocidas(self):
+        modelo = falsos.ModeloFalso(ciudades=["San Luis Potosí"], tokens=3)
+        prompt = "Responde ÚNICAMENTE con el nombre\nConsulta: hoteles en san luis potosi"
+        self.assertEqual(modelo.generate_content(prompt).text, "San Luis Potosí")
+        self.assertEqual(modelo.generate_content("Responde ÚNICAMENTE con el nombre\nConsulta: hola").text,
+                         "None")
+        self.assertEqual(modelo.generate_content("genera").text, "palabra0 palabra1 palabra2")
+
+    def test_estadisticas_en_milisegundos(self):
+        resumen = estadisticas([i / 1000 for i in range(1, 101)])
+        self.assertEqual((resumen["n"], resumen["p50"], resumen["p95"], resumen["p99"], resumen["max"]),
+                         (100, 50.5, 95.0, 99.0, 100.0))
+
+    def test_comparar_detecta_regresiones(self):
+        def resultado(p50, ms_archivo):
+            return {"escalas": {"10": {"agentes": {"turismo": {"total": {"p50": p50}}},
+                                       "descarga_gcs": {"ms_por_archivo": ms_archivo}}}}
+
+        self.assertEqual(comparar(resultado(1.1, 2.0), resultado(1.0, 2.0), 0.2), [])
+        regresiones = comparar(resultado(1.5, 3.0), resultado(1.0, 2.0), 0.2)
+        self.assertEqual(len(regresiones), 2)
+        self.assertIn("turismo.total", regresiones[0])
+        # Diferencias por debajo del mínimo absoluto no cuentan
+        self.assertEqual(comparar(resultado(0.03, 2.0), resultado(0.01, 2.0), 0.2), [])
+
+
+class MetricasTests(SimpleTestCase):
+    """Exposición en formato de Prometheus y agregación entre workers."""
+
+    def test_exporta_contadores_e_histogramas(self):
+        registro = RegistroMetricas()
+        peticiones = registro.contador('peticiones', "Peticiones", ('codigo',))
+        duracion = registro.histograma('duracion_segundos', "Duración", limites=(0.1, 1.0))
+        peticiones.incrementar('200')
+        peticiones.incrementar('200')
+        peticiones.incrementar('a"b')
+        for valor in (0.05, 0.5, 5.0):
+            duracion.observar(valor)
+
+        lineas = registro.exportar().splitlines()
+        self.assertIn("# TYPE peticiones_total counter", lineas)
+        self.assertIn('peticiones_total{codigo="200"} 2', lineas)
+        self.assertIn('peticiones_total{codigo="a\\"b"} 1', lineas)
+        # Cubetas acumuladas hasta +Inf
+        self.assertIn('duracion_segundos_bucket{le="0.1"} 1', lineas)
+        self.assertIn('duracion_segundos_bucket{le="1"} 2', lineas)
+        self.assertIn('duracion_segundos_bucket{le="+Inf"} 3', lineas)
+        self.assertIn("duracion_segundos_sum 5.55", lineas)
+        self.assertIn("duracion_segundos_count 3", lineas)
+        with self.assertRaises(ValueError):
+            registro.contador('peticiones', "Duplicada")
+        with self.assertRaises(ValueError):
+            peticiones.incrementar()
+
+    def test_metrica_sin_series_falla_al_construirse(self):
+        class Incompleta(metricas._Metrica):
+            tipo = 'gauge'
+
+        with self.assertRaises(TypeError):
+            Incompleta('incompleta', "Sin _nueva_serie")
+
+    def test_cronometro_observa_etapas_y_total(self):
+        registro = RegistroMetricas()
+        etapas = registro.histograma('etapas', "Etapas", ('agente', 'etapa'))
+        cronometro = Cronometro(etapas, 'turismo')
+        cronometro.marcar('extraccion')
+        cronometro.marcar('generacion')
+        cronometro.terminar()
+        series = {tuple(valores): dato['cuenta'] for valores, dato in etapas.exportar_series()}
+        self.assertEqual(series, {('turismo', 'extraccion'): 1, ('turismo', 'generacion'): 1,
+                                  ('turismo', 'total'): 1})
+
+    def test_agrega_workers_y_acumula_los_terminados(self):
+        registro = RegistroMetricas()
+        peticiones = registro.contador('peticiones', "Peticiones")
+        en_curso = registro.medidor('en_curso', "En curso")
+        peticiones.incrementar(cantidad=2)
+        en_curso.fijar(1)
+        with tempfile.TemporaryDirectory() as directorio:
+            # Un worker que ya terminó (pid inexistente) con su último volcado
+            with open(os.path.join(directorio, 'metricas_999999999.json'), 'w') as archivo:
+                json.dump({'peticiones': [[[], 5]], 'en_curso': [[[], 3]]}, archivo)
+            registro.configurar(directorio, intervalo=3600)
+            try:
+                for _ in range(2):
+                    lineas = registro.exportar().splitlines()
+                    self.assertIn("peticiones_total 7", lineas)
+                    # Los medidores de procesos terminados no cuentan
+                    self.assertIn("en_curso 1", lineas)
+                self.assertNotIn('metricas_999999999.json', os.listdir(directorio))
+                self.assertIn('metricas_acumuladas.json', os.listdir(directorio))
+            finally:
+                registro._detener.set()
+
+    @override_settings(METRICAS_DIRECTORIO=None)
+    def test_vista_metrics(self):
+        RUTA_CRISIS.incrementar('prueba')
+        respuesta = Client().get('/metrics')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('rag_ruta_crisis_total{categoria="prueba"}', respuesta.content.decode())
+        self.assertEqual(Client().post('/metrics').status_code, 405)
+
+
+class ModeloLento(ModeloFalso):
+    """Extrae al instante pero tarda ``pausa`` segundos en generar."""
+
+    def __init__(self, pausa, **kwargs):
+        super().__init__(**kwargs)
+        self.pausa = pausa
+
+    def generate_content(self, prompt, **opciones):
+        if "extrae el nombre" not in prompt:
+            time.sleep(self.pausa)
+        return self._responder(prompt)
+
+    async def generate_content_async(self, prompt, **opciones):
+        if "extrae el nombre" not in prompt:
+            await asyncio.sleep(self.pausa)
+        return self._responder(prompt)
+
+
+@override_settings(**AJUSTES_AGENTES)
+class PlazosTests(SimpleTestCase):
+    """Reparto del plazo entre etapas y respuesta degradada al agotarse."""
+
+    def tearDown(self):
+        concurrencia.reset()
+
+    def test_para_etapa_descuenta_el_margen_y_acota_por_maximo(self):
+        with mock.patch('agentes.servicios.plazos.time.monotonic', return_value=100.0):
+            plazo = Plazo(4.5, margen=0.5)
+            self.assertEqual(plazo.para_etapa('extraccion', 1.5), 1.5)
+            self.assertEqual(plazo.para_etapa('generacion'), 4.0)
+        with mock.patch('agentes.servicios.plazos.time.monotonic', return_value=103.5):
+            self.assertEqual(plazo.para_etapa('generacion'), 0.5)
+        with mock.patch('agentes.servicios.plazos.time.monotonic', return_value=104.0):
+            with self.assertRaises(PlazoVencido) as contexto:
+                plazo.para_etapa('recuperacion', 1.0)
+        self.assertEqual(contexto.exception.etapa, 'recuperacion')
+        sin_limite = Plazo(None)
+        self.assertTrue(sin_limite.ilimitado)
+        self.assertIsNone(sin_limite.para_etapa('generacion'))
+        self.assertEqual(sin_limite.para_etapa('extraccion', 1.5), 1.5)
+
+    def test_ejecutar_y_esperar_con_plazo(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            self.assertEqual(ejecutar_con_plazo(executor, None, 'etapa', sum, (1, 2)), 3)
+            self.assertEqual(ejecutar_con_plazo(executor, 1.0, 'etapa', sum, (1, 2)), 3)
+            with self.assertRaises(PlazoVencido):
+                ejecutar_con_plazo(executor, 0.01, 'lenta', time.sleep, 0.2)
+        with self.assertRaises(PlazoVencido):
+            asyncio.run(esperar_con_plazo(asyncio.sleep(0.2), 0.01, 'lenta'))
+
+    def test_generacion_lenta_responde_con_el_documento(self):
+        antes = valor_metrica(RESPUESTAS_DEGRADADAS, 'turismo', 'generacion')
+        agente = crear_agente(RAGTurismo, ModeloLento(0.3))
+        for respuesta in (agente.process_query("¿Qué hacer en Oaxaca?", plazo=Plazo(0.1)),
+                          asyncio.run(agente.aprocess_query("¿Qué hacer en Oaxaca?", plazo=Plazo(0.1)))):
+            self.assertTrue(respuesta.startswith("Esto es lo que sé de Oaxaca:"))
+        self.assertEqual(valor_metrica(RESPUESTAS_DEGRADADAS, 'turismo', 'generacion') - antes, 2)
+
+    def test_generacion_lenta_en_salud_mental_incluye_emergencias(self):
+        agente = crear_agente(RAGSaludMental, ModeloLento(0.3))
+        sincrona, asincrona = ejecutar_ambos(agente, "busco terapia en Mérida", plazo=Plazo(0.1))
+        self.assertEqual(sincrona, asincrona)
+        self.assertIn("Línea de la Vida", sincrona)
+
+
+class ModeloIrregular:
+    """Modelo cuya primera llamada tarda ``pausa`` segundos y las demás responden al instante."""
+
+    def __init__(self, pausa):
+        self.pausa = pausa
+        self.llamadas = 0
+        self._lock = threading.Lock()
+
+    def _turno(self):
+        with self._lock:
+            self.llamadas += 1
+            return self.llamadas
+
+    def generate_content(self, prompt, **opciones):
+        turno = self._turno()
+        if turno == 1:
+            time.sleep(self.pausa)
+        return SimpleNamespace(text=f"respuesta {turno}")
+
+    async def generate_content_async(self, prompt, **opciones):
+        turno = self._turno()
+        if turno == 1:
+            await asyncio.sleep(self.pausa)
+        return SimpleNamespace(text=f"respuesta {turno}")
+
+
+class ClienteGeminiTests(SimpleTestCase):
+    """Interruptor de circuito (fallos, latencia, sonda única) y llamadas de cobertura."""
+
+    def test_fallos_seguidos_abren_y_la_sonda_es_unica(self):
+        interruptor = InterruptorCircuito(umbral_fallos=2, espera=0.05)
+        for _ in range(2):
+            self.assertFalse(interruptor.entrar())
+            interruptor.registrar(0.01, False)
+        self.assertEqual(interruptor.estado, ABIERTO)
+        with self.assertRaises(CircuitoAbierto):
+            interruptor.entrar()
+        time.sleep(0.06)
+        # Semiabierto: solo pasa una sonda a la vez
+        self.assertTrue(interruptor.entrar())
+        with self.assertRaises(CircuitoAbierto):
+            interruptor.entrar()
+        interruptor.cancelar(True)
+        self.assertTrue(interruptor.entrar())
+        interruptor.registrar(0.01, False, sonda=True)
+        self.assertEqual(interruptor.estado, ABIERTO)
+        time.sleep(0.06)
+        self.assertTrue(interruptor.entrar())
+        interruptor.registrar(0.01, True, sonda=True)
+        self.assertEqual(interruptor.estado, CERRADO)
+        self.assertFalse(interruptor.entrar())
+
+    def test_p95_lento_abre_el_circuito(self):
+        interruptor = InterruptorCircuito(umbral_p95=1.0, min_muestras=10)
+        for _ in range(9):
+            interruptor.registrar(2.0, True)
+        self.assertEqual(interruptor.estado, CERRADO)
+        interruptor.registrar(2.0, True)
+        self.assertEqual(interruptor.estado, ABIERTO)
+
+    def test_cliente_rechaza_con_el_circuito_abierto(self):
+        modelo = ModeloFalso(error=RuntimeError("sin servicio"))
+        cliente = ClienteGemini(modelo, InterruptorCircuito(umbral_fallos=1, espera=60))
+        with self.assertRaises(RuntimeError):
+            cliente.generate_content("hola")
+        with self.assertRaises(CircuitoAbierto):
+            cliente.generate_content("hola")
+        with self.assertRaises(CircuitoAbierto):
+            asyncio.run(cliente.generate_content_async("hola"))
+        self.assertEqual(len(modelo.prompts), 1)
+
+    def test_llamada_cortada_por_el_plazo_cuenta_como_fallo(self):
+        interruptor = InterruptorCircuito(umbral_fallos=100, umbral_p95=0.05, min_muestras=2, espera=60)
+        cliente = ClienteGemini(ModeloLento(0.3), interruptor)
+        for _ in range(2):
+            with self.assertRaises(PlazoVencido):
+                asyncio.run(esperar_con_plazo(cliente.generate_content_async("genera"), 0.1, 'generacion'))
+        self.assertEqual(interruptor.estado, ABIERTO)
+
+    @override_settings(**AJUSTES_AGENTES)
+    def test_gemini_lento_abre_el_circuito_en_el_webhook_asincrono(self):
+        modelo = ModeloLento(0.3)
+        cliente = ClienteGemini(modelo, InterruptorCircuito(umbral_fallos=2, espera=60))
+        agente = crear_agente(RAGTurismo, cliente)
+        try:
+            for _ in range(2):
+                respuesta = asyncio.run(agente.aprocess_query("¿Qué hacer en Oaxaca?", plazo=Plazo(0.1)))
+                self.assertTrue(respuesta.startswith("Esto es lo que sé de Oaxaca:"))
+            self.assertEqual(cliente.interruptor.estado, ABIERTO)
+            generaciones = len(modelo.prompts)
+            asyncio.run(agente.aprocess_query("¿Qué hacer en Oaxaca?", plazo=Plazo(0.1)))
+            self.assertEqual(len(modelo.prompts), generaciones)
+        finally:
+            concurrencia.reset()
+
+    def cliente_con_cobertura(self, fraccion=1.0):
+        interruptor = InterruptorCircuito(min_muestras=5)
+        for _ in range(5):
+            interruptor.registrar(0.01, True)
+        return ClienteGemini(ModeloIrregular(0.5), interruptor, cobertura=True, fraccion_cobertura=fraccion)
+
+    def test_cobertura_usa_la_segunda_llamada_si_gana(self):
+        cliente = self.cliente_con_cobertura()
+        self.assertEqual(cliente.generate_content("hola").text, "respuesta 2")
+        cliente = self.cliente_con_cobertura()
+        self.assertEqual(asyncio.run(cliente.generate_content_async("hola")).text, "respuesta 2")
+
+    def test_cobertura_limitada_por_fraccion(self):
+        cliente = self.cliente_con_cobertura(fraccion=0.0)
+        self.assertEqual(cliente.generate_content("hola").text, "respuesta 1")
+        self.assertEqual(cliente.modelo.llamadas, 1)
+
+    @override_settings(**AJUSTES_AGENTES)
+    def test_agente_con_circuito_abierto_responde_degradada(self):
+        cliente = ClienteGemini(ModeloFalso(extraccion="Oaxaca"), InterruptorCircuito(umbral_fallos=1, espera=60))
+        cliente.interruptor.registrar(0.01, False)
+        agente = crear_agente(RAGTurismo, cliente)
+        try:
+            sincrona, asincrona = ejecutar_ambos(agente, "¿Qué hacer en Oaxaca?")
+        finally:
+            concurrencia.reset()
+        self.assertTrue(sincrona.startswith("Esto es lo que sé de Oaxaca:"))
+        self.assertEqual(sincrona, asincrona)
+
+
+class ModeloContado(ModeloFalso):
+    """Tarda ``pausa`` segundos en generar y cuenta las generaciones."""
+
+    def __init__(self, pausa, **kwargs):
+        super().__init__(**kwargs)
+        self.pausa = pausa
+        self.generaciones = 0
+
+    def generate_content(self, prompt, **opciones):
+        if "extrae el nombre" not in prompt:
+            self.generaciones += 1
+            time.sleep(self.pausa)
+        return self._responder(prompt)
+
+
+class LimitadorCoalescenciaTests(SimpleTestCase):
+    """Cubo de tokens en orden de llegada y coalescencia de llamadas idénticas en vuelo."""
+
+    def test_cubo_admite_rafaga_y_encola_en_orden(self):
+        with mock.patch('agentes.servicios.limitador.time.monotonic', return_value=10.0):
+            cubo = CuboTokens(tasa=2.0, capacidad=2, espera_maxima=1.0)
+            self.assertEqual([cubo._reservar(cubo.espera_maxima) for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+            # La quinta esperaría 1.5 s: se descarta sin consumir token
+            with self.assertRaises(LimiteExcedido):
+                cubo.adquirir()
+            self.assertFalse(cubo.intentar())
+        with mock.patch('agentes.servicios.limitador.time.monotonic', return_value=12.0):
+            self.assertTrue(cubo.intentar())
+
+    def test_cancelar_la_espera_devuelve_el_token(self):
+        cubo = CuboTokens(tasa=5.0, capacidad=1, espera_maxima=1.0)
+        self.assertEqual(cubo.adquirir(), 0.0)
+
+        async def cancelar():
+            tarea = asyncio.ensure_future(cubo.aadquirir())
+            await asyncio.sleep(0.01)
+            tarea.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await tarea
+
+        asyncio.run(cancelar())
+        # Solo queda en cola la reposición del primer token
+        self.assertLessEqual(cubo._reservar(1.0), 0.2)
+
+    def test_compartir_lanza_una_sola_llamada(self):
+        grupo = GrupoVuelo()
+        lanzadas = []
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            def lanzar():
+                lanzadas.append(1)
+                return executor.submit(time.sleep, 0.05)
+
+            clave = clave_vuelo('turismo', 'generacion', 'Oaxaca', '¿Qué hacer?')
+            futuro, lider = grupo.compartir(clave, lanzar)
+            otro, seguidor = grupo.compartir(('turismo', 'generacion', 'oaxaca', 'que hacer'), lanzar)
+            self.assertTrue(lider)
+            self.assertFalse(seguidor)
+            self.assertIs(futuro, otro)
+            futuro.result()
+        self.assertEqual(len(lanzadas), 1)
+        self.assertEqual(len(grupo), 0)
+
+    def test_acompartir_en_el_event_loop(self):
+        grupo = GrupoVuelo()
+        llamadas = []
+
+        async def llamar():
+            llamadas.append(1)
+            await asyncio.sleep(0.01)
+            return "hecho"
+
+        async def varias():
+            tareas = [grupo.acompartir('clave', llamar) for _ in range(3)]
+            self.assertEqual([lider for _, lider in tareas], [True, False, False])
+            return await asyncio.gather(*(asyncio.shield(tarea) for tarea, _ in tareas))
+
+        self.assertEqual(asyncio.run(varias()), ["hecho"] * 3)
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(len(grupo), 0)
+
+    @override_settings(**{**AJUSTES_AGENTES, 'GEMINI_COALESCENCIA': True})
+    def test_consultas_identicas_concurrentes_comparten_generacion(self):
+        modelo = ModeloContado(0.2)
+        agente = crear_agente(RAGTurismo, modelo)
+        try:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                respuestas = list(executor.map(lambda _: agente.process_query("¿Qué hacer en Oaxaca?"), range(4)))
+        finally:
+            concurrencia.reset()
+        self.assertEqual(respuestas, ["respuesta generada"] * 4)
+        self.assertEqual(modelo.generaciones, 1)
+
+
+class MotorVectorialTests(SimpleTestCase):
+    """Top-k exacto, filtros ``where`` y persistencia del motor NumPy."""
+
+    def setUp(self):
+        self.temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temporal.cleanup)
+        generador = np.random.default_rng(7)
+        self.vectores = generador.normal(size=(200, 16)).astype(np.float32)
+        self.ids = [f"doc{i}" for i in range(200)]
+        self.metadatas = [{"ciudad": f"ciudad{i % 5}", "tipo": "resumen" if i % 2 else "documento"}
+                          for i in range(200)]
+        self.cliente = ClienteVectorial(self.temporal.name)
+        self.coleccion = self.cliente.create_collection("destinos_turisticos")
+        self.coleccion.add(ids=self.ids, embeddings=self.vectores, metadatas=self.metadatas,
+                           documents=[f"texto {i}" for i in range(200)])
+
+    def fuerza_bruta(self, consulta, k, filas=None):
+        normalizados = self.vectores / np.linalg.norm(self.vectores, axis=1, keepdims=True)
+        similitudes = normalizados @ (consulta / np.linalg.norm(consulta))
+        filas = range(200) if filas is None else filas
+        return [self.ids[fila] for fila in sorted(filas, key=lambda fila: -similitudes[fila])[:k]]
+
+    def test_top_k_exacto_como_fuerza_bruta(self):
+        consultas = np.random.default_rng(11).normal(size=(3, 16)).astype(np.float32)
+        resultado = self.coleccion.query(query_embeddings=consultas, n_results=10)
+        for j, consulta in enumerate(consultas):
+            self.assertEqual(resultado["ids"][j], self.fuerza_bruta(consulta, 10))
+            distancias = resultado["distances"][j]
+            self.assertEqual(distancias, sorted(distancias))
+        self.assertEqual(len(self.coleccion.query(query_embeddings=consultas[:1], n_results=500)["ids"][0]), 200)
+
+    def test_filtros_where(self):
+        consulta = self.vectores[3]
+        casos = [
+            ({"ciudad": "ciudad1"}, lambda m: m["ciudad"] == "ciudad1"),
+            ({"ciudad": {"$ne": "ciudad1"}}, lambda m: m["ciudad"] != "ciudad1"),
+            ({"ciudad": {"$in": ["ciudad1", "ciudad2"]}}, lambda m: m["ciudad"] in ("ciudad1", "ciudad2")),
+            ({"$and": [{"ciudad": "ciudad3"}, {"tipo": "resumen"}]},
+             lambda m: m["ciudad"] == "ciudad3" and m["tipo"] == "resumen"),
+            ({"$or": [{"ciudad": "ciudad0"}, {"tipo": {"$nin": ["documento"]}}]},
+             lambda m: m["ciudad"] == "ciudad0" or m["tipo"] != "documento"),
+        ]
+        for where, cumple in casos:
+            filas = [i for i, metadata in enumerate(self.metadatas) if cumple(metadata)]
+            resultado = self.coleccion.query(query_embeddings=[consulta], n_results=7, where=where)
+            self.assertEqual(resultado["ids"][0], self.fuerza_bruta(consulta, 7, filas), where)
+            self.assertEqual(self.coleccion.get(where=where)["ids"], [self.ids[fila] for fila in filas])
+        with self.assertRaises(ValueError):
+            self.coleccion.get(where={"ciudad": {"$gt": 1}})
+
+    def test_upsert_y_delete(self):
+        self.coleccion.upsert(ids=["doc0"], embeddings=[self.vectores[1]], metadatas=[{"ciudad": "nueva"}])
+        self.assertEqual(self.coleccion.count(), 200)
+        self.assertEqual(self.coleccion.get(where={"ciudad": "nueva"})["ids"], ["doc0"])
+        # El texto no se reemplaza si no se pasa
+        self.assertEqual(self.coleccion.get(ids=["doc0"])["documents"], ["texto 0"])
+        self.assertEqual(self.coleccion.delete(where={"ciudad": "ciudad4"}), [f"doc{i}" for i in range(4, 200, 5)])
+        self.assertEqual(self.coleccion.count(), 160)
+        with self.assertRaises(ValueError):
+            self.coleccion.add(ids=["doc1"], embeddings=[self.vectores[1]])
+        with self.assertRaises(ValueError):
+            self.coleccion.upsert(ids=["otro"], embeddings=[[1.0, 0.0]])
+
+    def test_persistir_y_reabrir(self):
+        self.cliente.persist()
+        reabierto = ClienteVectorial(self.temporal.name).get_collection("destinos_turisticos")
+        consulta = self.vectores[:1]
+        self.assertEqual(reabierto.query(query_embeddings=consulta, n_results=5, where={"tipo": "resumen"}),
+                         self.coleccion.query(query_embeddings=consulta, n_results=5, where={"tipo": "resumen"}))
+        self.cliente.delete_collection("destinos_turisticos")
+        self.cliente.persist()
+        self.assertEqual(ClienteVectorial(self.temporal.name).list_collections(), [])
+
+
+class RespuestasPrecalculadasTests(SimpleTestCase):
+    """Clasificación de temas, almacén de respuestas y plan de regeneración."""
+
+    def setUp(self):
+        self.temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temporal.cleanup)
+        self.almacen = AlmacenRespuestas(self.temporal.name)
+
+    def test_clasificar_tema_prefiere_no_responder(self):
+        self.assertEqual(clasificar_tema("destinos_turisticos", "¿Qué hoteles hay en Mérida?", "Mérida"), "hoteles")
+        self.assertEqual(clasificar_tema("destinos_turisticos", "¿Dónde comer en Oaxaca?", "Oaxaca"), "comida")
+        self.assertEqual(clasificar_tema("salud_mental", "Teléfonos de ayuda en Oaxaca", "Oaxaca"), "lineas_ayuda")
+        self.assertIsNone(clasificar_tema("destinos_turisticos", "hoteles baratos cerca de la playa", "Mérida"))
+        # Palabras de dos temas a la vez
+        self.assertIsNone(clasificar_tema("destinos_turisticos", "hoteles y restaurantes en Mérida", "Mérida"))
+        self.assertIsNone(clasificar_tema("destinos_turisticos", "¿Qué hay en Mérida?", "Mérida"))
+        self.assertIsNone(clasificar_tema("otra", "hoteles", ""))
+
+    def test_almacen_solo_devuelve_entradas_vigentes(self):
+        self.almacen.guardar("turismo", "Mérida", "hoteles", "Hotel Centro", "h1", "v1", ttl=60)
+        self.almacen.guardar("turismo", "Oaxaca", "hoteles", "Hotel Viejo", "h2", "v1", ttl=-1)
+        self.assertEqual(self.almacen.obtener("turismo", "merida", "hoteles", "h1"), "Hotel Centro")
+        self.assertIsNone(self.almacen.obtener("turismo", "Mérida", "hoteles", "otro hash"))
+        self.assertIsNone(self.almacen.obtener("salud_mental", "Mérida", "hoteles"))
+        self.assertIsNone(self.almacen.obtener("turismo", "Oaxaca", "hoteles"))
+        self.assertEqual(set(self.almacen.entradas("turismo")), {("merida", "hoteles"), ("oaxaca", "hoteles")})
+        self.almacen.eliminar("turismo", [("oaxaca", "hoteles")])
+        self.assertEqual(set(self.almacen.entradas("turismo")), {("merida", "hoteles")})
+
+    def test_planificar_regenera_solo_lo_necesario(self):
+        temas = TEMAS["destinos_turisticos"]
+        documentos = [
+            {"ciudad": "Mérida", "_metadata": {"ciudad": "Mérida", "hash": "hm"}},
+            {"ciudad": "Oaxaca", "_metadata": {"ciudad": "Oaxaca", "hash": "ho"}},
+            {"ciudad": "Sin hash", "_metadata": {"ciudad": "Sin hash"}},
+        ]
+        lejos = time.time() + 3600
+        entradas = {("merida", tema): EntradaRespuesta(hash_fuente("hm", definicion.pregunta), "v1", lejos)
+                    for tema, definicion in temas.items()}
+        # Fuente cambiada, a punto de expirar y ciudad eliminada
+        entradas[("merida", "hoteles")] = EntradaRespuesta("viejo", "v1", lejos)
+        entradas[("merida", "comida")] = entradas[("merida", "comida")]._replace(expira=time.time() + 10)
+        entradas[("tijuana", "hoteles")] = EntradaRespuesta("h", "v1", lejos)
+
+        tareas, obsoletas = planificar("destinos_turisticos", documentos, entradas, renovar_antes=60)
+        self.assertEqual({(t.ciudad, t.tema) for t in tareas},
+                         {("Mérida", "hoteles"), ("Mérida", "comida")} | {("Oaxaca", tema) for tema in temas})
+        self.assertEqual(obsoletas, {("tijuana", "hoteles")})
+        tarea = next(t for t in tareas if t.ciudad == "Mérida" and t.tema == "hoteles")
+        self.assertEqual(tarea.hash_fuente, hash_fuente("hm", temas["hoteles"].pregunta))
+        self.assertIn("Destino: Mérida", tarea.prompt)
+
+        forzadas, _ = planificar("destinos_turisticos", documentos, entradas, renovar_antes=60, forzar=True)
+        self.assertEqual(len(forzadas), 2 * len(temas))
+
+    @override_settings(**AJUSTES_AGENTES)
+    def test_agente_responde_precalculada_con_el_documento_actual(self):
+        pregunta = TEMAS["destinos_turisticos"]["hoteles"].pregunta
+        self.almacen.guardar("turismo", "Mérida", "hoteles", "Hoteles precalculados",
+                             hash_fuente("hm", pregunta), "v1", ttl=60)
+        modelo = ModeloFalso()
+        agente = crear_agente(RAGTurismo, modelo)
+        agente.precalculadas = self.almacen
+        vigente = {"ciudad": "Mérida", "_metadata": {"ciudad": "Mérida", "hash": "hm"}}
+        repoblado = {"ciudad": "Mérida", "_metadata": {"ciudad": "Mérida", "hash": "nuevo"}}
+        try:
+            self.assertEqual(agente.generate_response("¿Qué hoteles hay en Mérida?", vigente),
+                             "Hoteles precalculados")
+            self.assertEqual(asyncio.run(agente.agenerate_response("hoteles en Mérida", vigente)),
+                             "Hoteles precalculados")
+            self.assertEqual(modelo.prompts, [])
+            self.assertEqual(agente.generate_response("¿Qué hoteles hay en Mérida?", repoblado),
+                             "respuesta generada")
+        finally:
+            concurrencia.reset()
+
+
+@skipUnless(importlib.util.find_spec('onnx'), "preparar el modelo int8 requiere el paquete onnx")
+class EmbeddingsONNXTests(SimpleTestCase):
+    """Cuantización de un modelo ONNX pequeño y embeddings con los pesos compartidos."""
+
+    VOCABULARIO = ["[PAD]", "[UNK]"] + [f"palabra{i}" for i in range(62)]
+    DIMENSION = 32
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import onnx
+        from onnx import TensorProto, helper, numpy_helper
+        from tokenizers import Tokenizer
+        from tokenizers.models import WordLevel
+        from tokenizers.pre_tokenizers import Whitespace
+
+        cls.temporal = tempfile.TemporaryDirectory()
+        cls.origen = os.path.join(cls.temporal.name, 'fp32')
+        cls.destino = os.path.join(cls.temporal.name, 'int8')
+        os.makedirs(cls.origen)
+        generador = np.random.default_rng(3)
+        cls.tabla = generador.normal(size=(len(cls.VOCABULARIO), cls.DIMENSION)).astype(np.float32)
+        cls.proyeccion = generador.normal(size=(cls.DIMENSION, cls.DIMENSION)).astype(np.float32)
+        # Un codificador mínimo con las entradas y la salida de all-MiniLM-L6-v2
+        entradas = [helper.make_tensor_value_info(nombre, TensorProto.INT64, ['lote', 'tokens'])
+                    for nombre in ('input_ids', 'attention_mask', 'token_type_ids')]
+        grafo = helper.make_graph(
+            [helper.make_node('Gather', ['tabla', 'input_ids'], ['incrustados']),
+             helper.make_node('MatMul', ['incrustados', 'proyeccion'], ['last_hidden_state'])],
+            'codificador', entradas,
+            [helper.make_tensor_value_info('last_hidden_state', TensorProto.FLOAT, ['lote', 'tokens', cls.DIMENSION])],
+            [numpy_helper.from_array(cls.tabla, 'tabla'), numpy_helper.from_array(cls.proyeccion, 'proyeccion')],
+        )
+        modelo = helper.make_model(grafo, opset_imports=[helper.make_opsetid('', 17)])
+        modelo.ir_version = 8
+        onnx.save(modelo, os.path.join(cls.origen, 'model.onnx'))
+        tokenizador = Tokenizer(WordLevel({p: i for i, p in enumerate(cls.VOCABULARIO)}, unk_token="[UNK]"))
+        tokenizador.pre_tokenizer = Whitespace()
+        tokenizador.save(os.path.join(cls.origen, 'tokenizer.json'))
+        cls.resumen = preparar_modelo(cls.origen, cls.destino)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temporal.cleanup()
+        super().tearDownClass()
+
+    def referencia(self, texto):
+        """Embedding fp32 esperado: promedio de los tokens y normalización L2."""
+        ids = [self.VOCABULARIO.index(p) for p in texto.split()]
+        vector = (self.tabla[ids] @ self.proyeccion).mean(axis=0)
+        return vector / np.linalg.norm(vector)
+
+    def test_modelo_preparado_comparte_los_pesos(self):
+        self.assertEqual(set(os.listdir(self.destino)),
+                         {'modelo_int8.onnx', 'pesos.bin', 'pesos.json', 'tokenizer.json'})
+        self.assertGreater(self.resumen['tensores_compartidos'], 0)
+        self.assertLess(self.resumen['bytes_int8'], self.resumen['bytes_fp32'])
+        with open(os.path.join(self.destino, 'pesos.json')) as archivo:
+            indice = json.load(archivo)
+        self.assertTrue(all(t['desplazamiento'] % 4096 == 0 for t in indice.values()))
+
+    def test_embeddings_cercanos_al_modelo_fp32_y_en_orden(self):
+        funcion = crear_funcion_embedding('onnx_int8', directorio_modelo=self.destino, tamano_lote=2)
+        textos = ["palabra1 palabra2 palabra3 palabra4 palabra5", "palabra7",
+                  "palabra9 palabra10 palabra11", "palabra12 palabra13"]
+        vectores = funcion.embeber(textos)
+        self.assertEqual(vectores.shape, (4, self.DIMENSION))
+        np.testing.assert_allclose(np.linalg.norm(vectores, axis=1), 1.0, rtol=1e-5)
+        for texto, vector in zip(textos, vectores):
+            self.assertGreater(float(vector @ self.referencia(texto)), 0.99)
+        # El relleno de un lote no cambia el embedding de cada texto
+        np.testing.assert_allclose(funcion.embeber(["palabra7"])[0], vectores[1], atol=1e-5)
+        self.assertEqual(funcion([]), [])
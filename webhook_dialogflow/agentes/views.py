@@ -1,16 +1,65 @@
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, HttpResponseNotAllowed
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+import asyncio
+import functools
 import json
-from .servicios.rag_turismo import RAGTurismo
-from .servicios.rag_salud_mental import RAGSaludMental
+import logging
+from .servicios.registro import registro, obtener_rag_turismo, obtener_rag_salud_mental
+from .servicios.metricas import metricas, PETICIONES, PETICIONES_EN_CURSO, RESPALDOS
+from .servicios.plazos import plazo_peticion
+
+logger = logging.getLogger(__name__)
+
+
+def instrumentar(agente: str):
+    """
+    Cuenta las peticiones en curso y las respuestas por código de estado de
+    una vista del webhook (síncrona o asíncrona).
+    """
+    def decorador(vista):
+        if asyncio.iscoroutinefunction(vista):
+            @functools.wraps(vista)
+            async def envoltura(request, *args, **kwargs):
+                with PETICIONES_EN_CURSO.en_curso(agente):
+                    response = await vista(request, *args, **kwargs)
+                PETICIONES.incrementar(agente, str(response.status_code))
+                return response
+        else:
+            @functools.wraps(vista)
+            def envoltura(request, *args, **kwargs):
+                with PETICIONES_EN_CURSO.en_curso(agente):
+                    response = vista(request, *args, **kwargs)
+                PETICIONES.incrementar(agente, str(response.status_code))
+                return response
+        return envoltura
+    return decorador
+
+
+def _respuesta_fulfillment(response_text: str) -> dict:
+    """Construye la respuesta en el formato que espera Dialogflow."""
+    return {
+        "fulfillmentText": response_text,
+        "fulfillmentMessages": [
+            {
+                "text": {
+                    "text": [response_text]
+                }
+            }
+        ]
+    }
+
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@instrumentar('turismo')
 def webhook_turismo(request):
     """
     Webhook para el agente de turismo.
     """
+    # El plazo de Dialogflow empieza a contar al recibir la petición
+    plazo = plazo_peticion()
     try:
         # Parsear el body de la solicitud
         body = json.loads(request.body)
@@ -22,39 +71,33 @@ def webhook_turismo(request):
         
         # Obtener el destino si está en los parámetros
         destination = parameters.get('destination', None)
+        # Sesión de Dialogflow: los turnos de seguimiento reutilizan su destino
+        sesion = body.get('session')
         
-        # Inicializar el servicio RAG de turismo
-        rag_turismo = RAGTurismo()
+        # Obtener el servicio RAG de turismo ya inicializado en el worker
+        rag_turismo = obtener_rag_turismo()
         
         # Procesar la consulta
-        response_text = rag_turismo.process_query(query_text, destination)
+        response_text = rag_turismo.process_query(query_text, destination, plazo, sesion=sesion)
         
         # Construir la respuesta para Dialogflow
-        response = {
-            "fulfillmentText": response_text,
-            "fulfillmentMessages": [
-                {
-                    "text": {
-                        "text": [response_text]
-                    }
-                }
-            ]
-        }
-        
-        return JsonResponse(response)
+        return JsonResponse(_respuesta_fulfillment(response_text))
         
     except Exception as e:
-        print(f"Error en webhook_turismo: {str(e)}")
+        logger.error(f"Error en webhook_turismo: {str(e)}")
+        RESPALDOS.incrementar('turismo', 'error_webhook')
         return JsonResponse({
             "fulfillmentText": "Lo siento, ocurrió un error al procesar tu consulta turística. ¿Podrías intentar de nuevo?"
         })
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@instrumentar('salud_mental')
 def webhook_salud_mental(request):
     """
     Webhook para el agente de salud mental.
     """
+    plazo = plazo_peticion()
     try:
         # Parsear el body de la solicitud
         body = json.loads(request.body)
@@ -66,29 +109,134 @@ def webhook_salud_mental(request):
         
         # Obtener la ciudad si está en los parámetros
         city = parameters.get('city', None)
+        # Sesión de Dialogflow: los turnos de seguimiento reutilizan su ciudad
+        sesion = body.get('session')
         
-        # Inicializar el servicio RAG de salud mental
-        rag_salud_mental = RAGSaludMental()
+        # Obtener el servicio RAG de salud mental ya inicializado en el worker
+        rag_salud_mental = obtener_rag_salud_mental()
         
         # Procesar la consulta
-        response_text = rag_salud_mental.process_query(query_text, city)
+        response_text = rag_salud_mental.process_query(query_text, city, plazo, sesion=sesion)
         
         # Construir la respuesta para Dialogflow
-        response = {
-            "fulfillmentText": response_text,
-            "fulfillmentMessages": [
-                {
-                    "text": {
-                        "text": [response_text]
-                    }
-                }
-            ]
-        }
+        return JsonResponse(_respuesta_fulfillment(response_text))
         
-        return JsonResponse(response)
+    except Exception as e:
+        logger.error(f"Error en webhook_salud_mental: {str(e)}")
+        RESPALDOS.incrementar('salud_mental', 'error_webhook')
+        return JsonResponse({
+            "fulfillmentText": "Si necesitas ayuda inmediata, por favor llama a la Línea de la Vida: 800-911-2000 (24 horas) o al 911."
+        })
+
+
+def exento_csrf(vista):
+    """
+    ``csrf_exempt`` que también admite vistas asíncronas: en Django 4.2 el
+    decorador original envuelve la corrutina en una función síncrona y Django
+    dejaría de ejecutarla como vista asíncrona.
+    """
+    if not asyncio.iscoroutinefunction(vista):
+        return csrf_exempt(vista)
+
+    @functools.wraps(vista)
+    async def envoltura(request, *args, **kwargs):
+        return await vista(request, *args, **kwargs)
+    envoltura.csrf_exempt = True
+    return envoltura
+
+
+# Vistas asíncronas para el despliegue ASGI (uvicorn). En Django 4.2
+# require_http_methods no admite corrutinas, por lo que el método se valida
+# a mano.
+
+@exento_csrf
+@instrumentar('turismo')
+async def webhook_turismo_async(request):
+    """
+    Webhook asíncrono para el agente de turismo.
+    """
+    plazo = plazo_peticion()
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        body = json.loads(request.body)
+        
+        query_result = body.get('queryResult', {})
+        query_text = query_result.get('queryText', '')
+        parameters = query_result.get('parameters', {})
+        destination = parameters.get('destination', None)
+        sesion = body.get('session')
+        
+        rag_turismo = obtener_rag_turismo()
+        response_text = await rag_turismo.aprocess_query(query_text, destination, plazo, sesion=sesion)
+        
+        return JsonResponse(_respuesta_fulfillment(response_text))
+        
+    except Exception as e:
+        logger.error(f"Error en webhook_turismo_async: {str(e)}")
+        RESPALDOS.incrementar('turismo', 'error_webhook')
+        return JsonResponse({
+            "fulfillmentText": "Lo siento, ocurrió un error al procesar tu consulta turística. ¿Podrías intentar de nuevo?"
+        })
+
+
+@exento_csrf
+@instrumentar('salud_mental')
+async def webhook_salud_mental_async(request):
+    """
+    Webhook asíncrono para el agente de salud mental.
+    """
+    plazo = plazo_peticion()
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        body = json.loads(request.body)
+        
+        query_result = body.get('queryResult', {})
+        query_text = query_result.get('queryText', '')
+        parameters = query_result.get('parameters', {})
+        city = parameters.get('city', None)
+        sesion = body.get('session')
+        
+        rag_salud_mental = obtener_rag_salud_mental()
+        response_text = await rag_salud_mental.aprocess_query(query_text, city, plazo, sesion=sesion)
+        
+        return JsonResponse(_respuesta_fulfillment(response_text))
         
     except Exception as e:
-        print(f"Error en webhook_salud_mental: {str(e)}")
+        logger.error(f"Error en webhook_salud_mental_async: {str(e)}")
+        RESPALDOS.incrementar('salud_mental', 'error_webhook')
         return JsonResponse({
             "fulfillmentText": "Si necesitas ayuda inmediata, por favor llama a la Línea de la Vida: 800-911-2000 (24 horas) o al 911."
         })
+
+
+@require_http_methods(["GET", "HEAD"])
+def healthz(request):
+    """
+    Liveness: el proceso responde. No toca ChromaDB ni Gemini.
+    """
+    return JsonResponse({"status": "ok"})
+
+
+@require_http_methods(["GET", "HEAD"])
+def readyz(request):
+    """
+    Readiness: el worker terminó de calentar (colecciones abiertas, modelo de
+    embeddings cargado e índice de ciudades construido). Responde 503 hasta
+    entonces para que el balanceador no le envíe tráfico; si el calentamiento
+    del arranque falló, se reintenta aquí.
+    """
+    if not registro.estado()['listo']:
+        registro.calentar()
+    estado = registro.estado()
+    return JsonResponse(estado, status=200 if estado['listo'] else 503)
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    Métricas en formato de texto de Prometheus, agregadas entre los workers.
+    """
+    metricas.configurar(settings.METRICAS_DIRECTORIO, settings.METRICAS_INTERVALO_VOLCADO)
+    return HttpResponse(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
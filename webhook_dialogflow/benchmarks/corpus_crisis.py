@@ -0,0 +1,90 @@
+"""
+Corpus de verificación del detector de crisis (``agentes/servicios/detector_crisis.py``).
+
+``POSITIVOS`` son consultas con lenguaje de crisis y la categoría esperada;
+``NEGATIVOS`` son consultas habituales del agente de salud mental (incluidas
+consultas informativas sobre suicidio o autolesión) que no deben desviarse a
+la ruta de crisis. Al ampliar el léxico se añaden aquí los casos que lo motivan.
+"""
+
+POSITIVOS = (
+    ("Ya no quiero vivir", 'ideacion_suicida'),
+    ("no quiero seguir viviendo, todo me sale mal", 'ideacion_suicida'),
+    ("Me quiero morir", 'ideacion_suicida'),
+    ("a veces quisiera morirme y ya", 'ideacion_suicida'),
+    ("tengo ganas de morir todos los días", 'ideacion_suicida'),
+    ("Estoy pensando en suicidarme", 'ideacion_suicida'),
+    ("creo que me voy a suicidar esta noche", 'ideacion_suicida'),
+    ("tengo pensamientos suicidas desde hace semanas", 'ideacion_suicida'),
+    ("He tenido ideas suicidas, vivo en Mérida", 'ideacion_suicida'),
+    ("pienso en el suicidio muy seguido", 'ideacion_suicida'),
+    ("me quiero matar", 'ideacion_suicida'),
+    ("me voy a matar", 'ideacion_suicida'),
+    ("pienso en matarme", 'ideacion_suicida'),
+    ("si sigo así me mato", 'ideacion_suicida'),
+    ("me quiero quitar la vida", 'ideacion_suicida'),
+    ("voy a matarme, ya lo decidí", 'ideacion_suicida'),
+    ("quiero quitarme la vida", 'ideacion_suicida'),
+    ("Quiero acabar con mi vida", 'ideacion_suicida'),
+    ("no vale la pena vivir así", 'ideacion_suicida'),
+    ("Todos estarían mejor sin mí", 'ideacion_suicida'),
+    ("estaría mejor muerta", 'ideacion_suicida'),
+    ("ojalá no despertar mañana", 'ideacion_suicida'),
+    ("ya no quiero estar aquí", 'ideacion_suicida'),
+    ("QUIERO DESAPARECER PARA SIEMPRE!!!", 'ideacion_suicida'),
+    ("no puedo seguir viviendo con este dolor", 'ideacion_suicida'),
+    ("Me corto los brazos cuando me siento mal", 'autolesion'),
+    ("anoche me volví a cortar", 'autolesion'),
+    ("tengo ganas de lastimarme", 'autolesion'),
+    ("a veces me hago daño a propósito", 'autolesion'),
+    ("quiero hacerme daño", 'autolesion'),
+    ("me quemo la piel con cigarros", 'autolesion'),
+    ("no le he dicho a nadie que me autolesiono", 'autolesion'),
+    ("Voy a tomarme todas las pastillas", 'plan_o_medios'),
+    ("ya compré veneno para morir", 'plan_o_medios'),
+    ("pienso tirarme del puente de la Unidad", 'plan_o_medios'),
+    ("quiero aventarme desde la azotea", 'plan_o_medios'),
+    ("me quiero aventar del puente", 'plan_o_medios'),
+    ("estoy pensando en ahorcarme", 'plan_o_medios'),
+    ("ya escribí una carta de despedida", 'plan_o_medios'),
+    ("solo quería despedirme de todos", 'plan_o_medios'),
+    ("mi pareja me amenazó con matarme", 'violencia_inminente'),
+    ("me va a matar, ayúdenme", 'violencia_inminente'),
+    ("Mi esposo me está golpeando", 'violencia_inminente'),
+)
+
+NEGATIVOS = (
+    "Necesito apoyo psicológico en Campeche",
+    "¿Dónde hay grupos de apoyo en Mérida?",
+    "Me siento muy ansioso, vivo en Cancún, ¿a dónde puedo ir?",
+    "¿Cuáles son las estadísticas de suicidio en Campeche?",
+    "¿Cómo puedo ayudar a un amigo que habla de suicidio?",
+    "Información sobre prevención del suicidio para maestros",
+    "¿Qué es la autoestima y cómo mejorarla?",
+    "Busco terapia gratuita para depresión",
+    "¿Hay psiquiatras en Ciudad del Carmen?",
+    "Mi hijo adolescente se aísla mucho, ¿qué hago?",
+    "¿Qué hago si tengo ataques de pánico?",
+    "Quiero dejar de fumar, ¿hay programas?",
+    "¿Dónde puedo tomar un taller de manejo del estrés?",
+    "No puedo dormir bien desde hace un mes",
+    "Estoy cansado del trabajo",
+    "Me muero de hambre, ¿hay comedores comunitarios?",
+    "¿Qué centros de salud mental hay en Champotón?",
+    "Quiero vivir en una ciudad más tranquila",
+    "¿Cómo cortar la dependencia del celular?",
+    "Me duele la cabeza todo el día",
+    "¿La línea de la vida atiende de noche?",
+    "Mi mamá tiene demencia, ¿dónde hay apoyo para cuidadores?",
+    "Quiero hablar con alguien sobre mi duelo",
+    "¿Cuánto cuesta una consulta con psicólogo en Escárcega?",
+    "Necesito información sobre adicciones en Calkiní",
+    "¿Hay terapia de pareja en Campeche?",
+    "Me siento solo desde que me mudé",
+    "¿Qué hago si un familiar se autolesiona? Quiero entender cómo apoyarlo",
+    "Me corto el pelo mañana, ¿hay citas en la tarde?",
+    "Quiero cortarme el cabello antes de la entrevista",
+    "me quiero morir de la risa con ese video",
+    "Me va a matar mi jefe si llego tarde otra vez",
+    "Me mato trabajando y aun así no me alcanza",
+)
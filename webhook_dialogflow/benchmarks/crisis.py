@@ -0,0 +1,95 @@
+"""
+Verificación y benchmark del detector de crisis, sin Django ni red.
+
+Clasifica el corpus de ``benchmarks/corpus_crisis.py`` (positivos con su
+categoría esperada y negativos) y mide el tiempo por detección sobre todas
+sus consultas.
+
+Uso (desde webhook_dialogflow/):
+    python -m benchmarks.crisis
+    python -m benchmarks.crisis --repeticiones 20000 --salida crisis.json
+
+El proceso termina con código 1 si alguna consulta del corpus se clasifica
+mal o si la mediana por detección supera ``--maximo-us`` microsegundos.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agentes.servicios.detector_crisis import detectar_crisis  # noqa: E402
+from benchmarks.corpus_crisis import POSITIVOS, NEGATIVOS  # noqa: E402
+from benchmarks.ejecutar import estadisticas  # noqa: E402
+
+
+def verificar_corpus() -> List[str]:
+    """Retorna la lista de errores de clasificación del corpus."""
+    errores = []
+    for consulta, categoria in POSITIVOS:
+        deteccion = detectar_crisis(consulta)
+        if deteccion is None:
+            errores.append(f"no detectada ({categoria}): {consulta!r}")
+        elif deteccion.categoria != categoria:
+            errores.append(f"categoría {deteccion.categoria} en vez de {categoria}: {consulta!r}")
+    for consulta in NEGATIVOS:
+        deteccion = detectar_crisis(consulta)
+        if deteccion is not None:
+            errores.append(f"falso positivo ({deteccion.categoria}, {deteccion.frase!r}): {consulta!r}")
+    return errores
+
+
+def medir_deteccion(repeticiones: int) -> Dict[str, Dict[str, float]]:
+    """Tiempo por detección en positivos y negativos (estadísticas en ms)."""
+    resultados = {}
+    for nombre, consultas in (('positivos', [c for c, _ in POSITIVOS]), ('negativos', list(NEGATIVOS))):
+        muestras = []
+        for i in range(repeticiones):
+            consulta = consultas[i % len(consultas)]
+            inicio = time.perf_counter()
+            detectar_crisis(consulta)
+            muestras.append(time.perf_counter() - inicio)
+        resultados[nombre] = estadisticas(muestras)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificación y benchmark del detector de crisis")
+    parser.add_argument('--repeticiones', type=int, default=10000, help="Detecciones medidas por grupo")
+    parser.add_argument('--maximo-us', type=float, default=50.0,
+                        help="Mediana máxima por detección en microsegundos")
+    parser.add_argument('--salida', help="Archivo JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    errores = verificar_corpus()
+    tiempos = medir_deteccion(args.repeticiones)
+    resultado: Dict[str, Any] = {
+        'python': platform.python_version(),
+        'corpus': {'positivos': len(POSITIVOS), 'negativos': len(NEGATIVOS), 'errores': errores},
+        'tiempos': tiempos,
+    }
+
+    print(f"Corpus: {len(POSITIVOS)} positivos, {len(NEGATIVOS)} negativos, {len(errores)} errores")
+    for error in errores:
+        print(f"  {error}")
+    lentos = []
+    for nombre, estadistica in tiempos.items():
+        p50_us = estadistica['p50'] * 1000
+        print(f"{nombre:<10} p50={p50_us:.1f}us p99={estadistica['p99'] * 1000:.1f}us")
+        if p50_us > args.maximo_us:
+            lentos.append(nombre)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+
+    if errores or lentos:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
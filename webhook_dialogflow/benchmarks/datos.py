@@ -0,0 +1,134 @@
+"""
+Datos sintéticos y base vectorial local para los benchmarks.
+
+Las ciudades se generan de forma determinista a partir de una semilla, con
+la misma estructura que los documentos reales de GCS, y se cargan con las
+mismas funciones que usa la ingesta (ids estables, almacén de documentos,
+contexto precompilado).
+"""
+from typing import Any, Dict, List
+import json
+import os
+import random
+from agentes.servicios.ingesta import TEXTO_RESUMEN, aplicar_registros, registros_unicos
+from agentes.servicios.version_datos import leer_version
+
+_SILABAS = ("ca", "mpe", "che", "me", "ri", "da", "to", "lu", "za", "ta", "xa", "co", "pa",
+            "hui", "te", "pec", "ma", "sa", "tla", "yu", "ca", "tan", "go", "ro", "al", "mo")
+_PREFIJOS = ("", "", "", "San ", "Santa ", "Puerto ", "Villa ", "Ciudad ")
+_LUGARES = ("malecón", "catedral", "zona arqueológica", "mercado", "cenote", "museo", "playa", "jardín")
+_ACTIVIDADES = ("buceo", "senderismo", "recorrido histórico", "gastronomía", "kayak", "observación de aves")
+_COMIDA = ("cochinita pibil", "panuchos", "pozole", "mole", "tamales", "pan de cazón")
+_SERVICIOS = ("atención psicológica", "grupos de apoyo", "línea de crisis", "terapia familiar")
+
+LOTE_CARGA = 2000
+
+COLECCIONES = ("destinos_turisticos", "salud_mental")
+
+
+def generar_ciudades(n: int, semilla: int = 7) -> List[str]:
+    """Genera ``n`` nombres de ciudad únicos y deterministas."""
+    aleatorio = random.Random(semilla)
+    nombres: List[str] = []
+    vistos = set()
+    while len(nombres) < n:
+        raiz = "".join(aleatorio.choice(_SILABAS) for _ in range(aleatorio.randint(2, 4)))
+        nombre = f"{aleatorio.choice(_PREFIJOS)}{raiz.capitalize()}"
+        if nombre.lower() in vistos:
+            continue
+        vistos.add(nombre.lower())
+        nombres.append(nombre)
+    return nombres
+
+
+def documento_turismo(ciudad: str, aleatorio: random.Random) -> Dict[str, Any]:
+    lugares = aleatorio.sample(_LUGARES, 4)
+    return {
+        "ciudad": ciudad,
+        "informacion_turistica": {
+            "resumen_turistico": (
+                f"{ciudad} es un destino con {lugares[0]} y {lugares[1]}, conocido por su "
+                f"{aleatorio.choice(_COMIDA)} y actividades como {aleatorio.choice(_ACTIVIDADES)}."
+            ),
+            "campos_extraidos": {
+                "hoteles": [f"Hotel {ciudad} {i}" for i in range(aleatorio.randint(3, 12))],
+                "actividades": aleatorio.sample(_ACTIVIDADES, 3),
+                "restaurantes": [f"Restaurante {i} de {ciudad}" for i in range(aleatorio.randint(3, 10))],
+                "comida_tipica": aleatorio.sample(_COMIDA, 3),
+                "lugares_turisticos": [f"{lugar} de {ciudad}" for lugar in lugares],
+                "consejos_viajero": ["Llevar protector solar", "Reservar con anticipación"],
+            },
+        },
+    }
+
+
+def documento_salud_mental(ciudad: str, aleatorio: random.Random) -> Dict[str, Any]:
+    return {
+        "ciudad": ciudad,
+        "informacion_salud_mental": {
+            "resumen_salud_mental": (
+                f"En {ciudad} hay {aleatorio.randint(1, 9)} centros de salud mental con "
+                f"{aleatorio.choice(_SERVICIOS)} y {aleatorio.choice(_SERVICIOS)}."
+            ),
+            "campos_extraidos": {
+                "centros_locales": [f"Centro Comunitario {i} {ciudad}" for i in range(aleatorio.randint(1, 5))],
+                "servicios_gratuitos": aleatorio.sample(_SERVICIOS, 2),
+                "lineas_ayuda_locales": [f"800-{aleatorio.randint(100, 999)}-{aleatorio.randint(1000, 9999)}"],
+                "organizaciones_apoyo": [f"Asociación Bienestar {ciudad}"],
+                "hospitales_psiquiatricos": [f"Hospital General de {ciudad}"],
+            },
+        },
+    }
+
+
+def generar_documentos(ciudades: List[str], semilla: int = 7) -> Dict[str, List[Dict[str, Any]]]:
+    """Documentos de ambas colecciones para las ciudades indicadas."""
+    aleatorio = random.Random(semilla)
+    return {
+        "destinos_turisticos": [documento_turismo(c, aleatorio) for c in ciudades],
+        "salud_mental": [documento_salud_mental(c, aleatorio) for c in ciudades],
+    }
+
+
+def preparar_base(chroma_db: Any, escala: int, semilla: int = 7) -> List[str]:
+    """
+    Puebla (una sola vez) la base vectorial del servicio con ``escala`` ciudades.
+
+    Si el directorio ya contiene una base con la misma escala y semilla se
+    reutiliza, de modo que las ejecuciones repetidas no pagan la carga.
+
+    Args:
+        chroma_db: ``ServicioChromaDB`` con la función de embeddings del benchmark.
+        escala: Número de ciudades.
+        semilla: Semilla de los datos sintéticos.
+
+    Returns:
+        Nombres de las ciudades cargadas.
+    """
+    ciudades = generar_ciudades(escala, semilla)
+    marca = os.path.join(chroma_db.persist_dir, 'benchmark.json')
+    esperado = {"escala": escala, "semilla": semilla}
+    try:
+        with open(marca, encoding='utf-8') as archivo:
+            if json.load(archivo) == esperado and leer_version(chroma_db.persist_dir):
+                return ciudades
+    except (OSError, ValueError):
+        pass
+
+    documentos = generar_documentos(ciudades, semilla)
+    for nombre in COLECCIONES:
+        try:
+            chroma_db.cliente.delete_collection(nombre)
+        except ValueError:
+            # La colección aún no existe
+            pass
+        chroma_db.almacen.eliminar_coleccion(nombre)
+        coleccion = chroma_db.crear_coleccion(nombre)
+        registros = registros_unicos(nombre, documentos[nombre], TEXTO_RESUMEN)
+        for inicio in range(0, len(registros), LOTE_CARGA):
+            lote = registros[inicio:inicio + LOTE_CARGA]
+            aplicar_registros(coleccion, chroma_db.almacen, lote, chroma_db.embeber([r.texto for r in lote]))
+    chroma_db._marcar_cambio()
+    with open(marca, 'w', encoding='utf-8') as archivo:
+        json.dump(esperado, archivo)
+    return ciudades
@@ -0,0 +1,317 @@
+"""
+Benchmark por etapas de los agentes RAG, sin red.
+
+Mide por separado cada etapa de una consulta para ambos agentes:
+
+- extraccion_local: resolutor de ciudades en memoria.
+- extraccion_llm: extracción con el modelo (sustituto con latencia fija).
+- recuperacion_indice: búsqueda exacta en el índice de ciudades.
+- recuperacion_vectorial: consulta a ChromaDB con caché de documentos caliente.
+- decodificacion: unión con el almacén y decodificación JSON con la caché fría.
+- construccion_prompt: interpolación del contexto precompilado.
+- generacion: llamada al modelo (sin caché de respuestas).
+- total: ``process_query`` completo.
+
+y la descarga paralela de GCS (``descarga_gcs``, por archivo). Gemini, GCS y
+el modelo de embeddings se sustituyen por los de ``benchmarks/falsos.py``,
+de modo que los tiempos reflejan solo el código del servicio más las
+latencias simuladas que se indiquen.
+
+Uso (desde webhook_dialogflow/):
+    python -m benchmarks.ejecutar --escalas 10,1000 --salida resultados.json
+    python -m benchmarks.ejecutar --escalas 10,1000,100000 --repeticiones 500
+    python -m benchmarks.ejecutar --comparar base.json --tolerancia 0.2
+
+Con ``--comparar`` el proceso termina con código 1 si la mediana de alguna
+etapa empeora más que la tolerancia respecto a la línea base.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+ETAPAS = (
+    'extraccion_local', 'extraccion_llm', 'recuperacion_indice', 'recuperacion_vectorial',
+    'decodificacion', 'construccion_prompt', 'generacion', 'total',
+)
+
+# Consultas de ejemplo por agente: la ciudad se interpola en cada repetición
+CONSULTAS = {
+    'turismo': (
+        "¿Qué lugares turísticos hay en {ciudad}?",
+        "Recomiéndame restaurantes de comida típica en {ciudad}",
+        "Voy a viajar a {ciudad} el fin de semana, ¿qué hago?",
+    ),
+    'salud_mental': (
+        "Necesito apoyo psicológico en {ciudad}",
+        "¿Dónde hay grupos de apoyo en {ciudad}?",
+        "Me siento muy ansioso, vivo en {ciudad}, ¿a dónde puedo ir?",
+    ),
+}
+
+COLECCION_AGENTE = {'turismo': 'destinos_turisticos', 'salud_mental': 'salud_mental'}
+
+# Diferencias menores a este umbral (ms) no cuentan como regresión
+MINIMO_REGRESION_MS = 0.05
+
+
+def estadisticas(muestras: List[float]) -> Dict[str, float]:
+    """Resumen en milisegundos de una lista de duraciones en segundos."""
+    ordenadas = sorted(s * 1000 for s in muestras)
+
+    def percentil(p: float) -> float:
+        indice = min(len(ordenadas) - 1, max(0, round(p / 100 * len(ordenadas)) - 1))
+        return round(ordenadas[indice], 4)
+
+    return {
+        'n': len(ordenadas),
+        'media': round(statistics.fmean(ordenadas), 4),
+        'p50': round(statistics.median(ordenadas), 4),
+        'p95': percentil(95),
+        'p99': percentil(99),
+        'min': round(ordenadas[0], 4),
+        'max': round(ordenadas[-1], 4),
+    }
+
+
+def medir(funcion: Callable[[Any], Any], argumentos: List[Any],
+          preparar: Callable[[], None] = None) -> Dict[str, float]:
+    """Ejecuta ``funcion`` con cada argumento y resume las duraciones."""
+    muestras = []
+    for argumento in argumentos:
+        if preparar is not None:
+            preparar()
+        inicio = time.perf_counter()
+        funcion(argumento)
+        muestras.append(time.perf_counter() - inicio)
+    return estadisticas(muestras)
+
+
+def preparar_django(directorio: str) -> None:
+    """Configura Django apuntando ChromaDB al directorio del benchmark."""
+    os.environ['CHROMADB_PERSIST_DIR'] = directorio
+    os.environ.pop('CHROMADB_SNAPSHOT', None)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webhook_dialogflow.settings')
+    import django
+    django.setup()
+
+
+def medir_agente(nombre: str, agente: Any, ciudades: List[str], repeticiones: int,
+                 aleatorio: random.Random) -> Dict[str, Dict[str, float]]:
+    """Mide todas las etapas de un agente con consultas deterministas."""
+    from agentes.servicios.ingesta import id_documento
+
+    coleccion = COLECCION_AGENTE[nombre]
+    chroma_db = agente.chroma_db
+    elegidas = [aleatorio.choice(ciudades) for _ in range(repeticiones)]
+    consultas = [aleatorio.choice(CONSULTAS[nombre]).format(ciudad=c) for c in elegidas]
+    datos = [agente.indice.buscar(coleccion, c) for c in elegidas]
+    resolver_local, extraer = agente._resolver_ciudad_local, agente._extraer_ciudad
+
+    def decodificar(ciudad: str) -> None:
+        id_doc = id_documento(coleccion, {"ciudad": ciudad})
+        chroma_db._unir_documentos([id_doc], [{"ciudad": ciudad}])
+
+    return {
+        'extraccion_local': medir(resolver_local, consultas),
+        'extraccion_llm': medir(extraer, consultas),
+        'recuperacion_indice': medir(lambda c: agente.indice.buscar(coleccion, c), elegidas),
+        'recuperacion_vectorial': medir(lambda c: chroma_db.query_collection(coleccion, c, n_results=1), elegidas),
+        'decodificacion': medir(decodificar, elegidas, preparar=chroma_db.cache_documentos.invalidar),
+        'construccion_prompt': medir(lambda i: agente._construir_prompt(consultas[i], datos[i]), list(range(repeticiones))),
+        'generacion': medir(lambda i: agente.generate_response(consultas[i], datos[i]), list(range(repeticiones))),
+        'total': medir(agente.process_query, consultas),
+    }
+
+
+def medir_descarga(escala: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """Descarga paralela de un archivo por ciudad desde el bucket falso."""
+    from agentes.servicios.descarga import DescargadorParalelo, decodificar_json
+    from benchmarks.datos import generar_ciudades, generar_documentos
+    from benchmarks.falsos import FuenteGCSFalsa
+
+    ciudades = generar_ciudades(min(escala, args.max_archivos), args.semilla)
+    documentos = generar_documentos(ciudades, args.semilla)['destinos_turisticos']
+    fuente = FuenteGCSFalsa(
+        {f"turismo/{i:06d}.json": doc for i, doc in enumerate(documentos)},
+        latencia=args.latencia_gcs
+    )
+    descargador = DescargadorParalelo(fuente, hilos=args.hilos)
+    inicio = time.perf_counter()
+    decodificados = sum(
+        1 for resultado in descargador.descargar(fuente.listar("turismo/"))
+        if decodificar_json(resultado) is not None
+    )
+    segundos = time.perf_counter() - inicio
+    return {
+        'archivos': decodificados,
+        'segundos': round(segundos, 4),
+        'ms_por_archivo': round(segundos * 1000 / max(decodificados, 1), 4),
+        'archivos_por_segundo': round(decodificados / max(segundos, 1e-9), 1),
+    }
+
+
+def ejecutar_escala(escala: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """Prepara la base de la escala indicada y mide ambos agentes."""
+    from django.conf import settings
+    from agentes.servicios.chromadb_service import ServicioChromaDB
+    from agentes.servicios.indice_ciudades import IndiceCiudades
+    from agentes.servicios.resolutor_ciudades import ResolutorCiudades
+    from agentes.servicios.rag_turismo import RAGTurismo
+    from agentes.servicios.rag_salud_mental import RAGSaludMental
+    from benchmarks.datos import preparar_base
+    from benchmarks.falsos import EmbeddingFalso, ModeloFalso
+
+    # django.conf.settings ya está cargado: el directorio de cada escala se fija aquí
+    settings.CHROMADB_PERSIST_DIR = os.path.join(args.directorio_datos, f"escala_{escala}")
+
+    inicio = time.perf_counter()
+    chroma_db = ServicioChromaDB()
+    chroma_db.funcion_embedding = EmbeddingFalso()
+    ciudades = preparar_base(chroma_db, escala, args.semilla)
+    segundos_carga = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    indice = IndiceCiudades(chroma_db, intervalo_verificacion=settings.INDICE_CIUDADES_INTERVALO_VERIFICACION)
+    resolutor = ResolutorCiudades(indice.ciudades(), umbral_difuso=settings.RESOLUTOR_UMBRAL_DIFUSO)
+    segundos_indices = time.perf_counter() - inicio
+
+    modelo = ModeloFalso(ciudades, latencia=args.latencia, latencia_extraccion=args.latencia_extraccion,
+                         tokens=args.tokens)
+    agentes = {
+        'turismo': RAGTurismo(model=modelo, chroma_db=chroma_db, resolutor=resolutor, indice=indice),
+        'salud_mental': RAGSaludMental(model=modelo, chroma_db=chroma_db, resolutor=resolutor, indice=indice),
+    }
+    aleatorio = random.Random(args.semilla)
+    resultado = {
+        'ciudades': len(ciudades),
+        'preparacion_s': {'base': round(segundos_carga, 3), 'indices': round(segundos_indices, 3)},
+        'agentes': {
+            nombre: medir_agente(nombre, agente, ciudades, args.repeticiones, aleatorio)
+            for nombre, agente in agentes.items()
+        },
+        'descarga_gcs': medir_descarga(escala, args),
+    }
+    return resultado
+
+
+def comparar(actual: Dict[str, Any], base: Dict[str, Any], tolerancia: float) -> List[str]:
+    """
+    Compara las medianas por etapa con una ejecución anterior.
+
+    Returns:
+        Descripción de cada etapa que empeoró más que ``tolerancia``.
+    """
+    regresiones = []
+    for escala, resultado in actual['escalas'].items():
+        anterior = base.get('escalas', {}).get(escala)
+        if anterior is None:
+            continue
+        for agente, etapas in resultado['agentes'].items():
+            for etapa, valores in etapas.items():
+                previo = anterior.get('agentes', {}).get(agente, {}).get(etapa)
+                if previo is None:
+                    continue
+                delta = valores['p50'] - previo['p50']
+                if delta > MINIMO_REGRESION_MS and delta > previo['p50'] * tolerancia:
+                    regresiones.append(
+                        f"escala {escala}, {agente}.{etapa}: p50 {previo['p50']:.3f} -> "
+                        f"{valores['p50']:.3f} ms (+{delta / max(previo['p50'], 1e-9):.0%})"
+                    )
+        previo = anterior.get('descarga_gcs', {}).get('ms_por_archivo')
+        actual_ms = resultado['descarga_gcs']['ms_por_archivo']
+        if previo and actual_ms - previo > max(MINIMO_REGRESION_MS, previo * tolerancia):
+            regresiones.append(
+                f"escala {escala}, descarga_gcs: {previo:.3f} -> {actual_ms:.3f} ms por archivo"
+            )
+    return regresiones
+
+
+def imprimir(resultados: Dict[str, Any]) -> None:
+    for escala, resultado in resultados['escalas'].items():
+        preparacion = resultado['preparacion_s']
+        print(f"\n== {escala} ciudades (base {preparacion['base']}s, índices {preparacion['indices']}s)")
+        print(f"{'agente':13} {'etapa':23} {'p50':>9} {'p95':>9} {'p99':>9} {'media':>9}  (ms)")
+        for agente, etapas in resultado['agentes'].items():
+            for etapa in ETAPAS:
+                valores = etapas[etapa]
+                print(f"{agente:13} {etapa:23} {valores['p50']:>9.3f} {valores['p95']:>9.3f} "
+                      f"{valores['p99']:>9.3f} {valores['media']:>9.3f}")
+        descarga = resultado['descarga_gcs']
+        print(f"descarga_gcs: {descarga['archivos']} archivos, {descarga['ms_por_archivo']} ms/archivo, "
+              f"{descarga['archivos_por_segundo']} archivos/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapas de los agentes RAG")
+    parser.add_argument('--escalas', default='10,1000',
+                        help="Número de ciudades sintéticas, separados por comas (ej. 10,1000,100000)")
+    parser.add_argument('--repeticiones', type=int, default=200, help="Consultas medidas por etapa")
+    parser.add_argument('--semilla', type=int, default=7)
+    parser.add_argument('--latencia', type=float, default=0.0,
+                        help="Segundos simulados por respuesta generada")
+    parser.add_argument('--latencia-extraccion', type=float, default=None,
+                        help="Segundos simulados por extracción (por defecto, --latencia)")
+    parser.add_argument('--tokens', type=int, default=200, help="Palabras de cada respuesta simulada")
+    parser.add_argument('--latencia-gcs', type=float, default=0.002, help="Segundos simulados por descarga")
+    parser.add_argument('--hilos', type=int, default=16, help="Hilos de descarga")
+    parser.add_argument('--max-archivos', type=int, default=2000,
+                        help="Máximo de archivos en la etapa de descarga")
+    parser.add_argument('--directorio-datos',
+                        default=os.path.join(tempfile.gettempdir(), 'benchmark_webhook'),
+                        help="Directorio de las bases sintéticas (se reutilizan entre ejecuciones)")
+    parser.add_argument('--salida', help="Archivo JSON donde guardar los resultados")
+    parser.add_argument('--comparar', help="Resultados JSON de referencia")
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help="Empeoramiento relativo de p50 tolerado al comparar (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    escalas = [int(e) for e in args.escalas.split(',') if e.strip()]
+    preparar_django(os.path.join(args.directorio_datos, f"escala_{escalas[0]}"))
+
+    resultados = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'parametros': {
+            'repeticiones': args.repeticiones, 'semilla': args.semilla, 'latencia': args.latencia,
+            'latencia_extraccion': args.latencia_extraccion, 'tokens': args.tokens,
+            'latencia_gcs': args.latencia_gcs, 'hilos': args.hilos,
+        },
+        'escalas': {},
+    }
+    for escala in escalas:
+        print(f"Midiendo {escala} ciudades...")
+        resultados['escalas'][str(escala)] = ejecutar_escala(escala, args)
+
+    imprimir(resultados)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, indent=1, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        regresiones = comparar(resultados, base, args.tolerancia)
+        if regresiones:
+            print(f"\n{len(regresiones)} regresiones respecto a {args.comparar}:")
+            for regresion in regresiones:
+                print(f"  - {regresion}")
+            sys.exit(1)
+        print(f"\nSin regresiones respecto a {args.comparar} (tolerancia {args.tolerancia:.0%})")
+
+
+if __name__ == "__main__":
+    main()
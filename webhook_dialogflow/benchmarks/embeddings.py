@@ -0,0 +1,173 @@
+"""
+Benchmark de la función de embeddings int8 frente a la de ChromaDB, sin Django.
+
+Embebe con cada función (``FUNCIONES_EMBEDDING``) el texto de los documentos
+sintéticos de ambas colecciones (modo ``resumen``, como la ingesta) y las
+preguntas de los temas frecuentes de ``temas.py`` para ciudades del corpus.
+Cada función se mide en un proceso nuevo:
+
+- carga: crear la función y embeber el primer texto (lo que paga un worker).
+- consulta: embeber una consulta suelta.
+- lote: documentos por segundo al embeber el corpus en lotes.
+- memoria: RSS y memoria privada del proceso tras embeber el corpus (Linux).
+
+La calidad se compara con la función de ChromaDB (fp32) como referencia:
+
+- similitud: coseno medio entre el vector fp32 y el de la función de cada texto.
+- recall@k: fracción del top-k fp32 (consultas y corpus fp32) que recupera la
+  función con consultas y corpus propios.
+- recall@k mixto: consultas de la función contra el corpus fp32 (una base
+  aún no repoblada tras cambiar de función).
+
+Requiere el modelo de ChromaDB descargado y el int8 preparado con
+``scripts/cuantizar_embeddings.py``.
+
+Uso (desde webhook_dialogflow/):
+    python -m benchmarks.embeddings
+    python -m benchmarks.embeddings --ciudades 2000 --hilos 2 --salida embeddings.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from agentes.servicios.embeddings import FUNCIONES_EMBEDDING, crear_funcion_embedding  # noqa: E402
+from agentes.servicios.ingesta import TEXTO_RESUMEN, texto_embedding  # noqa: E402
+from agentes.servicios.temas import TEMAS  # noqa: E402
+from benchmarks.datos import generar_ciudades, generar_documentos  # noqa: E402
+from benchmarks.ejecutar import estadisticas  # noqa: E402
+
+REFERENCIA = 'chromadb'
+
+
+def generar_textos(ciudades: int, consultas: int, semilla: int):
+    """Textos de embedding del corpus y consultas de temas sobre sus ciudades."""
+    nombres = generar_ciudades(ciudades, semilla)
+    corpus = []
+    for coleccion, documentos in generar_documentos(nombres, semilla).items():
+        for dato in documentos:
+            documento = json.dumps(dato, ensure_ascii=False)
+            corpus.append(texto_embedding(coleccion, dato, documento, TEXTO_RESUMEN))
+    aleatorio = random.Random(semilla)
+    preguntas = [tema.pregunta for temas in TEMAS.values() for tema in temas.values()]
+    textos_consulta = [aleatorio.choice(preguntas).format(ciudad=aleatorio.choice(nombres))
+                       for _ in range(consultas)]
+    return corpus, textos_consulta
+
+
+def _leer_memoria() -> Optional[Dict[str, float]]:
+    try:
+        with open('/proc/self/smaps_rollup') as archivo:
+            campos = {p[0].rstrip(':'): int(p[1]) for p in (linea.split() for linea in archivo)
+                      if len(p) >= 2 and p[0].endswith(':')}
+    except OSError:
+        return None
+    privada = campos.get('Private_Clean', 0) + campos.get('Private_Dirty', 0)
+    return {'rss_mb': round(campos.get('Rss', 0) / 1024, 1), 'privada_mb': round(privada / 1024, 1)}
+
+
+def medir_funcion(opciones: Dict[str, Any], corpus: List[str], consultas: List[str], lote: int) -> Dict[str, Any]:
+    """Se ejecuta en un proceso nuevo: tiempos, memoria y vectores de una función."""
+    inicio = time.perf_counter()
+    funcion = crear_funcion_embedding(**opciones)
+    funcion([consultas[0]])
+    carga = time.perf_counter() - inicio
+
+    muestras = []
+    vectores_consulta = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        vectores_consulta.append(funcion([consulta])[0])
+        muestras.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    vectores_corpus = [v for desde in range(0, len(corpus), lote) for v in funcion(corpus[desde:desde + lote])]
+    segundos_lote = time.perf_counter() - inicio
+
+    return {
+        'carga_s': round(carga, 3),
+        'consulta': estadisticas(muestras),
+        'lote_docs_s': round(len(corpus) / segundos_lote, 1),
+        'memoria': _leer_memoria(),
+        'corpus': np.asarray(vectores_corpus, dtype=np.float32),
+        'consultas': np.asarray(vectores_consulta, dtype=np.float32),
+    }
+
+
+def top_k(corpus: np.ndarray, consultas: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(consultas @ corpus.T), axis=1, kind='stable')[:, :k]
+
+
+def recall(esperados: np.ndarray, encontrados: np.ndarray) -> float:
+    aciertos = sum(len(set(e) & set(f)) for e, f in zip(esperados.tolist(), encontrados.tolist()))
+    return round(aciertos / esperados.size, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la función de embeddings int8 frente a la de ChromaDB")
+    parser.add_argument('--funciones', default=','.join(FUNCIONES_EMBEDDING),
+                        help="Funciones a medir, separadas por comas")
+    parser.add_argument('--modelo', default='./data/modelo_embeddings', help="Directorio del modelo int8")
+    parser.add_argument('--hilos', type=int, default=1, help="Hilos de ONNX Runtime del modelo int8")
+    parser.add_argument('--ciudades', type=int, default=500, help="Ciudades del corpus (dos documentos por ciudad)")
+    parser.add_argument('--consultas', type=int, default=200, help="Consultas medidas")
+    parser.add_argument('--lote', type=int, default=32, help="Textos por lote al embeber el corpus")
+    parser.add_argument('--k', type=int, default=3, help="Resultados por consulta")
+    parser.add_argument('--semilla', type=int, default=7)
+    parser.add_argument('--salida', help="Archivo JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    corpus, consultas = generar_textos(args.ciudades, args.consultas, args.semilla)
+    resultado: Dict[str, Any] = {
+        'python': platform.python_version(), 'documentos': len(corpus), 'consultas': len(consultas),
+        'funciones': {},
+    }
+    vectores = {}
+    for nombre in (f for f in args.funciones.split(',') if f):
+        opciones = {'funcion': nombre, 'directorio_modelo': args.modelo, 'hilos': args.hilos,
+                    'tamano_lote': args.lote}
+        # Un proceso por función: la carga y la memoria no dependen de la anterior
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            try:
+                medicion = executor.submit(medir_funcion, opciones, corpus, consultas, args.lote).result()
+            except (ImportError, ValueError, OSError) as e:
+                print(f"{nombre}: no disponible ({e})")
+                continue
+        vectores[nombre] = (medicion.pop('corpus'), medicion.pop('consultas'))
+        resultado['funciones'][nombre] = medicion
+
+    if REFERENCIA in vectores:
+        corpus_ref, consultas_ref = vectores[REFERENCIA]
+        esperados = top_k(corpus_ref, consultas_ref, args.k)
+        for nombre, (corpus_f, consultas_f) in vectores.items():
+            resultado['funciones'][nombre].update({
+                'similitud': round(float(np.mean(np.sum(corpus_f * corpus_ref, axis=1))), 4),
+                'recall': recall(esperados, top_k(corpus_f, consultas_f, args.k)),
+                'recall_mixto': recall(esperados, top_k(corpus_ref, consultas_f, args.k)),
+            })
+
+    for nombre, medicion in resultado['funciones'].items():
+        memoria = medicion['memoria'] or {}
+        calidad = (f" similitud={medicion['similitud']:.4f} recall@{args.k}={medicion['recall']:.3f} "
+                   f"mixto={medicion['recall_mixto']:.3f}") if 'recall' in medicion else ""
+        print(f"{nombre:<10} carga={medicion['carga_s']:.2f}s p50={medicion['consulta']['p50']:.2f}ms "
+              f"p95={medicion['consulta']['p95']:.2f}ms lote={medicion['lote_docs_s']:.0f} docs/s "
+              f"rss={memoria.get('rss_mb', '?')}MB privada={memoria.get('privada_mb', '?')}MB{calidad}")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Sustitutos deterministas de Gemini, GCS y el modelo de embeddings.
+
+Permiten medir el código propio del servicio sin red ni cuota: la latencia
+y el tamaño de las respuestas del modelo son parámetros del benchmark.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence
+import asyncio
+import hashlib
+import json
+import math
+import re
+import time
+from agentes.servicios.descarga import ArchivoFuente
+from agentes.servicios.resolutor_ciudades import normalizar_texto
+
+
+class RespuestaFalsa:
+    """Objeto con el atributo ``text`` como las respuestas de Gemini."""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class ModeloFalso:
+    """
+    Sustituto de ``genai.GenerativeModel``.
+
+    Las peticiones de extracción (las que piden el nombre del destino o la
+    ciudad) responden con la primera ciudad conocida que aparece en la
+    consulta, o "None"; el resto responde con ``tokens`` palabras.
+    """
+
+    _CONSULTA = re.compile(r"Consulta: (.*)")
+    MAX_PALABRAS = 4
+
+    def __init__(self, ciudades: Iterable[str] = (), latencia: float = 0.0,
+                 latencia_extraccion: Optional[float] = None, tokens: int = 200):
+        """
+        Args:
+            ciudades: Ciudades que puede "reconocer" la extracción.
+            latencia: Segundos de espera por respuesta generada.
+            latencia_extraccion: Segundos por extracción (por defecto, ``latencia``).
+            tokens: Palabras de cada respuesta generada.
+        """
+        self.latencia = latencia
+        self.latencia_extraccion = latencia if latencia_extraccion is None else latencia_extraccion
+        self.texto = " ".join(f"palabra{i % 50}" for i in range(tokens))
+        self._ciudades = {normalizar_texto(c): c for c in ciudades}
+        self.llamadas = 0
+
+    def _responder(self, prompt: str):
+        self.llamadas += 1
+        if "Responde ÚNICAMENTE con el nombre" in prompt:
+            coincidencia = self._CONSULTA.search(prompt)
+            palabras = normalizar_texto(coincidencia.group(1) if coincidencia else prompt).split()
+            # n-gramas de la consulta, del más largo al más corto (independiente del número de ciudades)
+            for n in range(min(self.MAX_PALABRAS, len(palabras)), 0, -1):
+                for inicio in range(len(palabras) - n + 1):
+                    ciudad = self._ciudades.get(" ".join(palabras[inicio:inicio + n]))
+                    if ciudad is not None:
+                        return self.latencia_extraccion, RespuestaFalsa(ciudad)
+            return self.latencia_extraccion, RespuestaFalsa("None")
+        return self.latencia, RespuestaFalsa(self.texto)
+
+    def generate_content(self, prompt: str, **opciones) -> RespuestaFalsa:
+        latencia, respuesta = self._responder(prompt)
+        if latencia:
+            time.sleep(latencia)
+        return respuesta
+
+    async def generate_content_async(self, prompt: str, **opciones) -> RespuestaFalsa:
+        latencia, respuesta = self._responder(prompt)
+        if latencia:
+            await asyncio.sleep(latencia)
+        return respuesta
+
+
+class EmbeddingFalso:
+    """
+    Embeddings deterministas por hashing de palabras (bolsa de palabras
+    normalizada). Textos con palabras en común quedan cerca, lo suficiente
+    para que la búsqueda vectorial se comporte de forma realista.
+    """
+
+    def __init__(self, dimension: int = 64):
+        self.dimension = dimension
+
+    def __call__(self, textos: Sequence[str]) -> List[List[float]]:
+        vectores = []
+        for texto in textos:
+            vector = [0.0] * self.dimension
+            for palabra in normalizar_texto(texto).split():
+                digest = hashlib.blake2b(palabra.encode('utf-8'), digest_size=8).digest()
+                indice = int.from_bytes(digest[:4], 'little') % self.dimension
+                vector[indice] += 1.0 if digest[4] & 1 else -1.0
+            norma = math.sqrt(sum(x * x for x in vector)) or 1.0
+            vectores.append([x / norma for x in vector])
+        return vectores
+
+
+class FuenteGCSFalsa:
+    """
+    Bucket en memoria con la interfaz de ``FuenteGCS`` y latencia por descarga.
+    """
+
+    def __init__(self, archivos: Dict[str, object], latencia: float = 0.0):
+        """
+        Args:
+            archivos: Nombre de archivo -> contenido JSON (se serializa una vez).
+            latencia: Segundos de espera por descarga.
+        """
+        self._contenidos = {
+            nombre: json.dumps(contenido, ensure_ascii=False).encode('utf-8')
+            for nombre, contenido in archivos.items()
+        }
+        self.latencia = latencia
+
+    def listar(self, prefijo: str) -> List[ArchivoFuente]:
+        return [ArchivoFuente(nombre, "1") for nombre in sorted(self._contenidos) if nombre.startswith(prefijo)]
+
+    def descargar(self, archivo: ArchivoFuente) -> bytes:
+        if self.latencia:
+            time.sleep(self.latencia)
+        return self._contenidos[archivo.nombre]
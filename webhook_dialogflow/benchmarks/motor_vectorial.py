@@ -0,0 +1,166 @@
+"""
+Benchmark del motor vectorial NumPy frente a ChromaDB, sin Django ni red.
+
+Para cada tamaño de colección genera vectores sintéticos agrupados por
+ciudad (dimensión de all-MiniLM-L6-v2) y mide en cada motor:
+
+- importacion: importar el módulo del motor en un proceso nuevo.
+- carga: insertar los vectores y persistir.
+- apertura: abrir un cliente nuevo sobre el directorio y resolver la
+  primera consulta (lo que paga un worker al arrancar o tras un cambio de
+  versión de datos).
+- consulta / consulta_filtrada: top-k sin filtro y con ``where`` por ciudad.
+
+y el recall@k de cada motor respecto al top-k exacto (el del motor NumPy es 1
+por construcción; el de ChromaDB refleja su índice HNSW aproximado).
+
+Uso (desde webhook_dialogflow/):
+    python -m benchmarks.motor_vectorial
+    python -m benchmarks.motor_vectorial --tamanos 1000,20000 --motores numpy --salida motor.json
+"""
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from agentes.servicios.motor_vectorial import abrir_cliente, MOTORES  # noqa: E402
+from benchmarks.ejecutar import estadisticas  # noqa: E402
+
+COLECCION = 'benchmark'
+LOTE_CARGA = 2000
+
+IMPORTACIONES = {
+    'chromadb': "import chromadb",
+    'numpy': "import agentes.servicios.motor_vectorial",
+}
+
+
+def generar_vectores(n: int, dimension: int, ciudades: int, semilla: int) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+    """Vectores normalizados alrededor de un centroide por ciudad, con sus metadatos."""
+    rng = np.random.default_rng(semilla)
+    centroides = rng.normal(size=(ciudades, dimension)).astype(np.float32)
+    asignacion = rng.integers(0, ciudades, size=n)
+    vectores = centroides[asignacion] + rng.normal(scale=0.8, size=(n, dimension)).astype(np.float32)
+    vectores /= np.linalg.norm(vectores, axis=1, keepdims=True)
+    metadatas = [{"ciudad": f"Ciudad {c}", "hash": str(i)} for i, c in enumerate(asignacion)]
+    return vectores, metadatas
+
+
+def generar_consultas(vectores: np.ndarray, cantidad: int, semilla: int) -> np.ndarray:
+    """Consultas cercanas a documentos existentes."""
+    rng = np.random.default_rng(semilla + 1)
+    base = vectores[rng.integers(0, len(vectores), size=cantidad)]
+    consultas = base + rng.normal(scale=0.05, size=base.shape).astype(np.float32)
+    return consultas / np.linalg.norm(consultas, axis=1, keepdims=True)
+
+
+def top_exacto(vectores: np.ndarray, consultas: np.ndarray, k: int) -> List[List[int]]:
+    similitudes = consultas @ vectores.T
+    return [np.argsort(-fila, kind='stable')[:k].tolist() for fila in similitudes]
+
+
+def medir_importacion(motor: str) -> float:
+    inicio = time.perf_counter()
+    subprocess.run([sys.executable, '-c', IMPORTACIONES[motor]], check=True,
+                   cwd=str(Path(__file__).resolve().parent.parent))
+    return time.perf_counter() - inicio
+
+
+def medir_motor(motor: str, vectores: np.ndarray, metadatas: List[Dict[str, Any]], consultas: np.ndarray,
+                k: int, exactos: List[List[int]]) -> Dict[str, Any]:
+    directorio = tempfile.mkdtemp(prefix=f'motor-{motor}-')
+    try:
+        ids = [f"doc-{i}" for i in range(len(vectores))]
+        inicio = time.perf_counter()
+        cliente = abrir_cliente(directorio, motor)
+        coleccion = cliente.create_collection(name=COLECCION)
+        for desde in range(0, len(ids), LOTE_CARGA):
+            hasta = desde + LOTE_CARGA
+            coleccion.add(ids=ids[desde:hasta], embeddings=vectores[desde:hasta].tolist(),
+                          documents=ids[desde:hasta], metadatas=metadatas[desde:hasta])
+        cliente.persist()
+        carga = time.perf_counter() - inicio
+        del cliente, coleccion
+
+        consultas_lista = consultas.tolist()
+        inicio = time.perf_counter()
+        coleccion = abrir_cliente(directorio, motor).get_collection(name=COLECCION)
+        coleccion.query(query_embeddings=[consultas_lista[0]], n_results=k)
+        apertura = time.perf_counter() - inicio
+
+        muestras, aciertos, encontrados = [], 0, []
+        for consulta, exacto in zip(consultas_lista, exactos):
+            inicio = time.perf_counter()
+            resultado = coleccion.query(query_embeddings=[consulta], n_results=k)
+            muestras.append(time.perf_counter() - inicio)
+            encontrados = resultado['ids'][0]
+            aciertos += len({f"doc-{i}" for i in exacto} & set(encontrados))
+
+        filtradas = []
+        for j, consulta in enumerate(consultas_lista):
+            filtro = {"ciudad": metadatas[exactos[j][0]]["ciudad"]}
+            inicio = time.perf_counter()
+            coleccion.query(query_embeddings=[consulta], n_results=k, where=filtro)
+            filtradas.append(time.perf_counter() - inicio)
+
+        return {
+            'importacion_s': round(medir_importacion(motor), 3),
+            'carga_s': round(carga, 3),
+            'apertura_ms': round(apertura * 1000, 2),
+            'consulta': estadisticas(muestras),
+            'consulta_filtrada': estadisticas(filtradas),
+            'recall': round(aciertos / (len(exactos) * k), 4),
+        }
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del motor vectorial NumPy frente a ChromaDB")
+    parser.add_argument('--tamanos', default='1000,5000,20000', help="Documentos por colección, separados por comas")
+    parser.add_argument('--motores', default=','.join(MOTORES), help="Motores a medir, separados por comas")
+    parser.add_argument('--dimension', type=int, default=384, help="Dimensión de los vectores")
+    parser.add_argument('--ciudades', type=int, default=50, help="Valores distintos de la metadata ciudad")
+    parser.add_argument('--consultas', type=int, default=200, help="Consultas medidas por tamaño")
+    parser.add_argument('--k', type=int, default=3, help="Resultados por consulta")
+    parser.add_argument('--semilla', type=int, default=7)
+    parser.add_argument('--salida', help="Archivo JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    motores = [m for m in args.motores.split(',') if m]
+    resultado: Dict[str, Any] = {'python': platform.python_version(), 'numpy': np.__version__, 'tamanos': {}}
+    for tamano in (int(t) for t in args.tamanos.split(',')):
+        vectores, metadatas = generar_vectores(tamano, args.dimension, args.ciudades, args.semilla)
+        consultas = generar_consultas(vectores, args.consultas, args.semilla)
+        exactos = top_exacto(vectores, consultas, args.k)
+        resultado['tamanos'][tamano] = {}
+        for motor in motores:
+            try:
+                medicion = medir_motor(motor, vectores, metadatas, consultas, args.k, exactos)
+            except ImportError as e:
+                print(f"{motor}: no disponible ({e})")
+                continue
+            resultado['tamanos'][tamano][motor] = medicion
+            print(f"{tamano:>7} {motor:<9} carga={medicion['carga_s']:.2f}s "
+                  f"apertura={medicion['apertura_ms']:.1f}ms "
+                  f"p50={medicion['consulta']['p50']:.3f}ms p95={medicion['consulta']['p95']:.3f}ms "
+                  f"filtrada_p50={medicion['consulta_filtrada']['p50']:.3f}ms "
+                  f"recall@{args.k}={medicion['recall']:.3f} importacion={medicion['importacion_s']:.2f}s")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Configuración de gunicorn para producción.
+
+Todo se ajusta con variables de entorno:
+
+- ``GUNICORN_WORKER_CLASS``: ``sync``, ``gthread`` o ``uvicorn`` (por defecto
+  ``uvicorn`` si ``WEBHOOK_ASYNC`` está activo y ``gthread`` si no).
+- ``GUNICORN_WORKERS`` / ``GUNICORN_THREADS``: por defecto se derivan del
+  número de CPUs. Las peticiones pasan casi todo su tiempo esperando a
+  Gemini, así que se usan pocos procesos con varios hilos (o un event loop).
+  El cálculo está en ``webhook_dialogflow/procesos.py``, que settings.py usa
+  también para repartir la cuota de Gemini entre los workers.
+- ``GUNICORN_TIMEOUT`` / ``GUNICORN_GRACEFUL_TIMEOUT``: dimensionados para la
+  latencia de Gemini (una respuesta larga puede tardar decenas de segundos).
+- ``GUNICORN_PRELOAD``: carga la aplicación en el proceso maestro. Los
+  índices de solo lectura (documentos decodificados, índice de ciudades,
+  resolutor) se construyen una vez y los workers los comparten
+  copy-on-write; ``gc.freeze()`` evita que el recolector de basura toque
+  esas páginas y las copie en cada worker.
+
+Ver ``scripts/medir_memoria.py`` para medir la memoria por worker.
+
+Las métricas de ``/metrics`` se agregan entre workers a través de
+``METRICAS_DIRECTORIO`` (mismo valor por defecto que en settings.py); el
+maestro lo vacía al arrancar y cada worker vuelca sus valores al salir.
+"""
+import gc
+import os
+import tempfile
+
+from webhook_dialogflow.procesos import CLASES_WORKER, clase_worker, numero_hilos, numero_workers
+
+_CLASE = clase_worker()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = CLASES_WORKER[_CLASE]
+wsgi_app = ('webhook_dialogflow.asgi:application' if _CLASE == 'uvicorn'
+            else 'webhook_dialogflow.wsgi:application')
+
+workers = numero_workers(_CLASE)
+threads = numero_hilos(_CLASE)
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '60'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Reciclar workers de vez en cuando acota fugas de memoria sin reinicios simultáneos
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '500'))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true'
+if preload_app:
+    # wsgi.py/asgi.py solo precargan en el maestro; cada worker se calienta tras el fork
+    os.environ['GUNICORN_PRECARGA'] = '1'
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+
+METRICAS_DIRECTORIO = os.getenv('METRICAS_DIRECTORIO', os.path.join(tempfile.gettempdir(), 'metricas_webhook'))
+
+
+def on_starting(server):
+    """Al arrancar el maestro, antes de cargar la aplicación."""
+    from agentes.servicios.metricas import limpiar_directorio
+    limpiar_directorio(METRICAS_DIRECTORIO)
+
+
+def when_ready(server):
+    """Después de cargar la aplicación y antes de crear los workers."""
+    if preload_app:
+        # Mover los objetos precargados a la generación permanente: el GC no
+        # los vuelve a recorrer y sus páginas siguen compartidas tras el fork
+        gc.collect()
+        gc.freeze()
+        server.log.info(f"Aplicación precargada; {gc.get_freeze_count()} objetos congelados")
+
+
+def post_worker_init(worker):
+    """En cada worker, justo después del fork."""
+    if preload_app:
+        from agentes.servicios.registro import registro
+        registro.despues_de_fork()
+        registro.calentar()
+
+
+def worker_exit(server, worker):
+    """Al terminar un worker: conservar sus últimos contadores."""
+    from agentes.servicios.metricas import metricas
+    metricas.volcar()
@@ -0,0 +1,51 @@
+"""
+Prepara el modelo de embeddings int8 de ``FUNCION_EMBEDDING=onnx_int8``.
+
+Cuantiza a int8 el modelo all-MiniLM-L6-v2 fp32 que usa ChromaDB (si no está
+en su caché, la función por defecto de ChromaDB lo descarga) y escribe en el
+destino el grafo, los pesos compartibles y el tokenizador (ver
+``agentes/servicios/embeddings_onnx.py``). Requiere el paquete ``onnx``.
+
+Al cambiar de función de embeddings hay que volver a poblar la base;
+``poblar_vectordb.py`` lo detecta y recalcula todos los vectores.
+
+Uso:
+    python scripts/cuantizar_embeddings.py
+    python scripts/cuantizar_embeddings.py --destino ./data/modelo_embeddings --si-falta
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Permitir importar los módulos de la aplicación sin configurar Django
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from agentes.servicios.embeddings_onnx import ARCHIVO_MODELO, MODELO_CHROMADB, preparar_modelo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cuantiza a int8 el modelo de embeddings de ChromaDB")
+    parser.add_argument('--origen', default=MODELO_CHROMADB,
+                        help="Directorio con model.onnx y tokenizer.json en fp32 (por defecto, la caché de ChromaDB)")
+    parser.add_argument('--destino', default=os.getenv('EMBEDDING_ONNX_DIRECTORIO', './data/modelo_embeddings'),
+                        help="Directorio del modelo int8 (por defecto, EMBEDDING_ONNX_DIRECTORIO)")
+    parser.add_argument('--si-falta', action='store_true', help="No hace nada si el destino ya tiene un modelo")
+    args = parser.parse_args()
+
+    if args.si_falta and os.path.exists(os.path.join(args.destino, ARCHIVO_MODELO)):
+        print(f"El modelo int8 ya existe en {args.destino}")
+        return
+
+    if not os.path.exists(os.path.join(args.origen, 'model.onnx')) and args.origen == MODELO_CHROMADB:
+        print("Descargando el modelo de ChromaDB...")
+        from chromadb.utils import embedding_functions
+        embedding_functions.DefaultEmbeddingFunction()(["descarga"])
+
+    print(f"Cuantizando {args.origen} en {args.destino}...")
+    resumen = preparar_modelo(args.origen, args.destino)
+    print(f"Modelo fp32: {resumen['bytes_fp32'] / 2**20:.1f} MB; int8: {resumen['bytes_int8'] / 2**20:.1f} MB "
+          f"({resumen['tensores_compartidos']} tensores en pesos compartidos)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Mide la memoria del maestro de gunicorn y de cada worker.
+
+Lee ``/proc/<pid>/smaps_rollup`` (Linux) de cada proceso:
+
+- RSS: páginas residentes, contando dos veces las compartidas.
+- PSS: RSS con cada página compartida dividida entre los procesos que la
+  comparten. La suma de PSS es la memoria real del servicio.
+- Compartida / Privada: páginas compartidas con otros procesos y páginas
+  propias (las que copy-on-write no logró conservar compartidas).
+
+Uso (dentro del contenedor, con el servicio ya caliente):
+    python scripts/medir_memoria.py                # busca el maestro de gunicorn
+    python scripts/medir_memoria.py --pid 1        # maestro indicado
+    python scripts/medir_memoria.py --json
+
+Para comparar, medir con ``GUNICORN_PRELOAD=True`` y ``False`` tras enviar
+algunas peticiones a cada worker.
+"""
+import argparse
+import json
+import os
+import sys
+
+CAMPOS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'compartida',
+    'Shared_Dirty': 'compartida',
+    'Private_Clean': 'privada',
+    'Private_Dirty': 'privada',
+}
+
+def leer_memoria(pid):
+    """Retorna la memoria del proceso en KB, agregada por tipo."""
+    memoria = {'rss': 0, 'pss': 0, 'compartida': 0, 'privada': 0}
+    with open(f"/proc/{pid}/smaps_rollup") as archivo:
+        for linea in archivo:
+            partes = linea.split()
+            campo = partes[0].rstrip(':')
+            if campo in CAMPOS:
+                memoria[CAMPOS[campo]] += int(partes[1])
+    return memoria
+
+def leer_comando(pid):
+    with open(f"/proc/{pid}/cmdline", 'rb') as archivo:
+        return archivo.read().replace(b'\0', b' ').decode(errors='replace').strip()
+
+def hijos(pid):
+    """PIDs de los procesos hijos directos."""
+    resultado = []
+    for tarea in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{tarea}/children") as archivo:
+                resultado.extend(int(p) for p in archivo.read().split())
+        except OSError:
+            pass
+    return resultado
+
+def buscar_maestro():
+    """PID del proceso gunicorn cuyo padre no es gunicorn."""
+    for entrada in os.listdir('/proc'):
+        if not entrada.isdigit():
+            continue
+        try:
+            if 'gunicorn' not in leer_comando(entrada):
+                continue
+            with open(f"/proc/{entrada}/stat") as archivo:
+                padre = archivo.read().rsplit(')', 1)[1].split()[1]
+            if 'gunicorn' not in leer_comando(padre):
+                return int(entrada)
+        except OSError:
+            continue
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria por worker de gunicorn")
+    parser.add_argument('--pid', type=int, help="PID del maestro de gunicorn")
+    parser.add_argument('--json', action='store_true', help="Salida en JSON")
+    args = parser.parse_args()
+
+    maestro = args.pid or buscar_maestro()
+    if maestro is None:
+        print("No se encontró el proceso maestro de gunicorn")
+        sys.exit(1)
+
+    procesos = [('maestro', maestro)] + [('worker', pid) for pid in hijos(maestro)]
+    filas = [{'rol': rol, 'pid': pid, **leer_memoria(pid)} for rol, pid in procesos]
+    workers = [f for f in filas if f['rol'] == 'worker']
+    resumen = {
+        'workers': len(workers),
+        'pss_total_mb': round(sum(f['pss'] for f in filas) / 1024, 1),
+        'pss_por_worker_mb': round(sum(f['pss'] for f in workers) / len(workers) / 1024, 1) if workers else 0,
+        'privada_por_worker_mb': round(sum(f['privada'] for f in workers) / len(workers) / 1024, 1) if workers else 0,
+    }
+
+    if args.json:
+        print(json.dumps({'procesos': filas, 'resumen': resumen}, indent=1))
+        return
+
+    print(f"{'rol':8} {'pid':>7} {'RSS MB':>8} {'PSS MB':>8} {'compart.':>9} {'privada':>8}")
+    for f in filas:
+        print(f"{f['rol']:8} {f['pid']:>7} {f['rss'] / 1024:>8.1f} {f['pss'] / 1024:>8.1f} "
+              f"{f['compartida'] / 1024:>9.1f} {f['privada'] / 1024:>8.1f}")
+    print(f"\n{resumen['workers']} workers, PSS total {resumen['pss_total_mb']} MB, "
+          f"PSS por worker {resumen['pss_por_worker_mb']} MB, "
+          f"privada por worker {resumen['privada_por_worker_mb']} MB")
+
+if __name__ == "__main__":
+    main()
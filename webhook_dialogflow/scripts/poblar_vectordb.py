@@ -1,142 +1,225 @@
 import json
-import chromadb
-from chromadb.config import Settings
+import argparse
 import os
+import sys
 from pathlib import Path
-from google.cloud import storage
 from datetime import datetime
 
-def get_storage_client():
-    """Inicializa el cliente de Google Cloud Storage."""
-    return storage.Client()
+# Permitir importar los módulos de la aplicación sin configurar Django
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from agentes.servicios.version_datos import marcar_version
+from agentes.servicios.ingesta import (
+    leer_manifiesto, escribir_manifiesto, planificar_archivos, ids_obsoletos,
+    estado_actualizado, registros_unicos, registros_cambiados, hashes_en_coleccion,
+    aplicar_registros, eliminar_registros, MODOS_TEXTO, TEXTO_RESUMEN
+)
+from agentes.servicios.almacen_documentos import AlmacenDocumentos
+from agentes.servicios.snapshot import construir_snapshot
+from agentes.servicios.motor_vectorial import abrir_cliente, MOTORES
+from agentes.servicios.embeddings import EtapaEmbeddings, FUNCIONES_EMBEDDING
+from agentes.servicios.descarga import (
+    DescargadorParalelo, FuenteGCS, FuenteLocal, decodificar_json
+)
 
-def download_json_from_gcs(bucket_name, prefix):
+PERSIST_DIR = "./data/chromadb"
+
+def crear_fuente(args):
+    """Bucket de GCS con cliente compartido, o un directorio local en su lugar."""
+    if args.directorio_local:
+        return FuenteLocal(args.directorio_local)
+    return FuenteGCS(args.bucket, max_conexiones=args.hilos)
+
+def reportar_progreso(estadisticas):
+    print(f"  descargas: {estadisticas.resumen()}")
+
+def inicializar_chromadb(motor="chromadb"):
     """
-    Descarga y combina todos los archivos JSON que coincidan con el prefijo.
+    Abre (o crea) las colecciones de la base vectorial sin borrarlas.
     
-    Args:
-        bucket_name: Nombre del bucket de GCS
-        prefix: Prefijo de los archivos a buscar
+    Las colecciones se actualizan en sitio, por lo que el servicio sigue
+    respondiendo con los datos anteriores mientras dura la actualización.
     
-    Returns:
-        List[Dict]: Lista de documentos JSON combinados
+    Args:
+        motor: Motor vectorial ('chromadb' o 'numpy'), como MOTOR_VECTORIAL del servicio
     """
-    client = get_storage_client()
-    bucket = client.bucket(bucket_name)
-    blobs = bucket.list_blobs(prefix=prefix)
-    
-    combined_data = []
-    for blob in blobs:
-        if blob.name.endswith('.json'):
-            content = blob.download_as_string()
-            try:
-                data = json.loads(content)
-                if isinstance(data, list):
-                    combined_data.extend(data)
-                else:
-                    combined_data.append(data)
-            except json.JSONDecodeError as e:
-                print(f"Error decodificando {blob.name}: {str(e)}")
-    
-    return combined_data
-
-def inicializar_chromadb():
-    """Inicializa las colecciones de ChromaDB."""
-    # Configurar ChromaDB
-    chroma_client = chromadb.Client(Settings(
-        chroma_db_impl="duckdb+parquet",
-        persist_directory="./data/chromadb"
-    ))
-
-    # Eliminar colecciones existentes si existen
-    try:
-        chroma_client.delete_collection("destinos_turisticos")
-        chroma_client.delete_collection("salud_mental")
-    except:
-        pass
-
-    # Crear nuevas colecciones
-    collection_turismo = chroma_client.create_collection(name="destinos_turisticos")
-    collection_salud = chroma_client.create_collection(name="salud_mental")
-
-    return collection_turismo, collection_salud
-
-def cargar_datos_turismo(collection, datos):
-    """Carga los datos turísticos en ChromaDB."""
-    if not datos:
-        print("No se encontraron datos de turismo para cargar")
-        return
-
-    # Preparar los datos para ChromaDB
-    ids = [f"destino_{i}" for i in range(len(datos))]
-    documentos = [json.dumps(dato, ensure_ascii=False) for dato in datos]
-    metadatos = [{"ciudad": dato["ciudad"]} for dato in datos]
+    chroma_client = abrir_cliente(PERSIST_DIR, motor)
+
+    collection_turismo = chroma_client.get_or_create_collection(name="destinos_turisticos")
+    collection_salud = chroma_client.get_or_create_collection(name="salud_mental")
+
+    return chroma_client, collection_turismo, collection_salud
+
+def sincronizar_coleccion(fuente, collection, almacen, prefix, estado, etapa, forzar=False,
+                          hilos=16, reintentos=3, modo_texto=TEXTO_RESUMEN, reembeber=False):
+    """
+    Aplica a una colección solo los cambios del bucket desde la última ingesta.
     
-    # Crear embeddings de los resúmenes turísticos
-    textos = [dato["informacion_turistica"]["resumen_turistico"] for dato in datos]
+    Solo se descargan los archivos cuya generación en GCS cambió, solo se
+    consultan en la colección los documentos cuyo hash difiere del
+    manifiesto, solo se re-embeben los que cambiaron y se eliminan los
+    documentos que ya no aparecen en ningún archivo.
     
-    # Añadir a la colección
-    collection.add(
-        documents=documentos,
-        metadatas=metadatos,
-        ids=ids
-    )
-    print(f"Cargados {len(datos)} destinos turísticos")
-
-def cargar_datos_salud_mental(collection, datos):
-    """Carga los datos de salud mental en ChromaDB."""
-    if not datos:
-        print("No se encontraron datos de salud mental para cargar")
-        return
-
-    # Preparar los datos para ChromaDB
-    ids = [f"salud_{i}" for i in range(len(datos))]
-    documentos = [json.dumps(dato, ensure_ascii=False) for dato in datos]
-    metadatos = [{"ciudad": dato["ciudad"]} for dato in datos]
+    Los archivos se descargan en paralelo y cada uno se procesa en cuanto
+    llega, mientras siguen las descargas del resto.
     
-    # Crear embeddings de los resúmenes de salud mental
-    textos = [dato["informacion_salud_mental"]["resumen_salud_mental"] for dato in datos]
+    Args:
+        fuente: FuenteGCS o FuenteLocal
+        collection: Colección de ChromaDB
+        almacen: AlmacenDocumentos con los documentos completos
+        prefix: Prefijo de los archivos de la colección
+        estado: Entrada del manifiesto anterior para la colección
+        etapa: EtapaEmbeddings que calcula los vectores de los documentos cambiados
+        forzar: Ignorar el manifiesto y revisar todos los archivos
+        hilos: Descargas simultáneas
+        reintentos: Reintentos por archivo
+        modo_texto: Texto del documento que se embebe (ver MODOS_TEXTO)
+        reembeber: Recalcular los embeddings de todos los documentos (cambió la función de embeddings)
     
-    # Añadir a la colección
-    collection.add(
-        documents=documentos,
-        metadatas=metadatos,
-        ids=ids
-    )
-    print(f"Cargados {len(datos)} registros de salud mental")
+    Returns:
+        Tuple[Dict, int, int]: Nuevo estado del manifiesto, documentos escritos y eliminados
+    """
+    nombre = collection.name
+    if forzar or reembeber:
+        estado = {}
+    archivos = fuente.listar(prefix)
+    generaciones = {archivo.nombre: archivo.generacion for archivo in archivos}
+    plan = planificar_archivos(generaciones, estado)
+    print(f"{nombre}: {len(plan.cambiados)} archivos nuevos o modificados, "
+          f"{len(plan.eliminados)} eliminados, {len(plan.sin_cambios)} sin cambios")
+
+    cambiados_set = set(plan.cambiados)
+    descargador = DescargadorParalelo(fuente, hilos=hilos, reintentos=reintentos,
+                                      progreso=reportar_progreso)
+    registros_por_archivo = {}
+    invalidos = []
+    for resultado in descargador.descargar(a for a in archivos if a.nombre in cambiados_set):
+        datos = decodificar_json(resultado)
+        if datos is None:
+            invalidos.append(resultado.nombre)
+            continue
+        registros_por_archivo[resultado.nombre] = registros_unicos(nombre, datos, modo_texto)
+    if invalidos:
+        # Conservar el contenido anterior de los archivos inválidos; se reintentan en la próxima ejecución
+        anteriores = estado.get("archivos", {})
+        plan = plan._replace(
+            cambiados=[n for n in plan.cambiados if n not in invalidos],
+            sin_cambios=plan.sin_cambios + [n for n in invalidos if n in anteriores],
+        )
+
+    # Un documento por ciudad aunque aparezca en varios archivos
+    por_id = {r.id: r for lista in registros_por_archivo.values() for r in lista}
+    registros = list(por_id.values())
+
+    # Los documentos con el mismo hash que en el manifiesto no cambiaron y no
+    # se consultan en la colección; para el resto, el hash guardado en los
+    # metadatos evita re-embeber documentos que solo cambiaron de archivo o
+    # que ya se escribieron en una ejecución interrumpida
+    candidatos = registros_cambiados(registros, estado.get("documentos", {}))
+    existentes = {} if reembeber else hashes_en_coleccion(collection, [r.id for r in candidatos])
+    cambiados = registros_cambiados(candidatos, existentes)
+    # Los vectores se calculan en la etapa de embeddings y Chroma no los recalcula
+    aplicar_registros(collection, almacen, cambiados, etapa.embeber([r.texto for r in cambiados]))
+
+    ids_nuevos = {n: [r.id for r in lista] for n, lista in registros_por_archivo.items()}
+    obsoletos = ids_obsoletos(plan, estado, ids_nuevos)
+    if not estado.get("archivos") and not invalidos:
+        # Sin manifiesto previo: reconciliar contra todo lo que hay en la colección
+        # (por ejemplo, ids posicionales de versiones anteriores del script)
+        vigentes = {id_doc for ids in ids_nuevos.values() for id_doc in ids}
+        obsoletos = set(hashes_en_coleccion(collection)) - vigentes
+    eliminar_registros(collection, almacen, obsoletos)
+
+    print(f"{nombre}: {len(cambiados)} documentos escritos, "
+          f"{len(registros) - len(cambiados)} sin cambios, {len(obsoletos)} eliminados")
+    nuevo_estado = estado_actualizado(plan, estado, generaciones, registros_por_archivo, obsoletos)
+    return nuevo_estado, len(cambiados), len(obsoletos)
 
 def main():
+    parser = argparse.ArgumentParser(description="Puebla la base vectorial desde GCS de forma incremental")
+    parser.add_argument('--forzar', action='store_true',
+                        help="Ignora el manifiesto y revisa todos los archivos del bucket")
+    parser.add_argument('--bucket', default="chatbot-api-campeche", help="Bucket de GCS de origen")
+    parser.add_argument('--directorio-local',
+                        help="Directorio local con la misma estructura que el bucket (sustituye a GCS)")
+    parser.add_argument('--hilos', type=int, default=16, help="Descargas simultáneas")
+    parser.add_argument('--reintentos', type=int, default=3, help="Reintentos por archivo")
+    parser.add_argument('--procesos', type=int, default=None,
+                        help="Procesos para calcular embeddings (por defecto, todos los núcleos)")
+    parser.add_argument('--lote', type=int, default=64, help="Documentos por lote de embeddings")
+    parser.add_argument('--texto-embedding', choices=MODOS_TEXTO, default=TEXTO_RESUMEN,
+                        help="Texto de cada documento sobre el que se calcula el embedding")
+    parser.add_argument('--snapshot',
+                        help="Directorio donde escribir un snapshot de la base al terminar")
+    parser.add_argument('--motor', choices=MOTORES, default=os.getenv('MOTOR_VECTORIAL', 'chromadb'),
+                        help="Motor vectorial que se puebla (por defecto, MOTOR_VECTORIAL)")
+    parser.add_argument('--embedding', choices=FUNCIONES_EMBEDDING,
+                        default=os.getenv('FUNCION_EMBEDDING', 'chromadb'),
+                        help="Función de embeddings (por defecto, FUNCION_EMBEDDING)")
+    parser.add_argument('--modelo-embeddings',
+                        default=os.getenv('EMBEDDING_ONNX_DIRECTORIO', './data/modelo_embeddings'),
+                        help="Directorio del modelo int8 (scripts/cuantizar_embeddings.py)")
+    parser.add_argument('--hilos-embedding', type=int, default=1,
+                        help="Hilos de ONNX Runtime por proceso con --embedding onnx_int8")
+    args = parser.parse_args()
+
     # Configuración
-    BUCKET_NAME = "chatbot-api-campeche"
-    TURISMO_PREFIX = "turismo/turismo_"
-    SALUD_MENTAL_PREFIX = "salud_mental/salud_mental_"
+    PREFIJOS = {
+        "destinos_turisticos": "turismo/turismo_",
+        "salud_mental": "salud_mental/salud_mental_",
+    }
     
     print("Iniciando proceso de población de la base de datos vectorial...")
     
     # Crear directorio para ChromaDB si no existe
-    os.makedirs("./data/chromadb", exist_ok=True)
-    
-    # Descargar datos de GCS
-    print("Descargando datos de turismo...")
-    datos_turismo = download_json_from_gcs(BUCKET_NAME, TURISMO_PREFIX)
-    
-    print("Descargando datos de salud mental...")
-    datos_salud = download_json_from_gcs(BUCKET_NAME, SALUD_MENTAL_PREFIX)
+    os.makedirs(PERSIST_DIR, exist_ok=True)
+    manifiesto = leer_manifiesto(PERSIST_DIR)
     
     # Inicializar ChromaDB
-    print("Inicializando ChromaDB...")
-    collection_turismo, collection_salud = inicializar_chromadb()
-    
-    # Cargar datos
-    print("Cargando datos de turismo...")
-    cargar_datos_turismo(collection_turismo, datos_turismo)
-    
-    print("Cargando datos de salud mental...")
-    cargar_datos_salud_mental(collection_salud, datos_salud)
-    
-    print("Base de datos vectorial poblada exitosamente.")
-    print(f"Total de destinos turísticos: {len(datos_turismo)}")
-    print(f"Total de registros de salud mental: {len(datos_salud)}")
+    print(f"Inicializando la base vectorial ({args.motor})...")
+    chroma_client, collection_turismo, collection_salud = inicializar_chromadb(args.motor)
+    fuente = crear_fuente(args)
+    almacen = AlmacenDocumentos(PERSIST_DIR)
+    
+    # Vectores de otra función de embeddings no son comparables: se recalculan todos
+    reembeber = manifiesto.get("funcion_embedding", "chromadb") != args.embedding
+    if reembeber:
+        print(f"Función de embeddings cambiada a {args.embedding}: se recalculan todos los vectores")
+    opciones = {"funcion": args.embedding, "directorio_modelo": args.modelo_embeddings,
+                "hilos": args.hilos_embedding, "tamano_lote": args.lote}
+
+    total_escritos = total_eliminados = 0
+    with EtapaEmbeddings(procesos=args.procesos, tamano_lote=args.lote, opciones=opciones) as etapa:
+        for collection in (collection_turismo, collection_salud):
+            print(f"Sincronizando {collection.name}...")
+            estado, escritos, eliminados = sincronizar_coleccion(
+                fuente, collection, almacen, PREFIJOS[collection.name],
+                manifiesto["colecciones"].get(collection.name, {}), etapa,
+                # Una colección vacía (p. ej. al cambiar de motor) se revisa entera
+                forzar=args.forzar or collection.count() == 0, hilos=args.hilos, reintentos=args.reintentos,
+                modo_texto=args.texto_embedding, reembeber=reembeber
+            )
+            manifiesto["colecciones"][collection.name] = estado
+            total_escritos += escritos
+            total_eliminados += eliminados
+        print(f"Embeddings: {etapa.resumen()}")
+    manifiesto["funcion_embedding"] = args.embedding
+    
+    if total_escritos or total_eliminados:
+        # Persistir y publicar una nueva versión para que los workers reconstruyan sus índices
+        chroma_client.persist()
+        version = marcar_version(PERSIST_DIR)
+        print(f"Versión de datos: {version}")
+    else:
+        print("Sin cambios en los datos; se conserva la versión actual.")
+    escribir_manifiesto(PERSIST_DIR, manifiesto)
+    
+    if args.snapshot:
+        construir_snapshot(chroma_client, almacen, PERSIST_DIR, args.snapshot)
+        print(f"Snapshot escrito en {args.snapshot}")
+    
+    print("Base de datos vectorial sincronizada exitosamente.")
+    print(f"Total de destinos turísticos: {collection_turismo.count()}")
+    print(f"Total de registros de salud mental: {collection_salud.count()}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,175 @@
+"""
+Precalcula las respuestas de los temas frecuentes de cada ciudad.
+
+Se ejecuta después de ``poblar_vectordb.py``. Para cada documento de ambas
+colecciones y cada tema de ``agentes/servicios/temas.py`` genera con Gemini
+la respuesta a la pregunta canónica del tema, con el mismo prompt y los
+mismos parámetros que ``generate_response``, y la guarda en el almacén de
+respuestas precalculadas del directorio de persistencia.
+
+Solo se regeneran las entradas que faltan, cuya fuente cambió (hash del
+documento, pregunta o ``VERSION_RESPUESTAS``) o que expiran en menos de
+``--renovar-antes`` segundos; las de ciudades que ya no existen se eliminan.
+
+Uso:
+    python scripts/precalcular_respuestas.py
+    python scripts/precalcular_respuestas.py --simular
+    python scripts/precalcular_respuestas.py --forzar --ttl 259200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Set, Tuple
+import google.generativeai as genai
+
+# Permitir importar los módulos de la aplicación sin configurar Django
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from agentes.servicios.almacen_documentos import AlmacenDocumentos
+from agentes.servicios.motor_vectorial import abrir_cliente, MOTORES
+from agentes.servicios.version_datos import leer_version
+from agentes.servicios.prompts import OPCIONES, construir_prompt
+from agentes.servicios.resolutor_ciudades import normalizar_texto
+from agentes.servicios.respuestas_precalculadas import AlmacenRespuestas, EntradaRespuesta, hash_fuente
+from agentes.servicios.temas import TEMAS
+from agentes.servicios.cliente_gemini import MODELO_GEMINI
+
+PERSIST_DIR = "./data/chromadb"
+
+# Colección -> agente que responde sus consultas
+AGENTES = {
+    "destinos_turisticos": "turismo",
+    "salud_mental": "salud_mental",
+}
+
+
+class Tarea(NamedTuple):
+    coleccion: str
+    ciudad: str
+    tema: str
+    prompt: str
+    hash_fuente: str
+
+
+def leer_documentos(cliente, almacen, nombre):
+    """Documentos completos de una colección, con sus metadatos en ``_metadata``."""
+    coleccion = cliente.get_or_create_collection(name=nombre)
+    datos = coleccion.get(include=["documents", "metadatas"])
+    payloads = almacen.obtener(datos["ids"])
+    documentos = []
+    for id_doc, texto, metadata in zip(datos["ids"], datos["documents"], datos["metadatas"]):
+        try:
+            dato = json.loads(payloads.get(id_doc) or texto or "")
+        except ValueError:
+            print(f"  documento {id_doc} no es JSON válido, se omite")
+            continue
+        if isinstance(dato, dict):
+            documentos.append({**dato, "_metadata": metadata or {}})
+    return documentos
+
+
+def planificar(nombre: str, documentos: List[Dict[str, Any]], entradas: Dict[Tuple[str, str], EntradaRespuesta],
+               renovar_antes: float, forzar: bool = False) -> Tuple[List[Tarea], Set[Tuple[str, str]]]:
+    """
+    Decide qué entradas regenerar y cuáles eliminar.
+
+    Returns:
+        Tareas de generación y claves ``(ciudad, tema)`` obsoletas.
+    """
+    ahora = time.time()
+    tareas = []
+    vigentes = set()
+    for dato in documentos:
+        metadata = dato["_metadata"]
+        ciudad = dato.get("ciudad") or metadata.get("ciudad", "")
+        hash_documento = metadata.get("hash")
+        if not ciudad or not hash_documento:
+            continue
+        for tema, definicion in TEMAS[nombre].items():
+            clave = (normalizar_texto(ciudad), tema)
+            vigentes.add(clave)
+            fuente = hash_fuente(hash_documento, definicion.pregunta)
+            entrada = entradas.get(clave)
+            if (forzar or entrada is None or entrada.hash_fuente != fuente
+                    or entrada.expira - ahora < renovar_antes):
+                prompt = construir_prompt(nombre, dato, definicion.pregunta.format(ciudad=ciudad))
+                tareas.append(Tarea(nombre, ciudad, tema, prompt, fuente))
+    return tareas, set(entradas) - vigentes
+
+
+def generar(modelo, tarea: Tarea, reintentos: int = 3) -> str:
+    """Genera la respuesta de una tarea, reintentando con espera exponencial."""
+    for intento in range(reintentos + 1):
+        try:
+            return modelo.generate_content(tarea.prompt, **OPCIONES[tarea.coleccion]).text
+        except Exception:
+            if intento == reintentos:
+                raise
+            time.sleep(2 ** intento)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalcula las respuestas de los temas frecuentes de cada ciudad")
+    parser.add_argument('--persist-dir', default=PERSIST_DIR, help="Directorio de persistencia de ChromaDB")
+    parser.add_argument('--motor', choices=MOTORES, default=os.getenv('MOTOR_VECTORIAL', 'chromadb'),
+                        help="Motor vectorial (por defecto, MOTOR_VECTORIAL)")
+    parser.add_argument('--ttl', type=float, default=7 * 24 * 3600, help="Vigencia de cada respuesta en segundos")
+    parser.add_argument('--renovar-antes', type=float, default=24 * 3600,
+                        help="Regenerar las respuestas que expiran en menos de estos segundos")
+    parser.add_argument('--forzar', action='store_true', help="Regenera todas las respuestas")
+    parser.add_argument('--hilos', type=int, default=4, help="Llamadas simultáneas a Gemini")
+    parser.add_argument('--reintentos', type=int, default=3, help="Reintentos por respuesta")
+    parser.add_argument('--simular', action='store_true', help="Solo muestra qué se regeneraría")
+    args = parser.parse_args()
+
+    cliente = abrir_cliente(args.persist_dir, args.motor)
+    almacen = AlmacenDocumentos(args.persist_dir)
+    respuestas = AlmacenRespuestas(args.persist_dir)
+    version = leer_version(args.persist_dir)
+
+    tareas = []
+    for nombre, agente in AGENTES.items():
+        documentos = leer_documentos(cliente, almacen, nombre)
+        entradas = respuestas.entradas(agente)
+        pendientes, obsoletas = planificar(nombre, documentos, entradas, args.renovar_antes, args.forzar)
+        print(f"{nombre}: {len(documentos)} ciudades, {len(pendientes)} respuestas por generar, "
+              f"{len(entradas) - len(obsoletas) - len(pendientes)} vigentes, {len(obsoletas)} obsoletas")
+        if not args.simular:
+            respuestas.eliminar(agente, obsoletas)
+        tareas.extend(pendientes)
+
+    if args.simular or not tareas:
+        return
+
+    genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+    modelo = genai.GenerativeModel(MODELO_GEMINI)
+    generadas = errores = 0
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.hilos) as executor:
+        futuros = {executor.submit(generar, modelo, tarea, args.reintentos): tarea for tarea in tareas}
+        for futuro in as_completed(futuros):
+            tarea = futuros[futuro]
+            try:
+                texto = futuro.result()
+            except Exception as e:
+                errores += 1
+                print(f"  error en {tarea.ciudad} / {tarea.tema}: {str(e)}")
+                continue
+            # Se guarda cada respuesta al llegar: una ejecución interrumpida conserva lo generado
+            respuestas.guardar(AGENTES[tarea.coleccion], tarea.ciudad, tarea.tema, texto,
+                               tarea.hash_fuente, version, args.ttl)
+            generadas += 1
+            if generadas % 20 == 0:
+                print(f"  {generadas}/{len(tareas)} respuestas generadas")
+
+    print(f"{generadas} respuestas generadas y {errores} errores en {time.perf_counter() - inicio:.1f}s "
+          f"(versión de datos {version})")
+    if errores:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
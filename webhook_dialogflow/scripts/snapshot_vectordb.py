@@ -0,0 +1,104 @@
+"""
+Construye, inspecciona, verifica y restaura snapshots de la base vectorial.
+
+Uso:
+    python scripts/snapshot_vectordb.py construir ./data/snapshot
+    python scripts/snapshot_vectordb.py inspeccionar ./data/snapshot
+    python scripts/snapshot_vectordb.py verificar ./data/snapshot
+    python scripts/snapshot_vectordb.py restaurar ./data/snapshot
+    python scripts/snapshot_vectordb.py --motor numpy restaurar ./data/snapshot
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Permitir importar los módulos de la aplicación sin configurar Django
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from agentes.servicios.almacen_documentos import AlmacenDocumentos
+from agentes.servicios.snapshot import (
+    construir_snapshot, cargar_snapshot, verificar_snapshot, restaurar_snapshot,
+    leer_manifiesto_snapshot
+)
+from agentes.servicios.motor_vectorial import abrir_cliente, MOTORES
+
+PERSIST_DIR = "./data/chromadb"
+
+def abrir_chromadb(persist_dir, motor="chromadb"):
+    """Abre el cliente del motor vectorial sobre el directorio de persistencia."""
+    return abrir_cliente(persist_dir, motor)
+
+def construir(args):
+    manifiesto = construir_snapshot(
+        abrir_chromadb(args.persist_dir, args.motor), AlmacenDocumentos(args.persist_dir),
+        args.persist_dir, args.snapshot
+    )
+    print(f"Snapshot escrito en {args.snapshot} (versión de datos {manifiesto['version_datos']})")
+    for nombre, info in manifiesto["colecciones"].items():
+        print(f"  {nombre}: {info['registros']} registros, dimensión {info['dimension']}")
+
+def inspeccionar(args):
+    manifiesto = leer_manifiesto_snapshot(args.snapshot)
+    tamanos = {
+        archivo: os.path.getsize(os.path.join(args.snapshot, archivo))
+        for archivo in os.listdir(args.snapshot)
+    }
+    print(f"Formato: {manifiesto['formato']}")
+    print(f"Versión de datos: {manifiesto['version_datos']}")
+    print(f"Fecha: {manifiesto['fecha']}")
+    for nombre, info in manifiesto["colecciones"].items():
+        print(f"{nombre}: {info['registros']} registros, dimensión {info['dimension']}")
+        for archivo in info["archivos"].values():
+            print(f"  {archivo['nombre']}: {tamanos.get(archivo['nombre'], 0) / 1e6:.2f} MB "
+                  f"sha256={archivo['sha256'][:12]}")
+    if args.json:
+        print(json.dumps(manifiesto, ensure_ascii=False, indent=1))
+
+def verificar(args):
+    inicio = time.perf_counter()
+    problemas = verificar_snapshot(args.snapshot)
+    if problemas:
+        for problema in problemas:
+            print(f"ERROR: {problema}")
+        sys.exit(1)
+    snapshot_inicio = time.perf_counter()
+    cargar_snapshot(args.snapshot)
+    print(f"Snapshot válido (verificado en {snapshot_inicio - inicio:.2f}s, "
+          f"cargado en {time.perf_counter() - snapshot_inicio:.3f}s)")
+
+def restaurar(args):
+    inicio = time.perf_counter()
+    snapshot = cargar_snapshot(args.snapshot)
+    version = restaurar_snapshot(
+        snapshot, abrir_chromadb(args.persist_dir, args.motor), AlmacenDocumentos(args.persist_dir),
+        args.persist_dir
+    )
+    print(f"Snapshot restaurado en {args.persist_dir} en {time.perf_counter() - inicio:.2f}s "
+          f"(versión de datos {version})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshots de la base vectorial")
+    parser.add_argument('--persist-dir', default=PERSIST_DIR, help="Directorio de persistencia de ChromaDB")
+    parser.add_argument('--motor', choices=MOTORES, default=os.getenv('MOTOR_VECTORIAL', 'chromadb'),
+                        help="Motor vectorial (por defecto, MOTOR_VECTORIAL)")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    for nombre, funcion, ayuda in (
+        ('construir', construir, "Escribe un snapshot del estado actual"),
+        ('inspeccionar', inspeccionar, "Muestra el manifiesto y el tamaño de los archivos"),
+        ('verificar', verificar, "Comprueba hashes, conteos y dimensiones"),
+        ('restaurar', restaurar, "Reemplaza las colecciones por las del snapshot"),
+    ):
+        subparser = subparsers.add_parser(nombre, help=ayuda)
+        subparser.add_argument('snapshot', help="Directorio del snapshot")
+        if nombre == 'inspeccionar':
+            subparser.add_argument('--json', action='store_true', help="Imprime el manifiesto completo")
+        subparser.set_defaults(funcion=funcion)
+
+    args = parser.parse_args()
+    args.funcion(args)
+
+if __name__ == "__main__":
+    main()
@@ -14,3 +14,14 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webhook_dialogflow.settings')
 
 application = get_asgi_application()
+
+# Construir y calentar los servicios RAG una sola vez al arrancar el worker.
+# Con preload_app (gunicorn.conf.py) este módulo se importa en el proceso
+# maestro: ahí solo se precargan los índices de solo lectura y cada worker se
+# calienta después del fork.
+from agentes.servicios.registro import registro  # noqa: E402
+
+if os.environ.get('GUNICORN_PRECARGA') == '1':
+    registro.precargar()
+else:
+    registro.calentar()
@@ -0,0 +1,52 @@
+"""
+Tamaño del despliegue de gunicorn a partir de las variables de entorno.
+
+Lo usan ``gunicorn.conf.py`` para arrancar los workers y ``settings.py`` para
+repartir la cuota de Gemini entre ellos, así que ambos cuentan los mismos
+procesos aunque ``GUNICORN_WORKERS`` no esté definido.
+"""
+import multiprocessing
+import os
+from typing import Optional
+
+# Nombre corto -> clase de worker de gunicorn
+CLASES_WORKER = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'uvicorn': 'uvicorn.workers.UvicornWorker',
+}
+
+
+def clase_worker() -> str:
+    """
+    Nombre corto de la clase de worker (``GUNICORN_WORKER_CLASS``).
+
+    Por defecto ``uvicorn`` si ``WEBHOOK_ASYNC`` está activo y ``gthread`` si no.
+
+    Raises:
+        ValueError: Si la clase no es una de ``CLASES_WORKER``.
+    """
+    webhook_async = os.getenv('WEBHOOK_ASYNC', 'False').lower() == 'true'
+    clase = os.getenv('GUNICORN_WORKER_CLASS') or ('uvicorn' if webhook_async else 'gthread')
+    if clase not in CLASES_WORKER:
+        raise ValueError(f"GUNICORN_WORKER_CLASS desconocida: {clase} (opciones: {', '.join(CLASES_WORKER)})")
+    return clase
+
+
+def numero_workers(clase: Optional[str] = None) -> int:
+    """
+    Procesos worker (``GUNICORN_WORKERS`` o derivado del número de CPUs).
+
+    sync: un proceso por petición en vuelo. gthread/uvicorn: la concurrencia
+    viene de los hilos o del event loop, basta un proceso por CPU.
+    """
+    clase = clase or clase_worker()
+    cpus = multiprocessing.cpu_count()
+    por_defecto = 2 * cpus + 1 if clase == 'sync' else cpus + 1
+    return int(os.getenv('GUNICORN_WORKERS') or por_defecto)
+
+
+def numero_hilos(clase: Optional[str] = None) -> int:
+    """Hilos por worker (``GUNICORN_THREADS``; solo gthread usa más de uno por defecto)."""
+    clase = clase or clase_worker()
+    return int(os.getenv('GUNICORN_THREADS') or (4 * multiprocessing.cpu_count() if clase == 'gthread' else 1))
@@ -1,7 +1,10 @@
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
+from webhook_dialogflow.procesos import numero_workers
+
 load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -20,9 +23,144 @@ GCP_SERVICE_ACCOUNT_PATH = os.path.join(BASE_DIR, 'service_account.json')
 GCP_PROJECT_ID = os.getenv('GCP_PROJECT_ID')
 GCP_LOCATION = os.getenv('GCP_LOCATION', 'us-central1')
 GCP_BUCKET_NAME = os.getenv('GCP_BUCKET_NAME')
+
+# Descargas paralelas desde GCS (ingesta y ServicioGCS)
+GCS_DESCARGA_HILOS = int(os.getenv('GCS_DESCARGA_HILOS', '16'))
+GCS_DESCARGA_REINTENTOS = int(os.getenv('GCS_DESCARGA_REINTENTOS', '3'))
+
 # Gemini Settings
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+# Modo asíncrono (ASGI/uvicorn): vistas async, Gemini con API asíncrona y
+# operaciones bloqueantes en un pool de hilos acotado
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', 'False').lower() == 'true'
+GEMINI_MAX_CONCURRENCIA = int(os.getenv('GEMINI_MAX_CONCURRENCIA', '64'))
+EXECUTOR_BLOQUEANTE_HILOS = int(os.getenv('EXECUTOR_BLOQUEANTE_HILOS', '8'))
+
+# Búsqueda vectorial especulativa en paralelo con la extracción de ciudad por Gemini
+RAG_RECUPERACION_ESPECULATIVA = os.getenv('RAG_RECUPERACION_ESPECULATIVA', 'True').lower() == 'true'
+
+# Plazo por petición: Dialogflow abandona el webhook a los 5 segundos. Al agotarse
+# se responde con una respuesta degradada construida del documento recuperado.
+# El margen se reserva para construir y enviar esa respuesta; las etapas de
+# extracción y recuperación tienen además su propio tope.
+WEBHOOK_PLAZO_SEGUNDOS = float(os.getenv('WEBHOOK_PLAZO_SEGUNDOS', '4.5'))
+PLAZO_MARGEN_SEGUNDOS = float(os.getenv('PLAZO_MARGEN_SEGUNDOS', '0.3'))
+PLAZO_EXTRACCION_SEGUNDOS = float(os.getenv('PLAZO_EXTRACCION_SEGUNDOS', '1.5'))
+PLAZO_RECUPERACION_SEGUNDOS = float(os.getenv('PLAZO_RECUPERACION_SEGUNDOS', '1.0'))
+
+# Interruptor de circuito de Gemini: se abre tras N errores seguidos o si el p95
+# de las últimas llamadas supera el umbral (0: sin umbral de latencia), y
+# rechaza las llamadas durante la espera antes de probar con una sonda. El
+# umbral queda por debajo del plazo de la petición: un p95 mayor ya son
+# respuestas degradadas.
+GEMINI_CIRCUITO_FALLOS = int(os.getenv('GEMINI_CIRCUITO_FALLOS', '5'))
+GEMINI_CIRCUITO_P95_SEGUNDOS = float(os.getenv('GEMINI_CIRCUITO_P95_SEGUNDOS', '3.5'))
+GEMINI_CIRCUITO_ESPERA_SEGUNDOS = float(os.getenv('GEMINI_CIRCUITO_ESPERA_SEGUNDOS', '30'))
+GEMINI_CIRCUITO_VENTANA = int(os.getenv('GEMINI_CIRCUITO_VENTANA', '100'))
+GEMINI_CIRCUITO_MIN_MUESTRAS = int(os.getenv('GEMINI_CIRCUITO_MIN_MUESTRAS', '20'))
+# Llamadas de cobertura: una segunda llamada si la primera supera el percentil
+# indicado de latencia, como mucho en la fracción indicada de las llamadas
+GEMINI_COBERTURA = os.getenv('GEMINI_COBERTURA', 'False').lower() == 'true'
+GEMINI_COBERTURA_PERCENTIL = float(os.getenv('GEMINI_COBERTURA_PERCENTIL', '0.9'))
+GEMINI_COBERTURA_FRACCION = float(os.getenv('GEMINI_COBERTURA_FRACCION', '0.1'))
+# Cuota de Gemini (llamadas por minuto del proyecto, 0: sin límite) repartida a
+# partes iguales entre los procesos; ráfaga por proceso y cola máxima antes de
+# descartar la llamada con una respuesta degradada. Los procesos se cuentan
+# igual que los workers de gunicorn.conf.py (GUNICORN_WORKERS o según las CPUs)
+GEMINI_CUOTA_RPM = float(os.getenv('GEMINI_CUOTA_RPM', '0'))
+GEMINI_CUOTA_PROCESOS = int(os.getenv('GEMINI_CUOTA_PROCESOS') or numero_workers())
+GEMINI_CUOTA_RAFAGA = float(os.getenv('GEMINI_CUOTA_RAFAGA', '10'))
+GEMINI_CUOTA_ESPERA_SEGUNDOS = float(os.getenv('GEMINI_CUOTA_ESPERA_SEGUNDOS', '1.0'))
+# Llamadas idénticas concurrentes (agente, etapa, ciudad, consulta) comparten una sola llamada
+GEMINI_COALESCENCIA = os.getenv('GEMINI_COALESCENCIA', 'True').lower() == 'true'
+
+# Ruta de crisis del agente de salud mental: ante lenguaje de crisis se responde
+# al instante con los números de emergencia, sin extracción ni generación
+CRISIS_RUTA_RAPIDA = os.getenv('CRISIS_RUTA_RAPIDA', 'True').lower() == 'true'
+
+# Directorio de persistencia de ChromaDB
+CHROMADB_PERSIST_DIR = os.getenv('CHROMADB_PERSIST_DIR', os.path.join(BASE_DIR, 'data', 'chromadb'))
+# Texto que se embebe de cada documento: 'resumen' (resumen y entidades clave)
+# o 'documento' (JSON completo). Debe coincidir con --texto-embedding de
+# scripts/poblar_vectordb.py
+CHROMADB_TEXTO_EMBEDDING = os.getenv('CHROMADB_TEXTO_EMBEDDING', 'resumen')
+# Snapshot (scripts/snapshot_vectordb.py) con el que se puebla un directorio de
+# persistencia vacío al arrancar, sin acceder a GCS
+CHROMADB_SNAPSHOT = os.getenv('CHROMADB_SNAPSHOT') or None
+# Motor vectorial: 'chromadb' (duckdb+parquet) o 'numpy' (matriz en proceso con
+# búsqueda exacta, agentes/servicios/motor_vectorial.py). Los scripts de
+# ingesta y snapshots aceptan --motor con el mismo valor por defecto
+MOTOR_VECTORIAL = os.getenv('MOTOR_VECTORIAL', 'chromadb')
+# Mapear en memoria las matrices del motor NumPy (páginas compartidas entre workers)
+MOTOR_VECTORIAL_MMAP = os.getenv('MOTOR_VECTORIAL_MMAP', 'True').lower() == 'true'
+
+# Función de embeddings de colecciones y consultas: 'chromadb' (all-MiniLM-L6-v2
+# en fp32) u 'onnx_int8' (el mismo modelo cuantizado con scripts/cuantizar_embeddings.py,
+# pesos compartidos entre workers). Debe coincidir con --embedding de scripts/poblar_vectordb.py
+FUNCION_EMBEDDING = os.getenv('FUNCION_EMBEDDING', 'chromadb')
+EMBEDDING_ONNX = {
+    'directorio_modelo': os.getenv('EMBEDDING_ONNX_DIRECTORIO', os.path.join(BASE_DIR, 'data', 'modelo_embeddings')),
+    # Hilos intra-op por worker: con varios workers, 1 evita que compitan por los núcleos
+    'hilos': int(os.getenv('EMBEDDING_ONNX_HILOS', '1')),
+    'tamano_lote': int(os.getenv('EMBEDDING_ONNX_LOTE', '32')),
+}
+
+# Caché de documentos decodificados de ChromaDB
+CACHE_DOCUMENTOS_MAX_ENTRADAS = int(os.getenv('CACHE_DOCUMENTOS_MAX_ENTRADAS', '5000'))
+
+# Índice exacto ciudad -> documento (segundos entre verificaciones de versión)
+INDICE_CIUDADES_INTERVALO_VERIFICACION = float(os.getenv('INDICE_CIUDADES_INTERVALO_VERIFICACION', '5'))
+
+# Caché de respuestas de Gemini por agente.
+# backend: 'memoria' (por worker), 'django' (settings.CACHES) o 'sqlite' (compartido entre workers).
+# umbral_similitud: similitud coseno mínima para reutilizar una respuesta semánticamente
+# parecida; None desactiva la búsqueda semántica.
+CACHE_RESPUESTAS_BACKEND = os.getenv('CACHE_RESPUESTAS_BACKEND', 'sqlite')
+CACHE_RESPUESTAS_RUTA = os.getenv('CACHE_RESPUESTAS_RUTA', os.path.join(BASE_DIR, 'data', 'cache_respuestas.sqlite3'))
+CACHE_RESPUESTAS = {
+    'turismo': {
+        'habilitada': os.getenv('CACHE_RESPUESTAS_TURISMO', 'True').lower() == 'true',
+        'backend': CACHE_RESPUESTAS_BACKEND,
+        'ruta': CACHE_RESPUESTAS_RUTA,
+        'ttl': int(os.getenv('CACHE_RESPUESTAS_TURISMO_TTL', str(6 * 3600))),
+        'max_entradas': 5000,
+        'umbral_similitud': 0.92,
+    },
+    # Política más estricta: vida corta y solo coincidencias exactas
+    'salud_mental': {
+        'habilitada': os.getenv('CACHE_RESPUESTAS_SALUD_MENTAL', 'True').lower() == 'true',
+        'backend': CACHE_RESPUESTAS_BACKEND,
+        'ruta': CACHE_RESPUESTAS_RUTA,
+        'ttl': int(os.getenv('CACHE_RESPUESTAS_SALUD_MENTAL_TTL', '900')),
+        'max_entradas': 500,
+        'umbral_similitud': None,
+    },
+}
+
+# Estado de conversación por sesión de Dialogflow: ciudad y documento del último
+# turno, para que los seguimientos sin ciudad pasen directo a la generación.
+# backend: 'memoria' (por worker) o 'sqlite' (compartido entre workers).
+ESTADO_SESION = {
+    'habilitado': os.getenv('ESTADO_SESION', 'True').lower() == 'true',
+    'backend': os.getenv('ESTADO_SESION_BACKEND', 'sqlite'),
+    'ruta': os.getenv('ESTADO_SESION_RUTA', os.path.join(BASE_DIR, 'data', 'sesiones.sqlite3')),
+    'ttl': int(os.getenv('ESTADO_SESION_TTL', '1800')),
+    'max_entradas': int(os.getenv('ESTADO_SESION_MAX_ENTRADAS', '20000')),
+}
+
+# Respuestas precalculadas por ciudad y tema (scripts/precalcular_respuestas.py):
+# las consultas que el clasificador de temas reconoce se responden sin Gemini
+RESPUESTAS_PRECALCULADAS = os.getenv('RESPUESTAS_PRECALCULADAS', 'True').lower() == 'true'
+
+# Resolución local de ciudades (evita la extracción con Gemini)
+RESOLUTOR_UMBRAL_DIFUSO = float(os.getenv('RESOLUTOR_UMBRAL_DIFUSO', '0.82'))
+
+# Métricas Prometheus (/metrics). Cada worker vuelca sus valores a este
+# directorio cada METRICAS_INTERVALO_VOLCADO segundos para agregarlos entre workers
+METRICAS_DIRECTORIO = os.getenv('METRICAS_DIRECTORIO', os.path.join(tempfile.gettempdir(), 'metricas_webhook'))
+METRICAS_INTERVALO_VOLCADO = float(os.getenv('METRICAS_INTERVALO_VOLCADO', '5'))
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -14,12 +14,24 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from agentes.views import webhook_turismo, webhook_salud_mental
+from agentes import views
+
+# En modo ASGI (uvicorn) se sirven las vistas asíncronas en las mismas rutas
+if settings.WEBHOOK_ASYNC:
+    webhook_turismo = views.webhook_turismo_async
+    webhook_salud_mental = views.webhook_salud_mental_async
+else:
+    webhook_turismo = views.webhook_turismo
+    webhook_salud_mental = views.webhook_salud_mental
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('webhook/turismo/', webhook_turismo, name='webhook_turismo'),
     path('webhook/salud-mental/', webhook_salud_mental, name='webhook_salud_mental'),
+    path('healthz', views.healthz, name='healthz'),
+    path('readyz', views.readyz, name='readyz'),
+    path('metrics', views.metrics, name='metrics'),
 ]